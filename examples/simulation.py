@@ -45,33 +45,33 @@ class RandomAgent(Agent):
             # Randomly open or close a position depending on the trader's
             # ability to perform these actions.
             if max_long > 0 and len(open_longs) == 0:
-                action_list.append(self._open_long(max_long=max_long, market_time=market.time))
+                action_list.append(self._open_long(max_long=max_long, mint_block=market.block_number))
             elif max_long == 0 and len(open_longs) > 0:
                 action_list.append(self._close_long(open_longs))
             elif max_long > 0 and len(open_longs) > 0:
                 flip = self.rng.random()
                 if flip < 0.5:
-                    action_list.append(self._open_long(max_long=max_long, market_time=market.time))
+                    action_list.append(self._open_long(max_long=max_long, mint_block=market.block_number))
                 else:
                     action_list.append(self._close_long(open_longs))
 
         return action_list
 
-    def _open_long(self, max_long: float, market_time: float) -> MarketAction:
+    def _open_long(self, max_long: float, mint_block: int) -> MarketAction:
         return self.create_agent_action(
             action_type=MarketActionType.OPEN_LONG,
             # Uniformly select trade amounts from (0, max_long].
             trade_amount=abs(self.rng.uniform(-max_long, 0)),
-            mint_time=market_time,
+            mint_block=mint_block,
         )
 
-    def _close_long(self, open_longs: list[tuple[float, Long]]) -> MarketAction:
-        (mint_time, long) = open_longs[self.rng.integers(0, len(open_longs))]
+    def _close_long(self, open_longs: list[tuple[int, Long]]) -> MarketAction:
+        (mint_block, long) = open_longs[self.rng.integers(0, len(open_longs))]
         return self.create_agent_action(
             action_type=MarketActionType.CLOSE_LONG,
             # Uniformly select trade amounts from (0, long_balance].
             trade_amount=abs(self.rng.uniform(-long.balance, 0)),
-            mint_time=mint_time,
+            mint_block=mint_block,
         )
 
 
@@ -104,6 +104,11 @@ def get_argparser() -> argparse.ArgumentParser:
         default=elfpy.DEFAULT_LOG_MAXBYTES,
         type=int,
     )
+    parser.add_argument(
+        "--queue_logs",
+        help="Write the logs from a background thread, so the simulation does not wait on them.",
+        action="store_true",
+    )
     parser.add_argument(
         "--log_level",
         help='Logging level, should be in ["DEBUG", "INFO", "WARNING"]. Default uses the config.',
@@ -143,6 +148,7 @@ if __name__ == "__main__":
         log_filename=args.output,
         max_bytes=args.max_bytes,
         log_level=config_utils.text_to_logging_level(config.simulator.logging_level),
+        use_queue=args.queue_logs,
     )
 
     # Initialize the simulator.
@@ -13,6 +13,8 @@ DEFAULT_LOG_LEVEL = logging.INFO
 DEFAULT_LOG_FORMATTER = "\n%(asctime)s: %(levelname)s: %(module)s.%(funcName)s:\n%(message)s"
 DEFAULT_LOG_DATETIME = "%y-%m-%d %H:%M:%S"
 DEFAULT_LOG_MAXBYTES = int(2e6)  # 2MB
+DEFAULT_LOG_QUEUE_SIZE = 10_000  # records waiting for the background writer, when logs are queued
+DEFAULT_LOG_BATCH_SIZE = 100  # records per file write, when logs are queued
 
 # Plotting defaults
 BLACK = "black"
@@ -1,13 +1,16 @@
 """Implements abstract classes that control agent behavior"""
 from __future__ import annotations  # types will be strings by default in 3.11
 
-from typing import TYPE_CHECKING, Iterable
+from typing import TYPE_CHECKING, Iterable, Optional
 import logging
 
 import numpy as np
 
 from elfpy.wallet import Long, Short, Wallet
+from elfpy.wallet_registry import WalletView
 from elfpy.types import MarketAction, MarketActionType, Quantity, TokenType
+from elfpy.utils.solvers import find_max_feasible
+from elfpy.utils.trace import WalletDeltaEvent
 
 if TYPE_CHECKING:
     from elfpy.markets import Market
@@ -34,7 +37,8 @@ class Agent:
     product_of_time_and_base : float
         Helper attribute used to track how an agent spends their assets over time
     wallet : elfpy.wallet.Wallet
-        Wallet object which tracks the agent's asset balances
+        Wallet object which tracks the agent's asset balances; when the simulator stores wallets in a
+        WalletRegistry, this is replaced by an elfpy.wallet_registry.WalletView with the same attributes
     """
 
     def __init__(self, wallet_address: int, budget: float):
@@ -46,7 +50,7 @@ class Agent:
         self.name = str(self).split(" ", maxsplit=1)[0][len("<elfpy.policies.") : -len(".Policy")]
 
     def create_agent_action(
-        self, action_type: MarketActionType, trade_amount: float, mint_time: float = 0, open_share_price=0.0
+        self, action_type: MarketActionType, trade_amount: float, mint_block: int = 0, open_share_price=0.0
     ) -> MarketAction:
         r"""Creates and returns a MarketAction object which represents a trade that this agent can make
 
@@ -56,8 +60,8 @@ class Agent:
             Type of action this function will execute. Must be one of the supported MarketActionTypes
         trade_amount : float
             Amount of assets that the agent will trade
-        mint_time : float
-            Time relative to the market at which the tokens relevant to this trade were minted, in yearfracs
+        mint_block : int
+            Market block number at which the tokens relevant to this trade were minted
 
         Returns
         -------
@@ -70,7 +74,7 @@ class Agent:
             trade_amount=trade_amount,
             # next two variables are set automatically by the basic agent class
             wallet_address=self.wallet.address,
-            mint_time=mint_time,
+            mint_block=mint_block,
             open_share_price=open_share_price,
         )
         return agent_action
@@ -92,6 +96,28 @@ class Agent:
         """
         raise NotImplementedError
 
+    def get_next_wakeup_time(self, market: Market) -> float | None:
+        r"""Returns the earliest market time at which the policy might want to act
+
+        Used by the simulator when `skip_idle_blocks` is enabled to fast-forward over blocks where no agent acts.
+        The simulator asks again after every block where trades were collected and after every daily vault update,
+        so a policy only needs to describe what it will do while the market state and its wallet are unchanged.
+        Waking up too early is always safe; waking up too late changes the simulation results.
+
+        Parameters
+        ----------
+        market : Market
+            The market on which this agent will be executing trades (MarketActions)
+
+        Returns
+        -------
+        float | None
+            Market time, in yearfracs, of the next block where `action` could return trades.
+            None indicates that the agent will not act until the market state or its wallet changes.
+            The default returns the current market time, i.e. the agent is consulted every block.
+        """
+        return market.time
+
     def get_max_long(self, market: Market) -> float:
         """Gets an approximation of the maximum amount of base the agent can use
 
@@ -107,10 +133,7 @@ class Agent:
         float
             Maximum amount the agent can use to open a long
         """
-        (max_long, _) = market.pricing_model.get_max_long(
-            market_state=market.market_state,
-            time_remaining=market.position_duration,
-        )
+        (max_long, _) = market.get_max_long()
         return min(
             self.wallet.base,
             max_long,
@@ -130,37 +153,31 @@ class Agent:
             Amount of base that the agent can short in the current market
         """
         # Get the market level max short.
-        (max_short_max_loss, max_short) = market.pricing_model.get_max_short(
-            market_state=market.market_state,
-            time_remaining=market.position_duration,
-        )
+        (max_short_max_loss, max_short) = market.get_max_short()
         # If the Agent's base balance can cover the max loss of the maximum
         # short, we can simply return the maximum short.
         if self.wallet.base >= max_short_max_loss:
             return max_short
-        last_maybe_max_short = 0
-        bond_percent = 1
-        num_iters = 25
-        for step_size in [1 / (2 ** (x + 1)) for x in range(num_iters)]:
+        if max_short <= 0:
+            return 0
+
+        def max_loss_slack(bond_percent: float) -> tuple[Optional[float], float]:
             # Compute the amount of base returned by selling the specified
-            # amount of bonds.
+            # amount of bonds. The short is affordable if its max loss is
+            # covered by the wallet's base.
             maybe_max_short = max_short * bond_percent
-            trade_result = market.pricing_model.calc_out_given_in(
-                in_=Quantity(amount=maybe_max_short, unit=TokenType.PT),
-                market_state=market.market_state,
-                time_remaining=market.position_duration,
-            )
-            # If the max loss is greater than the wallet's base, we need to
-            # decrease the bond percentage. Otherwise, we may have found the
-            # max short, and we should increase the bond percentage.
+            try:
+                trade_result = market.pricing_model.calc_out_given_in(
+                    in_=Quantity(amount=maybe_max_short, unit=TokenType.PT),
+                    market_state=market.market_state,
+                    time_remaining=market.position_duration,
+                )
+            except (ArithmeticError, AssertionError):
+                return None, maybe_max_short
             max_loss = maybe_max_short - trade_result.user_result.d_base
-            if max_loss > self.wallet.base:
-                bond_percent -= step_size
-            else:
-                last_maybe_max_short = maybe_max_short
-                if bond_percent == 1:
-                    return last_maybe_max_short
-                bond_percent += step_size
+            return (self.wallet.base - max_loss) / max_short, maybe_max_short
+
+        _, last_maybe_max_short = find_max_feasible(max_loss_slack, default_payload=0)
         return last_maybe_max_short
 
     def get_trades(self, market: Market) -> list:
@@ -189,8 +206,8 @@ class Agent:
         """
         actions = self.action(market)  # get the action list from the policy
         for action in actions:  # edit each action in place
-            if action.mint_time is None:
-                action.mint_time = market.time
+            if action.mint_block is None:
+                action.mint_block = market.block_number
         # TODO: Add safety checks
         # e.g. if trade amount > 0, whether there is enough money in the account
         # agent wallet Long and Short balances should not be able to be negative
@@ -214,6 +231,11 @@ class Agent:
         new_spend = (market.time - self.last_update_spend) * (self.budget - self.wallet["base"])
         self.product_of_time_and_base += new_spend
         self.last_update_spend = market.time
+        if market.trace.enabled:
+            market.trace.record(WalletDeltaEvent.from_deltas(market.block_number, self.wallet.address, wallet_deltas))
+        if isinstance(self.wallet, WalletView):
+            self.wallet.registry.apply_deltas(self.wallet.index, wallet_deltas)
+            return
         for key, value_or_dict in wallet_deltas.__dict__.items():
             if value_or_dict is None:
                 continue
@@ -221,16 +243,8 @@ class Agent:
                 continue
             # handle updating a value
             if key in ["base", "lp_tokens", "fees_paid"]:
-                logging.debug(
-                    "agent #%g %s pre-trade = %.0g\npost-trade = %1g\ndelta = %1g",
-                    self.wallet.address,
-                    key,
-                    self.wallet[key],
-                    self.wallet[key] + value_or_dict,
-                    value_or_dict,
-                )
                 self.wallet[key] += value_or_dict
-            # handle updating a dict, which have mint_time attached
+            # handle updating a dict, which have mint_block attached
             elif key == "longs":
                 self._update_longs(value_or_dict.items())
             elif key == "shorts":
@@ -238,69 +252,55 @@ class Agent:
             else:
                 raise ValueError(f"wallet_key={key} is not allowed.")
 
-    def _update_longs(self, longs: Iterable[tuple[float, Long]]) -> None:
+    def _update_longs(self, longs: Iterable[tuple[int, Long]]) -> None:
         """Helper internal function that updates the data about Longs contained in the Agent's Wallet object
 
         Parameters
         ----------
-        shorts : Iterable[tuple[float, Short]]
+        shorts : Iterable[tuple[int, Short]]
             A list (or other Iterable type) of tuples that contain a Long object
-            and its market-relative mint time
+            and its mint block
         """
-        for mint_time, long in longs:
+        for mint_block, long in longs:
             if long.balance != 0:
-                logging.debug(
-                    "agent #%g trade longs, mint_time = %g\npre-trade amount = %s\ntrade delta = %s",
-                    self.wallet.address,
-                    mint_time,
-                    self.wallet.longs,
-                    long,
-                )
-                if mint_time in self.wallet.longs:  #  entry already exists for this mint_time, so add to it
-                    self.wallet.longs[mint_time].balance += long.balance
+                if mint_block in self.wallet.longs:  #  entry already exists for this mint_block, so add to it
+                    self.wallet.longs[mint_block].balance += long.balance
                 else:
-                    self.wallet.longs.update({mint_time: long})
-            if self.wallet.longs[mint_time].balance == 0:
+                    self.wallet.longs.update({mint_block: long})
+            if self.wallet.longs[mint_block].balance == 0:
                 # Remove the empty long from the wallet.
-                del self.wallet.longs[mint_time]
+                del self.wallet.longs[mint_block]
 
-    def _update_shorts(self, shorts: Iterable[tuple[float, Short]]) -> None:
+    def _update_shorts(self, shorts: Iterable[tuple[int, Short]]) -> None:
         """Helper internal function that updates the data about Shortscontained in the Agent's Wallet object
 
         Parameters
         ----------
-        shorts : Iterable[tuple[float, Short]]
+        shorts : Iterable[tuple[int, Short]]
             A list (or other Iterable type) of tuples that contain a Short object
-            and its market-relative mint time
+            and its mint block
         """
-        for mint_time, short in shorts:
+        for mint_block, short in shorts:
             if short.balance != 0:
-                logging.debug(
-                    "agent #%g trade shorts, mint_time = %g\npre-trade amount = %s\ntrade delta = %s",
-                    self.wallet.address,
-                    mint_time,
-                    self.wallet.shorts,
-                    short,
-                )
-                if mint_time in self.wallet.shorts:  #  entry already exists for this mint_time, so add to it
-                    self.wallet.shorts[mint_time].balance += short.balance
+                if mint_block in self.wallet.shorts:  #  entry already exists for this mint_block, so add to it
+                    self.wallet.shorts[mint_block].balance += short.balance
 
-                    old_balance = self.wallet.shorts[mint_time].balance
-                    old_share_price = self.wallet.shorts[mint_time].open_share_price
+                    old_balance = self.wallet.shorts[mint_block].balance
+                    old_share_price = self.wallet.shorts[mint_block].open_share_price
 
                     # if the balance is positive, we are opening a short, therefore do a weighted
                     # mean for the open share price.  this covers an edge case where two shorts are
                     # opened for the same account in the same block.  if the balance is negative, we
                     # don't want to update the open_short_price
                     if short.balance > 0:
-                        self.wallet.shorts[mint_time].open_share_price = (
+                        self.wallet.shorts[mint_block].open_share_price = (
                             short.open_share_price * short.balance + old_share_price * old_balance
                         ) / (short.balance + old_balance)
                 else:
-                    self.wallet.shorts.update({mint_time: short})
-            if self.wallet.shorts[mint_time].balance == 0:
+                    self.wallet.shorts.update({mint_block: short})
+            if self.wallet.shorts[mint_block].balance == 0:
                 # Remove the empty short from the wallet.
-                del self.wallet.shorts[mint_time]
+                del self.wallet.shorts[mint_block]
 
     def get_liquidation_trades(self, market: Market) -> list[MarketAction]:
         """Get final trades for liquidating positions
@@ -316,34 +316,36 @@ class Agent:
             List of trades to execute in order to liquidate positions where applicable
         """
         action_list: list[MarketAction] = []
-        for mint_time, long in self.wallet.longs.items():
-            logging.debug("evaluating closing long: mint_time=%g, position=%s", mint_time, long)
+        for mint_block, long in self.wallet.longs.items():
+            logging.debug("evaluating closing long: mint_block=%d, position=%s", mint_block, long)
             if long.balance > 0:
                 action_list.append(
                     self.create_agent_action(
                         action_type=MarketActionType.CLOSE_LONG,
                         trade_amount=long.balance,
-                        mint_time=mint_time,
+                        mint_block=mint_block,
                     )
                 )
-        for mint_time, short in self.wallet.shorts.items():
-            logging.debug("evaluating closing short: mint_time=%g, position=%s", mint_time, short)
+        for mint_block, short in self.wallet.shorts.items():
+            logging.debug("evaluating closing short: mint_block=%d, position=%s", mint_block, short)
             if short.balance > 0:
                 action_list.append(
                     self.create_agent_action(
                         action_type=MarketActionType.CLOSE_SHORT,
                         trade_amount=short.balance,
-                        mint_time=mint_time,
+                        mint_block=mint_block,
                         open_share_price=short.open_share_price,
                     )
                 )
         if self.wallet.lp_tokens > 0:
-            logging.debug("evaluating closing lp: mint_time=%g, position=%s", market.time, self.wallet.lp_tokens)
+            logging.debug(
+                "evaluating closing lp: mint_block=%d, position=%s", market.block_number, self.wallet.lp_tokens
+            )
             action_list.append(
                 self.create_agent_action(
                     action_type=MarketActionType.REMOVE_LIQUIDITY,
                     trade_amount=self.wallet.lp_tokens,
-                    mint_time=market.time,
+                    mint_block=market.block_number,
                 )
             )
         return action_list
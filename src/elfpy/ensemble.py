@@ -0,0 +1,1125 @@
+"""Ensembles of structurally identical simulations, advanced in lockstep
+
+Monte Carlo studies run many simulations that only differ in their random draws (seeds, target APRs, vault APR
+paths). An EnsembleSimulator holds R such simulations. Instead of running them one after another, it stacks their
+markets into an EnsembleMarket, whose MarketState fields are arrays over the R runs, and advances every run together
+block by block. The agents at each wallet address are replaced by an EnsemblePolicy, which computes the actions of
+that agent in every run with NumPy operations, and each action is executed in all runs at once with the batch
+pricing functions. The cost of a block is then a few array operations per agent, instead of R Python loops.
+
+Lockstep execution requires that every agent follows a policy with a vectorized counterpart in ENSEMBLE_POLICIES,
+and that the simulations are structurally identical (same agents, clock, and position duration). Otherwise, or for
+features that are not vectorized, the ensemble falls back to running each simulator on the normal path; see
+EnsembleSimulator.fallback_reason. The final day, which ends with the liquidation of every position, is always run on
+the normal path, after the lockstep state has been written back into the simulators.
+
+Trades are computed with float64 arithmetic, like elfpy.valuation and elfpy.settlement, so the results agree with
+simulations run at 64 bits of precision to within rounding error; runs at Decimal precision fall back to the normal
+path. The input and output checks of the pricing model are run on the trades of each run that its validation_level
+selects, as on the normal path, so a trade that the reserves of a run cannot support raises an AssertionError. Where
+the checks are skipped, such a trade evaluates to NaN, and it is skipped in that run with a warning.
+
+At the end of each lockstep day, the state of every run is written back into its simulator, which records a
+simulation_state row if the run traded that day. Since the trades of a lockstep day are not executed one at a time,
+lockstep days are recorded once per day whatever the record_cadence.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+from numpy.random import Generator
+
+import elfpy.utils.price as price_utils
+import elfpy.utils.time as time_utils
+from elfpy.policies import init_lp, no_action, single_long, single_short
+from elfpy.simulators import VOLUME_ACTION_TYPES
+from elfpy.types import (
+    MAX_RESERVES_DIFFERENCE,
+    WEI,
+    MarketActionType,
+    MarketDeltas,
+    MarketState,
+    StretchedTime,
+    TokenType,
+    ValidationLevel,
+)
+from elfpy.utils import sweep
+from elfpy.wallet import Long, Short, Wallet
+
+if TYPE_CHECKING:
+    from elfpy.agent import Agent
+    from elfpy.markets import Market
+    from elfpy.simulators import Simulator
+    from elfpy.utils.config import Config
+
+# pylint: disable=too-many-lines
+
+# market state fields recorded at the end of each lockstep day
+RECORDED_MARKET_STATE_KEYS = (
+    "share_reserves",
+    "bond_reserves",
+    "base_buffer",
+    "bond_buffer",
+    "lp_reserves",
+    "vault_apr",
+    "share_price",
+)
+
+
+@dataclass
+class EnsembleAction:
+    r"""A trade of one agent in every run of an ensemble, the vectorized counterpart of a MarketAction
+
+    Parameters
+    ----------
+    action_type : MarketActionType
+        The type of the trade
+    trade_amounts : np.ndarray
+        The amount traded in each run, in the units used by the matching Market method
+    is_trading : np.ndarray
+        Boolean mask of the runs in which the agent makes the trade
+    mint_blocks : Optional[np.ndarray]
+        The mint block of the position closed in each run; only used by closing trades
+    """
+
+    action_type: MarketActionType
+    trade_amounts: np.ndarray
+    is_trading: np.ndarray
+    mint_blocks: Optional[np.ndarray] = None
+
+
+class EnsembleMarket:
+    r"""The markets of every run of an ensemble, whose state fields are arrays over the runs
+
+    The markets must share a block clock, pricing model, and position duration; the time stretch, reserves, fees,
+    and share price path of each run can differ.
+
+    Parameters
+    ----------
+    markets : Sequence[Market]
+        The market of each run
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, markets: Sequence[Market]):
+        first_market = markets[0]
+        self.num_runs = len(markets)
+        self.pricing_model = first_market.pricing_model
+        self.block_number: int = first_market.block_number
+        self.blocks_per_year: int = first_market.blocks_per_year
+        self.market_state = MarketState(
+            **{
+                key: np.array([getattr(market.market_state, key) for market in markets], dtype=np.float64)
+                for key in first_market.market_state.__dict__
+            }
+        )
+        self.time_stretch = np.array([market.position_duration.time_stretch for market in markets], dtype=np.float64)
+        self.position_duration = first_market.position_duration
+        # days and normalized time remaining do not depend on the time stretch, so the runs share one table
+        self.time_remaining_table = first_market.time_remaining_table
+        self.share_prices = np.stack([market.share_price_path.prices for market in markets])
+        self.blocks_per_share_price_step = first_market.share_price_path.blocks_per_step
+        # the validation settings of each run's pricing model; see sample_validation
+        pricing_models = [market.pricing_model for market in markets]
+        self.validation_levels = np.array([pricing_model.validation_level.value for pricing_model in pricing_models])
+        self.validation_intervals = np.array([pricing_model.validation_interval for pricing_model in pricing_models])
+        self.num_sampled_trades = np.array([pricing_model.num_sampled_trades for pricing_model in pricing_models])
+        self.is_validating = np.zeros(self.num_runs, dtype=bool)
+
+    @property
+    def time(self) -> float:
+        """Returns the market time, in years since the market was initialized"""
+        return self.block_number / self.blocks_per_year
+
+    def blocks_to_years(self, num_blocks: np.ndarray) -> np.ndarray:
+        r"""Converts an array of block numbers into years, as Market.blocks_to_years"""
+        return num_blocks / self.blocks_per_year
+
+    def tick(self) -> None:
+        """Advances the block clock of every run by one block"""
+        self.block_number += 1
+
+    def apply_share_price(self) -> None:
+        r"""Set the share price of each run to its value at the current block in the run's share price path"""
+        index = min(self.block_number // self.blocks_per_share_price_step, self.share_prices.shape[1] - 1)
+        self.market_state.share_price = self.share_prices[:, index].copy()
+
+    def get_market_state(self, runs: np.ndarray) -> MarketState:
+        r"""Returns a copy of the market state of the given runs
+
+        Parameters
+        ----------
+        runs : np.ndarray
+            Indices of the runs
+
+        Returns
+        -------
+        MarketState
+            The state, with array fields that only contain the given runs
+        """
+        return MarketState(**{key: value[runs] for key, value in self.market_state.__dict__.items()})
+
+    def get_position_duration(self, runs: np.ndarray) -> StretchedTime:
+        r"""Returns the position duration of the given runs, whose stretched time depends on their time stretch"""
+        return StretchedTime.from_components(
+            days=self.position_duration.days,
+            normalized_time=self.position_duration.normalized_time,
+            stretched_time=time_utils.stretch_time(self.position_duration.normalized_time, self.time_stretch[runs]),
+            time_stretch=self.time_stretch[runs],
+            normalizing_constant=self.position_duration.normalizing_constant,
+        )
+
+    def get_time_remaining(self, mint_blocks: np.ndarray, runs: np.ndarray) -> StretchedTime:
+        r"""Returns the stretched time remaining on positions of the given runs, as Market.get_time_remaining
+
+        Parameters
+        ----------
+        mint_blocks : np.ndarray
+            The block number at which the position of each run was minted
+        runs : np.ndarray
+            Indices of the runs
+
+        Returns
+        -------
+        StretchedTime
+            Time remaining, with the arithmetic of the market's StretchedTimeTable
+        """
+        if np.any(mint_blocks > self.block_number):
+            raise ValueError(f"mint blocks {mint_blocks} must be at most the market block {self.block_number}")
+        table = self.time_remaining_table
+        rows = table.get_rows(self.block_number - mint_blocks)
+        normalized_time = table.normalized_time[rows]
+        return StretchedTime.from_components(
+            days=table.days[rows],
+            normalized_time=normalized_time,
+            stretched_time=time_utils.stretch_time(normalized_time, self.time_stretch[runs]),
+            time_stretch=self.time_stretch[runs],
+            normalizing_constant=self.position_duration.normalizing_constant,
+        )
+
+    def get_spot_price(self, runs: np.ndarray) -> np.ndarray:
+        r"""Returns the spot price of the given runs, or NaN for runs whose market is empty"""
+        market_state = self.get_market_state(runs)
+        spot_price = np.full(len(runs), np.nan)
+        has_reserves = market_state.share_reserves != 0
+        if np.any(has_reserves):
+            spot_price[has_reserves] = self.pricing_model.calc_spot_price_from_reserves_batch(
+                market_state=self.get_market_state(runs[has_reserves]),
+                time_remaining=self.get_position_duration(runs[has_reserves]),
+            )
+        return spot_price
+
+    def get_rate(self, runs: np.ndarray) -> np.ndarray:
+        r"""Returns the market APR of the given runs, or NaN for runs whose market is empty"""
+        market_state = self.get_market_state(runs)
+        rate = np.full(len(runs), np.nan)
+        has_reserves = market_state.share_reserves > 0
+        if np.any(has_reserves):
+            rate[has_reserves] = self.pricing_model.calc_apr_from_reserves_batch(
+                market_state=self.get_market_state(runs[has_reserves]),
+                time_remaining=self.get_position_duration(runs[has_reserves]),
+            )
+        return rate
+
+    def trade_and_update(self, wallet_address: int, action: EnsembleAction) -> tuple[np.ndarray, Wallet]:
+        r"""Execute a trade in every run where the agent makes it, as Market.trade_and_update
+
+        Parameters
+        ----------
+        wallet_address : int
+            The address of the trading agent
+        action : EnsembleAction
+            The trade
+
+        Returns
+        -------
+        tuple[np.ndarray, Wallet]
+            A boolean mask of the runs in which the trade was executed, and the agent's wallet deltas, whose values
+            are arrays over the runs that are zero where the trade was not executed
+        """
+        self.sample_validation(action.is_trading)
+        if action.action_type == MarketActionType.OPEN_LONG:
+            return self.open_long(wallet_address, action.trade_amounts, action.is_trading)
+        if action.action_type == MarketActionType.CLOSE_LONG:
+            return self.close_long(wallet_address, action.trade_amounts, action.mint_blocks, action.is_trading)
+        if action.action_type == MarketActionType.OPEN_SHORT:
+            return self.open_short(wallet_address, action.trade_amounts, action.is_trading)
+        raise ValueError(f"{action.action_type} is not supported in lockstep")
+
+    def update_market(self, runs: np.ndarray, market_deltas: MarketDeltas) -> None:
+        r"""Apply deltas to the market state of the given runs, as Market.update_market
+
+        Parameters
+        ----------
+        runs : np.ndarray
+            Indices of the runs
+        market_deltas : MarketDeltas
+            The deltas, with array fields that only contain the given runs
+        """
+        market_state = self.get_market_state(runs)
+        market_state.apply_delta(market_deltas)
+        for key, value in market_state.__dict__.items():
+            self.market_state.__dict__[key][runs] = value
+
+    def sample_validation(self, is_trading: np.ndarray) -> None:
+        r"""Decide in which runs the checks of the next trade are run, as PricingModel.sample_validation
+
+        Parameters
+        ----------
+        is_trading : np.ndarray
+            Boolean mask of the runs in which the trade is submitted
+        """
+        is_sampled = self.validation_levels == ValidationLevel.SAMPLED.value
+        is_sampled_trade = self.num_sampled_trades % self.validation_intervals == 0
+        self.is_validating = is_trading & np.where(
+            is_sampled, is_sampled_trade, self.validation_levels == ValidationLevel.FULL.value
+        )
+        self.num_sampled_trades += is_sampled & is_trading
+
+    def check_trade(self, runs: np.ndarray, trade_amounts: np.ndarray, time_remaining: StretchedTime, trade_result):
+        r"""Run the input and output checks of PricingModel on the trades of the runs that are validating
+
+        This must be called before the trades are applied to the market.
+
+        Parameters
+        ----------
+        runs : np.ndarray
+            Indices of the runs
+        trade_amounts : np.ndarray
+            The amount traded in each of the runs
+        time_remaining : StretchedTime
+            The time remaining on the traded positions, with scalar or array components
+        trade_result : TradeResult
+            The result of the trades, with array fields over the runs
+        """
+        is_checked = self.is_validating[runs]
+        if not np.any(is_checked):
+            return
+        market_state = self.get_market_state(runs[is_checked])
+        stretched_time = np.broadcast_to(time_remaining.stretched_time, runs.shape)[is_checked]
+        fee = trade_result.breakdown.fee[is_checked]
+        without_fee = trade_result.breakdown.without_fee[is_checked]
+        checks = [
+            (trade_amounts[is_checked] >= WEI, f"expected trade amounts >= {WEI}"),
+            (market_state.share_reserves >= WEI, f"expected share_reserves >= {WEI}"),
+            (
+                (market_state.bond_reserves >= WEI) | (market_state.bond_reserves == 0),
+                f"expected bond_reserves >= {WEI} or bond_reserves == 0",
+            ),
+            (
+                (market_state.share_price >= market_state.init_share_price) & (market_state.init_share_price >= 1),
+                "expected share_price >= init_share_price >= 1",
+            ),
+            (
+                np.abs(market_state.share_reserves * market_state.share_price - market_state.bond_reserves)
+                < MAX_RESERVES_DIFFERENCE,
+                f"expected reserves_difference < {MAX_RESERVES_DIFFERENCE}",
+            ),
+            (
+                (market_state.trade_fee_percent >= 0) & (market_state.trade_fee_percent <= 1),
+                "expected 1 >= trade_fee_percent >= 0",
+            ),
+            (
+                (market_state.redemption_fee_percent >= 0) & (market_state.redemption_fee_percent <= 1),
+                "expected 1 >= redemption_fee_percent >= 0",
+            ),
+            ((stretched_time < 1) & (stretched_time >= 0), "expected 1 > time_remaining.stretched_time >= 0"),
+            ((fee >= 0) & (without_fee >= 0), "expected non-negative fee and without_fee"),
+            (
+                np.isfinite(trade_result.market_result.d_base[is_checked])
+                & np.isfinite(trade_result.market_result.d_bonds[is_checked]),
+                "expected finite market deltas",
+            ),
+        ]
+        for is_valid, message in checks:
+            if not np.all(is_valid):
+                raise AssertionError(
+                    f"ensemble.EnsembleMarket.check_trade: ERROR: {message}, which fails in runs"
+                    f" {runs[is_checked][~is_valid].tolist()} at block {self.block_number}!"
+                )
+
+    def open_long(
+        self, wallet_address: int, trade_amounts: np.ndarray, is_trading: np.ndarray
+    ) -> tuple[np.ndarray, Wallet]:
+        r"""Buy bonds with base in the given runs, as Market.open_long"""
+        # open_long does not trade if the amount is larger than the bond reserves
+        runs = np.flatnonzero(is_trading & (trade_amounts <= self.market_state.bond_reserves))
+        trade_result = self.pricing_model.calc_out_given_in_batch(
+            in_amount=trade_amounts[runs],
+            in_unit=TokenType.BASE,
+            market_state=self.get_market_state(runs),
+            time_remaining=self.get_position_duration(runs),
+        )
+        self.check_trade(runs, trade_amounts[runs], self.get_position_duration(runs), trade_result)
+        runs, trade_result = self._get_executed_trades(runs, trade_result, "open_long")
+        self.update_market(
+            runs,
+            MarketDeltas(
+                d_base_asset=trade_result.market_result.d_base,
+                d_token_asset=trade_result.market_result.d_bonds,
+                d_base_buffer=trade_result.user_result.d_bonds,
+            ),
+        )
+        agent_deltas = Wallet(
+            address=wallet_address,
+            base=self._scatter(runs, trade_result.user_result.d_base),
+            longs={self.block_number: Long(self._scatter(runs, trade_result.user_result.d_bonds))},
+            fees_paid=self._scatter(runs, trade_result.breakdown.fee),
+        )
+        return self._scatter(runs, True), agent_deltas
+
+    def close_long(
+        self, wallet_address: int, trade_amounts: np.ndarray, mint_blocks: np.ndarray, is_trading: np.ndarray
+    ) -> tuple[np.ndarray, Wallet]:
+        r"""Sell the bonds of longs minted at mint_blocks in the given runs, as Market.close_long"""
+        runs = np.flatnonzero(is_trading)
+        time_remaining = self.get_time_remaining(mint_blocks[runs], runs)
+        trade_result = self.pricing_model.calc_out_given_in_batch(
+            in_amount=trade_amounts[runs],
+            in_unit=TokenType.PT,
+            market_state=self.get_market_state(runs),
+            time_remaining=time_remaining,
+        )
+        self.check_trade(runs, trade_amounts[runs], time_remaining, trade_result)
+        runs, trade_result = self._get_executed_trades(runs, trade_result, "close_long")
+        self.update_market(
+            runs,
+            MarketDeltas(
+                d_base_asset=trade_result.market_result.d_base,
+                d_token_asset=trade_result.market_result.d_bonds,
+                d_base_buffer=-trade_amounts[runs],
+            ),
+        )
+        d_bonds = self._scatter(runs, trade_result.user_result.d_bonds)
+        is_executed = self._scatter(runs, True)
+        agent_deltas = Wallet(
+            address=wallet_address,
+            base=self._scatter(runs, trade_result.user_result.d_base),
+            longs={
+                int(mint_block): Long(np.where(mint_blocks == mint_block, d_bonds, 0.0))
+                for mint_block in np.unique(mint_blocks[runs])
+            },
+            fees_paid=self._scatter(runs, trade_result.breakdown.fee),
+        )
+        return is_executed, agent_deltas
+
+    def open_short(
+        self, wallet_address: int, trade_amounts: np.ndarray, is_trading: np.ndarray
+    ) -> tuple[np.ndarray, Wallet]:
+        r"""Sell bonds in the given runs, depositing the maximum loss, as Market.open_short"""
+        runs = np.flatnonzero(is_trading)
+        trade_result = self.pricing_model.calc_out_given_in_batch(
+            in_amount=trade_amounts[runs],
+            in_unit=TokenType.PT,
+            market_state=self.get_market_state(runs),
+            time_remaining=self.get_position_duration(runs),
+        )
+        self.check_trade(runs, trade_amounts[runs], self.get_position_duration(runs), trade_result)
+        runs, trade_result = self._get_executed_trades(runs, trade_result, "open_short")
+        self.update_market(
+            runs,
+            MarketDeltas(
+                d_base_asset=trade_result.market_result.d_base,
+                d_token_asset=trade_result.market_result.d_bonds,
+                d_bond_buffer=trade_amounts[runs],
+            ),
+        )
+        max_loss = trade_amounts[runs] - trade_result.user_result.d_base
+        agent_deltas = Wallet(
+            address=wallet_address,
+            base=self._scatter(runs, -max_loss),
+            shorts={
+                self.block_number: Short(
+                    balance=self._scatter(runs, trade_amounts[runs]),
+                    open_share_price=self._scatter(runs, self.market_state.share_price[runs]),
+                )
+            },
+            fees_paid=self._scatter(runs, trade_result.breakdown.fee),
+        )
+        return self._scatter(runs, True), agent_deltas
+
+    def _get_executed_trades(self, runs: np.ndarray, trade_result, trade_name: str):
+        r"""Drop the runs whose trade evaluated to NaN, and log them"""
+        is_executed = np.isfinite(trade_result.user_result.d_base) & np.isfinite(trade_result.market_result.d_base)
+        if not np.all(is_executed):
+            logging.warning(
+                "ensemble.EnsembleMarket.%s: WARNING: the reserves of runs %s could not support the trade at block %d",
+                trade_name,
+                runs[~is_executed].tolist(),
+                self.block_number,
+            )
+            trade_result = type(trade_result)(
+                **{
+                    name: type(component)(**{key: value[is_executed] for key, value in component.__dict__.items()})
+                    for name, component in trade_result.__dict__.items()
+                }
+            )
+        return runs[is_executed], trade_result
+
+    def _scatter(self, runs: np.ndarray, values) -> np.ndarray:
+        r"""Returns an array over every run with the values at the given runs, and zero (or False) elsewhere"""
+        array = np.zeros(self.num_runs, dtype=np.asarray(values).dtype)
+        array[runs] = values
+        return array
+
+
+class EnsemblePolicy(ABC):
+    r"""The agents at one wallet address in every run of an ensemble, whose actions are computed together
+
+    The wallet holds arrays over the runs: base, lp_tokens, and fees_paid are arrays, and each long or short
+    is keyed by mint block and holds the balance of every run, which is zero in runs without that position.
+
+    Parameters
+    ----------
+    agents : Sequence[Agent]
+        The agent of each run, in run order; all of them follow the policy that this class vectorizes
+    """
+
+    def __init__(self, agents: Sequence[Agent]):
+        self.agents = list(agents)
+        self.address: int = self.agents[0].wallet.address
+        self.budget = np.array([agent.budget for agent in self.agents], dtype=np.float64)
+        self.last_update_spend = np.array([agent.last_update_spend for agent in self.agents], dtype=np.float64)
+        self.product_of_time_and_base = np.array(
+            [agent.product_of_time_and_base for agent in self.agents], dtype=np.float64
+        )
+        wallets = [agent.wallet for agent in self.agents]
+        long_mint_blocks = sorted({mint_block for wallet in wallets for mint_block in wallet.longs})
+        short_mint_blocks = sorted({mint_block for wallet in wallets for mint_block in wallet.shorts})
+        empty_short = Short(balance=0.0, open_share_price=0.0)
+        self.wallet = Wallet(
+            address=self.address,
+            base=np.array([wallet.base for wallet in wallets], dtype=np.float64),
+            lp_tokens=np.array([wallet.lp_tokens for wallet in wallets], dtype=np.float64),
+            longs={
+                mint_block: Long(np.array([wallet.longs.get(mint_block, Long(0.0)).balance for wallet in wallets]))
+                for mint_block in long_mint_blocks
+            },
+            shorts={
+                mint_block: Short(
+                    balance=np.array([wallet.shorts.get(mint_block, empty_short).balance for wallet in wallets]),
+                    open_share_price=np.array(
+                        [wallet.shorts.get(mint_block, empty_short).open_share_price for wallet in wallets]
+                    ),
+                )
+                for mint_block in short_mint_blocks
+            },
+            fees_paid=np.array([wallet.fees_paid for wallet in wallets], dtype=np.float64),
+        )
+
+    @classmethod
+    def get_unsupported_reason(cls, agents: Sequence[Agent]) -> Optional[str]:
+        r"""Returns why the agents cannot be run in lockstep, or None if they can
+
+        Parameters
+        ----------
+        agents : Sequence[Agent]
+            The agent of each run
+
+        Returns
+        -------
+        Optional[str]
+            A description of the unsupported state, or None
+        """
+        # pylint: disable=unused-argument
+        return None
+
+    @abstractmethod
+    def get_actions(self, market: EnsembleMarket, is_acting: np.ndarray) -> list[EnsembleAction]:
+        r"""Returns the trades of the agent in every run where it acts, as Agent.action
+
+        Parameters
+        ----------
+        market : EnsembleMarket
+            The markets of the ensemble
+        is_acting : np.ndarray
+            Boolean mask of the runs in which the agent acts in this turn
+
+        Returns
+        -------
+        list[EnsembleAction]
+            The trades, which are executed in order
+        """
+        raise NotImplementedError
+
+    def update_wallet(self, wallet_deltas: Wallet, is_executed: np.ndarray, market: EnsembleMarket) -> None:
+        r"""Apply the deltas of an executed trade to the wallet of every run, as Agent.update_wallet
+
+        Parameters
+        ----------
+        wallet_deltas : Wallet
+            The deltas, with arrays over the runs
+        is_executed : np.ndarray
+            Boolean mask of the runs in which the trade was executed
+        market : EnsembleMarket
+            The markets of the ensemble
+        """
+        new_spend = (market.time - self.last_update_spend) * (self.budget - self.wallet.base)
+        self.product_of_time_and_base += np.where(is_executed, new_spend, 0.0)
+        self.last_update_spend = np.where(is_executed, market.time, self.last_update_spend)
+        # as in Agent.update_wallet, fees_paid is not accumulated in the wallet
+        self.wallet.base = self.wallet.base + wallet_deltas.base
+        self.wallet.lp_tokens = self.wallet.lp_tokens + wallet_deltas.lp_tokens
+        for mint_block, long in wallet_deltas.longs.items():
+            if mint_block in self.wallet.longs:
+                self.wallet.longs[mint_block].balance = self.wallet.longs[mint_block].balance + long.balance
+            else:
+                self.wallet.longs[mint_block] = Long(long.balance)
+            if not np.any(self.wallet.longs[mint_block].balance):
+                del self.wallet.longs[mint_block]
+        for mint_block, short in wallet_deltas.shorts.items():
+            if mint_block in self.wallet.shorts:
+                existing = self.wallet.shorts[mint_block]
+                is_held = existing.balance != 0
+                balance = existing.balance + short.balance
+                # same weighting of the open share price as Agent._update_shorts, which uses the updated balance
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    averaged_share_price = (
+                        short.open_share_price * short.balance + existing.open_share_price * balance
+                    ) / (short.balance + balance)
+                open_share_price = np.where(
+                    is_held,
+                    np.where(short.balance > 0, averaged_share_price, existing.open_share_price),
+                    np.where(short.balance != 0, short.open_share_price, existing.open_share_price),
+                )
+                self.wallet.shorts[mint_block] = Short(balance=balance, open_share_price=open_share_price)
+            else:
+                self.wallet.shorts[mint_block] = Short(balance=short.balance, open_share_price=short.open_share_price)
+            if not np.any(self.wallet.shorts[mint_block].balance):
+                del self.wallet.shorts[mint_block]
+
+    def write_back(self) -> None:
+        r"""Copy the wallet and spend tracking of each run back into the run's agent"""
+        for run, agent in enumerate(self.agents):
+            agent.budget = float(self.budget[run])
+            agent.last_update_spend = float(self.last_update_spend[run])
+            agent.product_of_time_and_base = float(self.product_of_time_and_base[run])
+            agent.wallet.base = float(self.wallet.base[run])
+            agent.wallet.lp_tokens = float(self.wallet.lp_tokens[run])
+            agent.wallet.fees_paid = float(self.wallet.fees_paid[run])
+            agent.wallet.longs = {
+                mint_block: Long(float(long.balance[run]))
+                for mint_block, long in self.wallet.longs.items()
+                if long.balance[run] != 0
+            }
+            agent.wallet.shorts = {
+                mint_block: Short(float(short.balance[run]), float(short.open_share_price[run]))
+                for mint_block, short in self.wallet.shorts.items()
+                if short.balance[run] != 0
+            }
+
+
+class NoActionEnsemble(EnsemblePolicy):
+    r"""Agents that never trade, e.g. elfpy.policies.no_action"""
+
+    def get_actions(self, market, is_acting):
+        return []
+
+
+class InitLpEnsemble(NoActionEnsemble):
+    r"""The initial LP of every run, which does not trade once it has provided liquidity"""
+
+    @classmethod
+    def get_unsupported_reason(cls, agents):
+        if any(agent.wallet.lp_tokens <= 0 for agent in agents):
+            return "the initial LP has not provided liquidity in every run"
+        return None
+
+
+class SingleLongEnsemble(EnsemblePolicy):
+    r"""elfpy.policies.single_long agents, which open a long and close it after a quarter year"""
+
+    holding_period = 0.25  # in years, as in single_long.Policy
+
+    def __init__(self, agents):
+        super().__init__(agents)
+        self.amounts_to_trade = np.array([agent.amount_to_trade for agent in self.agents], dtype=np.float64)
+
+    def get_actions(self, market, is_acting):
+        base = self.wallet.base
+        can_open_long = (base >= self.amounts_to_trade) & (market.market_state.share_reserves >= self.amounts_to_trade)
+        if self.wallet.longs:
+            mint_blocks = np.array(list(self.wallet.longs), dtype=np.int64)
+            balances = np.stack([long.balance for long in self.wallet.longs.values()])
+            has_opened_long = np.any(balances > 0, axis=0)
+            total_long_balances = np.sum(balances, axis=0)
+            # the newest long held in each run
+            last_mint_blocks = np.max(np.where(balances != 0, mint_blocks[:, np.newaxis], -1), axis=0)
+        else:
+            has_opened_long = np.zeros(market.num_runs, dtype=bool)
+            total_long_balances = np.zeros(market.num_runs)
+            last_mint_blocks = np.full(market.num_runs, -1, dtype=np.int64)
+        is_closing = (
+            is_acting
+            & has_opened_long
+            & (market.blocks_to_years(market.block_number - last_mint_blocks) > self.holding_period)
+        )
+        is_opening = is_acting & ~has_opened_long & can_open_long
+        actions = []
+        if np.any(is_closing):
+            closing_runs = np.flatnonzero(is_closing)
+            trade_amounts = np.zeros(market.num_runs)
+            # assume 1% slippage
+            trade_amounts[closing_runs] = total_long_balances[closing_runs] / (
+                market.get_spot_price(closing_runs) * 0.99
+            )
+            actions.append(
+                EnsembleAction(MarketActionType.CLOSE_LONG, trade_amounts, is_closing, mint_blocks=last_mint_blocks)
+            )
+        if np.any(is_opening):
+            actions.append(EnsembleAction(MarketActionType.OPEN_LONG, self.amounts_to_trade, is_opening))
+        return actions
+
+
+class SingleShortEnsemble(EnsemblePolicy):
+    r"""elfpy.policies.single_short agents, which open one short and hold it until liquidation
+
+    single_short.Policy opens its short if Agent.get_max_short is at least the trade amount. Since the maximum
+    short is found with a solver, this class checks directly that the short is feasible: the trade is supported by
+    the reserves, its maximum loss is covered by the wallet, and the pool has enough bonds that are not backing other
+    shorts. The two agree except within the tolerance of the solver.
+    """
+
+    def __init__(self, agents):
+        super().__init__(agents)
+        self.amounts_to_trade = np.array([agent.amount_to_trade for agent in self.agents], dtype=np.float64)
+
+    def get_actions(self, market, is_acting):
+        if self.wallet.shorts:
+            balances = np.stack([short.balance for short in self.wallet.shorts.values()])
+            has_opened_short = np.any(balances > 0, axis=0)
+        else:
+            has_opened_short = np.zeros(market.num_runs, dtype=bool)
+        runs = np.flatnonzero(is_acting & ~has_opened_short)
+        if len(runs) == 0:
+            return []
+        market_state = market.get_market_state(runs)
+        trade_amounts = self.amounts_to_trade[runs]
+        trade_result = market.pricing_model.calc_out_given_in_batch(
+            in_amount=trade_amounts,
+            in_unit=TokenType.PT,
+            market_state=market_state,
+            time_remaining=market.get_position_duration(runs),
+        )
+        max_loss = trade_amounts - trade_result.user_result.d_base
+        with np.errstate(invalid="ignore"):
+            can_open_short = (
+                np.isfinite(max_loss)
+                & (max_loss <= self.wallet.base[runs])
+                & (market_state.bond_reserves - market_state.bond_buffer >= trade_amounts)
+            )
+        if not np.any(can_open_short):
+            return []
+        is_opening = np.zeros(market.num_runs, dtype=bool)
+        is_opening[runs[can_open_short]] = True
+        return [EnsembleAction(MarketActionType.OPEN_SHORT, self.amounts_to_trade, is_opening)]
+
+
+# the vectorized counterpart of each agent policy that can be run in lockstep
+ENSEMBLE_POLICIES: dict[type, type[EnsemblePolicy]] = {
+    init_lp.Policy: InitLpEnsemble,
+    no_action.NoAction: NoActionEnsemble,
+    single_long.Policy: SingleLongEnsemble,
+    single_short.Policy: SingleShortEnsemble,
+}
+
+
+@dataclass
+class EnsembleTradeCounts:
+    r"""The trade counters of the simulators of an ensemble, as arrays over the runs"""
+
+    run_trade_number: np.ndarray
+    cumulative_volume: np.ndarray
+    cumulative_fees: np.ndarray
+    num_trades_since_record: np.ndarray
+
+    @classmethod
+    def from_simulators(cls, simulators: Sequence[Simulator]) -> EnsembleTradeCounts:
+        r"""Construct the counters from the current counters of each simulator"""
+        return cls(
+            **{
+                key: np.array([getattr(simulator, key) for simulator in simulators])
+                for key in ["run_trade_number", "cumulative_volume", "cumulative_fees", "num_trades_since_record"]
+            }
+        )
+
+    def add_trade(self, action_type: MarketActionType, is_executed: np.ndarray, agent_deltas: Wallet) -> None:
+        r"""Count a trade in the runs in which it was executed, as Simulator.accumulate_trade_metrics"""
+        self.run_trade_number += is_executed
+        self.num_trades_since_record += is_executed
+        if action_type in VOLUME_ACTION_TYPES:
+            self.cumulative_volume += np.abs(agent_deltas.base)
+        self.cumulative_fees += agent_deltas.fees_paid
+
+
+# simulator config variables that must be the same in every run to advance the runs in lockstep
+LOCKSTEP_CONFIG_KEYS = ("num_trading_days", "num_blocks_per_day", "shuffle_users", "share_price_accrual")
+
+
+class EnsembleSimulator:
+    r"""Runs structurally identical simulations together, advancing every run in lockstep when possible
+
+    Parameters
+    ----------
+    simulators : Sequence[Simulator]
+        The simulator of each run, e.g. from get_ensemble_simulator; they have completed the same number of days
+    rng : Optional[Generator]
+        The random number generator that shuffles the order of the agents of each run in lockstep.
+        Defaults to a generator spawned from the random number generator of the first simulator.
+    """
+
+    def __init__(self, simulators: Sequence[Simulator], rng: Optional[Generator] = None):
+        if len(simulators) == 0:
+            raise ValueError("an ensemble needs at least one simulator")
+        self.simulators = list(simulators)
+        self.num_runs = len(self.simulators)
+        self.config = self.simulators[0].config
+        if rng is None:
+            rng = np.random.default_rng(self.simulators[0].rng.bit_generator.seed_seq.spawn(1)[0])
+        self.rng = rng
+        # if set, the ensemble runs each simulator on the normal path, for this reason
+        self.fallback_reason: Optional[str] = self.get_fallback_reason()
+        if self.fallback_reason is not None:
+            logging.info(
+                "ensemble: running %d simulations one at a time, because %s", self.num_runs, self.fallback_reason
+            )
+        # the state of every run at the end of each day run in lockstep, as arrays over the runs
+        self.state: dict[str, list] = {}
+
+    @property
+    def is_lockstep(self) -> bool:
+        """Returns True if the runs are advanced in lockstep"""
+        return self.fallback_reason is None
+
+    def get_fallback_reason(self) -> Optional[str]:
+        r"""Returns why the runs cannot be advanced in lockstep, or None if they can
+
+        Returns
+        -------
+        Optional[str]
+            The first unsupported feature or difference between the runs that was found, or None
+        """
+        first_simulator = self.simulators[0]
+        for simulator in self.simulators:
+            unsupported_reason = get_unsupported_reason(simulator, first_simulator)
+            if unsupported_reason is not None:
+                return unsupported_reason
+        for address, agent in first_simulator.agents.items():
+            agents = [simulator.agents[address] for simulator in self.simulators]
+            if any(type(other_agent) is not type(agent) for other_agent in agents):
+                return f"agent #{address} follows different policies in different runs"
+            ensemble_policy = ENSEMBLE_POLICIES.get(type(agent))
+            if ensemble_policy is None:
+                return f"agent #{address} follows {type(agent).__module__}, which has no vectorized policy"
+            unsupported_reason = ensemble_policy.get_unsupported_reason(agents)
+            if unsupported_reason is not None:
+                return unsupported_reason
+        return None
+
+    def run_simulation(self, stop_day: Optional[int] = None) -> None:
+        r"""Run every simulation up to stop_day, as Simulator.run_simulation
+
+        In lockstep, the days before the final day are run together, and the simulators are updated with the
+        resulting market and wallet states at the end of each day. The final day, which liquidates the positions, is
+        run by each simulator. Each simulator records one simulation_state row at the end of each lockstep day in
+        which its run traded, whatever its record_cadence, and the state of every run at the end of each lockstep
+        day is also kept in self.state.
+
+        Parameters
+        ----------
+        stop_day : Optional[int]
+            If provided, the simulations are paused before this day is run. Defaults to num_trading_days.
+        """
+        num_trading_days = self.config.simulator.num_trading_days
+        if stop_day is None:
+            stop_day = num_trading_days
+        if self.is_lockstep:
+            start_day = self.simulators[0].num_completed_days
+            if not start_day <= stop_day <= num_trading_days:
+                raise ValueError(
+                    f"stop_day must be between the number of completed days = {start_day}"
+                    f" and num_trading_days = {num_trading_days}, not {stop_day}"
+                )
+            lockstep_stop_day = min(stop_day, num_trading_days - 1)
+            if start_day < lockstep_stop_day:
+                self.run_lockstep(start_day, lockstep_stop_day)
+            if lockstep_stop_day == stop_day:
+                return
+        for simulator in self.simulators:
+            simulator.run_simulation(stop_day)
+
+    def run_lockstep(self, start_day: int, stop_day: int) -> None:
+        r"""Advance every run together from start_day up to stop_day, which must be before the final day
+
+        Parameters
+        ----------
+        start_day : int
+            The first day to run, which is the number of days the simulators have completed
+        stop_day : int
+            The runs are paused before this day is run
+        """
+        num_blocks_per_day = self.config.simulator.num_blocks_per_day
+        market = EnsembleMarket([simulator.market for simulator in self.simulators])
+        policies = [
+            ENSEMBLE_POLICIES[type(agent)]([simulator.agents[address] for simulator in self.simulators])
+            for address, agent in self.simulators[0].agents.items()
+        ]
+        vault_aprs = np.array([simulator.random_variables.vault_apr for simulator in self.simulators])
+        trade_counts = EnsembleTradeCounts.from_simulators(self.simulators)
+        for simulator in self.simulators:
+            if simulator.start_time is None:
+                simulator.start_time = time_utils.current_datetime()
+        for day in range(start_day, stop_day):
+            market.market_state.vault_apr = vault_aprs[:, day].copy()
+            market.apply_share_price()
+            for daily_block_number in range(num_blocks_per_day):
+                self.run_lockstep_block(market, policies, trade_counts)
+                if daily_block_number == num_blocks_per_day - 1:
+                    self.record_day(day, market, policies, trade_counts)
+                market.tick()
+        self.write_back(market, policies, trade_counts, num_completed_days=stop_day)
+
+    def run_lockstep_block(
+        self, market: EnsembleMarket, policies: list[EnsemblePolicy], trade_counts: EnsembleTradeCounts
+    ) -> None:
+        r"""Execute the trades of every run in the current block, as Simulator.collect_and_execute_trades
+
+        Parameters
+        ----------
+        market : EnsembleMarket
+            The markets of the ensemble
+        policies : list[EnsemblePolicy]
+            The policies, in order of wallet address
+        trade_counts : EnsembleTradeCounts
+            The trade counters, which are updated in place
+        """
+        if self.config.simulator.share_price_accrual == "block":
+            market.apply_share_price()
+        # every trade is collected before any is executed
+        trades = [(policy, policy.get_actions(market, is_acting)) for policy, is_acting in self.get_turns(policies)]
+        for policy, actions in trades:
+            for action in actions:
+                is_executed, agent_deltas = market.trade_and_update(policy.address, action)
+                policy.update_wallet(agent_deltas, is_executed, market)
+                trade_counts.add_trade(action.action_type, is_executed, agent_deltas)
+
+    def write_back(
+        self,
+        market: EnsembleMarket,
+        policies: list[EnsemblePolicy],
+        trade_counts: EnsembleTradeCounts,
+        num_completed_days: int,
+    ) -> None:
+        r"""Copy the market, wallet, and trade counter state of each run back into the run's simulator
+
+        Parameters
+        ----------
+        market : EnsembleMarket
+            The markets of the ensemble
+        policies : list[EnsemblePolicy]
+            The policies, in order of wallet address
+        trade_counts : EnsembleTradeCounts
+            The trade counters
+        num_completed_days : int
+            The number of days the simulators have completed; the simulators are at the last block of the day before
+        """
+        for run, simulator in enumerate(self.simulators):
+            for key, value in market.market_state.__dict__.items():
+                setattr(simulator.market.market_state, key, float(value[run]))
+            simulator.market.block_number = market.block_number
+            simulator.market.invalidate_quotes()
+            simulator.market.pricing_model.num_sampled_trades = int(market.num_sampled_trades[run])
+            simulator.block_number = market.block_number
+            simulator.day = num_completed_days - 1
+            simulator.daily_block_number = self.config.simulator.num_blocks_per_day - 1
+            simulator.num_completed_days = num_completed_days
+            for key, values in trade_counts.__dict__.items():
+                setattr(simulator, key, values[run].item())
+        for policy in policies:
+            policy.write_back()
+
+    def get_turns(self, policies: list[EnsemblePolicy]) -> list[tuple[EnsemblePolicy, np.ndarray]]:
+        r"""Returns the order in which the agents act in a block, with the runs in which each turn applies
+
+        Without shuffle_users, every agent acts in every run in order of wallet address. With shuffle_users, each
+        run has its own random order, so at each position in the order an agent acts in the runs that put it there.
+
+        Parameters
+        ----------
+        policies : list[EnsemblePolicy]
+            The policies, in order of wallet address
+
+        Returns
+        -------
+        list[tuple[EnsemblePolicy, np.ndarray]]
+            Each turn, as the policy and a boolean mask of the runs in which it acts
+        """
+        if not self.config.simulator.shuffle_users:
+            return [(policy, np.ones(self.num_runs, dtype=bool)) for policy in policies]
+        orders = np.argsort(self.rng.random((self.num_runs, len(policies))), axis=1)
+        turns = []
+        for position in range(len(policies)):
+            for index, policy in enumerate(policies):
+                is_acting = orders[:, position] == index
+                if np.any(is_acting):
+                    turns.append((policy, is_acting))
+        return turns
+
+    def record_day(
+        self, day: int, market: EnsembleMarket, policies: list[EnsemblePolicy], trade_counts: EnsembleTradeCounts
+    ) -> None:
+        r"""Record the state of every run at the last block of a lockstep day
+
+        The state is appended to self.state, and it is written back into the simulators, which record a
+        simulation_state row if their run traded since the last row.
+
+        Parameters
+        ----------
+        day : int
+            The day that is recorded
+        market : EnsembleMarket
+            The markets of the ensemble
+        policies : list[EnsemblePolicy]
+            The policies, in order of wallet address
+        trade_counts : EnsembleTradeCounts
+            The trade counters
+        """
+        runs = np.arange(self.num_runs)
+        row = {"day": day, "block_number": market.block_number}
+        row.update({key: getattr(market.market_state, key).copy() for key in RECORDED_MARKET_STATE_KEYS})
+        row["spot_price"] = market.get_spot_price(runs)
+        row["pool_apr"] = market.get_rate(runs)
+        row["cumulative_volume"] = trade_counts.cumulative_volume.copy()
+        row["cumulative_fees"] = trade_counts.cumulative_fees.copy()
+        for policy in policies:
+            row[f"agent_{policy.address}_base"] = policy.wallet.base.copy()
+            row[f"agent_{policy.address}_lp_tokens"] = policy.wallet.lp_tokens.copy()
+        for key, value in row.items():
+            self.state.setdefault(key, []).append(value)
+        self.write_back(market, policies, trade_counts, num_completed_days=day + 1)
+        for simulator in self.simulators:
+            if simulator.num_trades_since_record > 0:
+                simulator.update_simulation_state()
+                simulator.mark_last_row_to_market()
+                simulator.flush_simulation_state()
+        trade_counts.num_trades_since_record[:] = 0
+
+    def get_state(self) -> dict[str, np.ndarray]:
+        r"""Returns the recorded lockstep state
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            "day" and "block_number" have one entry per recorded day; every other key has shape
+            (num_recorded_days, num_runs)
+        """
+        return {key: np.array(values) for key, values in self.state.items()}
+
+    def get_state_df(self) -> pd.DataFrame:
+        r"""Returns the recorded lockstep state as a dataframe with one row per run and day
+
+        Returns
+        -------
+        pd.DataFrame
+            The recorded state, with a run_number column that holds the run_number of each simulator
+        """
+        state = self.get_state()
+        if not state:
+            return pd.DataFrame()
+        num_days = len(state["day"])
+        columns = {
+            "day": np.repeat(state["day"], self.num_runs),
+            "block_number": np.repeat(state["block_number"], self.num_runs),
+            "run_number": np.tile([simulator.run_number for simulator in self.simulators], num_days),
+        }
+        columns.update({key: values.reshape(-1) for key, values in state.items() if key not in ["day", "block_number"]})
+        return pd.DataFrame(columns)
+
+
+def get_unsupported_reason(simulator: Simulator, first_simulator: Simulator) -> Optional[str]:
+    r"""Returns why a simulator cannot be advanced in lockstep with the first simulator, or None if it can
+
+    Parameters
+    ----------
+    simulator : Simulator
+        The simulator of a run
+    first_simulator : Simulator
+        The simulator of the first run, which the other runs must match
+
+    Returns
+    -------
+    Optional[str]
+        The first unsupported feature or difference from the first run that was found, or None
+    """
+    simulator_config = simulator.config.simulator
+    first_market = first_simulator.market
+    checks = [
+        (bool(simulator.populations), "agent populations are not supported"),
+        (simulator_config.settle_matured_positions, "settle_matured_positions is not supported"),
+        (simulator_config.use_wallet_registry, "use_wallet_registry is not supported"),
+        (simulator_config.record_cadence == "reservoir", "the reservoir record_cadence is not supported"),
+        (
+            not isinstance(simulator.market.share_price_path, price_utils.SharePricePath),
+            "streamed vault APRs are not supported",
+        ),
+        (simulator.market.pricing_model.backend.precision != 64, "Decimal precision is not supported"),
+    ]
+    checks += [
+        (
+            getattr(simulator_config, key) != getattr(first_simulator.config.simulator, key),
+            f"the runs have different values of {key}",
+        )
+        for key in LOCKSTEP_CONFIG_KEYS
+    ]
+    checks += [
+        (
+            simulator.market.pricing_model.model_name() != first_market.pricing_model.model_name()
+            or simulator.market.position_duration.days != first_market.position_duration.days
+            or simulator.market.position_duration.normalizing_constant
+            != first_market.position_duration.normalizing_constant,
+            "the runs have different pricing models or position durations",
+        ),
+        (
+            simulator.num_completed_days != first_simulator.num_completed_days
+            or simulator.market.block_number != first_market.block_number,
+            "the runs are at different blocks",
+        ),
+        (list(simulator.agents) != list(first_simulator.agents), "the runs have different agents"),
+    ]
+    return next((reason for is_unsupported, reason in checks if is_unsupported), None)
+
+
+def get_ensemble_simulator(
+    config: Config, num_runs: int, root_seed: Optional[int] = None, override_dict: Optional[dict] = None
+) -> EnsembleSimulator:
+    r"""Construct an ensemble of independently seeded runs of the same config, as in a sweep over seeds
+
+    The agents of each run are constructed from config.simulator.agent_policies, with wallet addresses starting at 1,
+    and each run gets its own random number generator; see elfpy.utils.sweep.
+
+    Parameters
+    ----------
+    config : Config
+        The config of every run
+    num_runs : int
+        Number of runs
+    root_seed : Optional[int]
+        Entropy for the root SeedSequence; defaults to config.simulator.random_seed
+    override_dict : Optional[dict]
+        Config overrides applied to every run
+
+    Returns
+    -------
+    EnsembleSimulator
+        The ensemble, whose simulators have been initialized but not run
+    """
+    if root_seed is None:
+        root_seed = config.simulator.random_seed
+    runs = sweep.get_sweep_runs([override_dict or {}], num_seeds=num_runs, root_seed=root_seed)
+    return EnsembleSimulator([sweep.get_sweep_member_simulator(config, run) for run in runs])
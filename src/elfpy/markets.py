@@ -1,7 +1,7 @@
 """Market simulators store state information when interfacing AMM pricing models with users."""
 from __future__ import annotations  # types will be strings by default in 3.11
 
-from typing import TYPE_CHECKING
+from typing import Any, Callable, Optional, TYPE_CHECKING
 import logging
 
 import numpy as np
@@ -11,10 +11,13 @@ from elfpy.types import (
     MarketActionType,
     MarketDeltas,
     StretchedTime,
+    StretchedTimeTable,
     Quantity,
     TokenType,
 )
+from elfpy.settlement import MaturityIndex
 from elfpy.wallet import Long, Short, Wallet
+from elfpy.utils.trace import EventTrace, MarketDeltaEvent, TradeEvent
 import elfpy.utils.time as time_utils
 import elfpy.utils.price as price_utils
 
@@ -29,8 +32,15 @@ class Market:
     Holds state variables for market simulation and executes trades.
     The Market class executes trades by updating market variables according to the given pricing model.
     It also has some helper variables for assessing pricing model values given market conditions.
+
+    Quotes derived from the market state (spot_price, rate, get_max_long, get_max_short) are cached until
+    the state version changes. The version is incremented by update_market, tick, and assigning a new
+    market_state; code that mutates market_state fields directly must call invalidate_quotes afterwards.
     """
 
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-public-methods
+
     def __init__(
         self,
         pricing_model: PricingModel,
@@ -47,12 +57,123 @@ class Market:
             redemption_fee_percent=0,
         ),
         position_duration: StretchedTime = StretchedTime(365, 1),
+        blocks_per_year: int = 365 * 7_200,
     ):
         # market state variables
-        self.time: float = 0  # t: timefrac unit is time normalized to 1 year, i.e. 0.5 = 1/2 year
+        self.state_version: int = 0  # incremented every time the market state or time changes
+        self._quote_cache: dict[str, Any] = {}  # quotes computed at the current state_version
+        # the integer block clock is the source of truth for time; year fractions are derived from it
+        self.block_number: int = 0
+        self.blocks_per_year: int = blocks_per_year
         self.pricing_model = pricing_model
         self.market_state: MarketState = market_state
         self.position_duration: StretchedTime = position_duration  # how long do positions take to mature
+        # time remaining on positions, indexed by the number of blocks since they were minted
+        self.time_remaining_table = StretchedTimeTable(position_duration, blocks_per_year)
+        # the precomputed vault share price at each block, if any; see Simulator.apply_share_price
+        self.share_price_path: Optional[price_utils.SharePricePath | price_utils.StreamingSharePricePath] = None
+        # outstanding positions by maturity block, for elfpy.settlement.settle_matured_positions
+        self.maturity_index = MaturityIndex(self.time_remaining_table.blocks_to_maturity)
+        # the most recent trades and their deltas; disabled (capacity 0) unless it is resized
+        self.trace = EventTrace()
+
+    @property
+    def time(self) -> float:
+        """Returns the market time, in years since the market was initialized (i.e. 0.5 = 1/2 year)"""
+        return self.block_number / self.blocks_per_year
+
+    def blocks_to_years(self, num_blocks: Any) -> Any:
+        r"""Converts a number of blocks, or an array of block numbers, into years
+
+        Parameters
+        ----------
+        num_blocks : Any
+            A number of blocks, or a NumPy array of them
+
+        Returns
+        -------
+        Any
+            The duration of the blocks, in years
+        """
+        return num_blocks / self.blocks_per_year
+
+    def get_years_remaining(self, mint_block: Any) -> Any:
+        r"""Returns the years remaining until positions minted at the given block(s) mature
+
+        Parameters
+        ----------
+        mint_block : Any
+            The block number at which the positions were minted, or a NumPy array of them
+
+        Returns
+        -------
+        Any
+            Years remaining until maturity, or zero for matured positions
+        """
+        return time_utils.get_years_remaining_at_block(
+            market_block=self.block_number,
+            mint_block=mint_block,
+            blocks_per_year=self.blocks_per_year,
+            position_duration_years=self.position_duration.days / 365,
+        )
+
+    def get_time_remaining(self, mint_block: Any, market_block: Any = None) -> StretchedTime:
+        r"""Returns the stretched time remaining on positions minted at the given block(s)
+
+        Parameters
+        ----------
+        mint_block : Any
+            The block number at which the positions were minted, or a NumPy array of them
+        market_block : Any
+            The block number at which time remaining is measured; defaults to the current block_number
+
+        Returns
+        -------
+        StretchedTime
+            Time remaining, looked up in the market's StretchedTimeTable
+        """
+        if market_block is None:
+            market_block = self.block_number
+        if np.any(np.asarray(mint_block) > market_block):
+            raise ValueError(
+                f"elfpy.markets.Market.get_time_remaining: ERROR: {mint_block=} must be at most {market_block=}."
+            )
+        return self.time_remaining_table.get_time_remaining(market_block - mint_block)
+
+    @property
+    def market_state(self) -> MarketState:
+        """Returns the current market state"""
+        return self._market_state
+
+    @market_state.setter
+    def market_state(self, market_state: MarketState) -> None:
+        """Replaces the market state and invalidates the cached quotes"""
+        self._market_state = market_state
+        self.invalidate_quotes()
+
+    def invalidate_quotes(self) -> None:
+        """Increments the state version, which clears the cached quotes"""
+        self.state_version += 1
+        self._quote_cache.clear()
+
+    def _get_cached_quote(self, name: str, calc_quote: Callable[[], Any]) -> Any:
+        r"""Returns a quote computed at the current state version, computing it if it is not cached
+
+        Parameters
+        ----------
+        name : str
+            Key for the quote in the cache
+        calc_quote : Callable[[], Any]
+            Computes the quote from the current market state
+
+        Returns
+        -------
+        Any
+            The output of calc_quote for the current state version
+        """
+        if name not in self._quote_cache:
+            self._quote_cache[name] = calc_quote()
+        return self._quote_cache[name]
 
     def check_action_type(self, action_type: MarketActionType, pricing_model_name: str) -> None:
         r"""Ensure that the agent action is an allowed action for this market
@@ -105,18 +226,23 @@ class Market:
 
         add_liquidity
             pricing model computes new market deltas
-            market updates its "liquidity pool" wallet, which stores each trade's mint time and user address
+            market updates its "liquidity pool" wallet, which stores each trade's mint block and user address
             LP tokens are also stored in user wallet as fungible amounts, for ease of use
 
         remove_liquidity
             market figures out how much the user has contributed (calcualtes their fee weighting)
             market resolves fees, adds this to the agent_action (optional function, to check AMM logic)
             pricing model computes new market deltas
-            market updates its "liquidity pool" wallet, which stores each trade's mint time and user address
+            market updates its "liquidity pool" wallet, which stores each trade's mint block and user address
             LP tokens are also stored in user wallet as fungible amounts, for ease of use
         """
         # TODO: add use of the Quantity type to enforce units while making it clear what units are being used
         self.check_action_type(agent_action.action_type, self.pricing_model.model_name())
+        # decide once per trade whether its checks are run, according to the pricing model's validation level
+        self.pricing_model.sample_validation()
+        # the trade is recorded before it is executed, so that the trace ends with a trade that fails
+        if self.trace.enabled:
+            self.trace.record(TradeEvent.from_action(self.block_number, agent_action, self.market_state))
         # for each position, specify how to forumulate trade and then execute
         # TODO:
         # if agent_action.action_type == MarketActionType.INITIALIZE_MARKET:
@@ -136,7 +262,7 @@ class Market:
             market_deltas, agent_deltas = self.close_long(
                 wallet_address=agent_action.wallet_address,
                 trade_amount=agent_action.trade_amount,  # in bonds: that's the thing in your wallet you want to sell
-                mint_time=agent_action.mint_time,
+                mint_block=agent_action.mint_block,
             )
         elif agent_action.action_type == MarketActionType.OPEN_SHORT:  # sell PT to open short
             market_deltas, agent_deltas = self.open_short(
@@ -147,7 +273,7 @@ class Market:
             market_deltas, agent_deltas = self.close_short(
                 wallet_address=agent_action.wallet_address,
                 trade_amount=agent_action.trade_amount,  # in bonds: that's the thing you owe, and need to buy back
-                mint_time=agent_action.mint_time,
+                mint_block=agent_action.mint_block,
                 open_share_price=agent_action.open_share_price,
             )
         elif agent_action.action_type == MarketActionType.ADD_LIQUIDITY:
@@ -162,13 +288,12 @@ class Market:
             )
         else:
             raise ValueError(f'ERROR: Unknown trade type "{agent_action.action_type}".')
-        logging.debug(
-            "%s\n%s\nagent_deltas = %s\npre_trade_market = %s",
-            agent_action,
-            market_deltas,
-            agent_deltas,
-            self.market_state,
-        )
+        if agent_deltas.longs and agent_action.action_type == MarketActionType.OPEN_LONG:
+            self.maturity_index.add(agent_action.wallet_address, "long", self.block_number)
+        if agent_deltas.shorts and agent_action.action_type == MarketActionType.OPEN_SHORT:
+            self.maturity_index.add(agent_action.wallet_address, "short", self.block_number)
+        if self.trace.enabled:
+            self.trace.record(MarketDeltaEvent.from_deltas(self.block_number, agent_action, market_deltas))
         self.update_market(market_deltas)
         return agent_deltas
 
@@ -179,14 +304,20 @@ class Market:
         .. todo:: This order is weird. We should move everything in apply_update to update_market,
             and then make a new function called check_update that runs these checks
         """
-        for key, value in market_deltas.__dict__.items():
-            if value:  # check that it's instantiated and non-empty
-                assert np.isfinite(value), f"markets.update_market: ERROR: market delta key {key} is not finite."
+        if self.pricing_model.is_validating:
+            for key, value in market_deltas.__dict__.items():
+                if value:  # check that it's instantiated and non-empty
+                    assert np.isfinite(value), f"markets.update_market: ERROR: market delta key {key} is not finite."
         self.market_state.apply_delta(market_deltas)
+        self.invalidate_quotes()
 
     @property
     def rate(self):
         """Returns the current market apr"""
+        return self._get_cached_quote("rate", self._calc_rate)
+
+    def _calc_rate(self) -> float:
+        """Computes the current market apr"""
         # calc_apr_from_spot_price will throw an error if share_reserves <= zero
         # TODO: Negative values should never happen, but do because of rounding errors.
         #       Write checks to remedy this in the market.
@@ -199,6 +330,10 @@ class Market:
     @property
     def spot_price(self):
         """Returns the current market price of the share reserves"""
+        return self._get_cached_quote("spot_price", self._calc_spot_price)
+
+    def _calc_spot_price(self) -> float:
+        """Computes the current market price of the share reserves"""
         # calc_spot_price_from_reserves will throw an error if share_reserves is zero
         if self.market_state.share_reserves == 0:  # market is empty
             spot_price = np.nan
@@ -209,15 +344,60 @@ class Market:
             )
         return spot_price
 
+    def get_max_long(self) -> tuple[float, float]:
+        r"""Returns the maximum long the market can support, cached for the current state version
+
+        Returns
+        -------
+        float
+            The maximum amount of base that can be used to purchase bonds.
+        float
+            The amount of bonds purchased with the maximum amount of base.
+        """
+        return self._get_cached_quote(
+            "max_long",
+            lambda: self.pricing_model.get_max_long(
+                market_state=self.market_state,
+                time_remaining=self.position_duration,
+            ),
+        )
+
+    def get_max_short(self) -> tuple[float, float]:
+        r"""Returns the maximum short the market can support, cached for the current state version
+
+        Returns
+        -------
+        float
+            The maximum amount of base that can be used to short bonds.
+        float
+            The maximum amount of bonds that can be shorted.
+        """
+        return self._get_cached_quote(
+            "max_short",
+            lambda: self.pricing_model.get_max_short(
+                market_state=self.market_state,
+                time_remaining=self.position_duration,
+            ),
+        )
+
     def get_market_state_string(self) -> str:
         """Returns a formatted string containing all of the Market class member variables"""
         strings = [f"{attribute} = {value}" for attribute, value in self.__dict__.items()]
         state_string = "\n".join(strings)
         return state_string
 
-    def tick(self, delta_time: float) -> None:
-        """Increments the time member variable"""
-        self.time += delta_time
+    def tick(self, num_blocks: int = 1) -> None:
+        """Advances the block clock
+
+        Parameters
+        ----------
+        num_blocks : int
+            Number of blocks to advance
+        """
+        if num_blocks < 0:
+            raise ValueError(f"the block clock cannot go backwards; {num_blocks=} must be non-negative")
+        self.block_number += num_blocks
+        self.invalidate_quotes()
 
     def open_short(
         self,
@@ -259,7 +439,7 @@ class Market:
         agent_deltas = Wallet(
             address=wallet_address,
             base=-max_loss,
-            shorts={self.time: Short(balance=trade_amount, open_share_price=self.market_state.share_price)},
+            shorts={self.block_number: Short(balance=trade_amount, open_share_price=self.market_state.share_price)},
             fees_paid=trade_result.breakdown.fee,
         )
         return market_deltas, agent_deltas
@@ -269,7 +449,7 @@ class Market:
         wallet_address: int,
         open_share_price: float,
         trade_amount: float,
-        mint_time: float,
+        mint_block: int,
     ) -> tuple[MarketDeltas, Wallet]:
         """
         when closing a short, the number of bonds being closed out, at face value, give us the total margin returned
@@ -293,15 +473,8 @@ class Market:
             )
             trade_amount = self.market_state.bond_reserves
 
-        # Compute the time remaining given the mint time.
-        years_remaining = time_utils.get_years_remaining(
-            market_time=self.time, mint_time=mint_time, position_duration_years=self.position_duration.days / 365
-        )  # all args in units of years
-        time_remaining = StretchedTime(
-            days=years_remaining * 365,  # converting years to days
-            time_stretch=self.position_duration.time_stretch,
-            normalizing_constant=self.position_duration.normalizing_constant,
-        )
+        # Compute the time remaining given the mint block.
+        time_remaining = self.get_time_remaining(mint_block)
 
         # Perform the trade.
         trade_quantity = Quantity(amount=trade_amount, unit=TokenType.PT)
@@ -327,7 +500,7 @@ class Market:
             base=(self.market_state.share_price / open_share_price) * trade_amount
             + trade_result.user_result.d_base,  # see CLOSING SHORT LOGIC above
             shorts={
-                mint_time: Short(
+                mint_block: Short(
                     balance=-trade_amount,
                     open_share_price=0,
                 )
@@ -370,7 +543,7 @@ class Market:
             agent_deltas = Wallet(
                 address=wallet_address,
                 base=trade_result.user_result.d_base,
-                longs={self.time: Long(trade_result.user_result.d_bonds)},
+                longs={self.block_number: Long(trade_result.user_result.d_bonds)},
                 fees_paid=trade_result.breakdown.fee,
             )
         else:
@@ -382,7 +555,7 @@ class Market:
         self,
         wallet_address: int,
         trade_amount: float,  # in bonds
-        mint_time: float,
+        mint_block: int,
     ) -> tuple[MarketDeltas, Wallet]:
         """
         take trade spec & turn it into trade details
@@ -390,15 +563,8 @@ class Market:
         will be conditional on the pricing model
         """
 
-        # Compute the time remaining given the mint time.
-        years_remaining = time_utils.get_years_remaining(
-            market_time=self.time, mint_time=mint_time, position_duration_years=self.position_duration.days / 365
-        )  # all args in units of years
-        time_remaining = StretchedTime(
-            days=years_remaining * 365,  # converting years to days
-            time_stretch=self.position_duration.time_stretch,
-            normalizing_constant=self.position_duration.normalizing_constant,
-        )
+        # Compute the time remaining given the mint block.
+        time_remaining = self.get_time_remaining(mint_block)
 
         # Perform the trade.
         trade_quantity = Quantity(amount=trade_amount, unit=TokenType.PT)
@@ -422,7 +588,7 @@ class Market:
         agent_deltas = Wallet(
             address=wallet_address,
             base=trade_result.user_result.d_base,
-            longs={mint_time: Long(trade_result.user_result.d_bonds)},
+            longs={mint_block: Long(trade_result.user_result.d_bonds)},
             fees_paid=trade_result.breakdown.fee,
         )
         return market_deltas, agent_deltas
@@ -510,6 +676,9 @@ class Market:
 
     def log_market_step_string(self) -> None:
         """Logs the current market step"""
+        # the spot price and rate are computed for the message, so skip them unless it would be logged
+        if not logging.getLogger().isEnabledFor(logging.DEBUG):
+            return
         # TODO: This is a HACK to prevent test_sim from failing on market shutdown
         # when the market closes, the share_reserves are 0 (or negative & close to 0) and several logging steps break
         if self.market_state.share_reserves <= 0:
@@ -57,3 +57,7 @@ class Policy(Agent):
             else:
                 raise ValueError(f"Pricing model = {market.pricing_model.model_name()} is not supported.")
         return action_list
+
+    def get_next_wakeup_time(self, market: Market):
+        """Wake up only until the initial liquidity has been provided"""
+        return None if self.wallet.lp_tokens > 0 else market.time
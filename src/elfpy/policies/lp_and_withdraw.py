@@ -38,3 +38,9 @@ class Policy(Agent):
                     action_type=MarketActionType.REMOVE_LIQUIDITY, trade_amount=self.wallet.lp_tokens
                 )
         return action_list
+
+    def get_next_wakeup_time(self, market: Market):
+        """Wake up to add liquidity, or once enough time has passed to withdraw it"""
+        if self.wallet.lp_tokens > 0:
+            return self.time_to_withdraw
+        return market.time if self.wallet.base >= self.amount_to_lp else None
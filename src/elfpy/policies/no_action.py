@@ -20,3 +20,8 @@ class NoAction(Agent):
         # pylint disable=unused-argument
         action_list = []
         return action_list
+
+    def get_next_wakeup_time(self, market: Market) -> float | None:
+        """Never wakes up"""
+        # pylint: disable=unused-argument
+        return None
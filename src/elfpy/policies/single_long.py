@@ -26,17 +26,17 @@ class Policy(Agent):
         longs = list(self.wallet.longs.values())
         has_opened_long = bool(any((long.balance > 0 for long in longs)))
         action_list = []
-        mint_times = list(self.wallet["longs"].keys())
+        mint_blocks = list(self.wallet["longs"].keys())
         if has_opened_long:
-            mint_time = mint_times[-1]
-            enough_time_has_passed = market.time - mint_time > 0.25
+            mint_block = mint_blocks[-1]
+            enough_time_has_passed = market.blocks_to_years(market.block_number - mint_block) > 0.25
             if enough_time_has_passed:
                 action_list.append(
                     self.create_agent_action(
                         action_type=MarketActionType.CLOSE_LONG,
                         trade_amount=sum(long.balance for long in longs)
                         / (market.spot_price * 0.99),  # assume 1% slippage
-                        mint_time=mint_time,
+                        mint_block=mint_block,
                     )
                 )
         elif (not has_opened_long) and can_open_long:
@@ -44,3 +44,12 @@ class Policy(Agent):
                 self.create_agent_action(action_type=MarketActionType.OPEN_LONG, trade_amount=self.amount_to_trade)
             )
         return action_list
+
+    def get_next_wakeup_time(self, market: Market):
+        """Wake up once the open long is old enough to close, or now if a long can be opened"""
+        if any(long.balance > 0 for long in self.wallet.longs.values()):
+            return market.blocks_to_years(list(self.wallet["longs"].keys())[-1]) + 0.25
+        can_open_long = (self.wallet.base >= self.amount_to_trade) and (
+            market.market_state.share_reserves >= self.amount_to_trade
+        )
+        return market.time if can_open_long else None
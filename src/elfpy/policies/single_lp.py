@@ -29,3 +29,9 @@ class Policy(Agent):
                 self.create_agent_action(action_type=MarketActionType.ADD_LIQUIDITY, trade_amount=self.amount_to_lp)
             )
         return action_list
+
+    def get_next_wakeup_time(self, market: Market):
+        """Wake up only while the LP can still be opened"""
+        has_lp = self.wallet.lp_tokens > 0
+        can_lp = self.wallet.base >= self.amount_to_lp
+        return market.time if can_lp and not has_lp else None
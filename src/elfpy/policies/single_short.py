@@ -28,3 +28,10 @@ class Policy(Agent):
                 self.create_agent_action(action_type=MarketActionType.OPEN_SHORT, trade_amount=self.amount_to_trade)
             )
         return action_list
+
+    def get_next_wakeup_time(self, market: Market):
+        """Wake up only while a short has not been opened and the market can take it"""
+        has_opened_short = bool(any(short.balance > 0 for short in self.wallet.shorts.values()))
+        if has_opened_short or self.get_max_short(market) < self.amount_to_trade:
+            return None
+        return market.time
@@ -0,0 +1,174 @@
+"""Populations of agents that follow the same policy, whose actions are computed together
+
+A PopulationPolicy holds N member agents of one policy. Instead of calling each member's ``action`` method, the
+simulator asks the population for the actions of every member at once, and the population computes them with NumPy
+operations over the members' wallets. The members are ordinary agents in Simulator.agents, so trades are still
+executed member by member in the (shuffled) order used by Simulator.collect_and_execute_trades, and wallet updates,
+liquidation, and the final reports are unchanged.
+
+The member wallets are read with elfpy.valuation.get_balances and get_positions, which read the arrays directly
+when the simulator stores wallets in a WalletRegistry.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Iterable
+
+import numpy as np
+
+from elfpy import valuation
+from elfpy.policies import single_long
+from elfpy.types import MarketAction, MarketActionType
+from elfpy.wallet import Wallet
+
+if TYPE_CHECKING:
+    from elfpy.agent import Agent
+    from elfpy.markets import Market
+
+
+class PopulationPolicy(ABC):
+    r"""Agents that follow the same policy, whose actions are computed in a single pass over their wallets
+
+    Parameters
+    ----------
+    agents : Iterable[Agent]
+        The member agents; they are added to the simulator with Simulator.add_population
+    """
+
+    def __init__(self, agents: Iterable[Agent]):
+        self.agents = list(agents)
+
+    @property
+    def wallets(self) -> list[Wallet]:
+        r"""The wallets of the member agents, in the order of self.agents"""
+        return [agent.wallet for agent in self.agents]
+
+    @abstractmethod
+    def get_actions(self, market: Market) -> list[list[MarketAction]]:
+        r"""Returns the actions of every member for the current block
+
+        Parameters
+        ----------
+        market : Market
+            The market on which the members will be executing trades (MarketActions)
+
+        Returns
+        -------
+        list[list[MarketAction]]
+            One list of actions per member, in the order of self.agents
+        """
+        raise NotImplementedError
+
+    def get_trades(self, market: Market) -> dict[int, list[MarketAction]]:
+        r"""Returns the trades of every member, keyed by wallet address, as Agent.get_trades would
+
+        Parameters
+        ----------
+        market : Market
+            The market on which the members will be executing trades (MarketActions)
+
+        Returns
+        -------
+        dict[int, list[MarketAction]]
+            The list of trades of each member
+        """
+        trades = {}
+        for agent, actions in zip(self.agents, self.get_actions(market)):
+            for action in actions:
+                if action.mint_block is None:
+                    action.mint_block = market.block_number
+            trades[agent.wallet.address] = actions
+        return trades
+
+    def get_next_wakeup_time(self, market: Market) -> float | None:
+        r"""Returns the earliest market time at which any member might want to act
+
+        See Agent.get_next_wakeup_time. The default returns the current market time, i.e. the population is
+        consulted every block.
+
+        Parameters
+        ----------
+        market : Market
+            The market on which the members will be executing trades (MarketActions)
+
+        Returns
+        -------
+        float | None
+            Market time, in yearfracs, of the next block where get_actions could return trades, or None if no
+            member will act until the market state or the wallets change
+        """
+        return market.time
+
+
+class SingleLongPopulation(PopulationPolicy):
+    r"""Many elfpy.policies.single_long agents, which each open one long and close it after a quarter year
+
+    Parameters
+    ----------
+    wallet_addresses : Iterable[int]
+        The wallet address of each member
+    budget : float
+        The budget of each member
+    """
+
+    holding_period = 0.25  # in years, as in single_long.Policy
+
+    def __init__(self, wallet_addresses: Iterable[int], budget: float = 1000):
+        super().__init__(single_long.Policy(wallet_address, budget) for wallet_address in wallet_addresses)
+        self.amounts_to_trade = np.array([agent.amount_to_trade for agent in self.agents], dtype=np.float64)
+
+    def get_long_summary(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        r"""Returns each member's base, whether it has an open long, its long balance, and its latest mint block
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+            bases, has_opened_long, total_long_balances, and last_mint_blocks, with one entry per member;
+            last_mint_blocks is -1 for members without longs
+        """
+        wallets = self.wallets
+        num_agents = len(wallets)
+        _, bases, _ = valuation.get_balances(wallets)
+        long_owners, long_mint_blocks, long_balances, *_ = valuation.get_positions(wallets)
+        has_opened_long = np.bincount(long_owners, weights=long_balances > 0, minlength=num_agents) > 0
+        total_long_balances = np.bincount(long_owners, weights=long_balances, minlength=num_agents)
+        # longs are added to a wallet in order of increasing block number, so the newest mint block is the largest
+        last_mint_blocks = np.full(num_agents, -1, dtype=np.int64)
+        np.maximum.at(last_mint_blocks, long_owners, long_mint_blocks)
+        return bases, has_opened_long, total_long_balances, last_mint_blocks
+
+    def get_actions(self, market: Market) -> list[list[MarketAction]]:
+        r"""Open a long if the member has none, and close it once the holding period has passed"""
+        bases, has_opened_long, total_long_balances, last_mint_blocks = self.get_long_summary()
+        can_open_long = (bases >= self.amounts_to_trade) & (market.market_state.share_reserves >= self.amounts_to_trade)
+        is_closing = has_opened_long & (
+            market.blocks_to_years(market.block_number - last_mint_blocks) > self.holding_period
+        )
+        is_opening = ~has_opened_long & can_open_long
+        actions: list[list[MarketAction]] = [[] for _ in self.agents]
+        if np.any(is_closing):
+            close_price = market.spot_price * 0.99  # assume 1% slippage
+            for index in np.flatnonzero(is_closing):
+                actions[index].append(
+                    self.agents[index].create_agent_action(
+                        action_type=MarketActionType.CLOSE_LONG,
+                        trade_amount=float(total_long_balances[index]) / close_price,
+                        mint_block=int(last_mint_blocks[index]),
+                    )
+                )
+        for index in np.flatnonzero(is_opening):
+            actions[index].append(
+                self.agents[index].create_agent_action(
+                    action_type=MarketActionType.OPEN_LONG, trade_amount=float(self.amounts_to_trade[index])
+                )
+            )
+        return actions
+
+    def get_next_wakeup_time(self, market: Market) -> float | None:
+        r"""Wake up once the oldest open long can be closed, or now if a member can open a long"""
+        bases, has_opened_long, _, last_mint_blocks = self.get_long_summary()
+        wakeup_times = market.blocks_to_years(last_mint_blocks[has_opened_long]) + self.holding_period
+        can_open_long = (bases >= self.amounts_to_trade) & (market.market_state.share_reserves >= self.amounts_to_trade)
+        if np.any(~has_opened_long & can_open_long):
+            wakeup_times = np.append(wakeup_times, market.time)
+        return float(np.min(wakeup_times)) if len(wakeup_times) > 0 else None
@@ -2,21 +2,31 @@
 from __future__ import annotations  # types will be strings by default in 3.11
 
 from abc import ABC, abstractmethod
+from typing import Optional
 import copy
 import decimal
-from decimal import Decimal
+
+import numpy as np
+from numpy.typing import ArrayLike
+
+from elfpy.pricing_models.backends import ArrayBackend, Number, get_numeric_backend
 
 from elfpy.types import (
     MAX_RESERVES_DIFFERENCE,
     WEI,
+    AgentTradeResult,
     MarketDeltas,
+    MarketTradeResult,
     Quantity,
     MarketState,
     StretchedTime,
     TokenType,
+    TradeBreakdown,
     TradeResult,
+    ValidationLevel,
 )
 import elfpy.utils.price as price_utils
+from elfpy.utils.solvers import find_max_feasible
 
 # Set the Decimal precision to be higher than the default of 28. This ensures
 # that the pricing models can safely a lowest possible input of 1e-18 with an
@@ -28,8 +38,56 @@ class PricingModel(ABC):
     """Contains functions for calculating AMM variables
 
     Base class should not be instantiated on its own; it is assumed that a user will instantiate a child class
+
+    Parameters
+    ----------
+    precision : int
+        Selects the numeric backend used for the trade arithmetic; 128 (the default) uses Decimal and 64 uses native
+        float64, which is faster with a small loss in accuracy (see elfpy.pricing_models.backends)
+    validation_level : ValidationLevel
+        How often the input, output, and LP checks of trades are run; FULL (the default) checks every trade,
+        SAMPLED checks the first of every validation_interval trades, and OFF skips the checks
+    validation_interval : int
+        Number of trades per checked trade when the validation_level is SAMPLED
     """
 
+    # the batch API adds an array variant of each scalar calculation
+    # pylint: disable=too-many-public-methods
+
+    def __init__(
+        self,
+        precision: int = 128,
+        validation_level: ValidationLevel = ValidationLevel.FULL,
+        validation_interval: int = 100,
+    ):
+        self.backend = get_numeric_backend(precision)
+        self._batch_model: Optional[PricingModel] = None
+        if validation_interval < 1:
+            raise ValueError(f"validation_interval must be at least 1, not {validation_interval}")
+        self.validation_level = ValidationLevel(validation_level)
+        self.validation_interval = validation_interval
+        # whether the checks of the current trade are run; updated by sample_validation at the start of each trade
+        self.is_validating = self.validation_level != ValidationLevel.OFF
+        self.num_sampled_trades = 0
+
+    def sample_validation(self) -> bool:
+        r"""Decide whether the checks of the next trade are run, according to the validation level
+
+        Markets call this once at the start of each trade, so that either all or none of the checks of a trade
+        are run. Calls to the pricing model outside of a trade use the decision of the last trade.
+
+        Returns
+        -------
+        bool
+            True if the checks of the trade are run
+        """
+        if self.validation_level == ValidationLevel.SAMPLED:
+            self.is_validating = self.num_sampled_trades % self.validation_interval == 0
+            self.num_sampled_trades += 1
+        else:
+            self.is_validating = self.validation_level == ValidationLevel.FULL
+        return self.is_validating
+
     @abstractmethod
     def calc_in_given_out(
         self,
@@ -94,7 +152,7 @@ class PricingModel(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def _calc_k_const(self, market_state: MarketState, time_remaining: StretchedTime) -> Decimal:
+    def _calc_k_const(self, market_state: MarketState, time_remaining: StretchedTime) -> Number:
         """Returns the 'k' constant variable for trade mathematics"""
         raise NotImplementedError
 
@@ -290,7 +348,7 @@ class PricingModel(ABC):
         float
             The spot price of principal tokens.
         """
-        return float(
+        return self.backend.to_float(
             self._calc_spot_price_from_reserves_high_precision(market_state=market_state, time_remaining=time_remaining)
         )
 
@@ -298,10 +356,10 @@ class PricingModel(ABC):
         self,
         market_state: MarketState,
         time_remaining: StretchedTime,
-    ) -> Decimal:
+    ) -> Number:
         r"""
         Calculates the spot price of base in terms of bonds. This variant returns
-        the result in a high precision format.
+        the result in the working type of the numeric backend.
 
         The spot price is defined as:
 
@@ -319,25 +377,27 @@ class PricingModel(ABC):
 
         Returns
         -------
-        Decimal
+        Number
             The spot price of principal tokens.
         """
-        assert market_state.share_reserves > 0, (
+        assert self.backend.all(market_state.share_reserves > 0), (
             "pricing_models.calc_spot_price_from_reserves: ERROR: "
             f"expected share_reserves > 0, not {market_state.share_reserves}!",
         )
 
         # TODO: in general s != y + c*z, we'll want to update this to have s = lp_reserves
         # s = y + c*z
-        total_reserves = Decimal(market_state.bond_reserves) + Decimal(market_state.share_price) * Decimal(
+        num = self.backend.number
+        total_reserves = num(market_state.bond_reserves) + num(market_state.share_price) * num(
             market_state.share_reserves
         )
         # p = ((y + s)/(mu*z))^(-tau)
         # p = ((2y + cz)/(mu*z))^(-tau)
-        spot_price = (
-            (Decimal(market_state.bond_reserves) + total_reserves)
-            / (Decimal(market_state.init_share_price) * Decimal(market_state.share_reserves))
-        ) ** Decimal(-time_remaining.stretched_time)
+        spot_price = self.backend.power(
+            (num(market_state.bond_reserves) + total_reserves)
+            / (num(market_state.init_share_price) * num(market_state.share_reserves)),
+            num(-time_remaining.stretched_time),
+        )
         return spot_price
 
     def calc_apr_from_reserves(
@@ -353,6 +413,178 @@ class PricingModel(ABC):
         apr = price_utils.calc_apr_from_spot_price(spot_price, time_remaining)
         return apr
 
+    def calc_in_given_out_batch(
+        self,
+        out_amount: ArrayLike,
+        out_unit: TokenType,
+        market_state: MarketState,
+        time_remaining: StretchedTime,
+    ) -> TradeResult:
+        r"""Vectorized calc_in_given_out over arrays of trade amounts, market states, and times remaining
+
+        Parameters
+        ----------
+        out_amount : ArrayLike
+            The amounts of tokens that the user wants to receive
+        out_unit : TokenType
+            The unit of the tokens that the user wants to receive
+        market_state : MarketState
+            The state of the AMM; any of the fields can be arrays
+        time_remaining : StretchedTime
+            The time remaining for the asset; days can be an array
+
+        Returns
+        -------
+        TradeResult
+            The trade result, where every component is a float64 array with the broadcast shape of the inputs.
+            Trades that the reserves cannot support evaluate to NaN instead of raising an error.
+        """
+        trade_result = self._get_batch_model().calc_in_given_out(
+            out=Quantity(amount=np.asarray(out_amount, dtype=np.float64), unit=out_unit),
+            market_state=self._get_batch_market_state(market_state),
+            time_remaining=time_remaining,
+        )
+        return self._broadcast_trade_result(trade_result)
+
+    def calc_out_given_in_batch(
+        self,
+        in_amount: ArrayLike,
+        in_unit: TokenType,
+        market_state: MarketState,
+        time_remaining: StretchedTime,
+    ) -> TradeResult:
+        r"""Vectorized calc_out_given_in over arrays of trade amounts, market states, and times remaining
+
+        Parameters
+        ----------
+        in_amount : ArrayLike
+            The amounts of tokens that the user wants to pay
+        in_unit : TokenType
+            The unit of the tokens that the user wants to pay
+        market_state : MarketState
+            The state of the AMM; any of the fields can be arrays
+        time_remaining : StretchedTime
+            The time remaining for the asset; days can be an array
+
+        Returns
+        -------
+        TradeResult
+            The trade result, where every component is a float64 array with the broadcast shape of the inputs.
+            Trades that the reserves cannot support evaluate to NaN instead of raising an error.
+        """
+        trade_result = self._get_batch_model().calc_out_given_in(
+            in_=Quantity(amount=np.asarray(in_amount, dtype=np.float64), unit=in_unit),
+            market_state=self._get_batch_market_state(market_state),
+            time_remaining=time_remaining,
+        )
+        return self._broadcast_trade_result(trade_result)
+
+    def calc_spot_price_from_reserves_batch(
+        self,
+        market_state: MarketState,
+        time_remaining: StretchedTime,
+    ) -> np.ndarray:
+        r"""Vectorized calc_spot_price_from_reserves over arrays of market states and times remaining
+
+        Parameters
+        ----------
+        market_state : MarketState
+            The reserves and share prices of the pool; any of the fields can be arrays
+        time_remaining : StretchedTime
+            The time remaining for the asset; days can be an array
+
+        Returns
+        -------
+        np.ndarray
+            The spot prices of principal tokens, with the broadcast shape of the inputs
+        """
+        spot_price = self._get_batch_model().calc_spot_price_from_reserves(
+            market_state=self._get_batch_market_state(market_state),
+            time_remaining=time_remaining,
+        )
+        return np.asarray(spot_price, dtype=np.float64)
+
+    def calc_apr_from_reserves_batch(
+        self,
+        market_state: MarketState,
+        time_remaining: StretchedTime,
+    ) -> np.ndarray:
+        r"""Vectorized calc_apr_from_reserves over arrays of market states and times remaining
+
+        Parameters
+        ----------
+        market_state : MarketState
+            The reserves and share prices of the pool; any of the fields can be arrays
+        time_remaining : StretchedTime
+            The time remaining for the asset; days can be an array
+
+        Returns
+        -------
+        np.ndarray
+            The APRs implied by the reserves, with the broadcast shape of the inputs
+        """
+        spot_price = self.calc_spot_price_from_reserves_batch(market_state, time_remaining)
+        normalized_time = np.asarray(time_remaining.normalized_time, dtype=np.float64)
+        assert np.all(spot_price > 0), (
+            "pricing_models.calc_apr_from_reserves_batch: ERROR: "
+            f"Price argument should be greater than zero, not {spot_price}"
+        )
+        assert np.all(normalized_time > 0), (
+            "pricing_models.calc_apr_from_reserves_batch: ERROR: "
+            f"time_remaining.normalized_time should be greater than zero, not {normalized_time}"
+        )
+        # same as price_utils.calc_apr_from_spot_price, r = ((1/p)-1)/t = (1-p)/(pt)
+        return (1 - spot_price) / (spot_price * normalized_time)
+
+    def _get_batch_model(self) -> PricingModel:
+        """Returns a copy of this pricing model that uses the vectorized array backend"""
+        if self._batch_model is None:
+            batch_model = copy.copy(self)
+            batch_model.backend = ArrayBackend()
+            self._batch_model = batch_model
+        return self._batch_model
+
+    @staticmethod
+    def _get_batch_market_state(market_state: MarketState) -> MarketState:
+        """Returns a copy of the market state with every field converted to a float64 array"""
+        return MarketState(**{key: np.asarray(value, dtype=np.float64) for key, value in market_state.__dict__.items()})
+
+    @staticmethod
+    def _broadcast_trade_result(trade_result: TradeResult) -> TradeResult:
+        """Broadcasts the components of a batch trade result to a common shape"""
+        (
+            user_d_base,
+            user_d_bonds,
+            market_d_base,
+            market_d_bonds,
+            without_fee_or_slippage,
+            with_fee,
+            without_fee,
+            fee,
+        ) = (
+            np.array(component, dtype=np.float64)  # copy, since broadcast_arrays returns read-only views
+            for component in np.broadcast_arrays(
+                trade_result.user_result.d_base,
+                trade_result.user_result.d_bonds,
+                trade_result.market_result.d_base,
+                trade_result.market_result.d_bonds,
+                trade_result.breakdown.without_fee_or_slippage,
+                trade_result.breakdown.with_fee,
+                trade_result.breakdown.without_fee,
+                trade_result.breakdown.fee,
+            )
+        )
+        return TradeResult(
+            user_result=AgentTradeResult(d_base=user_d_base, d_bonds=user_d_bonds),
+            market_result=MarketTradeResult(d_base=market_d_base, d_bonds=market_d_bonds),
+            breakdown=TradeBreakdown(
+                without_fee_or_slippage=without_fee_or_slippage,
+                with_fee=with_fee,
+                without_fee=without_fee,
+                fee=fee,
+            ),
+        )
+
     # TODO: This needs to be tested more rigorously. Some of these conditionals
     # seem unnecessary. If they aren't document why they aren't. Otherwise,
     # remove them.
@@ -362,8 +594,12 @@ class PricingModel(ABC):
         time_remaining: StretchedTime,
     ) -> tuple[float, float]:
         r"""
-        Calculates the maximum long the market can support using the bisection
-        method.
+        Calculates the maximum long the market can support.
+
+        The search is over the fraction of the available bonds that are purchased. It uses a bracketed
+        Illinois solver (see elfpy.utils.solvers.find_max_feasible) on the smallest slack of the reserve
+        invariants, which converges to within the resolution of a 25 step bisection in a handful of
+        pricing model evaluations.
 
         Parameters
         ----------
@@ -378,30 +614,26 @@ class PricingModel(ABC):
         -------
         float
             The maximum amount of base that can be used to purchase bonds.
+        float
+            The amount of bonds purchased with the maximum amount of base.
         """
         available_bonds = market_state.bond_reserves - market_state.bond_buffer
         if available_bonds <= 0:
             return 0, 0
 
-        last_maybe_max_long = 0, 0
-        bond_percent = 1
-        num_iters = 25
-        for step_size in [1 / (2 ** (x + 1)) for x in range(num_iters)]:
-            # Compute the amount of base needed to purchase the specified amount
-            # of bonds.
-            trade_result = self.calc_in_given_out(
-                out=Quantity(amount=available_bonds * bond_percent, unit=TokenType.PT),
-                market_state=market_state,
-                time_remaining=time_remaining,
-            )
-            maybe_max_long = trade_result.breakdown.with_fee
-
-            # If the max long is less than or equal to zero, we need to reduce
-            # the amount of bonds that we are attempting to purchase. Otherwise,
-            # go through the other checks for the bisection.
-            if maybe_max_long <= 0:
-                bond_percent -= step_size
-            else:
+        def long_slack(bond_percent: float) -> tuple[Optional[float], Optional[tuple[float, float]]]:
+            try:
+                # Compute the amount of base needed to purchase the specified amount
+                # of bonds.
+                trade_result = self.calc_in_given_out(
+                    out=Quantity(amount=available_bonds * bond_percent, unit=TokenType.PT),
+                    market_state=market_state,
+                    time_remaining=time_remaining,
+                )
+                maybe_max_long = trade_result.breakdown.with_fee
+                # If the max long is not positive, the trade is too large.
+                if not maybe_max_long > 0:
+                    return None, None
                 # TODO: Do we actually need to do this? Run some tests and see
                 # if the result that only uses calc_in_given_out is always
                 # slightly lower. If so, then just take that.
@@ -415,7 +647,6 @@ class PricingModel(ABC):
                     time_remaining=time_remaining,
                 )
                 d_bonds = trade_result.breakdown.with_fee
-
                 # Apply the trade to the market state.
                 market_state_post_trade = copy.copy(market_state)
                 market_state_post_trade.apply_delta(
@@ -425,27 +656,27 @@ class PricingModel(ABC):
                         d_base_buffer=d_bonds,
                     )
                 )
+                post_trade_apr = self.calc_apr_from_reserves(
+                    market_state=market_state_post_trade, time_remaining=time_remaining
+                )
+            except (ArithmeticError, AssertionError):  # the trade is larger than the reserves can support
+                return None, None
+            # The trade is safe if none of the reserve invariants were broken.
+            slack = min(
+                (market_state.bond_reserves - d_bonds) / market_state.bond_reserves,
+                post_trade_apr,
+                (
+                    market_state_post_trade.share_price * market_state_post_trade.share_reserves
+                    - market_state_post_trade.base_buffer
+                )
+                / (market_state.share_price * market_state.share_reserves),
+                (market_state_post_trade.bond_reserves - market_state_post_trade.bond_buffer)
+                / market_state.bond_reserves,
+            )
+            return slack, (maybe_max_long, d_bonds)
 
-                # Verify that none of the reserve invariants were broken. If
-                # the invariants were broken, reduce the bond size. Otherwise,
-                # we've found a new max long amount, so we store that value and
-                # proceed with bisection with larger bond purchases.
-                if (
-                    market_state.bond_reserves < d_bonds
-                    or self.calc_apr_from_reserves(market_state=market_state_post_trade, time_remaining=time_remaining)
-                    < 0
-                    or market_state_post_trade.share_price * market_state_post_trade.share_reserves
-                    < market_state_post_trade.base_buffer
-                    or market_state_post_trade.bond_reserves < market_state_post_trade.bond_buffer
-                ):
-                    bond_percent -= step_size
-                else:
-                    last_maybe_max_long = (maybe_max_long, d_bonds)
-                    if bond_percent == 1:
-                        return last_maybe_max_long
-                    bond_percent += step_size
-
-        return last_maybe_max_long
+        _, max_long = find_max_feasible(long_slack, default_payload=(0, 0))
+        return max_long
 
     def get_max_short(
         self,
@@ -453,8 +684,10 @@ class PricingModel(ABC):
         time_remaining: StretchedTime,
     ) -> tuple[float, float]:
         r"""
-        Calculates the maximum short the market can support using the bisection
-        method.
+        Calculates the maximum short the market can support.
+
+        The search is over the fraction of the available bonds that are shorted, using the same solver as
+        get_max_long.
 
         Parameters
         ----------
@@ -476,10 +709,7 @@ class PricingModel(ABC):
         if available_bonds <= 0:
             return 0, 0
 
-        last_maybe_max_short = 0, 0
-        bond_percent = 1
-        num_iters = 25
-        for step_size in [1 / (2 ** (x + 1)) for x in range(num_iters)]:
+        def short_slack(bond_percent: float) -> tuple[Optional[float], Optional[tuple[float, float]]]:
             try:
                 # Compute the amount of base returned by selling the specified
                 # amount of bonds.
@@ -490,16 +720,9 @@ class PricingModel(ABC):
                     time_remaining=time_remaining,
                 )
                 maybe_max_short_base = maybe_max_short_bonds - trade_result.breakdown.with_fee
-            except decimal.InvalidOperation:
-                bond_percent -= step_size
-                continue
-
-            # If the max short base is less than or equal to zero, we need to
-            # reduce the amount of bonds that we are attempting to short.
-            # Otherwise, go through the other checks for the bisection.
-            if maybe_max_short_base <= 0:
-                bond_percent -= step_size
-            else:
+                # If the max short base is not positive, the short is too large.
+                if not maybe_max_short_base > 0:
+                    return None, None
                 # Apply the trade to the market state.
                 market_state_post_trade = copy.copy(market_state)
                 market_state_post_trade.apply_delta(
@@ -509,28 +732,29 @@ class PricingModel(ABC):
                         d_bond_buffer=maybe_max_short_bonds,
                     )
                 )
+                post_trade_apr = self.calc_apr_from_reserves(
+                    market_state=market_state_post_trade, time_remaining=time_remaining
+                )
+            except (ArithmeticError, AssertionError):  # e.g. a negative base in a fractional power
+                return None, None
+            # TODO: Some of these checks are certainly unnecessary. When
+            # writing rigorous tests these should be removed.
+            #
+            # The short is safe if none of the reserve invariants were broken.
+            slack = min(
+                post_trade_apr,
+                (
+                    market_state_post_trade.share_price * market_state_post_trade.share_reserves
+                    - market_state_post_trade.base_buffer
+                )
+                / (market_state.share_price * market_state.share_reserves),
+                (market_state_post_trade.bond_reserves - market_state_post_trade.bond_buffer)
+                / market_state.bond_reserves,
+            )
+            return slack, (maybe_max_short_base, maybe_max_short_bonds)
 
-                # TODO: Some of these checks are certainly unnecessary. When
-                # writing rigorous tests these should be removed.
-                #
-                # Verify that none of the reserve invariants were broken. If
-                # the invariants were broken, reduce the bond size. Otherwise,
-                # we've found a new max short amount, so we store that value and
-                # proceed with bisection with larger bond purchases.
-                if (
-                    self.calc_apr_from_reserves(market_state=market_state_post_trade, time_remaining=time_remaining) < 0
-                    or market_state_post_trade.share_price * market_state_post_trade.share_reserves
-                    < market_state_post_trade.base_buffer
-                    or market_state_post_trade.bond_reserves < market_state_post_trade.bond_buffer
-                ):
-                    bond_percent -= step_size
-                else:
-                    last_maybe_max_short = (maybe_max_short_base, maybe_max_short_bonds)
-                    if bond_percent == 1:
-                        return last_maybe_max_short
-                    bond_percent += step_size
-
-        return last_maybe_max_short
+        _, max_short = find_max_feasible(short_slack, default_payload=(0, 0))
+        return max_short
 
     def calc_time_stretch(self, apr):
         """Returns fixed time-stretch value based on current apr (as a decimal)"""
@@ -543,8 +767,9 @@ class PricingModel(ABC):
         market_state: MarketState,
         time_remaining: StretchedTime,
     ):
-        """Applies a set of assertions to the input of a trading function."""
-
+        """Applies a set of assertions to the input of a trading function, unless validation is skipped for the trade"""
+        if not self.is_validating:
+            return
         assert quantity.amount >= WEI, (
             "pricing_models.check_input_assertions: ERROR: "
             f"expected quantity.amount >= {WEI}, not {quantity.amount}!"
@@ -586,8 +811,9 @@ class PricingModel(ABC):
         self,
         trade_result: TradeResult,
     ):
-        """Applies a set of assertions to a trade result."""
-
+        """Applies a set of assertions to a trade result, unless validation is skipped for the trade"""
+        if not self.is_validating:
+            return
         assert isinstance(trade_result.breakdown.fee, float), (
             "pricing_models.check_output_assertions: ERROR: "
             f"fee should be a float, not {type(trade_result.breakdown.fee)}!"
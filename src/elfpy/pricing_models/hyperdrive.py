@@ -1,6 +1,5 @@
 """The Hyperdrive pricing model"""
 import copy
-from decimal import Decimal
 
 from elfpy.pricing_models.yieldspace import YieldSpacePricingModel
 from elfpy.types import (
@@ -24,6 +23,9 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
     base reserves to be deposited into yield bearing vaults
     """
 
+    # the trade calculations keep the flat and curve parts of the trade, and the backend conversions, as locals
+    # pylint: disable=too-many-locals
+
     def model_name(self) -> str:
         return "Hyperdrive"
 
@@ -106,9 +108,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
         """
 
         # Calculate some common values up front
-        out_amount = Decimal(out.amount)
-        normalized_time = Decimal(time_remaining.normalized_time)
-        share_price = Decimal(market_state.share_price)
+        num = self.backend.number
+        to_float = self.backend.to_float
+        out_amount = num(out.amount)
+        normalized_time = num(time_remaining.normalized_time)
+        share_price = num(market_state.share_price)
         d_bonds = out_amount * (1 - normalized_time)
         d_shares = d_bonds / share_price
 
@@ -118,11 +122,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
         # TODO: This is somewhat strange since these updates never actually hit the reserves.
         # Redeem the matured bonds 1:1 and simulate these updates hitting the reserves.
         if out.unit == TokenType.BASE:
-            market_state.share_reserves -= float(d_shares)
-            market_state.bond_reserves += float(d_bonds)
+            market_state.share_reserves = market_state.share_reserves - to_float(d_shares)
+            market_state.bond_reserves = market_state.bond_reserves + to_float(d_bonds)
         elif out.unit == TokenType.PT:
-            market_state.share_reserves += float(d_shares)
-            market_state.bond_reserves -= float(d_bonds)
+            market_state.share_reserves = market_state.share_reserves + to_float(d_shares)
+            market_state.bond_reserves = market_state.bond_reserves - to_float(d_bonds)
         else:
             raise AssertionError(
                 "pricing_models.calc_in_given_out: ERROR: "
@@ -131,7 +135,7 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
 
         # Trade the bonds that haven't matured on the YieldSpace curve.
         curve = super().calc_in_given_out(
-            out=Quantity(amount=float(out_amount * normalized_time), unit=out.unit),
+            out=Quantity(amount=to_float(out_amount * normalized_time), unit=out.unit),
             market_state=market_state,
             time_remaining=StretchedTime(  # time remaining is always fixed to the full term for flat+curve
                 days=time_remaining.normalizing_constant,  # position duration is the normalizing constant
@@ -142,14 +146,14 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
 
         # Compute flat part with fee
         flat_without_fee = out_amount * (1 - normalized_time)
-        redemption_fee = flat_without_fee * Decimal(market_state.redemption_fee_percent)
+        redemption_fee = flat_without_fee * num(market_state.redemption_fee_percent)
         flat_with_fee = flat_without_fee + redemption_fee
 
         # Compute the user's trade result including both the flat and the curve parts of the trade.
         if out.unit == TokenType.BASE:
             user_result = AgentTradeResult(
                 d_base=out.amount,
-                d_bonds=float(-flat_with_fee + Decimal(curve.user_result.d_bonds)),
+                d_bonds=to_float(-flat_with_fee + num(curve.user_result.d_bonds)),
             )
             market_result = MarketTradeResult(
                 d_base=-out.amount,
@@ -157,11 +161,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
             )
         elif out.unit == TokenType.PT:
             user_result = AgentTradeResult(
-                d_base=float(-flat_with_fee + Decimal(curve.user_result.d_base)),
+                d_base=to_float(-flat_with_fee + num(curve.user_result.d_base)),
                 d_bonds=out.amount,
             )
             market_result = MarketTradeResult(
-                d_base=float(flat_with_fee + Decimal(curve.market_result.d_base)),
+                d_base=to_float(flat_with_fee + num(curve.market_result.d_base)),
                 d_bonds=curve.market_result.d_bonds,
             )
         else:
@@ -174,10 +178,10 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
             user_result=user_result,
             market_result=market_result,
             breakdown=TradeBreakdown(
-                without_fee_or_slippage=float(flat_without_fee + Decimal(curve.breakdown.without_fee_or_slippage)),
-                without_fee=float(flat_without_fee + Decimal(curve.breakdown.without_fee)),
-                fee=float(redemption_fee + Decimal(curve.breakdown.fee)),
-                with_fee=float(flat_with_fee + Decimal(curve.breakdown.with_fee)),
+                without_fee_or_slippage=to_float(flat_without_fee + num(curve.breakdown.without_fee_or_slippage)),
+                without_fee=to_float(flat_without_fee + num(curve.breakdown.without_fee)),
+                fee=to_float(redemption_fee + num(curve.breakdown.fee)),
+                with_fee=to_float(flat_with_fee + num(curve.breakdown.with_fee)),
             ),
         )
 
@@ -248,9 +252,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
         """
 
         # Calculate some common values up front
-        in_amount = Decimal(in_.amount)
-        normalized_time = Decimal(time_remaining.normalized_time)
-        share_price = Decimal(market_state.share_price)
+        num = self.backend.number
+        to_float = self.backend.to_float
+        in_amount = num(in_.amount)
+        normalized_time = num(time_remaining.normalized_time)
+        share_price = num(market_state.share_price)
         d_bonds = in_amount * (1 - normalized_time)
         d_shares = d_bonds / share_price
 
@@ -260,11 +266,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
         # TODO: This is somewhat strange since these updates never actually hit the reserves.
         # Redeem the matured bonds 1:1 and simulate these updates hitting the reserves.
         if in_.unit == TokenType.BASE:
-            market_state.share_reserves += float(d_shares)
-            market_state.bond_reserves -= float(d_bonds)
+            market_state.share_reserves = market_state.share_reserves + to_float(d_shares)
+            market_state.bond_reserves = market_state.bond_reserves - to_float(d_bonds)
         elif in_.unit == TokenType.PT:
-            market_state.share_reserves -= float(d_shares)
-            market_state.bond_reserves += float(d_bonds)
+            market_state.share_reserves = market_state.share_reserves - to_float(d_shares)
+            market_state.bond_reserves = market_state.bond_reserves + to_float(d_bonds)
         else:
             raise AssertionError(
                 "pricing_models.calc_out_given_in: ERROR: "
@@ -273,7 +279,7 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
 
         # Trade the bonds that haven't matured on the YieldSpace curve.
         curve = super().calc_out_given_in(
-            in_=Quantity(amount=float(in_amount * normalized_time), unit=in_.unit),
+            in_=Quantity(amount=to_float(in_amount * normalized_time), unit=in_.unit),
             market_state=market_state,
             time_remaining=StretchedTime(  # time remaining is always fixed to the full term for flat+curve
                 days=time_remaining.normalizing_constant,  # position duration is the normalizing constant
@@ -284,14 +290,14 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
 
         # Compute flat part with fee
         flat_without_fee = in_amount * (1 - normalized_time)
-        redemption_fee = flat_without_fee * Decimal(market_state.redemption_fee_percent)
+        redemption_fee = flat_without_fee * num(market_state.redemption_fee_percent)
         flat_with_fee = flat_without_fee - redemption_fee
 
         # Compute the user's trade result including both the flat and the curve parts of the trade.
         if in_.unit == TokenType.BASE:
             user_result = AgentTradeResult(
                 d_base=-in_.amount,
-                d_bonds=float(flat_with_fee + Decimal(curve.user_result.d_bonds)),
+                d_bonds=to_float(flat_with_fee + num(curve.user_result.d_bonds)),
             )
             market_result = MarketTradeResult(
                 d_base=in_.amount,
@@ -299,11 +305,11 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
             )
         elif in_.unit == TokenType.PT:
             user_result = AgentTradeResult(
-                d_base=float(flat_with_fee + Decimal(curve.user_result.d_base)),
+                d_base=to_float(flat_with_fee + num(curve.user_result.d_base)),
                 d_bonds=-in_.amount,
             )
             market_result = MarketTradeResult(
-                d_base=float(-flat_with_fee + Decimal(curve.market_result.d_base)),
+                d_base=to_float(-flat_with_fee + num(curve.market_result.d_base)),
                 d_bonds=curve.market_result.d_bonds,
             )
         else:
@@ -316,9 +322,9 @@ class HyperdrivePricingModel(YieldSpacePricingModel):
             user_result=user_result,
             market_result=market_result,
             breakdown=TradeBreakdown(
-                without_fee_or_slippage=float(flat_without_fee + Decimal(curve.breakdown.without_fee_or_slippage)),
-                without_fee=float(flat_without_fee + Decimal(curve.breakdown.without_fee)),
-                fee=float(Decimal(curve.breakdown.fee) + redemption_fee),
-                with_fee=float(flat_with_fee + Decimal(curve.breakdown.with_fee)),
+                without_fee_or_slippage=to_float(flat_without_fee + num(curve.breakdown.without_fee_or_slippage)),
+                without_fee=to_float(flat_without_fee + num(curve.breakdown.without_fee)),
+                fee=to_float(num(curve.breakdown.fee) + redemption_fee),
+                with_fee=to_float(flat_with_fee + num(curve.breakdown.with_fee)),
             ),
         )
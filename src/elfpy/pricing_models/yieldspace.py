@@ -1,9 +1,9 @@
 """The YieldSpace pricing model"""
 from __future__ import annotations  # types will be strings by default in 3.11
 
-from decimal import Decimal
 import logging
 
+from elfpy.pricing_models.backends import Number
 from elfpy.pricing_models.base import PricingModel
 from elfpy.types import (
     MarketTradeResult,
@@ -51,37 +51,38 @@ class YieldSpacePricingModel(PricingModel):
             y = \frac{(z + \Delta z)(\mu \cdot (\frac{1}{1 + r \cdot t(d)})^{\frac{1}{\tau(d_b)}} - c)}{2}
 
         """
-        assert d_base > 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected d_base > 0, not {d_base}!"
-        assert market_state.share_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR:  "
-            f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
-        )
-        assert market_state.bond_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
-        )
-        assert market_state.base_buffer >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
-        )
-        assert market_state.lp_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
-        )
-        assert rate >= 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected rate >= 0, not {rate}!"
-        assert 1 >= time_remaining.normalized_time >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"expected 1 >= time_remaining >= 0, not {time_remaining.normalized_time}!"
-        )
-        assert time_remaining.stretched_time >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
-        )
-        assert market_state.share_price >= market_state.init_share_price >= 1, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            "expected share_price >= init_share_price >= 1, not "
-            f"share_price={market_state.share_price} and init_share_price={market_state.init_share_price}!"
-        )
+        if self.is_validating:
+            assert d_base > 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected d_base > 0, not {d_base}!"
+            assert market_state.share_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR:  "
+                f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
+            )
+            assert market_state.bond_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
+            )
+            assert market_state.base_buffer >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
+            )
+            assert market_state.lp_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
+            )
+            assert rate >= 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected rate >= 0, not {rate}!"
+            assert 1 >= time_remaining.normalized_time >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"expected 1 >= time_remaining >= 0, not {time_remaining.normalized_time}!"
+            )
+            assert time_remaining.stretched_time >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
+            )
+            assert market_state.share_price >= market_state.init_share_price >= 1, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                "expected share_price >= init_share_price >= 1, not "
+                f"share_price={market_state.share_price} and init_share_price={market_state.init_share_price}!"
+            )
         d_shares = d_base / market_state.share_price
         if market_state.share_reserves > 0:  # normal case where we have some share reserves
             # TODO: We need to update these LP calculations to address the LP
@@ -95,52 +96,6 @@ class YieldSpacePricingModel(PricingModel):
             * (1 + rate * time_remaining.normalized_time) ** (1 / time_remaining.stretched_time)
             - market_state.share_price
         ) - market_state.bond_reserves
-        logging.debug(
-            (
-                "inputs: d_base=%g, share_reserves=%d, "
-                "bond_reserves=%d, base_buffer=%g, "
-                "init_share_price=%g, share_price=%g, "
-                "lp_reserves=%g, rate=%g, "
-                "time_remaining=%g, stretched_time_remaining=%g"
-                "\nd_shares=%g (d_base / share_price = %g / %g)"
-                "\nlp_out=%g\n"
-                "(d_share_reserves * lp_reserves / (share_reserves - base_buffer / share_price) = "
-                "%g * %g / (%g - %g / %g))"
-                "\nd_bonds=%g\n"
-                "((share_reserves + d_share_reserves) / 2 * (init_share_price * (1 + rate * time_remaining) ** "
-                "(1 / stretched_time_remaining) - share_price) - bond_reserves = "
-                "(%g + %g) / 2 * (%g * (1 + %g * %g) ** "
-                "(1 / %g) - %g) - %g)"
-            ),
-            d_base,
-            market_state.share_reserves,
-            market_state.bond_reserves,
-            market_state.base_buffer,
-            market_state.init_share_price,
-            market_state.share_price,
-            market_state.lp_reserves,
-            rate,
-            time_remaining.normalized_time,
-            time_remaining.stretched_time,
-            d_shares,
-            d_base,
-            market_state.share_price,
-            lp_out,
-            d_shares,
-            market_state.lp_reserves,
-            market_state.share_reserves,
-            market_state.base_buffer,
-            market_state.share_price,
-            d_bonds,
-            market_state.share_reserves,
-            d_shares,
-            market_state.init_share_price,
-            rate,
-            time_remaining.normalized_time,
-            time_remaining.stretched_time,
-            market_state.share_price,
-            market_state.bond_reserves,
-        )
         return lp_out, d_base, d_bonds
 
     def calc_lp_in_given_tokens_out(
@@ -157,38 +112,39 @@ class YieldSpacePricingModel(PricingModel):
             y = \frac{(z - \Delta z)(\mu \cdot (\frac{1}{1 + r \cdot t(d)})^{\frac{1}{\tau(d_b)}} - c)}{2}
 
         """
-        assert d_base > 0, f"pricing_models.calc_lp_in_given_tokens_out: ERROR: expected d_base > 0, not {d_base}!"
-        assert market_state.share_reserves >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
-        )
-        assert market_state.bond_reserves >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
-        )
-        assert market_state.base_buffer >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
-        )
-        assert market_state.lp_reserves >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
-        )
-        assert rate >= 0, f"pricing_models.calc_lp_in_given_tokens_out: ERROR: expected rate >= 0, not {rate}!"
-        # TODO: convert this to a check for 1>=time and fix tests as necessary
-        assert 1 > time_remaining.normalized_time >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"expected 1 > time_remaining >= 0, not {time_remaining.normalized_time}!"
-        )
-        assert time_remaining.stretched_time >= 0, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
-        )
-        assert market_state.share_price >= market_state.init_share_price >= 1, (
-            "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
-            "expected share_price >= init_share_price >= 1, not "
-            f"share_price={market_state.share_price}, and init_share_price={market_state.init_share_price}"
-        )
+        if self.is_validating:
+            assert d_base > 0, f"pricing_models.calc_lp_in_given_tokens_out: ERROR: expected d_base > 0, not {d_base}!"
+            assert market_state.share_reserves >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
+            )
+            assert market_state.bond_reserves >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
+            )
+            assert market_state.base_buffer >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
+            )
+            assert market_state.lp_reserves >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
+            )
+            assert rate >= 0, f"pricing_models.calc_lp_in_given_tokens_out: ERROR: expected rate >= 0, not {rate}!"
+            # TODO: convert this to a check for 1>=time and fix tests as necessary
+            assert 1 > time_remaining.normalized_time >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"expected 1 > time_remaining >= 0, not {time_remaining.normalized_time}!"
+            )
+            assert time_remaining.stretched_time >= 0, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
+            )
+            assert market_state.share_price >= market_state.init_share_price >= 1, (
+                "pricing_models.calc_lp_in_given_tokens_out: ERROR: "
+                "expected share_price >= init_share_price >= 1, not "
+                f"share_price={market_state.share_price}, and init_share_price={market_state.init_share_price}"
+            )
         d_shares = d_base / market_state.share_price
         lp_in = (d_shares * market_state.lp_reserves) / (
             market_state.share_reserves - market_state.base_buffer / market_state.share_price
@@ -209,39 +165,40 @@ class YieldSpacePricingModel(PricingModel):
         time_remaining: StretchedTime,
     ) -> tuple[float, float, float]:
         """Calculate how many tokens should be returned for a given lp addition"""
-        assert lp_in > 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected lp_in > 0, not {lp_in}!"
-        assert market_state.share_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
-        )
-        assert market_state.bond_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
-        )
-        # TODO: #146 These asserts should check for 0 -- the buffers should never go below 0
-        # We think that this is happening due to an rounding error, based on the size of the difference
-        assert market_state.base_buffer >= -1e-8, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
-        )
-        assert market_state.lp_reserves >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
-        )
-        assert rate >= 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected rate >= 0, not {rate}!"
-        assert 1 >= time_remaining.normalized_time >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"Expected 1 >= time_remaining >= 0, not {time_remaining.normalized_time}!"
-        )
-        assert time_remaining.stretched_time >= 0, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
-        )
-        assert market_state.share_price >= market_state.init_share_price >= 1, (
-            "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
-            "expected share_price >= init_share_price >= 1, not "
-            f"share_price={market_state.share_price}, and init_share_price={market_state.init_share_price}"
-        )
+        if self.is_validating:
+            assert lp_in > 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected lp_in > 0, not {lp_in}!"
+            assert market_state.share_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected share_reserves >= 0, not {market_state.share_reserves}!"
+            )
+            assert market_state.bond_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected bond_reserves >= 0, not {market_state.bond_reserves}!"
+            )
+            # TODO: #146 These asserts should check for 0 -- the buffers should never go below 0
+            # We think that this is happening due to an rounding error, based on the size of the difference
+            assert market_state.base_buffer >= -1e-8, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected base_buffer >= 0, not {market_state.base_buffer}!"
+            )
+            assert market_state.lp_reserves >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected lp_reserves >= 0, not {market_state.lp_reserves}!"
+            )
+            assert rate >= 0, f"pricing_models.calc_lp_out_given_tokens_in: ERROR: expected rate >= 0, not {rate}!"
+            assert 1 >= time_remaining.normalized_time >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"Expected 1 >= time_remaining >= 0, not {time_remaining.normalized_time}!"
+            )
+            assert time_remaining.stretched_time >= 0, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                f"expected stretched_time_remaining >= 0, not {time_remaining.stretched_time}!"
+            )
+            assert market_state.share_price >= market_state.init_share_price >= 1, (
+                "pricing_models.calc_lp_out_given_tokens_in: ERROR: "
+                "expected share_price >= init_share_price >= 1, not "
+                f"share_price={market_state.share_price}, and init_share_price={market_state.init_share_price}"
+            )
         d_base = (
             market_state.share_price
             * (market_state.share_reserves - market_state.base_buffer)
@@ -255,42 +212,6 @@ class YieldSpacePricingModel(PricingModel):
             * (1 + rate * time_remaining.normalized_time) ** (1 / time_remaining.stretched_time)
             - market_state.share_price
         ) - market_state.bond_reserves
-        logging.debug(
-            (
-                "inputs: lp_in=%g, share_reserves=%d, "
-                "bond_reserves=%d, base_buffer=%g, "
-                "init_share_price=%g, share_price=%g, lp_reserves=%g, "
-                "rate=%g, time_remaining=%g, stretched_time_remaining=%g"
-                "  d_shares=%g (d_base / share_price = %g / %g)"
-                "  d_bonds=%g\n"
-                "((share_reserves + d_share_reserves) / 2 * (init_share_price * (1 + rate * time_remaining) "
-                "** (1 / stretched_time_remaining) - share_price) - bond_reserves = "
-                "(%g + %g) / 2 * (%g * (1 + %g * %g) "
-                "** (1 / %g) - %g) - %g)"
-            ),
-            lp_in,
-            market_state.share_reserves,
-            market_state.bond_reserves,
-            market_state.base_buffer,
-            market_state.init_share_price,
-            market_state.share_price,
-            market_state.lp_reserves,
-            rate,
-            time_remaining.normalized_time,
-            time_remaining.stretched_time,
-            d_shares,
-            d_base,
-            market_state.share_price,
-            d_bonds,
-            market_state.share_reserves,
-            d_shares,
-            market_state.init_share_price,
-            rate,
-            time_remaining.normalized_time,
-            time_remaining.stretched_time,
-            market_state.share_price,
-            market_state.bond_reserves,
-        )
         return lp_in, d_base, d_bonds
 
     def calc_in_given_out(
@@ -368,19 +289,22 @@ class YieldSpacePricingModel(PricingModel):
         """
 
         # Calculate some common values up front
-        time_elapsed = 1 - Decimal(time_remaining.stretched_time)
-        init_share_price = Decimal(market_state.init_share_price)
-        share_price = Decimal(market_state.share_price)
+        num = self.backend.number
+        power = self.backend.power
+        to_float = self.backend.to_float
+        time_elapsed = 1 - num(time_remaining.stretched_time)
+        init_share_price = num(market_state.init_share_price)
+        share_price = num(market_state.share_price)
         scale = share_price / init_share_price
-        share_reserves = Decimal(market_state.share_reserves)
-        bond_reserves = Decimal(market_state.bond_reserves)
+        share_reserves = num(market_state.share_reserves)
+        bond_reserves = num(market_state.bond_reserves)
         total_reserves = share_price * share_reserves + bond_reserves
         spot_price = self._calc_spot_price_from_reserves_high_precision(
             market_state,
             time_remaining,
         )
-        out_amount = Decimal(out.amount)
-        trade_fee_percent = Decimal(market_state.trade_fee_percent)
+        out_amount = num(out.amount)
+        trade_fee_percent = num(market_state.trade_fee_percent)
 
         # We precompute the YieldSpace constant k using the current reserves and
         # share price:
@@ -414,9 +338,10 @@ class YieldSpacePricingModel(PricingModel):
             # d_y' = (k - (c / mu) * (mu * (z - d_z))**(1 - tau))**(1 / (1 - tau)) - (2y + cz)
             #
             # without_fee = d_y'
-            without_fee = (k - scale * (init_share_price * (out_reserves - d_shares)) ** time_elapsed) ** (
-                1 / time_elapsed
-            ) - in_reserves
+            without_fee = (
+                power(k - scale * power(init_share_price * (out_reserves - d_shares), time_elapsed), 1 / time_elapsed)
+                - in_reserves
+            )
 
             # The fees are calculated as the difference between the bonds paid
             # without slippage and the base received times the fee percentage.
@@ -427,7 +352,7 @@ class YieldSpacePricingModel(PricingModel):
             logging.debug(
                 (
                     "fee = ((1 / spot_price) - 1) * _fee_percent * share_price * d_shares = "
-                    "((1 / %g) - 1) * %g * %g * %g = %g"
+                    "((1 / %s) - 1) * %s * %s * %s = %s"
                 ),
                 spot_price,
                 trade_fee_percent,
@@ -444,11 +369,11 @@ class YieldSpacePricingModel(PricingModel):
             # Create the user and market trade results.
             user_result = AgentTradeResult(
                 d_base=out.amount,
-                d_bonds=float(-with_fee),
+                d_bonds=to_float(-with_fee),
             )
             market_result = MarketTradeResult(
                 d_base=-out.amount,
-                d_bonds=float(with_fee),
+                d_bonds=to_float(with_fee),
             )
         elif out.unit == TokenType.PT:
             in_reserves = share_reserves
@@ -479,7 +404,8 @@ class YieldSpacePricingModel(PricingModel):
             #
             # without_fee = d_x'
             without_fee = (
-                (1 / init_share_price) * ((k - (out_reserves - d_bonds) ** time_elapsed) / scale) ** (1 / time_elapsed)
+                (1 / init_share_price)
+                * power((k - power(out_reserves - d_bonds, time_elapsed)) / scale, 1 / time_elapsed)
                 - in_reserves
             ) * share_price
 
@@ -490,7 +416,7 @@ class YieldSpacePricingModel(PricingModel):
             # fee = (1 - p) * phi * d_y
             fee = (1 - spot_price) * trade_fee_percent * d_bonds
             logging.debug(
-                ("fee = (1 - spot_price) * _fee_percent * d_bonds = (1 - %g) * %g * %g = %g"),
+                ("fee = (1 - spot_price) * _fee_percent * d_bonds = (1 - %s) * %s * %s = %s"),
                 spot_price,
                 trade_fee_percent,
                 d_bonds,
@@ -504,11 +430,11 @@ class YieldSpacePricingModel(PricingModel):
 
             # Create the user and market trade results.
             user_result = AgentTradeResult(
-                d_base=float(-with_fee),
+                d_base=to_float(-with_fee),
                 d_bonds=out.amount,
             )
             market_result = MarketTradeResult(
-                d_base=float(with_fee),
+                d_base=to_float(with_fee),
                 d_bonds=-out.amount,
             )
         else:
@@ -521,10 +447,10 @@ class YieldSpacePricingModel(PricingModel):
             user_result=user_result,
             market_result=market_result,
             breakdown=TradeBreakdown(
-                without_fee_or_slippage=float(without_fee_or_slippage),
-                with_fee=float(with_fee),
-                without_fee=float(without_fee),
-                fee=float(fee),
+                without_fee_or_slippage=to_float(without_fee_or_slippage),
+                with_fee=to_float(with_fee),
+                without_fee=to_float(without_fee),
+                fee=to_float(fee),
             ),
         )
 
@@ -605,19 +531,22 @@ class YieldSpacePricingModel(PricingModel):
         """
 
         # Calculate some common values up front
-        time_elapsed = 1 - Decimal(time_remaining.stretched_time)
-        init_share_price = Decimal(market_state.init_share_price)
-        share_price = Decimal(market_state.share_price)
+        num = self.backend.number
+        power = self.backend.power
+        to_float = self.backend.to_float
+        time_elapsed = 1 - num(time_remaining.stretched_time)
+        init_share_price = num(market_state.init_share_price)
+        share_price = num(market_state.share_price)
         scale = share_price / init_share_price
-        share_reserves = Decimal(market_state.share_reserves)
-        bond_reserves = Decimal(market_state.bond_reserves)
+        share_reserves = num(market_state.share_reserves)
+        bond_reserves = num(market_state.bond_reserves)
         total_reserves = share_price * share_reserves + bond_reserves
         spot_price = self._calc_spot_price_from_reserves_high_precision(
             market_state,
             time_remaining,
         )
-        in_amount = Decimal(in_.amount)
-        trade_fee_percent = Decimal(market_state.trade_fee_percent)
+        in_amount = num(in_.amount)
+        trade_fee_percent = num(market_state.trade_fee_percent)
 
         # We precompute the YieldSpace constant k using the current reserves and
         # share price:
@@ -646,9 +575,9 @@ class YieldSpacePricingModel(PricingModel):
             # without including fees:
             #
             # d_y' = 2y + cz - (k - (c / mu) * (mu * (z + d_z))**(1 - tau))**(1 / (1 - tau))
-            without_fee = out_reserves - (
-                k - scale * (init_share_price * (in_reserves + d_shares)) ** time_elapsed
-            ) ** (1 / time_elapsed)
+            without_fee = out_reserves - power(
+                k - scale * power(init_share_price * (in_reserves + d_shares), time_elapsed), 1 / time_elapsed
+            )
 
             # The fees are calculated as the difference between the bonds
             # received without slippage and the base paid times the fee
@@ -665,11 +594,11 @@ class YieldSpacePricingModel(PricingModel):
             # Create the user and market trade results.
             user_result = AgentTradeResult(
                 d_base=-in_.amount,
-                d_bonds=float(with_fee),
+                d_bonds=to_float(with_fee),
             )
             market_result = MarketTradeResult(
                 d_base=in_.amount,
-                d_bonds=float(-with_fee),
+                d_bonds=to_float(-with_fee),
             )
         elif in_.unit == TokenType.PT:
             d_bonds = in_amount
@@ -701,7 +630,8 @@ class YieldSpacePricingModel(PricingModel):
             # without_fee = d_x'
             without_fee = (
                 share_reserves
-                - (1 / init_share_price) * ((k - (in_reserves + d_bonds) ** time_elapsed) / scale) ** (1 / time_elapsed)
+                - (1 / init_share_price)
+                * power((k - power(in_reserves + d_bonds, time_elapsed)) / scale, 1 / time_elapsed)
             ) * share_price
 
             # The fees are calculated as the difference between the bonds paid
@@ -718,11 +648,11 @@ class YieldSpacePricingModel(PricingModel):
 
             # Create the user and market trade results.
             user_result = AgentTradeResult(
-                d_base=float(with_fee),
+                d_base=to_float(with_fee),
                 d_bonds=-in_.amount,
             )
             market_result = MarketTradeResult(
-                d_base=float(-with_fee),
+                d_base=to_float(-with_fee),
                 d_bonds=in_.amount,
             )
         else:
@@ -735,14 +665,14 @@ class YieldSpacePricingModel(PricingModel):
             user_result=user_result,
             market_result=market_result,
             breakdown=TradeBreakdown(
-                without_fee_or_slippage=float(without_fee_or_slippage),
-                with_fee=float(with_fee),
-                without_fee=float(without_fee),
-                fee=float(fee),
+                without_fee_or_slippage=to_float(without_fee_or_slippage),
+                with_fee=to_float(with_fee),
+                without_fee=to_float(without_fee),
+                fee=to_float(fee),
             ),
         )
 
-    def _calc_k_const(self, market_state: MarketState, time_remaining: StretchedTime) -> Decimal:
+    def _calc_k_const(self, market_state: MarketState, time_remaining: StretchedTime) -> Number:
         """
         Returns the 'k' constant variable for trade mathematics
 
@@ -755,15 +685,17 @@ class YieldSpacePricingModel(PricingModel):
 
         Returns
         -------
-        Decimal
-            'k' constant used for trade mathematics, calculated from the provided parameters
+        Number
+            'k' constant used for trade mathematics, calculated from the provided parameters,
+            in the working type of the numeric backend
         """
-        scale = Decimal(market_state.share_price) / Decimal(market_state.init_share_price)
-        total_reserves = Decimal(market_state.bond_reserves) + Decimal(market_state.share_price) * Decimal(
+        num = self.backend.number
+        power = self.backend.power
+        scale = num(market_state.share_price) / num(market_state.init_share_price)
+        total_reserves = num(market_state.bond_reserves) + num(market_state.share_price) * num(
             market_state.share_reserves
         )
-        time_elapsed = Decimal(1) - Decimal(time_remaining.stretched_time)
-        return (
-            scale * (Decimal(market_state.init_share_price) * Decimal(market_state.share_reserves)) ** time_elapsed
-            + (Decimal(market_state.bond_reserves) + Decimal(total_reserves)) ** time_elapsed
-        )
+        time_elapsed = num(1) - num(time_remaining.stretched_time)
+        return scale * power(
+            num(market_state.init_share_price) * num(market_state.share_reserves), time_elapsed
+        ) + power(num(market_state.bond_reserves) + num(total_reserves), time_elapsed)
@@ -0,0 +1,263 @@
+"""Bulk settlement of matured positions
+
+The market keeps a MaturityIndex of the positions opened on it, bucketed by the block at which they mature. When
+the simulator enables settle_matured_positions, every position that has matured is closed at the start of each
+block in a single batched pricing model call for all agents, instead of staying in the wallets until an agent or
+the final liquidation closes it. This keeps the wallets small, so the cost of valuing them does not grow with the
+length of the simulation.
+
+Matured positions have no time remaining, so they are redeemed at the flat part of the pricing model and the
+result does not depend on the order in which they are settled. The settlement trades follow market.close_long and
+market.close_short, including the clamping of shorts to the bond reserves, but are computed with the float64 batch
+pricing functions used by elfpy.valuation.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+import heapq
+import logging
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+from elfpy.types import MarketDeltas, TokenType
+from elfpy.wallet import Long, Short, Wallet
+
+if TYPE_CHECKING:
+    from elfpy.markets import Market
+
+# the position types tracked by the maturity index
+POSITION_TYPES = ("long", "short")
+
+
+class MaturityIndex:
+    r"""Outstanding positions, bucketed by the block at which they mature
+
+    Positions are added when they are opened and are not removed when they are closed early; settlement skips
+    positions that are no longer in the wallets.
+
+    Parameters
+    ----------
+    blocks_to_maturity : int
+        Number of blocks from the mint block until a position has no time remaining
+    """
+
+    def __init__(self, blocks_to_maturity: int):
+        self.blocks_to_maturity = blocks_to_maturity
+        # maturity block -> (wallet address, position type) of the positions minted blocks_to_maturity earlier
+        self.buckets: dict[int, dict[tuple[int, str], None]] = {}
+        self._maturity_blocks: list[int] = []  # heap of the keys of self.buckets
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets.values())
+
+    @property
+    def next_maturity_block(self) -> Optional[int]:
+        r"""The earliest block at which an indexed position matures, or None if the index is empty"""
+        return self._maturity_blocks[0] if self._maturity_blocks else None
+
+    def add(self, wallet_address: int, position_type: str, mint_block: int) -> None:
+        r"""Index a position that was opened at mint_block
+
+        Parameters
+        ----------
+        wallet_address : int
+            The address of the wallet that holds the position
+        position_type : str
+            One of POSITION_TYPES
+        mint_block : int
+            The block at which the position was opened
+        """
+        if position_type not in POSITION_TYPES:
+            raise ValueError(f"position_type must be one of {POSITION_TYPES}, not {position_type}")
+        maturity_block = mint_block + self.blocks_to_maturity
+        if maturity_block not in self.buckets:
+            self.buckets[maturity_block] = {}
+            heapq.heappush(self._maturity_blocks, maturity_block)
+        self.buckets[maturity_block][(wallet_address, position_type)] = None
+
+    def pop_matured(self, block_number: int) -> list[tuple[int, str, int]]:
+        r"""Remove and return the positions that have matured by block_number
+
+        Parameters
+        ----------
+        block_number : int
+            The current market block number
+
+        Returns
+        -------
+        list[tuple[int, str, int]]
+            The wallet address, position type, and mint block of each matured position, ordered by maturity block
+            and then by the order in which the positions were opened
+        """
+        matured = []
+        while self._maturity_blocks and self._maturity_blocks[0] <= block_number:
+            maturity_block = heapq.heappop(self._maturity_blocks)
+            mint_block = maturity_block - self.blocks_to_maturity
+            matured += [
+                (wallet_address, position_type, mint_block)
+                for wallet_address, position_type in self.buckets.pop(maturity_block)
+            ]
+        return matured
+
+
+def settle_matured_positions(market: Market, wallets: dict[int, Wallet]) -> dict[int, Wallet]:
+    r"""Close every matured position in the given wallets in one pass, and apply the trades to the market
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    wallets : dict[int, Wallet]
+        The agent wallets, keyed by address
+
+    Returns
+    -------
+    dict[int, Wallet]
+        The wallet deltas of each agent that had matured positions, to be applied with Agent.update_wallet
+    """
+    long_positions, short_positions = get_matured_positions(market, wallets)
+    wallet_deltas: dict[int, Wallet] = {}
+    market_deltas = MarketDeltas()
+    # both batches are priced against the market state before settlement
+    if long_positions:
+        settle_longs(market, long_positions, market_deltas, wallet_deltas)
+    if short_positions:
+        settle_shorts(market, short_positions, market_deltas, wallet_deltas)
+    if wallet_deltas:
+        logging.debug(
+            "settled matured positions of %d wallets at block %d\n%s",
+            len(wallet_deltas),
+            market.block_number,
+            market_deltas,
+        )
+        market.update_market(market_deltas)
+    return wallet_deltas
+
+
+def get_matured_positions(market: Market, wallets: dict[int, Wallet]) -> tuple[list[tuple], list[tuple]]:
+    r"""Pop the positions that have matured by the current block from the market's maturity index
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    wallets : dict[int, Wallet]
+        The agent wallets, keyed by address
+
+    Returns
+    -------
+    tuple[list[tuple], list[tuple]]
+        The (address, mint_block, balance) of each matured long, and the
+        (address, mint_block, balance, open_share_price) of each matured short, skipping closed positions
+    """
+    long_positions = []
+    short_positions = []
+    for wallet_address, position_type, mint_block in market.maturity_index.pop_matured(market.block_number):
+        wallet = wallets.get(wallet_address)
+        if wallet is None:
+            continue
+        if position_type == "long":
+            long = wallet.longs.get(mint_block)
+            if long is not None and long.balance > 0:
+                long_positions.append((wallet_address, mint_block, long.balance))
+        else:
+            short = wallet.shorts.get(mint_block)
+            if short is not None and short.balance > 0:
+                short_positions.append((wallet_address, mint_block, short.balance, short.open_share_price))
+    return long_positions, short_positions
+
+
+def settle_longs(
+    market: Market, long_positions: list[tuple], market_deltas: MarketDeltas, wallet_deltas: dict[int, Wallet]
+) -> None:
+    r"""Price closing trades for matured longs in one batch, and add their deltas
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    long_positions : list[tuple]
+        The (address, mint_block, balance) of each matured long
+    market_deltas : MarketDeltas
+        The market deltas of the settlement, which are updated in place
+    wallet_deltas : dict[int, Wallet]
+        The wallet deltas of each agent, keyed by address, which are updated in place
+    """
+    addresses, mint_blocks, balances = (np.array(column) for column in zip(*long_positions))
+    trade_result = market.pricing_model.calc_out_given_in_batch(
+        in_amount=balances,
+        in_unit=TokenType.PT,
+        market_state=market.market_state,
+        time_remaining=market.get_time_remaining(mint_blocks),
+    )
+    is_settled = np.isfinite(trade_result.user_result.d_base) & np.isfinite(trade_result.market_result.d_base)
+    market_deltas.d_base_asset += float(np.sum(trade_result.market_result.d_base[is_settled]))
+    market_deltas.d_token_asset += float(np.sum(trade_result.market_result.d_bonds[is_settled]))
+    market_deltas.d_base_buffer -= float(np.sum(balances[is_settled]))
+    for index in np.flatnonzero(is_settled):
+        deltas = wallet_deltas.setdefault(int(addresses[index]), Wallet(address=int(addresses[index])))
+        deltas.base += float(trade_result.user_result.d_base[index])
+        deltas.longs[int(mint_blocks[index])] = Long(float(trade_result.user_result.d_bonds[index]))
+        deltas.fees_paid += float(trade_result.breakdown.fee[index])
+    log_unsettled_positions("long", addresses[~is_settled], mint_blocks[~is_settled])
+
+
+def settle_shorts(
+    market: Market, short_positions: list[tuple], market_deltas: MarketDeltas, wallet_deltas: dict[int, Wallet]
+) -> None:
+    r"""Price closing trades for matured shorts in one batch, and add their deltas
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    short_positions : list[tuple]
+        The (address, mint_block, balance, open_share_price) of each matured short
+    market_deltas : MarketDeltas
+        The market deltas of the settlement, which are updated in place
+    wallet_deltas : dict[int, Wallet]
+        The wallet deltas of each agent, keyed by address, which are updated in place
+    """
+    addresses, mint_blocks, balances, open_share_prices = (np.array(column) for column in zip(*short_positions))
+    # close_short clamps the trade amount to the bond reserves
+    trade_amounts = np.minimum(balances, market.market_state.bond_reserves)
+    trade_result = market.pricing_model.calc_in_given_out_batch(
+        out_amount=trade_amounts,
+        out_unit=TokenType.PT,
+        market_state=market.market_state,
+        time_remaining=market.get_time_remaining(mint_blocks),
+    )
+    is_settled = np.isfinite(trade_result.user_result.d_base) & np.isfinite(trade_result.market_result.d_base)
+    market_deltas.d_base_asset += float(np.sum(trade_result.market_result.d_base[is_settled]))
+    market_deltas.d_token_asset += float(np.sum(trade_result.market_result.d_bonds[is_settled]))
+    market_deltas.d_bond_buffer -= float(np.sum(trade_amounts[is_settled]))
+    base_returned = (market.market_state.share_price / open_share_prices) * trade_amounts + (
+        trade_result.user_result.d_base
+    )
+    for index in np.flatnonzero(is_settled):
+        deltas = wallet_deltas.setdefault(int(addresses[index]), Wallet(address=int(addresses[index])))
+        deltas.base += float(base_returned[index])
+        deltas.shorts[int(mint_blocks[index])] = Short(balance=-float(trade_amounts[index]), open_share_price=0)
+        deltas.fees_paid += float(trade_result.breakdown.fee[index])
+    log_unsettled_positions("short", addresses[~is_settled], mint_blocks[~is_settled])
+
+
+def log_unsettled_positions(position_type: str, addresses: np.ndarray, mint_blocks: np.ndarray) -> None:
+    r"""Warn about matured positions that the reserves could not settle; they stay in the wallets
+
+    Parameters
+    ----------
+    position_type : str
+        One of POSITION_TYPES
+    addresses : np.ndarray
+        The wallet address of each unsettled position
+    mint_blocks : np.ndarray
+        The mint block of each unsettled position
+    """
+    for wallet_address, mint_block in zip(addresses.tolist(), mint_blocks.tolist()):
+        logging.warning(
+            "settlement.settle_matured_positions: WARNING: could not settle the %s of agent #%d minted at block %d",
+            position_type,
+            wallet_address,
+            mint_block,
+        )
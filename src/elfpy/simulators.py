@@ -2,22 +2,46 @@
 from __future__ import annotations  # types will be strings by default in 3.11
 
 from typing import Any, Optional, TYPE_CHECKING
+import copy
 import datetime
+import gzip
 import json
 import logging
+import math
+import pickle
 
 import numpy as np
 from numpy.random._generator import Generator
 
 import elfpy.utils.time as time_utils
+import elfpy.utils.price as price_utils
+from elfpy.utils.vault_apr import VaultAprStream
 from elfpy.utils.outputs import CustomEncoder
-from elfpy.types import MarketAction, MarketDeltas, RandomSimulationVariables, SimulationState
+from elfpy.utils.profiling import PhaseProfiler
+from elfpy.types import MarketAction, MarketActionType, RandomSimulationVariables, SimulationState
 from elfpy.utils import config as config_utils
+from elfpy import settlement, valuation
+from elfpy.wallet_registry import WalletRegistry
 
 if TYPE_CHECKING:
     from elfpy.agent import Agent
     from elfpy.markets import Market
+    from elfpy.populations import PopulationPolicy
     from elfpy.utils.config import Config
+    from elfpy.utils.sinks import StateSink
+    from elfpy.wallet import Wallet
+
+# incremented whenever a change to the Simulator makes old snapshots incompatible
+SNAPSHOT_FORMAT_VERSION = 11
+# when the simulator appends a row to simulation_state
+RECORD_CADENCES = ("trade", "interval", "block", "day", "reservoir")
+# trades that count towards the cumulative volume
+VOLUME_ACTION_TYPES = (
+    MarketActionType.OPEN_LONG,
+    MarketActionType.CLOSE_LONG,
+    MarketActionType.OPEN_SHORT,
+    MarketActionType.CLOSE_SHORT,
+)
 
 
 class Simulator:
@@ -29,6 +53,7 @@ class Simulator:
 
     # TODO: set up member (dataclass?) object that owns attributes instead of so many individual instance attributes
     # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-public-methods
 
     def __init__(
         self,
@@ -46,11 +71,26 @@ class Simulator:
         else:
             self.random_variables = random_simulation_variables
         self.check_vault_apr()
+        # the share price is looked up in a precomputed path, instead of accruing it with a delta each day
+        self.market.share_price_path = price_utils.get_share_price_path(
+            vault_apr=self.random_variables.vault_apr,
+            init_share_price=self.market.market_state.share_price,
+            compound_vault_apr=self.config.simulator.compound_vault_apr,
+            num_blocks_per_day=self.config.simulator.num_blocks_per_day,
+            accrual=self.config.simulator.share_price_accrual,
+        )
+        self.check_block_clock()
+        self.check_recording_config()
         self.agents = {}
+        self.populations: list[PopulationPolicy] = []  # the actions of their members are computed together
+        self.population_addresses: set[int] = set()
+        # if set, agent wallets are stored in the registry and each agent holds a view onto its entry
+        self.wallet_registry = WalletRegistry() if self.config.simulator.use_wallet_registry else None
 
         # Simulation variables
         self.run_number = 0
         self.day = 0
+        self.num_completed_days = 0
         self.block_number = 0
         self.daily_block_number = 0
         seconds_in_a_day = 86400
@@ -58,9 +98,26 @@ class Simulator:
         self.run_trade_number = 0
         self.start_time: datetime.datetime | None = None
         self.simulation_state = SimulationState()
+        self.last_row_needs_valuation = False  # True if the last row was recorded without marking to market
+        # the most recent mark-to-market wallet values, carried by rows that are recorded between valuations
+        self.last_mark: dict[str, float] = {}
+        self.last_mark_trade_number = -1  # the run_trade_number at which last_mark was computed
+        # aggregates are accumulated on every trade, regardless of how often rows are recorded
+        self.cumulative_volume = 0.0
+        self.cumulative_fees = 0.0
+        self.num_trades_since_record = 0
+        self.reservoir: list[dict[str, Any]] = []  # sampled rows when record_cadence is "reservoir"
+        # if set, full chunks of simulation_state rows are moved to the sink during run_simulation
+        self.state_sink: Optional[StateSink] = None
+        # times the phases of each block if profile_phases is enabled; see elfpy.utils.profiling
+        self.profiler = PhaseProfiler(enabled=self.config.simulator.profile_phases)
+        # keeps the most recent trades and their deltas if trace_capacity is set; see elfpy.utils.trace
+        self.market.trace.resize(self.config.simulator.trace_capacity)
 
     def check_vault_apr(self) -> None:
-        r"""Verify that the vault_apr is the right length"""
+        r"""Verify that the vault_apr is the right length, unless it is streamed"""
+        if isinstance(self.random_variables.vault_apr, VaultAprStream):
+            return
         if not len(self.random_variables.vault_apr) == self.config.simulator.num_trading_days:
             raise ValueError(
                 "vault_apr must have len equal to num_trading_days = "
@@ -68,6 +125,30 @@ class Simulator:
                 + f" not {len(self.random_variables.vault_apr)}"
             )
 
+    def check_block_clock(self) -> None:
+        r"""Verify that the market's block clock runs at num_blocks_per_day"""
+        blocks_per_year = 365 * self.config.simulator.num_blocks_per_day
+        if self.market.blocks_per_year != blocks_per_year:
+            raise ValueError(
+                f"market.blocks_per_year must be 365 * num_blocks_per_day = {blocks_per_year},"
+                f" not {self.market.blocks_per_year}"
+            )
+
+    def check_recording_config(self) -> None:
+        r"""Verify that the recording and valuation settings are valid"""
+        simulator_config = self.config.simulator
+        if simulator_config.record_cadence not in RECORD_CADENCES:
+            raise ValueError(f"record_cadence must be one of {RECORD_CADENCES}, not {simulator_config.record_cadence}")
+        if simulator_config.record_interval < 1:
+            raise ValueError(f"record_interval must be at least 1, not {simulator_config.record_interval}")
+        if simulator_config.reservoir_size < 1:
+            raise ValueError(f"reservoir_size must be at least 1, not {simulator_config.reservoir_size}")
+        if simulator_config.valuation_cadence not in valuation.VALUATION_CADENCES:
+            raise ValueError(
+                f"valuation_cadence must be one of {valuation.VALUATION_CADENCES},"
+                f" not {simulator_config.valuation_cadence}"
+            )
+
     def set_rng(self, rng: Generator) -> None:
         r"""Assign the internal random number generator to a new instantiation
         This function is useful for forcing identical trade volume and directions across simulation runs
@@ -80,6 +161,8 @@ class Simulator:
         if not isinstance(rng, Generator):
             raise TypeError(f"rng type must be a random number generator, not {type(rng)}.")
         self.rng = rng
+        # reservoir sampling draws from its own stream so that it does not change the simulation
+        self.reservoir_rng = np.random.default_rng(rng.bit_generator.seed_seq.spawn(1)[0])
 
     def log_config_variables(self) -> None:
         r"""Prints all variables that are in config"""
@@ -116,9 +199,10 @@ class Simulator:
     def add_agents(self, agent_list: list[Agent]) -> None:
         r"""Append the agents and simulation_state member variables
 
-        If trades have already happened (as indicated by self.run_trade_number), then empty wallet states are
-        prepended to the simulation_state for each new agent so that the state can still easily be converted into
-        a pandas dataframe.
+        If the simulator has a wallet_registry, each agent's wallet is moved into it. The wallet columns for each
+        new agent are registered in the simulation_state schema. If trades have already happened, the rows recorded
+        so far are filled with NaN for the new agent so that the state can still easily be converted into a pandas
+        dataframe.
 
         Parameters
         ----------
@@ -126,9 +210,22 @@ class Simulator:
             A list of instantiated Agent objects
         """
         for agent in agent_list:
+            if self.wallet_registry is not None:
+                agent.wallet = self.wallet_registry.add_wallet(agent.wallet)
             self.agents.update({agent.wallet.address: agent})
-            for key in agent.wallet.get_state_keys():
-                setattr(self.simulation_state, key, [None] * self.run_trade_number)
+            self.simulation_state.add_columns(agent.wallet.get_state_keys())
+
+    def add_population(self, population: PopulationPolicy) -> None:
+        r"""Add the members of a population as agents, whose actions are computed by the population
+
+        Parameters
+        ----------
+        population : PopulationPolicy
+            A population whose member agents are not yet in the simulator
+        """
+        self.add_agents(population.agents)
+        self.populations.append(population)
+        self.population_addresses.update(agent.wallet.address for agent in population.agents)
 
     def collect_and_execute_trades(self, last_block_in_sim: bool = False) -> None:
         r"""Get trades from the agent list, execute them, and update states
@@ -164,6 +261,37 @@ class Simulator:
         # Execute the trades.
         self.execute_trades(trades)
 
+    def apply_share_price(self) -> None:
+        r"""Set the market share price to its value at the current block in the precomputed share price path"""
+        with self.profiler.phase("share_price"):
+            share_price = self.market.share_price_path.get_share_price(self.block_number)
+            if share_price != self.market.market_state.share_price:
+                self.market.market_state.share_price = share_price
+                self.market.invalidate_quotes()
+
+    def settle_matured_positions(self) -> None:
+        r"""Close every matured position of every agent in bulk, if settle_matured_positions is enabled
+
+        See elfpy.settlement. The settlement is not counted as a trade, but its base and fees are added to the
+        cumulative volume and fees, as they would be for the closing trades.
+        """
+        if not self.config.simulator.settle_matured_positions:
+            return
+        next_maturity_block = self.market.maturity_index.next_maturity_block
+        if next_maturity_block is None or next_maturity_block > self.market.block_number:
+            return
+        # value the last row with the wallets it was recorded with
+        self.mark_last_row_to_market()
+        with self.profiler.phase("settlement"):
+            wallet_deltas = settlement.settle_matured_positions(
+                self.market, {address: agent.wallet for address, agent in self.agents.items()}
+            )
+            for address, agent_deltas in wallet_deltas.items():
+                agent = self.agents[address]
+                agent.update_wallet(agent_deltas, self.market)
+                self.cumulative_volume += abs(agent_deltas.base)
+                self.cumulative_fees += agent_deltas.fees_paid
+
     def collect_trades(self, agent_ids: Any) -> list[tuple[int, list[MarketAction]]]:
         r"""Collect trades from a set of provided agent IDs.
 
@@ -178,7 +306,20 @@ class Simulator:
         list[tuple[int, list[MarketAction]]]
             A list of trades associated with specific agents.
         """
-        return [(agent_id, self.agents[agent_id].get_trades(self.market)) for agent_id in agent_ids]
+        # each population computes the trades of all of its members at once
+        population_trades = {}
+        for population in self.populations:
+            with self.profiler.phase("collect_trades", policy=type(population).__name__):
+                population_trades.update(population.get_trades(self.market))
+        trades = []
+        for agent_id in agent_ids:
+            if agent_id in population_trades:
+                trades.append((agent_id, population_trades[agent_id]))
+            else:
+                agent = self.agents[agent_id]
+                with self.profiler.phase("collect_trades", policy=agent.name):
+                    trades.append((agent_id, agent.get_trades(self.market)))
+        return trades
 
     def collect_liquidation_trades(self, agent_ids: Any) -> list[tuple[int, list[MarketAction]]]:
         r"""Collect liquidation trades from a set of provided agent IDs.
@@ -195,7 +336,12 @@ class Simulator:
             A list of liquidation trades associated with specific agents.
         """
         logging.debug("Collecting liquiditation trades for market closure")
-        return [(agent_id, self.agents[agent_id].get_liquidation_trades(self.market)) for agent_id in agent_ids]
+        trades = []
+        for agent_id in agent_ids:
+            agent = self.agents[agent_id]
+            with self.profiler.phase("collect_trades", policy=agent.name):
+                trades.append((agent_id, agent.get_liquidation_trades(self.market)))
+        return trades
 
     def execute_trades(self, trades: list[tuple[int, list[MarketAction]]]) -> None:
         r"""Execute a list of trades associated with agents in the simulator.
@@ -208,98 +354,478 @@ class Simulator:
         for (agent_id, agent_trades) in trades:
             agent = self.agents[agent_id]
             for trade in agent_trades:
-                agent_deltas = self.market.trade_and_update(trade)
-                logging.debug(
-                    "agent #%g wallet deltas:\n%s",
-                    agent.wallet.address,
-                    agent_deltas,
-                )
-                agent.update_wallet(agent_deltas, self.market)
-                agent.log_status_report()
+                action_type = trade.action_type.value
+                with self.profiler.phase("trade_and_update", policy=agent.name, action_type=action_type):
+                    agent_deltas = self.market.trade_and_update(trade)
+                with self.profiler.phase("update_wallet", policy=agent.name, action_type=action_type):
+                    agent.update_wallet(agent_deltas, self.market)
+                with self.profiler.phase("logging"):
+                    agent.log_status_report()
+                self.accumulate_trade_metrics(trade, agent_deltas)
                 # TODO: Get simulator, market, pricing model, agent state strings and log
-                self.update_simulation_state()
-                self.run_trade_number += 1
+                self.record_trade()
+
+    def accumulate_trade_metrics(self, trade: MarketAction, agent_deltas: Wallet) -> None:
+        r"""Add an executed trade to the trade count, cumulative volume, and cumulative fees
 
-    def run_simulation(self) -> None:
+        Parameters
+        ----------
+        trade : MarketAction
+            The trade that was executed
+        agent_deltas : Wallet
+            The changes to the agent's wallet that resulted from the trade
+        """
+        self.run_trade_number += 1
+        self.num_trades_since_record += 1
+        if trade.action_type in VOLUME_ACTION_TYPES:
+            self.cumulative_volume += abs(agent_deltas.base)
+        self.cumulative_fees += agent_deltas.fees_paid
+
+    def record_trade(self) -> None:
+        r"""Record the state after a trade, if the record_cadence calls for it"""
+        record_cadence = self.config.simulator.record_cadence
+        if record_cadence == "trade" or (
+            record_cadence == "interval" and self.num_trades_since_record >= self.config.simulator.record_interval
+        ):
+            self.update_simulation_state()
+        elif record_cadence == "reservoir":
+            self.sample_reservoir()
+
+    def sample_reservoir(self) -> None:
+        r"""Keep the state after the current trade with probability reservoir_size / run_trade_number
+
+        This is reservoir sampling (Algorithm R), which keeps a uniform random sample of reservoir_size trades
+        without knowing the number of trades in advance. Rows are only constructed for sampled trades.
+        """
+        reservoir_size = self.config.simulator.reservoir_size
+        with self.profiler.phase("record_state"):
+            if len(self.reservoir) < reservoir_size:
+                self.reservoir.append(self.get_simulation_state_row())
+            else:
+                index = self.reservoir_rng.integers(self.run_trade_number)
+                if index < reservoir_size:
+                    self.reservoir[index] = self.get_simulation_state_row()
+        self.num_trades_since_record = 0
+
+    def record_block(self, end_of_day: bool) -> None:
+        r"""Record the state at the end of a block, if the record_cadence calls for it
+
+        A row is only recorded if at least one trade has been executed since the previous row.
+
+        Parameters
+        ----------
+        end_of_day : bool
+            True if the block is the last block of the day
+        """
+        record_cadence = self.config.simulator.record_cadence
+        if self.num_trades_since_record > 0 and (record_cadence == "block" or (record_cadence == "day" and end_of_day)):
+            self.update_simulation_state()
+
+    def finish_recording(self) -> None:
+        r"""Record the final state, or the sampled rows in order if the record_cadence is reservoir"""
+        if self.config.simulator.record_cadence == "reservoir":
+            columns = self.simulation_state.columns
+            for row in sorted(self.reservoir, key=lambda row: row["run_trade_number"]):
+                # agents that were added after the row was sampled have no wallet values
+                self.simulation_state.append({**dict.fromkeys(columns, np.nan), **row})
+            self.reservoir = []
+            self.num_trades_since_record = 0
+        elif self.num_trades_since_record > 0:
+            self.update_simulation_state()
+            self.mark_last_row_to_market()
+
+    def get_next_wakeup_time(self) -> float | None:
+        r"""Returns the earliest market time at which any agent might want to act
+
+        Returns
+        -------
+        float | None
+            The minimum of the wakeup times reported by the agents and populations, and of the next maturity if
+            matured positions are settled, or None if no agent will act until the market state changes
+        """
+        wakeup_times = [
+            agent.get_next_wakeup_time(self.market)
+            for address, agent in self.agents.items()
+            if address not in self.population_addresses
+        ]
+        wakeup_times += [population.get_next_wakeup_time(self.market) for population in self.populations]
+        if self.config.simulator.settle_matured_positions:
+            next_maturity_block = self.market.maturity_index.next_maturity_block
+            if next_maturity_block is not None:
+                wakeup_times.append(self.market.blocks_to_years(next_maturity_block))
+        wakeup_times = [wakeup_time for wakeup_time in wakeup_times if wakeup_time is not None]
+        return min(wakeup_times) if wakeup_times else None
+
+    def fast_forward_idle_blocks(self, next_wakeup_time: float | None, num_remaining_blocks: int) -> int:
+        r"""Fast-forward the market clock over consecutive blocks where no agent is scheduled to act
+
+        A block is idle if the next wakeup time is more than one market step after the block's time; waking up
+        a block early is harmless, but waking up late would change the results. The number of idle blocks is
+        computed from the integer block clock, and the market time of every block is derived from its block
+        number, so skipping blocks gives the same times as executing them. The skipped blocks also consume the
+        same random numbers as the block-by-block loop, so results are bit-identical.
+
+        Parameters
+        ----------
+        next_wakeup_time : float | None
+            Earliest market time at which any agent might act, as returned by `get_next_wakeup_time`
+        num_remaining_blocks : int
+            Maximum number of blocks that can be skipped, e.g. the blocks remaining in the current day
+
+        Returns
+        -------
+        int
+            The number of blocks that were skipped
+        """
+        block_number = self.market.block_number
+        if (
+            next_wakeup_time is None
+            or self.market.blocks_to_years(block_number + num_remaining_blocks) < next_wakeup_time
+        ):
+            num_idle_blocks = num_remaining_blocks
+        else:
+            # the first block whose time is not before the wakeup time, correcting the rounding of the product
+            wakeup_block = math.ceil(next_wakeup_time * self.market.blocks_per_year)
+            while self.market.blocks_to_years(wakeup_block) < next_wakeup_time:
+                wakeup_block += 1
+            while self.market.blocks_to_years(wakeup_block - 1) >= next_wakeup_time:
+                wakeup_block -= 1
+            num_idle_blocks = min(max(wakeup_block - block_number - 1, 0), num_remaining_blocks)
+        if num_idle_blocks > 0:
+            if self.config.simulator.shuffle_users:  # keep the rng stream aligned with the block-by-block loop
+                self.skip_agent_shuffles(num_idle_blocks)
+            self.market.tick(num_idle_blocks)
+            self.block_number += num_idle_blocks
+        return num_idle_blocks
+
+    def skip_agent_shuffles(self, num_blocks: int) -> None:
+        r"""Draw the random numbers of the agent shuffles of blocks that are skipped
+
+        Each row of a matrix is permuted with the same draws as a separate call to rng.permutation, so the
+        shuffles of many blocks are drawn together, in chunks that bound the size of the matrix.
+
+        Parameters
+        ----------
+        num_blocks : int
+            The number of skipped blocks
+        """
+        num_agents = len(self.agents)
+        if num_agents < 2:
+            return  # permuting fewer than two agents draws no random numbers
+        num_rows_per_chunk = max(2**16 // num_agents, 1)
+        for first_row in range(0, num_blocks, num_rows_per_chunk):
+            num_rows = min(num_rows_per_chunk, num_blocks - first_row)
+            self.rng.permuted(np.broadcast_to(np.arange(num_agents), (num_rows, num_agents)), axis=1)
+
+    def run_simulation(self, stop_day: Optional[int] = None) -> None:
         r"""Run the trade simulation and update the output state dictionary
 
         This is the primary function of the Simulator class.
         The PricingModel and Market objects will be constructed.
         A loop will execute a group of trades with random volumes and directions for each day,
         up to `self.config.simulator.num_trading_days` days.
+        If `self.config.simulator.skip_idle_blocks` is True, blocks where no agent is scheduled to act are
+        fast-forwarded instead of being executed one at a time.
+
+        The simulation can be run in several parts, e.g. to snapshot or fork it part way through. Each call
+        resumes from the first day that has not been completed, and running in parts gives the same results
+        as running all of the days at once.
+
+        If `self.config.simulator.profile_phases` is True, the time spent in each phase of the run, the trades and
+        blocks per second, and the number of pricing model calls are logged at the end; see elfpy.utils.profiling.
+
+        Parameters
+        ----------
+        stop_day : Optional[int]
+            If provided, the simulation is paused before this day is run. Defaults to num_trading_days.
 
         Returns
         -------
         There are no returns, but the function does update the simulation_state member variable
         """
-        last_block_in_sim = False
-        self.start_time = time_utils.current_datetime()
-        for day in range(0, self.config.simulator.num_trading_days):
-            self.day = day
-            self.market.market_state.vault_apr = self.random_variables.vault_apr[self.day]
-            # Vault return can vary per day, which sets the current price per share
-            if self.day > 0:  # Update only after first day (first day set to init_share_price)
-                if self.config.simulator.compound_vault_apr:  # Apply return to latest price (full compounding)
-                    price_multiplier = self.market.market_state.share_price
-                else:  # Apply return to starting price (no compounding)
-                    price_multiplier = self.market.market_state.init_share_price
-                delta = MarketDeltas(
-                    d_share_price=(
-                        self.market.market_state.vault_apr  # current day's apy
-                        / 365  # convert annual yield to daily
-                        * price_multiplier
-                    )
-                )
-                self.market.update_market(delta)
-            for daily_block_number in range(self.config.simulator.num_blocks_per_day):
-                self.daily_block_number = daily_block_number
-                last_block_in_sim = (self.day == self.config.simulator.num_trading_days - 1) and (
-                    self.daily_block_number == self.config.simulator.num_blocks_per_day - 1
-                )
-                self.collect_and_execute_trades(last_block_in_sim)
-                logging.debug("day = %d, daily_block_number = %d\n", self.day, self.daily_block_number)
-                self.market.log_market_step_string()
-                if not last_block_in_sim:
-                    self.market.tick(self.market_step_size())
-                    self.block_number += 1
-        # simulation has ended
-        for agent in self.agents.values():
-            agent.log_final_report(self.market)
+        skip_idle_blocks = self.config.simulator.skip_idle_blocks
+        num_blocks_per_day = self.config.simulator.num_blocks_per_day
+        num_trading_days = self.config.simulator.num_trading_days
+        stop_day = num_trading_days if stop_day is None else stop_day
+        if not self.num_completed_days <= stop_day <= num_trading_days:
+            raise ValueError(
+                f"stop_day must be between the number of completed days = {self.num_completed_days}"
+                f" and num_trading_days = {num_trading_days}, not {stop_day}"
+            )
+        start_day = self.num_completed_days
+        if self.start_time is None:
+            self.start_time = time_utils.current_datetime()
+        start_trade_number = self.run_trade_number
+        with self.profiler.profile_run(self.market.pricing_model):
+            for day in range(start_day, stop_day):
+                self.day = day
+                self.market.market_state.vault_apr = self.random_variables.vault_apr[self.day]
+                self.market.invalidate_quotes()
+                # Vault return can vary per day, which sets the current price per share
+                self.apply_share_price()
+                if skip_idle_blocks:
+                    next_wakeup_time = self.get_next_wakeup_time()
+                daily_block_number = 0
+                while daily_block_number < num_blocks_per_day:
+                    self.daily_block_number = daily_block_number
+                    if skip_idle_blocks:
+                        # the final block is always executed so that agents can liquidate
+                        last_day = self.day == self.config.simulator.num_trading_days - 1
+                        # the last block of each day is executed so that it can be recorded
+                        record_last_block = last_day or self.config.simulator.record_cadence == "day"
+                        num_remaining_blocks = num_blocks_per_day - daily_block_number - (1 if record_last_block else 0)
+                        num_idle_blocks = self.fast_forward_idle_blocks(next_wakeup_time, num_remaining_blocks)
+                        if num_idle_blocks > 0:
+                            daily_block_number += num_idle_blocks
+                            continue
+                    last_block_in_sim = self.run_block()
+                    if skip_idle_blocks and not last_block_in_sim:
+                        next_wakeup_time = self.get_next_wakeup_time()
+                    daily_block_number += 1
+                if self.config.simulator.valuation_cadence == "day":
+                    self.mark_last_row_to_market()
+                    self.flush_simulation_state()
+                self.num_completed_days = day + 1
+            if start_day < stop_day == num_trading_days:
+                # simulation has ended
+                self.finish_recording()
+                self.flush_simulation_state(flush_all=True)
+                self.log_final_reports()
+        if self.profiler.enabled:
+            self.profiler.num_trades += self.run_trade_number - start_trade_number
+            self.profiler.num_blocks += (stop_day - start_day) * num_blocks_per_day
+            logging.info("simulator: phase profile\n%s", self.profiler.get_report_string())
+
+    def log_final_reports(self) -> None:
+        r"""Log the final report of each agent at the end of the simulation"""
+        with self.profiler.phase("logging"):
+            for agent in self.agents.values():
+                agent.log_final_report(self.market)
+
+    def run_block(self) -> bool:
+        r"""Execute the trades of the current block, record it, and advance to the next block
+
+        Returns
+        -------
+        bool
+            True if this was the last block of the simulation, in which case the market is not advanced
+        """
+        num_blocks_per_day = self.config.simulator.num_blocks_per_day
+        last_block_in_sim = (self.day == self.config.simulator.num_trading_days - 1) and (
+            self.daily_block_number == num_blocks_per_day - 1
+        )
+        if self.config.simulator.share_price_accrual == "block":
+            self.apply_share_price()
+        self.settle_matured_positions()
+        self.collect_and_execute_trades(last_block_in_sim)
+        self.record_block(end_of_day=self.daily_block_number == num_blocks_per_day - 1)
+        if self.config.simulator.valuation_cadence == "block":
+            self.mark_last_row_to_market()
+        self.flush_simulation_state()
+        with self.profiler.phase("logging"):
+            logging.debug("day = %d, daily_block_number = %d\n", self.day, self.daily_block_number)
+            self.market.log_market_step_string()
+        if not last_block_in_sim:
+            self.market.tick()
+            self.block_number += 1
+        return last_block_in_sim
+
+    def flush_simulation_state(self, flush_all: bool = False) -> None:
+        r"""Move full chunks of recorded rows from simulation_state to the state_sink, if there is one
+
+        A row whose mark-to-market values have been deferred is kept until it has been valued.
+
+        Parameters
+        ----------
+        flush_all : bool
+            If True, the remaining rows are also flushed, as a final partial chunk
+        """
+        if self.state_sink is None:
+            return
+        chunk_size = self.state_sink.chunk_size
+        num_rows = len(self.simulation_state) - (1 if self.last_row_needs_valuation else 0)
+        with self.profiler.phase("flush_state"):
+            while num_rows >= chunk_size or (flush_all and num_rows > 0):
+                num_chunk_rows = min(chunk_size, num_rows)
+                self.state_sink.write_chunk(self.simulation_state.take_rows(num_chunk_rows))
+                num_rows -= num_chunk_rows
+
+    def fork(self) -> Simulator:
+        r"""Returns an independent copy of the simulator, which can be run without affecting the original
+
+        The copy includes the market, the agents, the random number generator state, the clock, and the recorded
+        simulation state. Both simulators continue with identical random numbers; use set_rng on either of them
+        to draw different random numbers. If there is a state_sink, the copies share the chunks that were written
+        before the fork and write new chunks to separate files in the same directory.
+
+        Returns
+        -------
+        Simulator
+            A deep copy of the simulator
+        """
+        return copy.deepcopy(self)
+
+    def save_snapshot(self, filename: str) -> None:
+        r"""Save the full simulator state to a compressed file
+
+        The snapshot is a gzip-compressed pickle of the simulator, which includes the market, the agents, the
+        random number generator state, the clock, and the recorded simulation state.
+
+        Parameters
+        ----------
+        filename : str
+            The file to write the snapshot to
+        """
+        snapshot = {"format_version": SNAPSHOT_FORMAT_VERSION, "simulator": self}
+        with gzip.open(filename, mode="wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load_snapshot(cls, filename: str) -> Simulator:
+        r"""Restore a simulator that was saved with save_snapshot
+
+        Snapshots are pickles, so only load snapshots from trusted sources.
+
+        Parameters
+        ----------
+        filename : str
+            The file to read the snapshot from
+
+        Returns
+        -------
+        Simulator
+            The restored simulator, which can be resumed with run_simulation
+        """
+        with gzip.open(filename, mode="rb") as file:
+            snapshot = pickle.load(file)
+        if not isinstance(snapshot, dict) or snapshot.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"{filename} is not a simulator snapshot with format version {SNAPSHOT_FORMAT_VERSION}")
+        simulator = snapshot["simulator"]
+        if not isinstance(simulator, cls):
+            raise TypeError(f"snapshot must contain a {cls.__name__}, not {type(simulator)}")
+        return simulator
 
     def update_simulation_state(self) -> None:
-        r"""Increment the list for each key in the simulation_state output variable"""
-        # pylint: disable=too-many-statements
-        self.simulation_state.model_name.append(self.market.pricing_model.model_name())
-        self.simulation_state.run_number.append(self.run_number)
-        self.simulation_state.simulation_start_time.append(self.start_time)
-        self.simulation_state.day.append(self.day)
-        self.simulation_state.block_number.append(self.block_number)
-        self.simulation_state.daily_block_number.append(self.daily_block_number)
-        self.simulation_state.block_timestamp.append(
-            time_utils.block_number_to_datetime(self.start_time, self.block_number, self.time_between_blocks)
-            if self.start_time
-            else "None"
+        r"""Append a row to the simulation_state output variable
+
+        With a valuation_cadence of "block" or "day", the row carries the most recent mark-to-market values; see
+        mark_last_row_to_market.
+        """
+        mark_to_market = self.config.simulator.valuation_cadence == "trade"
+        with self.profiler.phase("record_state"):
+            row = self.get_simulation_state_row(mark_to_market)
+            if not mark_to_market:
+                if any(key not in self.last_mark for key in row if key.endswith(("_total_longs", "_total_shorts"))):
+                    # value the positions of the agents that have no mark yet, and keep the others' last mark
+                    self.last_mark = {**self.get_mark(), **self.last_mark}
+                row.update(self.last_mark)
+            self.simulation_state.append(row)
+        self.last_row_needs_valuation = not mark_to_market
+        self.num_trades_since_record = 0
+
+    def get_simulation_state_row(self, mark_to_market: bool = True) -> dict[str, Any]:
+        r"""Returns the current state of the simulation as a simulation_state row
+
+        Parameters
+        ----------
+        mark_to_market : bool
+            If False, the agents' open positions are not valued by simulating closing trades;
+            see elfpy.valuation.get_wallets_state
+
+        Returns
+        -------
+        dict[str, Any]
+            The row, keyed by simulation_state column name
+        """
+        market_state = self.market.market_state
+        row = {
+            "model_name": self.market.pricing_model.model_name(),
+            "run_number": self.run_number,
+            "simulation_start_time": self.start_time,
+            "day": self.day,
+            "block_number": self.block_number,
+            "daily_block_number": self.daily_block_number,
+            "block_timestamp": (
+                time_utils.block_number_to_datetime(self.start_time, self.block_number, self.time_between_blocks)
+                if self.start_time
+                else "None"
+            ),
+            "current_market_datetime": (
+                time_utils.year_as_datetime(self.start_time, self.market.time) if self.start_time else "None"
+            ),
+            "current_market_time": self.market.time,
+            "run_trade_number": self.run_trade_number - 1,  # index of the last trade included in the row
+            "cumulative_volume": self.cumulative_volume,
+            "cumulative_fees": self.cumulative_fees,
+            "market_step_size": self.market_step_size(),
+            "position_duration": self.market.position_duration,
+            "target_liquidity": self.random_variables.target_liquidity,
+            "floor_fee": self.config.amm.floor_fee,
+            "init_vault_age": self.random_variables.init_vault_age,
+            "base_asset_price": self.config.market.base_asset_price,
+            "pool_apr": self.market.rate,
+            "num_trading_days": self.config.simulator.num_trading_days,
+            "num_blocks_per_day": self.config.simulator.num_blocks_per_day,
+            # TODO: This is a HACK to prevent test_sim from failing on market shutdown
+            # when the market closes, the share_reserves are 0 (or negative & close to 0) and several logging steps
+            # break
+            "spot_price": self.market.spot_price if market_state.share_reserves > 0 else np.nan,
+        }
+        row.update(market_state.__dict__)
+        row.update(
+            valuation.get_wallets_state(
+                self.market, [agent.wallet for agent in self.agents.values()], mark_to_market=mark_to_market
+            )
         )
-        self.simulation_state.current_market_datetime.append(
-            time_utils.year_as_datetime(self.start_time, self.market.time) if self.start_time else "None"
+        return row
+
+    def get_mark(self, market_block: Optional[int] = None) -> dict[str, float]:
+        r"""Value the agents' open positions by simulating closing trades
+
+        Parameters
+        ----------
+        market_block : Optional[int]
+            The market block number at which the positions are valued; defaults to market.block_number
+
+        Returns
+        -------
+        dict[str, float]
+            The total_longs and total_shorts of each agent, keyed by simulation_state column name
+        """
+        wallets_state = valuation.get_wallets_state(
+            self.market, [agent.wallet for agent in self.agents.values()], market_block=market_block
         )
-        self.simulation_state.current_market_time.append(self.market.time)
-        self.simulation_state.run_trade_number.append(self.run_trade_number)
-        self.simulation_state.market_step_size.append(self.market_step_size())
-        self.simulation_state.position_duration.append(self.market.position_duration)
-        self.simulation_state.target_liquidity.append(self.random_variables.target_liquidity)
-        self.simulation_state.floor_fee.append(self.config.amm.floor_fee)
-        self.simulation_state.init_vault_age.append(self.random_variables.init_vault_age)
-        self.simulation_state.base_asset_price.append(self.config.market.base_asset_price)
-        self.simulation_state.pool_apr.append(self.market.rate)
-        self.simulation_state.num_trading_days.append(self.config.simulator.num_trading_days)
-        self.simulation_state.num_blocks_per_day.append(self.config.simulator.num_blocks_per_day)
-        self.simulation_state.update_market_state(self.market.market_state)
-        for agent in self.agents.values():
-            self.simulation_state.update_agent_wallet(agent, self.market)
-        # TODO: This is a HACK to prevent test_sim from failing on market shutdown
-        # when the market closes, the share_reserves are 0 (or negative & close to 0) and several logging steps break
-        if self.market.market_state.share_reserves > 0:  # there is money in the market
-            self.simulation_state.spot_price.append(self.market.spot_price)
-        else:
-            self.simulation_state.spot_price.append(np.nan)
+        return {key: value for key, value in wallets_state.items() if key.endswith(("_total_longs", "_total_shorts"))}
+
+    def update_last_mark(self, market_block: Optional[int] = None) -> None:
+        r"""Mark the agents' open positions to market, and keep the values as the last mark
+
+        Parameters
+        ----------
+        market_block : Optional[int]
+            The market block number at which the positions are valued; defaults to market.block_number
+        """
+        self.last_mark = self.get_mark(market_block)
+        self.last_mark_trade_number = self.run_trade_number
+
+    def mark_last_row_to_market(self) -> None:
+        r"""Value the open positions at the end of a block or day, when the valuation_cadence defers valuations
+
+        With a valuation_cadence of "block" or "day", rows are recorded without simulating the closing trades and
+        carry the values of the most recent mark, and this function marks the positions to market once at the end
+        of each block or day. If the last row was recorded after the last trade, the wallets and reserves have not
+        changed since, so the positions are valued at the market block of that row and the row gets the exact
+        values. Otherwise the mark is only carried by later rows. No valuation is done if there were no trades
+        since the last one.
+        """
+        if self.config.simulator.valuation_cadence == "trade" or self.config.simulator.record_cadence == "reservoir":
+            return  # every row is marked to market when it is recorded
+        if self.last_row_needs_valuation and self.num_trades_since_record == 0:
+            with self.profiler.phase("record_state"):
+                # the simulator and market block numbers advance together
+                self.update_last_mark(market_block=int(self.simulation_state["block_number"][-1]))
+                self.simulation_state.update_last_row(self.last_mark)
+        elif self.run_trade_number != self.last_mark_trade_number:
+            with self.profiler.phase("record_state"):
+                self.update_last_mark()
+        self.last_row_needs_valuation = False
@@ -1,15 +1,13 @@
 """A set of common types used throughtout the simulation codebase"""
 
 from __future__ import annotations  # types will be strings by default in 3.11
-from typing import TYPE_CHECKING
-from dataclasses import dataclass, field
+from typing import Any, Iterable
+from dataclasses import dataclass, field, fields
 from enum import Enum
 
-import elfpy.utils.time as time_utils
+import numpy as np
 
-if TYPE_CHECKING:
-    from elfpy.agent import Agent
-    from elfpy.markets import Market
+import elfpy.utils.time as time_utils
 
 
 def to_description(description: str) -> dict[str, str]:
@@ -35,6 +33,17 @@ class TokenType(Enum):
     PT = "pt"
 
 
+class ValidationLevel(Enum):
+    r"""How often the consistency checks of trades are run
+
+    FULL runs them on every trade, SAMPLED on the first of every validation_interval trades, and OFF never
+    """
+
+    FULL = "full"
+    SAMPLED = "sampled"
+    OFF = "off"
+
+
 class MarketActionType(Enum):
     r"""The descriptor of an action in a market"""
 
@@ -66,11 +75,42 @@ class StretchedTime:
     def __init__(self, days: float, time_stretch: float, normalizing_constant: float = 365):
         self._days = days
         self._time_stretch = time_stretch
-        self._stretched_time = time_utils.days_to_time_remaining(
-            self._days, self._time_stretch, normalizing_constant=normalizing_constant
-        )
+        self._normalized_time = time_utils.norm_days(self._days, normalizing_constant)
+        self._stretched_time = time_utils.stretch_time(self._normalized_time, self._time_stretch)
         self.normalizing_constant = normalizing_constant
 
+    @classmethod
+    def from_components(
+        cls, days: Any, normalized_time: Any, stretched_time: Any, time_stretch: float, normalizing_constant: float
+    ) -> StretchedTime:
+        r"""Construct a StretchedTime from already computed components, e.g. rows of a StretchedTimeTable
+
+        Parameters
+        ----------
+        days : Any
+            Time remaining, in days
+        normalized_time : Any
+            Time remaining, normalized by normalizing_constant
+        stretched_time : Any
+            Time remaining, normalized and stretched by time_stretch
+        time_stretch : float
+            The time stretch constant
+        normalizing_constant : float
+            Amount of days used as a normalization factor
+
+        Returns
+        -------
+        StretchedTime
+            The time value, without recomputing its components
+        """
+        stretched = cls.__new__(cls)
+        stretched._days = days
+        stretched._time_stretch = time_stretch
+        stretched._normalized_time = normalized_time
+        stretched._stretched_time = stretched_time
+        stretched.normalizing_constant = normalizing_constant
+        return stretched
+
     @property
     def days(self):
         r"""Format time as days"""
@@ -79,10 +119,7 @@ class StretchedTime:
     @property
     def normalized_time(self):
         r"""Format time as normalized days"""
-        return time_utils.norm_days(
-            self._days,
-            self.normalizing_constant,
-        )
+        return self._normalized_time
 
     @property
     def stretched_time(self):
@@ -105,6 +142,141 @@ class StretchedTime:
         return output_string
 
 
+class StretchedTimeTable:
+    r"""Time remaining on positions, as a function of the number of blocks since they were minted
+
+    Time remaining only depends on the block offset (market block minus mint block) and the fixed position
+    duration, so the days, normalized time, and stretched time remaining are stored in arrays indexed by block
+    offset and shared by every trade and valuation on the market. Rows are computed lazily in pages of
+    ``page_size`` offsets, with the same arithmetic as time.get_years_remaining_at_block and StretchedTime,
+    so looked up values are identical to computing them directly. Offsets past maturity share the final row,
+    which has zero time remaining.
+
+    Parameters
+    ----------
+    position_duration : StretchedTime
+        The duration of positions on the market
+    blocks_per_year : int
+        Number of blocks in a year
+    page_size : int
+        Number of block offsets computed together the first time one of them is looked up
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, position_duration: StretchedTime, blocks_per_year: int, page_size: int = 4_096):
+        self.position_duration = position_duration
+        self.blocks_per_year = blocks_per_year
+        self.page_size = page_size
+        self.position_duration_years = position_duration.days / 365
+        # the first offset at which positions have matured, plus one row with zero time remaining
+        self.num_rows = int(np.floor(self.position_duration_years * blocks_per_year)) + 2
+        # the smallest block offset at which positions have no time remaining
+        self.blocks_to_maturity = self.num_rows - 1
+        while self.blocks_to_maturity > 0 and self._calc_years_remaining(self.blocks_to_maturity - 1) == 0:
+            self.blocks_to_maturity -= 1
+        self._reset()
+
+    def _calc_years_remaining(self, block_offsets: Any) -> Any:
+        r"""Years remaining on positions minted the given number of blocks ago"""
+        return time_utils.get_years_remaining_at_block(
+            market_block=block_offsets,
+            mint_block=0,
+            blocks_per_year=self.blocks_per_year,
+            position_duration_years=self.position_duration_years,
+        )
+
+    def _reset(self) -> None:
+        r"""Allocate the (uncomputed) table; untouched pages are never written, so they use no memory"""
+        self.days = np.empty(self.num_rows, dtype=np.float64)
+        self.normalized_time = np.empty(self.num_rows, dtype=np.float64)
+        self.stretched_time = np.empty(self.num_rows, dtype=np.float64)
+        self._is_page_computed = np.zeros(-(-self.num_rows // self.page_size), dtype=bool)
+
+    def __getstate__(self) -> dict:
+        r"""Pickle (and copy) the table parameters only; the rows are recomputed on demand"""
+        state = self.__dict__.copy()
+        for key in ["days", "normalized_time", "stretched_time", "_is_page_computed"]:
+            del state[key]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._reset()
+
+    @property
+    def num_computed_pages(self) -> int:
+        r"""The number of pages whose rows have been computed"""
+        return int(np.count_nonzero(self._is_page_computed))
+
+    def _compute_pages(self, pages: np.ndarray) -> None:
+        r"""Fill in the rows of the given pages"""
+        for page in pages:
+            rows = np.arange(page * self.page_size, min((page + 1) * self.page_size, self.num_rows))
+            days = self._calc_years_remaining(rows) * 365  # converting years to days
+            normalized_time = time_utils.norm_days(days, self.position_duration.normalizing_constant)
+            self.days[rows] = days
+            self.normalized_time[rows] = normalized_time
+            self.stretched_time[rows] = time_utils.stretch_time(normalized_time, self.position_duration.time_stretch)
+            self._is_page_computed[page] = True
+
+    def get_rows(self, block_offsets: Any) -> Any:
+        r"""Returns the table rows for the given block offsets, computing them if needed
+
+        Parameters
+        ----------
+        block_offsets : Any
+            Number of blocks elapsed since the positions were minted, or a NumPy array of them
+
+        Returns
+        -------
+        Any
+            The row index, or an array of them, into days, normalized_time, and stretched_time
+        """
+        if np.any(np.asarray(block_offsets) < 0):
+            raise ValueError(f"elfpy.types.StretchedTimeTable.get_rows: ERROR: {block_offsets=} must be non-negative.")
+        rows = np.minimum(block_offsets, self.num_rows - 1)
+        pages = np.unique(rows // self.page_size)
+        missing_pages = pages[~self._is_page_computed[pages]]
+        if len(missing_pages) > 0:
+            self._compute_pages(missing_pages)
+        return rows
+
+    def get_time_remaining(self, block_offsets: Any) -> StretchedTime:
+        r"""Returns the time remaining on positions minted the given number of blocks ago
+
+        Parameters
+        ----------
+        block_offsets : Any
+            Number of blocks elapsed since the positions were minted, or a NumPy array of them
+
+        Returns
+        -------
+        StretchedTime
+            Time remaining; the components are floats for a scalar offset and arrays for an array of offsets
+        """
+        rows = self.get_rows(block_offsets)
+        if np.ndim(rows) == 0:
+            days, normalized_time, stretched_time = (
+                float(self.days[rows]),
+                float(self.normalized_time[rows]),
+                float(self.stretched_time[rows]),
+            )
+        else:
+            days, normalized_time, stretched_time = (
+                self.days[rows],
+                self.normalized_time[rows],
+                self.stretched_time[rows],
+            )
+        return StretchedTime.from_components(
+            days=days,
+            normalized_time=normalized_time,
+            stretched_time=stretched_time,
+            time_stretch=self.position_duration.time_stretch,
+            normalizing_constant=self.position_duration.normalizing_constant,
+        )
+
+
 @dataclass
 class MarketAction:
     r"""Market action specification"""
@@ -117,8 +289,8 @@ class MarketAction:
     wallet_address: int
     # the share price when a short was created
     open_share_price: float = 1
-    # mint time is set only for trades that act on existing positions (close long or close short)
-    mint_time: float = 0
+    # mint block is set only for trades that act on existing positions (close long or close short)
+    mint_block: int = 0
 
     def __str__(self):
         r"""Return a description of the Action"""
@@ -126,7 +298,7 @@ class MarketAction:
         for key, value in self.__dict__.items():
             if key == "action_type":
                 output_string += f" execute {value}()"
-            elif key in ["trade_amount", "mint_time"]:
+            elif key in ["trade_amount", "mint_block"]:
                 output_string += f" {key}: {value}"
             elif key not in ["wallet_address", "agent"]:
                 output_string += f" {key}: {value}"
@@ -331,7 +503,9 @@ class RandomSimulationVariables:
     target_pool_apr: float = field(metadata=to_description("desired fixed apr for as a decimal"))
     trade_fee_percent: float = field(metadata=to_description("LP fee percent to charge for trades"))
     redemption_fee_percent: float = field(metadata=to_description("LP fee percent to charge for redemption"))
-    vault_apr: list = field(metadata=to_description("yield bearing source APR"))
+    vault_apr: list = field(
+        metadata=to_description("yield bearing source APR of each day; a list, or an elfpy.utils.vault_apr stream")
+    )
     init_vault_age: float = field(metadata=to_description("fraction of a year since the vault was opened"))
     # NOTE: We ignore the type error since the value will never be None after
     # initialization, and we don't want the value to be set to None downstream.
@@ -345,101 +519,203 @@ class RandomSimulationVariables:
             self.init_share_price = (1 + self.vault_apr[0]) ** self.init_vault_age
 
 
-@dataclass
 class SimulationState:
-    r"""Simulator state, updated after each trade"""
+    r"""Simulator state, updated after each trade
 
-    # dataclasses can have many attributes
-    # pylint: disable=too-many-instance-attributes
-    model_name: list = field(
-        default_factory=list, metadata=to_description("the name of the pricing model that is used in simulation")
-    )
-    run_number: list = field(default_factory=list, metadata=to_description("simulation index"))
-    simulation_start_time: list = field(
-        default_factory=list, metadata=to_description("start datetime for a given simulation")
-    )
-    day: list = field(default_factory=list, metadata=to_description("day index in a given simulation"))
-    block_number: list = field(
-        default_factory=list, metadata=to_description(" integer, block index in a given simulation")
-    )
-    daily_block_number: list = field(
-        default_factory=list, metadata=to_description(" integer, block index in a given day")
-    )
-    block_timestamp: list = field(
-        default_factory=list, metadata=to_description(" datetime of a given block's creation")
-    )
-    current_market_datetime: list = field(
-        default_factory=list, metadata=to_description(" float, current market time as a datetime")
-    )
-    current_market_time: list = field(
-        default_factory=list, metadata=to_description(" float, current market time in years")
-    )
-    run_trade_number: list = field(
-        default_factory=list, metadata=to_description(" integer, trade number in a given simulation")
-    )
-    market_step_size: list = field(
-        default_factory=list, metadata=to_description(" minimum time discretization for market time step")
-    )
-    position_duration: list = field(
-        default_factory=list, metadata=to_description(" time lapse between token mint and expiry as a yearfrac")
-    )
-    target_liquidity: list = field(
-        default_factory=list, metadata=to_description("amount of liquidity the market should stop with")
-    )
-    trade_fee_percent: list = field(
-        default_factory=list, metadata=to_description("the percentage of trade outputs to be collected as fees")
-    )
-    redemption_fee_percent: list = field(
-        default_factory=list, metadata=to_description("the percentage of redemption outputs to be collected as fees")
-    )
-    floor_fee: list = field(default_factory=list, metadata=to_description(" minimum fee we take"))
-    init_vault_age: list = field(default_factory=list, metadata=to_description("the age of the underlying vault"))
-    base_asset_price: list = field(default_factory=list, metadata=to_description("the market price of the shares"))
-    pool_apr: list = field(default_factory=list, metadata=to_description("apr of the AMM pool"))
-    num_trading_days: list = field(default_factory=list, metadata=to_description(" number of days in a simulation"))
-    num_blocks_per_day: list = field(
-        default_factory=list, metadata=to_description(" number of blocks in a day, simulates time between blocks")
+    The state is stored column-wise in preallocated NumPy arrays that grow by doubling whenever they run out of
+    room, so appending a row is amortized O(1) and does not allocate a Python object per value. The schema is fixed:
+    the simulator columns and the MarketState fields are registered at construction, and agent wallet columns are
+    registered once when agents are added to the simulator.
+
+    Columns are accessed by name, e.g. ``simulation_state["spot_price"]`` or ``simulation_state.spot_price``,
+    which returns a read-only view onto the recorded rows.
+    """
+
+    # name, dtype, description
+    simulator_columns = (
+        ("model_name", object, "the name of the pricing model that is used in simulation"),
+        ("run_number", np.int64, "simulation index"),
+        ("simulation_start_time", object, "start datetime for a given simulation"),
+        ("day", np.int64, "day index in a given simulation"),
+        ("block_number", np.int64, "integer, block index in a given simulation"),
+        ("daily_block_number", np.int64, "integer, block index in a given day"),
+        ("block_timestamp", object, "datetime of a given block's creation"),
+        ("current_market_datetime", object, "float, current market time as a datetime"),
+        ("current_market_time", np.float64, "float, current market time in years"),
+        ("run_trade_number", np.int64, "integer, trade number in a given simulation"),
+        ("cumulative_volume", np.float64, "base exchanged in long and short trades, up to and including this row"),
+        ("cumulative_fees", np.float64, "fees paid by agents, up to and including this row"),
+        ("market_step_size", np.float64, "minimum time discretization for market time step"),
+        ("position_duration", object, "time lapse between token mint and expiry as a yearfrac"),
+        ("target_liquidity", np.float64, "amount of liquidity the market should stop with"),
+        ("trade_fee_percent", np.float64, "the percentage of trade outputs to be collected as fees"),
+        ("redemption_fee_percent", np.float64, "the percentage of redemption outputs to be collected as fees"),
+        ("floor_fee", np.float64, "minimum fee we take"),
+        ("init_vault_age", np.float64, "the age of the underlying vault"),
+        ("base_asset_price", np.float64, "the market price of the shares"),
+        ("pool_apr", np.float64, "apr of the AMM pool"),
+        ("num_trading_days", np.int64, "number of days in a simulation"),
+        ("num_blocks_per_day", np.int64, "number of blocks in a day, simulates time between blocks"),
+        ("spot_price", np.float64, "price of shares"),
     )
-    spot_price: list = field(default_factory=list, metadata=to_description("price of shares"))
 
-    def update_market_state(self, market_state: MarketState) -> None:
-        r"""Update each entry in the SimulationState's copy for the market state
-        by appending to the list for each key, or creating a new key.
+    def __init__(self, capacity: int = 1024):
+        self._capacity = max(int(capacity), 1)
+        self._num_rows = 0
+        self._columns: dict[str, np.ndarray] = {}
+        self.descriptions: dict[str, str] = {}
+        for name, dtype, description in self.simulator_columns:
+            self.add_column(name, dtype, description)
+        for market_field in fields(MarketState):
+            self.add_column(market_field.name, np.float64, "market state variable")
+
+    def add_column(self, name: str, dtype: Any = np.float64, description: str = "") -> None:
+        r"""Register a new column in the schema
+
+        Rows that were recorded before the column existed are filled with NaN (or None for object columns);
+        integer columns have no missing value, so they can only be added while the state is empty.
+        Registering a column that already exists is a no-op.
 
         Parameters
         ----------
-        market_state: MarketState
-            The state variable for the Market class
+        name : str
+            The column name
+        dtype : Any
+            NumPy dtype of the column
+        description : str
+            Human readable description of the column
         """
-        for key, val in market_state.__dict__.items():
-            if hasattr(self, key):
-                attribute_state = getattr(self, key)
-                attribute_state.append(val)
-                setattr(self, key, attribute_state)
-            else:
-                setattr(self, key, [val])
-
-    def update_agent_wallet(self, agent: Agent, market: Market) -> None:
-        r"""Update each entry in the SimulationState's copy for the agent wallet state
-        by appending to the list for each key, or creating a new key.
+        if name in self._columns:
+            return
+        column = np.empty(self._capacity, dtype=dtype)
+        if self._num_rows > 0:
+            column[: self._num_rows] = self._get_missing_value(name, column.dtype)
+        self._columns[name] = column
+        self.descriptions[name] = description
+
+    def add_columns(self, names: Iterable[str], dtype: Any = np.float64) -> None:
+        r"""Register several columns with the same dtype; see add_column"""
+        for name in names:
+            self.add_column(name, dtype)
+
+    def append(self, row: dict[str, Any]) -> None:
+        r"""Append a row of values
 
         Parameters
         ----------
-        agent: Agent
-            An instantiated Agent object
+        row : dict[str, Any]
+            Values keyed by column name. Every key must be a registered column. Float columns that are missing
+            from the row are filled with NaN and object columns with None; integer columns must be provided.
         """
-        for key, value in agent.wallet.get_state(market).items():
-            if hasattr(self, key):
-                key_list = getattr(self, key)
-                key_list.append(value)
-                setattr(self, key, key_list)
-            else:
-                setattr(self, key, [value])
+        if self._num_rows == self._capacity:
+            self._grow()
+        index = self._num_rows
+        columns = self._columns
+        if len(row) < len(columns):
+            for name, column in columns.items():
+                if name not in row:
+                    column[index] = self._get_missing_value(name, column.dtype)
+        for key, value in row.items():
+            columns[key][index] = value
+        self._num_rows += 1
+
+    def update_last_row(self, values: dict[str, Any]) -> None:
+        r"""Overwrite values in the most recently appended row
 
-    def __getitem__(self, key):
-        r"""Get object attribute referenced by `key`"""
-        return getattr(self, key)
+        Parameters
+        ----------
+        values : dict[str, Any]
+            Values keyed by column name. Every key must be a registered column.
+        """
+        if self._num_rows == 0:
+            raise IndexError("cannot update the last row of an empty SimulationState")
+        index = self._num_rows - 1
+        for key, value in values.items():
+            self._columns[key][index] = value
 
-    def __setitem__(self, key, value):
-        r"""Set object attribute referenced by `key` to `value`"""
-        setattr(self, key, value)
+    def take_rows(self, num_rows: int) -> dict[str, np.ndarray]:
+        r"""Remove the oldest rows from the state and return them
+
+        Parameters
+        ----------
+        num_rows : int
+            Number of rows to remove; if there are fewer rows, all of them are removed
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            Copies of the removed rows of each column, keyed by column name
+        """
+        num_rows = min(num_rows, self._num_rows)
+        num_remaining_rows = self._num_rows - num_rows
+        taken = {}
+        for name, column in self._columns.items():
+            taken[name] = column[:num_rows].copy()
+            column[:num_remaining_rows] = column[num_rows : self._num_rows]
+            if column.dtype == object:  # release the references held by the vacated slots
+                column[num_remaining_rows : self._num_rows] = None
+        self._num_rows = num_remaining_rows
+        return taken
+
+    @staticmethod
+    def _get_missing_value(name: str, dtype: np.dtype) -> Any:
+        r"""Returns the value that marks a missing entry in a column of the given dtype"""
+        if dtype == object:
+            return None
+        if np.issubdtype(dtype, np.inexact):
+            return np.nan
+        raise ValueError(f"column {name} of dtype {dtype} has no missing value, so it must be provided")
+
+    def _grow(self) -> None:
+        r"""Double the capacity of every column"""
+        self._capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[: self._num_rows] = column[: self._num_rows]
+            self._columns[name] = grown
+
+    @property
+    def columns(self) -> list[str]:
+        r"""Names of the registered columns, in insertion order"""
+        return list(self._columns)
+
+    def as_dict(self) -> dict[str, np.ndarray]:
+        r"""Returns the recorded rows of each column as views keyed by column name
+
+        The views share memory with the state, so no values are copied.
+        """
+        return {name: self[name] for name in self._columns}
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        r"""Get a read-only view onto the recorded values of column `key`"""
+        view = self._columns[key][: self._num_rows]
+        view.flags.writeable = False
+        return view
+
+    def __setitem__(self, key: str, value: Iterable[Any]) -> None:
+        r"""Overwrite (or create) column `key` with `value`, which must have one entry per recorded row"""
+        values = np.asarray(value)
+        if len(values) != self._num_rows:
+            raise ValueError(f"column {key} must have {self._num_rows} entries, not {len(values)}")
+        self.add_column(key, values.dtype)
+        self._columns[key][: self._num_rows] = values
+
+    def __getstate__(self) -> dict[str, Any]:
+        # only the recorded rows are serialized (or copied), not the unused capacity
+        state = self.__dict__.copy()
+        state["_capacity"] = max(self._num_rows, 1)
+        state["_columns"] = {name: column[: state["_capacity"]].copy() for name, column in self._columns.items()}
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        # only called when normal attribute lookup fails; fall back to the columns
+        columns = self.__dict__.get("_columns")
+        if columns is None or name not in columns:
+            raise AttributeError(f"{type(self).__name__} has no attribute or column {name}")
+        return self[name]
@@ -0,0 +1,540 @@
+"""Benchmarks of the pricing models, market trades, wallets, post processing, and end-to-end simulations
+
+Each benchmark case times a single call, such as one calc_out_given_in or one run_simulation, repeated until it has
+run for at least min_time seconds. Any setup that a call needs, e.g. a fresh copy of the market to trade on, is done
+before the timer starts. Cases run in their own worker process by default, so that the peak resident set size of each
+case is measured separately.
+
+Results are written as JSON, with metadata that identifies the checkout they were measured on. To find a regression,
+run the suite on both checkouts and compare the two files; cases are matched by name. The cases are built with the
+block-numbered market API (Market.block_number, MarketAction.mint_block, and pricing model backends), so both
+checkouts must have it; the suite cannot be run on older checkouts. Results measured without the result cache
+module have no code fingerprint.
+
+Example
+-------
+python -m elfpy.utils.benchmark --output baseline.json
+(switch to the other checkout)
+python -m elfpy.utils.benchmark --output candidate.json
+python -m elfpy.utils.benchmark --compare baseline.json candidate.json
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, TYPE_CHECKING
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from elfpy.types import MarketAction, MarketActionType, Quantity, TokenType
+from elfpy.utils import outputs, post_processing, sim_utils
+from elfpy.utils.outputs import CustomEncoder
+import elfpy.utils.parse_config as config_utils
+
+try:
+    import resource
+except ImportError:  # resource is not available on Windows
+    resource = None
+
+try:
+    from elfpy.utils.result_cache import get_code_fingerprint
+except ImportError:  # checkouts from before the result cache
+    get_code_fingerprint = None
+
+if TYPE_CHECKING:
+    from elfpy.markets import Market
+    from elfpy.simulators import Simulator
+
+# policies of the agents in simulation benchmarks, assigned in turn
+AGENT_POLICIES = ["single_long", "single_short", "single_lp"]
+# amount of base or bonds in each benchmarked trade
+TRADE_AMOUNT = 1_000
+# number of longs and of shorts in the wallet of the Wallet.get_state benchmark
+NUM_WALLET_POSITIONS = 8
+
+
+@dataclass(frozen=True)
+class SimulationScale:
+    r"""Size of an end-to-end simulation benchmark"""
+
+    num_agents: int
+    num_trading_days: int
+    num_blocks_per_day: int
+
+    def __str__(self):
+        return f"{self.num_agents}x{self.num_trading_days}x{self.num_blocks_per_day}"
+
+    @classmethod
+    def from_string(cls, scale: str) -> SimulationScale:
+        r"""Parse a scale of the form AGENTSxDAYSxBLOCKS, e.g. 4x30x100"""
+        parts = scale.lower().split("x")
+        if len(parts) != 3 or not all(part.isdigit() and int(part) > 0 for part in parts):
+            raise ValueError(f"simulation scale must have the form AGENTSxDAYSxBLOCKS, not {scale}")
+        return cls(*(int(part) for part in parts))
+
+
+DEFAULT_SCALES = [SimulationScale(2, 10, 100), SimulationScale(8, 30, 100), SimulationScale(32, 30, 10)]
+
+
+@dataclass
+class BenchmarkOptions:
+    r"""Options shared by every benchmark case
+
+    Parameters
+    ----------
+    config_file : str
+        Config that the markets and simulations are constructed from
+    precision : Optional[int]
+        Precision of the pricing models; defaults to the precision in the config
+    min_time : float
+        Minimum number of seconds of timed calls in each case
+    max_calls : int
+        Maximum number of timed calls in each case
+    scales : list[SimulationScale]
+        Sizes of the end-to-end simulation cases
+    """
+
+    config_file: str = "config/example_config.toml"
+    precision: Optional[int] = None
+    min_time: float = 1.0
+    max_calls: int = 100_000
+    scales: list[SimulationScale] = field(default_factory=lambda: list(DEFAULT_SCALES))
+
+
+@dataclass
+class BenchmarkCase:
+    r"""A named benchmark
+
+    setup is called once, in the process that runs the case, and returns a function that prepares a trial. Preparing
+    a trial is not timed; it returns the call that is timed.
+    """
+
+    name: str
+    setup: Callable[[], Callable[[], Callable[[], Any]]]
+
+
+@dataclass
+class BenchmarkResult:
+    r"""Timing and memory use of a benchmark case"""
+
+    name: str
+    num_calls: int
+    total_seconds: float
+    ops_per_second: float
+    mean_seconds: float
+    min_seconds: float
+    peak_rss_bytes: Optional[int]
+
+
+def get_peak_rss_bytes() -> Optional[int]:
+    r"""Returns the peak resident set size of the current process in bytes, or None if it cannot be measured"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    return int(max_rss) if sys.platform == "darwin" else int(max_rss) * 1024
+
+
+def get_benchmark_simulator(options: BenchmarkOptions, scale: SimulationScale) -> Simulator:
+    r"""Construct a simulator from the benchmark config, with agents that cycle through AGENT_POLICIES
+
+    Parameters
+    ----------
+    options : BenchmarkOptions
+        The benchmark options, which select the config and precision
+    scale : SimulationScale
+        The number of agents, trading days, and blocks per day
+
+    Returns
+    -------
+    Simulator
+        The initialized simulator, which has not been run
+    """
+    override_dict: dict[str, Any] = {
+        "num_trading_days": scale.num_trading_days,
+        "num_blocks_per_day": scale.num_blocks_per_day,
+        "agent_policies": [AGENT_POLICIES[index % len(AGENT_POLICIES)] for index in range(scale.num_agents)],
+    }
+    if options.precision is not None:
+        override_dict["precision"] = options.precision
+    config = config_utils.override_config_variables(
+        config_utils.load_and_parse_config_file(options.config_file), override_dict
+    )
+    agents = [
+        sim_utils.get_policy(policy_name)(wallet_address=wallet_address)
+        for wallet_address, policy_name in enumerate(config.simulator.agent_policies, start=1)
+    ]
+    return sim_utils.get_simulator(config, agents)
+
+
+def get_market(options: BenchmarkOptions) -> Market:
+    r"""Returns a market that has been seeded by the initial LP, for the pricing and trade benchmarks"""
+    return get_benchmark_simulator(options, SimulationScale(1, 1, 1)).market
+
+
+def get_pricing_cases(options: BenchmarkOptions, model_name: str) -> list[BenchmarkCase]:
+    r"""Benchmarks of the trade calculations and maximum trade searches of a pricing model"""
+
+    def setup_calculation(calculation: str, unit: TokenType):
+        def setup():
+            market = get_market(options)
+            pricing_model = sim_utils.get_pricing_model(model_name, market.pricing_model.backend.precision)
+            method = getattr(pricing_model, calculation)
+            quantity = Quantity(amount=TRADE_AMOUNT, unit=unit)
+
+            def call():
+                return method(quantity, market.market_state, market.position_duration)
+
+            return lambda: call
+
+        return setup
+
+    def setup_max_trade(method_name: str):
+        def setup():
+            market = get_market(options)
+            pricing_model = sim_utils.get_pricing_model(model_name, market.pricing_model.backend.precision)
+            method = getattr(pricing_model, method_name)
+
+            def call():
+                return method(market.market_state, market.position_duration)
+
+            return lambda: call
+
+        return setup
+
+    cases = [
+        BenchmarkCase(f"pricing.{model_name}.{calculation}.{unit.value}", setup_calculation(calculation, unit))
+        for calculation in ["calc_in_given_out", "calc_out_given_in"]
+        for unit in [TokenType.BASE, TokenType.PT]
+    ]
+    cases += [
+        BenchmarkCase(f"pricing.{model_name}.{method_name}", setup_max_trade(method_name))
+        for method_name in ["get_max_long", "get_max_short"]
+    ]
+    return cases
+
+
+def get_market_cases(options: BenchmarkOptions) -> list[BenchmarkCase]:
+    r"""Benchmarks of each action type of Market.trade_and_update, each on a fresh copy of the market"""
+    # actions that need a position to act on are preceded by an untimed action that opens it
+    opening_actions = {
+        MarketActionType.CLOSE_LONG: MarketActionType.OPEN_LONG,
+        MarketActionType.CLOSE_SHORT: MarketActionType.OPEN_SHORT,
+        MarketActionType.REMOVE_LIQUIDITY: MarketActionType.ADD_LIQUIDITY,
+    }
+
+    def setup_action(action_type: MarketActionType):
+        def setup():
+            market = get_market(options)
+
+            def prepare_trial():
+                trial_market = copy.deepcopy(market)
+                action = MarketAction(action_type=action_type, trade_amount=TRADE_AMOUNT, wallet_address=1)
+                if action_type in opening_actions:
+                    opening_action = MarketAction(
+                        action_type=opening_actions[action_type], trade_amount=TRADE_AMOUNT, wallet_address=1
+                    )
+                    trial_market.trade_and_update(opening_action)
+                    action.mint_block = trial_market.block_number
+                    action.open_share_price = trial_market.market_state.share_price
+                return lambda: trial_market.trade_and_update(action)
+
+            return prepare_trial
+
+        return setup
+
+    return [
+        BenchmarkCase(f"market.trade_and_update.{action_type.value}", setup_action(action_type))
+        for action_type in MarketActionType
+    ]
+
+
+def setup_wallet_state(options: BenchmarkOptions):
+    r"""Setup of the Wallet.get_state benchmark, with a wallet that holds longs and shorts minted in several blocks"""
+    simulator = get_benchmark_simulator(options, SimulationScale(1, 1, 1))
+    market = simulator.market
+    agent = simulator.agents[1]
+    for _ in range(NUM_WALLET_POSITIONS):
+        market.tick()
+        for action_type in [MarketActionType.OPEN_LONG, MarketActionType.OPEN_SHORT]:
+            action = MarketAction(action_type=action_type, trade_amount=TRADE_AMOUNT, wallet_address=1)
+            agent.update_wallet(market.trade_and_update(action), market)
+
+    def call():
+        return agent.wallet.get_state(market)
+
+    return lambda: call
+
+
+def setup_derived_variables(options: BenchmarkOptions):
+    r"""Setup of the compute_derived_variables benchmark, on the output of the first simulation scale"""
+    simulator = get_benchmark_simulator(options, options.scales[0] if options.scales else DEFAULT_SCALES[0])
+    simulator.run_simulation()
+
+    def call():
+        return post_processing.compute_derived_variables(simulator)
+
+    return lambda: call
+
+
+def setup_simulation(options: BenchmarkOptions, scale: SimulationScale):
+    r"""Setup of an end-to-end benchmark, which constructs a new simulator for each trial"""
+
+    def prepare_trial():
+        simulator = get_benchmark_simulator(options, scale)
+        return simulator.run_simulation
+
+    return lambda: prepare_trial
+
+
+def get_benchmark_cases(options: BenchmarkOptions) -> list[BenchmarkCase]:
+    r"""Returns every benchmark case, in the order that they are run
+
+    Constructing the cases is cheap; their markets and simulators are only built when a case is set up.
+
+    Parameters
+    ----------
+    options : BenchmarkOptions
+        The benchmark options
+
+    Returns
+    -------
+    list[BenchmarkCase]
+        The cases, with unique names
+    """
+    cases = get_pricing_cases(options, "YieldSpace") + get_pricing_cases(options, "Hyperdrive")
+    cases += get_market_cases(options)
+    cases.append(BenchmarkCase("wallet.get_state", lambda: setup_wallet_state(options)))
+    cases.append(BenchmarkCase("post_processing.compute_derived_variables", lambda: setup_derived_variables(options)))
+    cases += [
+        BenchmarkCase(f"simulation.run_simulation.{scale}", lambda scale=scale: setup_simulation(options, scale))
+        for scale in options.scales
+    ]
+    return cases
+
+
+def time_case(case: BenchmarkCase, options: BenchmarkOptions) -> BenchmarkResult:
+    r"""Set up a benchmark case, then time its calls after a single untimed warm up call
+
+    Parameters
+    ----------
+    case : BenchmarkCase
+        The case to run
+    options : BenchmarkOptions
+        The benchmark options, which set how long the case runs
+
+    Returns
+    -------
+    BenchmarkResult
+        The timing of the calls, and the peak resident set size of the process afterwards
+    """
+    prepare_trial = case.setup()
+    prepare_trial()()  # warm up caches and lazily computed tables
+    durations = []
+    total_seconds = 0.0
+    while len(durations) < options.max_calls and (not durations or total_seconds < options.min_time):
+        call = prepare_trial()
+        start = time.perf_counter()
+        call()
+        duration = time.perf_counter() - start
+        durations.append(duration)
+        total_seconds += duration
+    return BenchmarkResult(
+        name=case.name,
+        num_calls=len(durations),
+        total_seconds=total_seconds,
+        ops_per_second=len(durations) / total_seconds if total_seconds > 0 else float("inf"),
+        mean_seconds=total_seconds / len(durations),
+        min_seconds=min(durations),
+        peak_rss_bytes=get_peak_rss_bytes(),
+    )
+
+
+def run_benchmark_case(name: str, options: BenchmarkOptions) -> BenchmarkResult:
+    r"""Run the benchmark case with the given name; this is the entry point of the worker processes"""
+    cases = {case.name: case for case in get_benchmark_cases(options)}
+    if name not in cases:
+        raise ValueError(f"unknown benchmark case {name}")
+    return time_case(cases[name], options)
+
+
+def run_benchmarks(
+    options: BenchmarkOptions,
+    name_filters: Optional[list[str]] = None,
+    isolate: bool = True,
+) -> list[BenchmarkResult]:
+    r"""Run the benchmark cases whose names contain any of the filters
+
+    Parameters
+    ----------
+    options : BenchmarkOptions
+        The benchmark options
+    name_filters : Optional[list[str]]
+        Substrings of the names of the cases to run; defaults to every case
+    isolate : bool
+        If True, each case runs in a new worker process, so that its peak resident set size is not affected by the
+        cases before it. If False, the cases run in the current process, and the peak only ever increases.
+
+    Returns
+    -------
+    list[BenchmarkResult]
+        One result per case that was run, in the order of get_benchmark_cases
+    """
+    names = [
+        case.name
+        for case in get_benchmark_cases(options)
+        if not name_filters or any(name_filter in case.name for name_filter in name_filters)
+    ]
+    results = []
+    for name in names:
+        logging.info("benchmark: running %s", name)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results.append(executor.submit(run_benchmark_case, name, options).result())
+        else:
+            results.append(run_benchmark_case(name, options))
+    return results
+
+
+def get_git_revision() -> Optional[str]:
+    r"""Returns the git commit of the working directory, or None if it is not a git checkout"""
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.strip() or None
+
+
+def get_metadata(options: BenchmarkOptions) -> dict[str, Any]:
+    r"""Returns a description of the checkout, environment, and options that a set of results was measured with"""
+    return {
+        "git_revision": get_git_revision(),
+        "code_fingerprint": get_code_fingerprint() if get_code_fingerprint is not None else None,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python_version": platform.python_version(),
+        "numpy_version": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": options,
+    }
+
+
+def get_report(options: BenchmarkOptions, results: list[BenchmarkResult]) -> dict[str, Any]:
+    r"""Combine results with their metadata, in the format that is written to and read from JSON"""
+    return {
+        "metadata": json.loads(json.dumps(get_metadata(options), cls=CustomEncoder)),
+        "results": [result.__dict__ for result in results],
+    }
+
+
+def compare_reports(baseline: dict[str, Any], candidate: dict[str, Any]) -> pd.DataFrame:
+    r"""Compare two sets of benchmark results, matching cases by name
+
+    Parameters
+    ----------
+    baseline : dict[str, Any]
+        Report from get_report, or loaded from a JSON results file
+    candidate : dict[str, Any]
+        Report to compare against the baseline
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per case in either report. speedup is the ratio of the candidate to the baseline operations per second,
+        so values below one are slowdowns; rss_ratio is the ratio of the candidate to the baseline peak resident set
+        size. Cases that are missing from either report have NaN ratios.
+    """
+    columns = ["name", "ops_per_second", "peak_rss_bytes"]
+    baseline_df = pd.DataFrame(baseline["results"], columns=columns)
+    candidate_df = pd.DataFrame(candidate["results"], columns=columns)
+    comparison = baseline_df.merge(candidate_df, on="name", how="outer", suffixes=("_baseline", "_candidate"))
+    comparison["speedup"] = comparison.ops_per_second_candidate / comparison.ops_per_second_baseline
+    peak_rss_bytes = comparison[["peak_rss_bytes_baseline", "peak_rss_bytes_candidate"]].astype(float)
+    comparison["rss_ratio"] = peak_rss_bytes.peak_rss_bytes_candidate / peak_rss_bytes.peak_rss_bytes_baseline
+    return comparison
+
+
+def get_argparser() -> argparse.ArgumentParser:
+    """Define & parse arguments from stdin"""
+    parser = argparse.ArgumentParser(
+        prog="ElfBenchmark",
+        description="Benchmark elfpy pricing models, market trades, and simulations, or compare two sets of results",
+    )
+    parser.add_argument(
+        "--config", help="Config file. Default uses the example config.", default="config/example_config.toml", type=str
+    )
+    parser.add_argument("--precision", help="Pricing model precision. Default uses the config.", default=None, type=int)
+    parser.add_argument("--min_time", help="Minimum seconds of timed calls in each case", default=1.0, type=float)
+    parser.add_argument("--max_calls", help="Maximum number of timed calls in each case", default=100_000, type=int)
+    parser.add_argument(
+        "--scales",
+        help="Comma separated simulation sizes, as AGENTSxDAYSxBLOCKS",
+        default=",".join(str(scale) for scale in DEFAULT_SCALES),
+        type=str,
+    )
+    parser.add_argument(
+        "--filter",
+        help="Only run cases whose name contains this string. May be given more than once.",
+        default=[],
+        action="append",
+        type=str,
+    )
+    parser.add_argument(
+        "--no_isolate", help="Run every case in this process instead of a new process each", action="store_true"
+    )
+    parser.add_argument(
+        "--compare",
+        help="Compare two results files instead of running the benchmarks",
+        nargs=2,
+        default=None,
+        metavar=("BASELINE", "CANDIDATE"),
+    )
+    parser.add_argument(
+        "--output",
+        help="Optional output filename; JSON results, or a CSV comparison with --compare. Default prints to stdout",
+        default=None,
+    )
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run the benchmarks, or compare two results files, from command line arguments"""
+    args = get_argparser().parse_args(argv)
+    if args.compare is not None:
+        baseline_path, candidate_path = args.compare
+        with open(baseline_path, mode="r", encoding="UTF-8") as file:
+            baseline = json.load(file)
+        with open(candidate_path, mode="r", encoding="UTF-8") as file:
+            candidate = json.load(file)
+        comparison = compare_reports(baseline, candidate)
+        if args.output is None:
+            print(comparison.to_string(index=False))
+        else:
+            comparison.to_csv(args.output, index=False)
+        return
+    options = BenchmarkOptions(
+        config_file=args.config,
+        precision=args.precision,
+        min_time=args.min_time,
+        max_calls=args.max_calls,
+        scales=[SimulationScale.from_string(scale) for scale in args.scales.split(",")],
+    )
+    results = run_benchmarks(options, name_filters=args.filter, isolate=not args.no_isolate)
+    outputs.write_json(get_report(options, results), args.output)
+
+
+if __name__ == "__main__":
+    main()
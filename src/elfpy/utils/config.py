@@ -7,6 +7,7 @@ from numpy.random import Generator
 from stochastic.processes import GeometricBrownianMotion
 
 from elfpy.types import RandomSimulationVariables
+import elfpy.utils.vault_apr as vault_apr_utils
 
 # dataclasses can have many attributes
 # pylint: disable=too-many-instance-attributes
@@ -66,6 +67,9 @@ class SimulatorConfig:
     shuffle_users: bool = field(default=True, metadata={"hint": "shuffle order of action (as if random gas paid)"})
     agent_policies: list = field(default_factory=list, metadata={"hint": "List of strings naming user policies"})
     init_lp: bool = field(default=True, metadata={"hint": "use initial LP to seed pool"})
+    skip_idle_blocks: bool = field(
+        default=False, metadata={"hint": "fast-forward over blocks where no agent is scheduled to act"}
+    )
 
     num_position_days: int = field(default=365, metadata={"hint": "Term length in days of a position"})
 
@@ -74,12 +78,48 @@ class SimulatorConfig:
         default=True, metadata={"hint": "whether or not to use compounding revenue for the underlying yield source"}
     )
     init_vault_age: float = field(default=0, metadata={"hint": "initial vault age"})
+    share_price_accrual: str = field(
+        default="day",
+        metadata={"hint": "when the vault share price accrues; day, or block to interpolate it within each day"},
+    )
 
     # logging
     logging_level: str = field(default="info", metadata={"hint": "Logging level, as defined by stdlib logging"})
+    record_cadence: str = field(
+        default="trade",
+        metadata={"hint": "when to record simulation state; trade, interval, block, day, or reservoir"},
+    )
+    record_interval: int = field(default=1, metadata={"hint": "number of trades between rows for the interval cadence"})
+    reservoir_size: int = field(
+        default=1_000, metadata={"hint": "number of trades sampled uniformly for the reservoir cadence"}
+    )
+    profile_phases: bool = field(
+        default=False, metadata={"hint": "time each phase of the simulation and log a report after each run"}
+    )
+    trace_capacity: int = field(
+        default=0, metadata={"hint": "number of recent trade, market delta, and wallet delta events kept; 0 is off"}
+    )
+    use_wallet_registry: bool = field(
+        default=False, metadata={"hint": "store agent wallets in arrays, for simulations with many agents"}
+    )
+    valuation_cadence: str = field(
+        default="trade", metadata={"hint": "how often open positions are marked to market; trade, block, or day"}
+    )
+    settle_matured_positions: bool = field(
+        default=False, metadata={"hint": "close all matured positions in bulk at the start of each block"}
+    )
 
     # numerical
-    precision: int = field(default=64, metadata={"hint": "precision of calculations; max is 64"})
+    precision: int = field(
+        default=128, metadata={"hint": "bits of precision for pricing calculations; 64 (float) or 128 (Decimal)"}
+    )
+    validation_level: str = field(
+        default="full",
+        metadata={"hint": "how often the checks of trades are run; full, sampled every validation_interval, or off"},
+    )
+    validation_interval: int = field(
+        default=100, metadata={"hint": "number of trades per checked trade for the sampled validation_level"}
+    )
 
     # random
     random_seed: int = field(default=1, metadata={"hint": "int to be used for the random seed"})
@@ -110,9 +150,16 @@ class Config:
 
 
 def setup_vault_apr(config: Config):
-    """Construct the vault_apr list
+    """Construct the vault_apr list, or a stream of vault aprs
     Note: callable type option would allow for infinite num_trading_days after small modifications
 
+    A dict vault_apr names one of the processes in elfpy.utils.vault_apr and its arguments. If the dict has
+    ``"stream": True``, the aprs are generated lazily, ``"chunk_size"`` days at a time, by a VaultAprStream with its
+    own random number generator, which is seeded from the simulation rng; otherwise the whole list is sampled up
+    front. Without streaming, "geometricbrownianmotion" samples the path over a unit time horizon of
+    num_trading_days, as before; the streamed process instead uses a time unit of a year, so that the path can be
+    extended day by day.
+
     Parameters
     ----------
     config : Config
@@ -120,20 +167,15 @@ def setup_vault_apr(config: Config):
 
     Returns
     -------
-    vault_apr : list
-        list of apr values that is the same length as num_trading_days
+    vault_apr : list | VaultAprStream
+        list of apr values that is the same length as num_trading_days, or a stream of the apr of each day
     """
     if isinstance(config.market.vault_apr, dict):  # dictionary specifies parameters for the callable
-        if config.market.vault_apr["type"].lower() == "constant":
-            vault_apr = [
-                config.market.vault_apr["value"],
-            ] * config.simulator.num_trading_days
-        elif config.market.vault_apr["type"].lower() == "uniform":
-            vault_apr = config.simulator.rng.uniform(
-                low=config.market.vault_apr["low"],
-                high=config.market.vault_apr["high"],
-                size=config.simulator.num_trading_days,
-            ).tolist()
+        if config.market.vault_apr.get("stream", False):
+            process = vault_apr_utils.get_vault_apr_process(config.market.vault_apr)
+            stream_rng = np.random.default_rng(config.simulator.rng.integers(np.iinfo(np.int64).max))
+            chunk_size = config.market.vault_apr.get("chunk_size", vault_apr_utils.DAYS_PER_YEAR)
+            vault_apr = vault_apr_utils.VaultAprStream(process, stream_rng, chunk_size=chunk_size)
         elif config.market.vault_apr["type"].lower() == "geometricbrownianmotion":
             # the n argument is number of steps, so the number of points is n+1
             vault_apr = (
@@ -142,10 +184,8 @@ def setup_vault_apr(config: Config):
                 )
             ).tolist()
         else:
-            raise ValueError(
-                f"{config.market.vault_apr['type']=} not one of \"constant\","
-                f'"uniform", or "geometricbrownianmotion"'
-            )
+            process = vault_apr_utils.get_vault_apr_process(config.market.vault_apr)
+            vault_apr = process.sample(config.simulator.rng, num_days=config.simulator.num_trading_days)[0].tolist()
     elif isinstance(config.market.vault_apr, Callable):  # callable (optionally generator) function
         vault_apr = list(config.market.vault_apr())
     elif isinstance(config.market.vault_apr, list):  # user-defined list of values
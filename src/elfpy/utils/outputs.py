@@ -2,11 +2,13 @@
 from __future__ import annotations  # types will be strings by default in 3.11
 
 from typing import TYPE_CHECKING
+import atexit
 import os
+import queue
 import sys
 import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -417,29 +419,198 @@ def delete_log_file() -> None:
     logging.getLogger().removeHandler(handler)
 
 
+class BatchedRotatingFileHandler(RotatingFileHandler):
+    r"""A rotating file handler that writes formatted records to the file in batches
+
+    Records are formatted as they are emitted and held until batch_size records are pending or the handler is
+    flushed; each batch is then written and flushed at once, and the file size is checked for rollover once per batch.
+    This is the file handler of the background writer when logs are queued; see setup_logging.
+
+    Parameters
+    ----------
+    filename : str
+        The log file
+    mode : str
+        The mode the log file is opened with
+    max_bytes : int
+        The file is rolled over when a batch would take it past this size; 0 never rolls it over
+    batch_size : int
+        The number of pending records that triggers a write
+    """
+
+    def __init__(self, filename: str, mode: str = "a", max_bytes: int = 0, batch_size: int = 1):
+        super().__init__(filename, mode=mode, maxBytes=max_bytes)
+        self.batch_size = batch_size
+        self.pending: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        r"""Format the record and add it to the pending batch, writing the batch if it is full"""
+        try:
+            self.pending.append(self.format(record) + self.terminator)
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        r"""Write the pending records to the file"""
+        self.acquire()
+        try:
+            if not self.pending:
+                return
+            text = "".join(self.pending)
+            self.pending.clear()
+            if self.stream is None:
+                self.stream = self._open()
+            position = self.stream.tell()
+            if position > 0 and 0 < self.maxBytes <= position + len(text):
+                self.doRollover()
+            self.stream.write(text)
+            self.stream.flush()
+        finally:
+            self.release()
+
+
+class LogQueueListener(QueueListener):
+    r"""Background thread that passes queued log records to the output handlers
+
+    The handlers are flushed whenever the queue is empty, so records are written in batches while the simulation logs
+    faster than they are written, and without delay otherwise.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.is_running = False
+
+    def start(self) -> None:
+        r"""Start the writer thread"""
+        super().start()
+        self.is_running = True
+        atexit.register(self.stop)  # in case close_logging is not called
+
+    def stop(self) -> None:
+        r"""Write the records that are still queued, stop the writer thread, and flush the handlers"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        atexit.unregister(self.stop)
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+    def enqueue_sentinel(self) -> None:
+        r"""Put the stop signal on the queue, waiting for space if it is full"""
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        r"""Pass a record to the handlers, and flush them if no more records are waiting"""
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+class LogQueueHandler(QueueHandler):
+    r"""Puts log records on a bounded queue for a LogQueueListener
+
+    The message arguments are merged into the message before the record is queued, so it reflects the state at the time
+    of the logging call; the formatting and writing are done by the listener's thread. If the queue is full, the logging
+    call blocks until the listener catches up, so memory stays bounded and no records are dropped.
+
+    Parameters
+    ----------
+    log_queue : queue.Queue
+        The queue of records; its maxsize bounds the memory used by records waiting to be written
+    listener : LogQueueListener
+        The listener that takes records off of the queue
+    """
+
+    def __init__(self, log_queue: queue.Queue, listener: LogQueueListener):
+        super().__init__(log_queue)
+        self.listener = listener
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        r"""Put the record on the queue, waiting for space if it is full"""
+        self.queue.put(record)
+
+
+def stop_log_queues() -> list[logging.Handler]:
+    r"""Stop the background writers of queued root logger handlers, writing out the records that are still queued
+
+    Returns
+    -------
+    list[logging.Handler]
+        The output handlers of the writers that were stopped
+    """
+    output_handlers = []
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, LogQueueHandler):
+            handler.listener.stop()
+            output_handlers.extend(handler.listener.handlers)
+    return output_handlers
+
+
 def setup_logging(
     log_filename: Optional[str] = None,
     max_bytes: int = elfpy.DEFAULT_LOG_MAXBYTES,
     log_level: int = elfpy.DEFAULT_LOG_LEVEL,
+    *,
+    use_queue: bool = False,
+    queue_size: int = elfpy.DEFAULT_LOG_QUEUE_SIZE,
+    batch_size: int = elfpy.DEFAULT_LOG_BATCH_SIZE,
 ) -> None:
-    r"""Setup logging and handlers with default settings"""
+    r"""Setup logging and handlers with default settings
+
+    Parameters
+    ----------
+    log_filename : Optional[str]
+        File to write the logs to; if None, the logs are written to stdout
+    max_bytes : int
+        Size at which the log file is rolled over
+    log_level : int
+        Events of this level and above are logged
+    use_queue : bool
+        If True, records are queued and written by a background thread, so the simulation does not wait on formatting
+        or writing them; call close_logging to write out the queued records
+    queue_size : int
+        Maximum number of records waiting to be written when use_queue is True; logging blocks while the queue is full
+    batch_size : int
+        Number of records per write to the log file when use_queue is True
+    """
+    # pylint: disable=too-many-arguments
+    for old_handler in stop_log_queues():  # a previous setup's queued records are written before it is replaced
+        old_handler.close()
     if log_filename is None:
-        handler = logging.StreamHandler(sys.stdout)
+        handler: logging.Handler = logging.StreamHandler(sys.stdout)
     else:
         log_dir, log_name = os.path.split(log_filename)
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
-        handler = RotatingFileHandler(os.path.join(log_dir, log_name), mode="w", maxBytes=max_bytes)
+        if use_queue:
+            handler = BatchedRotatingFileHandler(
+                os.path.join(log_dir, log_name), mode="w", max_bytes=max_bytes, batch_size=batch_size
+            )
+        else:
+            handler = RotatingFileHandler(os.path.join(log_dir, log_name), mode="w", maxBytes=max_bytes)
     logging.getLogger().setLevel(log_level)  # events of this level and above will be tracked
     handler.setFormatter(logging.Formatter(elfpy.DEFAULT_LOG_FORMATTER, elfpy.DEFAULT_LOG_DATETIME))
+    if use_queue:
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        listener = LogQueueListener(log_queue, handler)
+        listener.start()
+        handler = LogQueueHandler(log_queue, listener)
     logging.getLogger().handlers = [handler]  # overwrite handlers with the desired one
 
 
 def close_logging(delete_logs=True):
-    r"""Close logging and handlers for the test"""
+    r"""Close logging and handlers for the test
+
+    Queued records are written out before the handlers are closed.
+    """
+    handlers = logging.getLogger().handlers + stop_log_queues()
     logging.shutdown()
     if delete_logs:
-        for handler in logging.getLogger().handlers:
+        for handler in handlers:
             if hasattr(handler, "baseFilename") and not isinstance(handler, logging.StreamHandler):
                 # access baseFilename in a type safe way
                 handler_file_name = getattr(handler, "baseFilename")
@@ -463,3 +634,21 @@ class CustomEncoder(json.JSONEncoder):
             return o.__dict__
         except AttributeError:
             return repr(o)
+
+
+def write_json(obj: Any, filename: Optional[str] = None) -> None:
+    r"""Write an object as indented JSON with the CustomEncoder, to a file or to stdout
+
+    Parameters
+    ----------
+    obj : Any
+        The object to write
+    filename : Optional[str]
+        The file to write to, which is overwritten; if None, the JSON is printed to stdout
+    """
+    output = json.dumps(obj, indent=2, cls=CustomEncoder)
+    if filename is None:
+        print(output)
+    else:
+        with open(filename, mode="w", encoding="UTF-8") as file:
+            file.write(output)
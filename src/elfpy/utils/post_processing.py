@@ -3,8 +3,11 @@ from __future__ import annotations  # types will be strings by default in 3.11
 
 from typing import TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
 
+from elfpy.utils.price import SharePricePath
+
 if TYPE_CHECKING:
     from elfpy.simulators import Simulator
 
@@ -12,6 +15,10 @@ if TYPE_CHECKING:
 def get_simulation_state_df(simulator: Simulator) -> pd.DataFrame:
     r"""Converts the simulator output dictionary to a pandas dataframe
 
+    The dataframe columns are built directly on top of the simulation_state column arrays, without copying.
+    If the simulator has a state_sink, the chunks written to it are read back and placed before the rows that
+    are still in memory.
+
     Parameters
     ----------
     simulation_state : SimulationState
@@ -23,7 +30,37 @@ def get_simulation_state_df(simulator: Simulator) -> pd.DataFrame:
         Pandas dataframe containing the simulation_state keys as columns, as well as some computed columns
     """
     # construct dataframe from simulation dict
-    return pd.DataFrame.from_dict(simulator.simulation_state.__dict__)
+    trades_df = pd.DataFrame(simulator.simulation_state.as_dict(), copy=False)
+    if simulator.state_sink is not None and simulator.state_sink.chunk_files:
+        trades_df = pd.concat([simulator.state_sink.read(), trades_df], ignore_index=True)
+    return trades_df
+
+
+def get_share_price_path_df(simulator: Simulator) -> pd.DataFrame:
+    r"""Returns the precomputed vault share price path of the simulation as a pandas dataframe
+
+    Parameters
+    ----------
+    simulator : Simulator
+        The simulator, whose market holds the share price path
+
+    Returns
+    -------
+    DataFrame
+        One row per step of the path (a day or a block, depending on share_price_accrual), with the first
+        block_number and the day of the step, and the share_price in effect from that block on
+    """
+    share_price_path = simulator.market.share_price_path
+    if not isinstance(share_price_path, SharePricePath):
+        raise TypeError("the share price path of a simulation with streamed vault aprs is not stored")
+    block_numbers = np.arange(len(share_price_path)) * share_price_path.blocks_per_step
+    return pd.DataFrame(
+        {
+            "block_number": block_numbers,
+            "day": block_numbers // simulator.config.simulator.num_blocks_per_day,
+            "share_price": share_price_path.prices,
+        }
+    )
 
 
 def compute_derived_variables(simulator: Simulator) -> pd.DataFrame:
@@ -62,7 +99,7 @@ def compute_derived_variables(simulator: Simulator) -> pd.DataFrame:
         trades_df.price_total_return + 1
     ) * trades_df.init_share_price  # this is APR (does not include compounding)
     # compute the total return from share price
-    trades_df["share_price_total_return"] = 0
+    trades_df["share_price_total_return"] = 0.0
     for run in trades_df.run_number.unique():
         trades_df.loc[trades_df.run_number == run, "share_price_total_return"] = (
             trades_df.loc[trades_df.run_number == run, "share_price"]
@@ -96,7 +133,8 @@ def add_pnl_columns(trades_df: pd.DataFrame) -> None:
             f"agent_{agent_id}_total_longs_no_mock",
             f"agent_{agent_id}_total_shorts_no_mock",
         ]
-        trades_df[f"agent_{agent_id}_pnl"] = trades_df[wallet_values_in_base].sum(axis=1)
+        # rows whose positions were not marked to market (see SimulatorConfig.valuation_cadence) have NaN pnl
+        trades_df[f"agent_{agent_id}_pnl"] = trades_df[wallet_values_in_base].sum(axis=1, skipna=False)
         trades_df[f"agent_{agent_id}_pnl_no_mock"] = trades_df[wallet_values_in_base_no_mock].sum(axis=1)
 
 
@@ -1,7 +1,15 @@
 """Utilities for price calculations"""
 from __future__ import annotations  # types will be strings by default in 3.11
 
+from typing import Sequence
+
+import numpy as np
+
 from elfpy.types import StretchedTime
+from elfpy.utils.vault_apr import VaultAprStream
+
+# how the vault share price accrues during a simulation
+SHARE_PRICE_ACCRUALS = ("day", "block")
 
 
 ### Spot Price and APR ###
@@ -48,3 +56,213 @@ def calc_spot_price_from_apr(apr: float, time_remaining: StretchedTime):
         Spot price of bonds in terms of base, calculated from the provided parameters
     """
     return 1 / (1 + apr * time_remaining.normalized_time)  # price = 1 / (1 + r * t)
+
+
+### Vault Share Price ###
+class SharePricePath:
+    r"""The vault share price at every step of a simulation, precomputed from the daily vault APRs
+
+    Parameters
+    ----------
+    prices : np.ndarray
+        The share price at each step
+    blocks_per_step : int
+        Number of blocks in a step, i.e. num_blocks_per_day for daily accrual and 1 for per-block accrual
+    """
+
+    def __init__(self, prices: np.ndarray, blocks_per_step: int):
+        self.prices = prices
+        self.blocks_per_step = blocks_per_step
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def get_index(self, block_number: int) -> int:
+        r"""Returns the index of the step that contains the given block; blocks past the end use the last step"""
+        return min(block_number // self.blocks_per_step, len(self.prices) - 1)
+
+    def get_share_price(self, block_number: int) -> float:
+        r"""Returns the share price at the given block number
+
+        Parameters
+        ----------
+        block_number : int
+            Number of blocks since the start of the simulation
+
+        Returns
+        -------
+        float
+            The vault share price in effect at that block
+        """
+        return float(self.prices[self.get_index(block_number)])
+
+
+class StreamingSharePricePath:
+    r"""The vault share price of a simulation whose vault APRs are streamed, accrued as the blocks are reached
+
+    Only the share prices of the current day (and the next day, for per-block accrual) are kept, so blocks must be
+    requested in non-decreasing order. The prices are identical to those of a precomputed SharePricePath.
+
+    Parameters
+    ----------
+    vault_apr : VaultAprStream
+        The stream of daily vault APRs
+    init_share_price : float
+        The share price at the start of the simulation
+    compound_vault_apr : bool
+        If True, the daily return is applied to the latest share price; otherwise to init_share_price
+    num_blocks_per_day : int
+        Number of blocks in a day
+    accrual : str
+        One of SHARE_PRICE_ACCRUALS; see get_share_price_path
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-few-public-methods
+
+    def __init__(
+        self,
+        vault_apr: VaultAprStream,
+        init_share_price: float,
+        compound_vault_apr: bool,
+        num_blocks_per_day: int,
+        accrual: str = "day",
+    ):
+        self.vault_apr = vault_apr
+        self.init_share_price = init_share_price
+        self.compound_vault_apr = compound_vault_apr
+        self.num_blocks_per_day = num_blocks_per_day
+        self.accrual = accrual
+        self.day = 0
+        self.day_share_price = init_share_price
+        self.next_day_share_price: float | None = None
+
+    def get_share_price(self, block_number: int) -> float:
+        r"""Returns the share price at the given block number; see SharePricePath.get_share_price"""
+        day, daily_block_number = divmod(block_number, self.num_blocks_per_day)
+        if day < self.day:
+            raise ValueError(f"the share price of day {day} was discarded; the path is at day {self.day}")
+        while self.day < day:
+            self.day_share_price = self._get_next_day_share_price()
+            self.next_day_share_price = None
+            self.day += 1
+        if self.accrual == "day" or daily_block_number == 0:
+            return self.day_share_price
+        next_day_share_price = self._get_next_day_share_price()
+        return self.day_share_price + (next_day_share_price - self.day_share_price) * (
+            daily_block_number / self.num_blocks_per_day
+        )
+
+    def _get_next_day_share_price(self) -> float:
+        r"""Returns the share price at the start of the day after self.day"""
+        if self.next_day_share_price is None:
+            self.next_day_share_price = accrue_share_price(
+                self.day_share_price, self.init_share_price, self.vault_apr[self.day + 1], self.compound_vault_apr
+            )
+        return self.next_day_share_price
+
+
+def accrue_share_price(share_price: float, init_share_price: float, vault_apr: float, compound_vault_apr: bool):
+    r"""Returns the share price after accruing one day of the vault APR
+
+    Parameters
+    ----------
+    share_price : float
+        The share price on the previous day
+    init_share_price : float
+        The share price on the first day
+    vault_apr : float
+        The vault APR of the new day
+    compound_vault_apr : bool
+        If True, the daily return is applied to share_price; otherwise to init_share_price
+
+    Returns
+    -------
+    float
+        The share price on the new day
+    """
+    price_multiplier = share_price if compound_vault_apr else init_share_price
+    return share_price + vault_apr / 365 * price_multiplier
+
+
+def calc_daily_share_prices(
+    vault_apr: Sequence[float], init_share_price: float, compound_vault_apr: bool, num_days: int | None = None
+) -> np.ndarray:
+    r"""Returns the share price at the start of each day, as accrued from the daily vault APRs
+
+    Each day after the first, the share price grows by that day's APR / 365, applied to the previous day's price
+    when compounding and to the initial price otherwise. The arithmetic is done in the same order as applying the
+    daily growth as a MarketDeltas.d_share_price, so the path matches the share price of a market updated that way.
+
+    Parameters
+    ----------
+    vault_apr : Sequence[float]
+        The vault APR on each day
+    init_share_price : float
+        The share price on the first day
+    compound_vault_apr : bool
+        If True, the daily return is applied to the latest share price; otherwise to init_share_price
+    num_days : int | None
+        Number of days in the path; defaults to len(vault_apr). Days past the end of vault_apr use its last value.
+
+    Returns
+    -------
+    np.ndarray
+        The share price at the start of each day
+    """
+    if num_days is None:
+        num_days = len(vault_apr)
+    share_prices = np.empty(num_days, dtype=np.float64)
+    share_price = init_share_price
+    for day in range(num_days):
+        if day > 0:
+            share_price = accrue_share_price(
+                share_price, init_share_price, vault_apr[min(day, len(vault_apr) - 1)], compound_vault_apr
+            )
+        share_prices[day] = share_price
+    return share_prices
+
+
+def get_share_price_path(
+    vault_apr: Sequence[float] | VaultAprStream,
+    init_share_price: float,
+    compound_vault_apr: bool,
+    num_blocks_per_day: int,
+    accrual: str = "day",
+) -> SharePricePath | StreamingSharePricePath:
+    r"""Precompute the share price path of a simulation
+
+    Parameters
+    ----------
+    vault_apr : Sequence[float] | VaultAprStream
+        The vault APR on each day of the simulation; if it is streamed, the path is accrued as the simulation
+        reaches each day instead of being precomputed
+    init_share_price : float
+        The share price at the start of the simulation
+    compound_vault_apr : bool
+        If True, the daily return is applied to the latest share price; otherwise to init_share_price
+    num_blocks_per_day : int
+        Number of blocks in a day
+    accrual : str
+        "day" for a share price that changes at the start of each day, or "block" for a share price that is
+        linearly interpolated between the daily prices over the blocks of each day; the last day accrues towards
+        the price the next day would have at the last day's APR
+
+    Returns
+    -------
+    SharePricePath | StreamingSharePricePath
+        The share price at each day or block
+    """
+    if accrual not in SHARE_PRICE_ACCRUALS:
+        raise ValueError(f"accrual must be one of {SHARE_PRICE_ACCRUALS}, not {accrual}")
+    if isinstance(vault_apr, VaultAprStream):
+        return StreamingSharePricePath(vault_apr, init_share_price, compound_vault_apr, num_blocks_per_day, accrual)
+    if accrual == "day":
+        return SharePricePath(
+            calc_daily_share_prices(vault_apr, init_share_price, compound_vault_apr), blocks_per_step=num_blocks_per_day
+        )
+    # one extra day, so that the last day can be interpolated towards the next day's price
+    daily_prices = calc_daily_share_prices(vault_apr, init_share_price, compound_vault_apr, len(vault_apr) + 1)
+    block_fractions = np.arange(num_blocks_per_day) / num_blocks_per_day
+    block_prices = daily_prices[:-1, np.newaxis] + np.diff(daily_prices)[:, np.newaxis] * block_fractions[np.newaxis, :]
+    return SharePricePath(block_prices.ravel(), blocks_per_step=1)
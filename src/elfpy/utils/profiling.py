@@ -0,0 +1,220 @@
+"""Optional profiling of the phases of a simulation, with throughput and pricing model call counts
+
+cProfile charges a fixed overhead to every Python function call, which distorts the Decimal pricing math, where a
+single trade makes many small calls. PhaseProfiler instead times a few coarse phases of each block with
+time.perf_counter: collecting agent actions, executing trades, updating wallets, recording the simulation state,
+logging, and updating the share price. Phases are keyed by the policy of the agent and the action type of the trade
+where those apply. Time spent in a phase that is entered from within another phase is only counted for the inner
+phase, so the phase times add up to at most the wall clock time of the run.
+
+Enable it with the profile_phases simulator config option; the report is logged at the end of run_simulation and is
+available from Simulator.profiler.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Iterator
+import contextlib
+import functools
+import time
+
+import pandas as pd
+
+if TYPE_CHECKING:
+    from elfpy.pricing_models.base import PricingModel
+
+# prefixes of the pricing model methods whose calls are counted
+COUNTED_METHOD_PREFIXES = ("calc_", "get_max_")
+# returned by PhaseProfiler.phase outside of a profiled run
+NULL_PHASE = contextlib.nullcontext()
+
+
+class PhaseTimer:
+    r"""Context manager that adds the time spent inside it to a phase of a PhaseProfiler"""
+
+    def __init__(self, profiler: PhaseProfiler, key: tuple[str, str, str]):
+        self.profiler = profiler
+        self.key = key
+
+    def __enter__(self):
+        self.profiler.enter_phase(self.key)
+
+    def __exit__(self, *exc_info):
+        self.profiler.exit_phase()
+
+
+class PhaseProfiler:
+    r"""Accumulates the time spent in each phase of a simulation, and the throughput of its runs
+
+    Parameters
+    ----------
+    enabled : bool
+        If False, phases are not timed, and the profiler adds almost no overhead
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.phase_seconds: dict[tuple[str, str, str], float] = defaultdict(float)
+        self.phase_calls: dict[tuple[str, str, str], int] = defaultdict(int)
+        self.pricing_model_calls: dict[str, int] = defaultdict(int)
+        self.wall_seconds = 0.0
+        self.num_trades = 0
+        self.num_blocks = 0
+        # phases are only timed during profile_run, so that their times are comparable to wall_seconds
+        self.is_running = False
+        # keys and start times of the phases that are currently entered, innermost last
+        self.phase_stack: list[list[Any]] = []
+
+    def reset(self) -> None:
+        r"""Clear every timing and counter"""
+        self.phase_seconds.clear()
+        self.phase_calls.clear()
+        self.pricing_model_calls.clear()
+        self.wall_seconds = 0.0
+        self.num_trades = 0
+        self.num_blocks = 0
+        self.phase_stack = []
+
+    def phase(self, name: str, policy: str = "", action_type: str = "") -> contextlib.AbstractContextManager:
+        r"""Returns a context manager that times the code inside it as a phase
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase, e.g. trade_and_update
+        policy : str
+            The name of the policy of the agent that the phase is run for, if any
+        action_type : str
+            The action type of the trade that the phase is run for, if any
+
+        Returns
+        -------
+        contextlib.AbstractContextManager
+            The timer, or a context manager that does nothing if the profiler is disabled or not in a run
+        """
+        if not self.is_running:
+            return NULL_PHASE
+        return PhaseTimer(self, (name, policy, action_type))
+
+    def enter_phase(self, key: tuple[str, str, str]) -> None:
+        r"""Start timing a phase, pausing the phase that it is entered from"""
+        now = time.perf_counter()
+        if self.phase_stack:
+            parent_key, parent_start = self.phase_stack[-1]
+            self.phase_seconds[parent_key] += now - parent_start
+        self.phase_calls[key] += 1
+        self.phase_stack.append([key, now])
+
+    def exit_phase(self) -> None:
+        r"""Stop timing the innermost phase, resuming the phase that it was entered from"""
+        now = time.perf_counter()
+        key, start = self.phase_stack.pop()
+        self.phase_seconds[key] += now - start
+        if self.phase_stack:
+            self.phase_stack[-1][1] = now
+
+    @contextlib.contextmanager
+    def profile_run(self, pricing_model: PricingModel) -> Iterator[None]:
+        r"""Time a run of the simulation and the phases inside it, and count the calls to the pricing model during it
+
+        The pricing model's calc_* and get_max_* methods are wrapped with counters on the instance for the duration
+        of the run, which includes the calls that the pricing model makes to itself, e.g. in the maximum trade
+        searches. The wrappers are removed afterwards, so that the pricing model can be pickled.
+
+        Parameters
+        ----------
+        pricing_model : PricingModel
+            The pricing model of the simulated market
+        """
+        if not self.enabled:
+            yield
+            return
+        method_names = [
+            name
+            for name in dir(type(pricing_model))
+            if name.startswith(COUNTED_METHOD_PREFIXES) and callable(getattr(pricing_model, name))
+        ]
+        for name in method_names:
+            setattr(pricing_model, name, self.get_counted_method(name, getattr(pricing_model, name)))
+        self.is_running = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.wall_seconds += time.perf_counter() - start
+            self.is_running = False
+            self.phase_stack = []
+            for name in method_names:
+                delattr(pricing_model, name)
+
+    def get_counted_method(self, name: str, method: Any) -> Any:
+        r"""Wrap a method so that each call to it is counted under the given name"""
+
+        @functools.wraps(method)
+        def counted_method(*args, **kwargs):
+            self.pricing_model_calls[name] += 1
+            return method(*args, **kwargs)
+
+        return counted_method
+
+    def get_phase_df(self) -> pd.DataFrame:
+        r"""Returns the time spent in each phase, from the most to the least
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per phase, policy, and action type, with the number of calls, the total and mean seconds, and
+            the percent of the wall clock time of the runs. Time outside of every phase is in the "other" row.
+        """
+        rows = [
+            {
+                "phase": name,
+                "policy": policy,
+                "action_type": action_type,
+                "calls": self.phase_calls[(name, policy, action_type)],
+                "total_seconds": seconds,
+            }
+            for (name, policy, action_type), seconds in self.phase_seconds.items()
+        ]
+        other_seconds = self.wall_seconds - sum(self.phase_seconds.values())
+        if self.wall_seconds > 0:
+            rows.append(
+                {"phase": "other", "policy": "", "action_type": "", "calls": 0, "total_seconds": max(other_seconds, 0)}
+            )
+        phase_df = pd.DataFrame(rows, columns=["phase", "policy", "action_type", "calls", "total_seconds"])
+        phase_df["mean_seconds"] = phase_df.total_seconds / phase_df.calls.where(phase_df.calls > 0)
+        phase_df["percent_of_wall"] = 100 * phase_df.total_seconds / self.wall_seconds if self.wall_seconds > 0 else 0.0
+        return phase_df.sort_values("total_seconds", ascending=False, ignore_index=True)
+
+    def get_summary(self) -> dict[str, Any]:
+        r"""Returns the throughput of the runs and the number of calls to each pricing model method
+
+        Returns
+        -------
+        dict[str, Any]
+            The wall clock seconds, trades, and blocks of the runs, the trades and blocks per second, and the
+            pricing model call counts, keyed by method name
+        """
+        return {
+            "wall_seconds": self.wall_seconds,
+            "num_trades": self.num_trades,
+            "num_blocks": self.num_blocks,
+            "trades_per_second": self.num_trades / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+            "blocks_per_second": self.num_blocks / self.wall_seconds if self.wall_seconds > 0 else 0.0,
+            "pricing_model_calls": dict(sorted(self.pricing_model_calls.items())),
+        }
+
+    def get_report_string(self) -> str:
+        r"""Returns a formatted report of the throughput, pricing model calls, and phase times"""
+        summary = self.get_summary()
+        lines = [
+            f"simulated {summary['num_trades']} trades and {summary['num_blocks']} blocks in"
+            f" {summary['wall_seconds']:.3f} seconds: {summary['trades_per_second']:.1f} trades/sec,"
+            f" {summary['blocks_per_second']:.1f} blocks/sec",
+            "pricing model calls:",
+        ]
+        lines += [f"\t{name} = {num_calls}" for name, num_calls in summary["pricing_model_calls"].items()]
+        lines += ["phase times:", self.get_phase_df().to_string(index=False)]
+        return "\n".join(lines)
@@ -0,0 +1,345 @@
+"""On-disk cache of simulation results, keyed by everything that determines them
+
+Notebooks often re-run identical simulations. run_cached_simulation wraps sim_utils.get_simulator and
+Simulator.run_simulation: the first call runs the simulation and saves a snapshot of the finished simulator, and
+later calls with the same inputs load the snapshot instead of running it again.
+
+The cache key is a hash of a canonical JSON encoding of the config (including the state of its random number
+generator, which determines the random simulation variables), the agents, any explicit random simulation variables
+and overrides, and a fingerprint of the elfpy source code. Changing any of them, or editing the package, gives a new
+key; stale entries are never returned, and are eventually evicted. The cache holds at most max_bytes of snapshots and
+evicts the least recently used ones first.
+
+Snapshots are pickles, so only use cache directories that are not writable by untrusted users.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from importlib import metadata
+from types import CodeType, FunctionType, MethodType
+from typing import TYPE_CHECKING, Any, Optional
+import functools
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+
+from numpy.random import Generator
+
+import elfpy
+from elfpy.simulators import SNAPSHOT_FORMAT_VERSION, Simulator
+from elfpy.utils import sim_utils
+from elfpy.utils.outputs import CustomEncoder
+
+if TYPE_CHECKING:
+    from elfpy.agent import Agent
+    from elfpy.types import RandomSimulationVariables
+    from elfpy.utils.config import Config
+
+# default location and size limit of the cache
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "elfpy", "results")
+DEFAULT_MAX_BYTES = 1 << 30  # 1 GiB
+# file name suffix of cached snapshots
+ENTRY_SUFFIX = ".pkl.gz"
+
+
+class CacheKeyEncoder(CustomEncoder):
+    r"""JSON encoder that represents objects by their state, so that equal inputs always encode identically
+
+    Random number generators are encoded by the state of their bit generator, and other objects by their class and
+    attributes, instead of a repr that could contain a memory address. Functions, such as a callable vault_apr, are
+    encoded by their name, a hash of their bytecode, their constants, defaults, and the values of their closure, so
+    that two functions with the same name but different bodies or captured values get different keys.
+    """
+
+    def default(self, o):
+        if isinstance(o, Generator):
+            return {"bit_generator_state": o.bit_generator.state}
+        if isinstance(o, type):
+            return f"{o.__module__}.{o.__qualname__}"
+        if isinstance(o, (FunctionType, CodeType, MethodType, functools.partial)):
+            return self.encode_callable(o)
+        if isinstance(o, frozenset):
+            return sorted(o, key=repr)
+        if hasattr(o, "__dict__"):
+            return {"__class__": f"{type(o).__module__}.{type(o).__qualname__}", **vars(o)}
+        return super().default(o)
+
+    @staticmethod
+    def encode_callable(o: FunctionType | CodeType | MethodType | functools.partial) -> dict[str, Any]:
+        r"""Encode a function, its code, a bound method, or a partial function by what determines its results"""
+        if isinstance(o, FunctionType):
+            return {
+                "__function__": f"{o.__module__}.{o.__qualname__}",
+                "code": o.__code__,
+                "defaults": o.__defaults__,
+                "kwdefaults": o.__kwdefaults__,
+                "closure": [cell.cell_contents for cell in o.__closure__ or ()],
+            }
+        if isinstance(o, CodeType):
+            return {
+                "co_code": hashlib.sha256(o.co_code).hexdigest(),
+                "co_consts": list(o.co_consts),
+                "co_names": list(o.co_names),
+            }
+        if isinstance(o, MethodType):
+            return {"__method__": o.__func__, "__self__": o.__self__}
+        return {"__partial__": o.func, "args": o.args, "keywords": o.keywords}
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_fingerprint() -> str:
+    r"""Returns a hash of the elfpy version, snapshot format, and source files, which changes with any code change
+
+    Returns
+    -------
+    str
+        Hex digest of the fingerprint
+    """
+    try:
+        version = metadata.version("elfpy")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    fingerprint = hashlib.sha256(f"{version}:{SNAPSHOT_FORMAT_VERSION}".encode())
+    package_directory = os.path.dirname(os.path.abspath(elfpy.__file__))
+    for directory, subdirectories, filenames in os.walk(package_directory):
+        subdirectories.sort()  # walk in a deterministic order
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                path = os.path.join(directory, filename)
+                fingerprint.update(os.path.relpath(path, package_directory).encode())
+                with open(path, mode="rb") as file:
+                    fingerprint.update(file.read())
+    return fingerprint.hexdigest()
+
+
+def get_cache_key(
+    config: Config,
+    agents: Optional[list[Agent]] = None,
+    random_sim_vars: Optional[RandomSimulationVariables] = None,
+    override_dict: Optional[dict[str, Any]] = None,
+) -> str:
+    r"""Returns the cache key of a simulation, from the same arguments as sim_utils.get_simulator
+
+    The key must be computed before the simulator is constructed, since constructing and running it advances the
+    config's random number generator and changes the agents.
+
+    Parameters
+    ----------
+    config : Config
+        The simulator config
+    agents : Optional[list[Agent]]
+        The agents, in their initial state
+    random_sim_vars : Optional[RandomSimulationVariables]
+        Explicit random simulation variables, if any
+    override_dict : Optional[dict[str, Any]]
+        Overrides of the random simulation variables, if any
+
+    Returns
+    -------
+    str
+        Hex digest of the canonical encoding of the inputs and of the code fingerprint
+    """
+    inputs = {
+        "config": config,
+        "agents": agents,
+        "random_simulation_variables": random_sim_vars,
+        "override_dict": override_dict,
+        "code_fingerprint": get_code_fingerprint(),
+    }
+    canonical_inputs = json.dumps(inputs, sort_keys=True, cls=CacheKeyEncoder)
+    return hashlib.sha256(canonical_inputs.encode()).hexdigest()
+
+
+class ResultCache:
+    r"""A directory of simulator snapshots, keyed by get_cache_key, with least recently used eviction
+
+    Parameters
+    ----------
+    directory : str
+        The directory that holds the snapshots; it is created if it does not exist
+    max_bytes : int
+        The maximum total size of the snapshots. When a new snapshot makes the cache larger, the least recently
+        used snapshots are removed, except for the new one.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_bytes: int = DEFAULT_MAX_BYTES):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must be non-negative, not {max_bytes}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isfile(self.get_path(key))
+
+    def __len__(self) -> int:
+        return len(self.get_entries())
+
+    def get_path(self, key: str) -> str:
+        r"""Returns the path of the snapshot with the given key"""
+        return os.path.join(self.directory, f"{key}{ENTRY_SUFFIX}")
+
+    def get_entries(self) -> list[tuple[str, int, int]]:
+        r"""Returns the path, size in bytes, and last use time of each snapshot, from least to most recently used
+
+        Returns
+        -------
+        list[tuple[str, int, int]]
+            The snapshots; the last use time is the modification time in nanoseconds
+        """
+        entries = []
+        with os.scandir(self.directory) as directory_entries:
+            for entry in directory_entries:
+                if entry.is_file() and entry.name.endswith(ENTRY_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return sorted(entries, key=lambda entry: (entry[2], entry[0]))
+
+    @property
+    def size_bytes(self) -> int:
+        r"""The total size of the snapshots in the cache"""
+        return sum(size for _, size, _ in self.get_entries())
+
+    def load(self, key: str) -> Optional[Simulator]:
+        r"""Returns the cached simulator with the given key and marks it as recently used, or None on a miss
+
+        Snapshots that cannot be read, e.g. because they were only partly written, are removed and count as misses.
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+
+        Returns
+        -------
+        Optional[Simulator]
+            The simulator, as saved by save
+        """
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            simulator = Simulator.load_snapshot(path)
+        except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError) as err:
+            logging.warning("result_cache: WARNING: removing unreadable cache entry %s: %s", path, err)
+            self.invalidate(key)
+            return None
+        os.utime(path)  # the modification time records the last use
+        return simulator
+
+    def save(self, key: str, simulator: Simulator) -> None:
+        r"""Save a simulator under the given key, then evict least recently used snapshots if the cache is full
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+        simulator : Simulator
+            The simulator to save
+        """
+        # write to a temporary file first, so that readers never see a partial snapshot
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            simulator.save_snapshot(temporary_path)
+            os.replace(temporary_path, self.get_path(key))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        r"""Remove least recently used snapshots until the cache is at most max_bytes
+
+        Parameters
+        ----------
+        keep : Optional[str]
+            A key that is never evicted, e.g. the snapshot that was just saved
+
+        Returns
+        -------
+        int
+            The number of snapshots that were removed
+        """
+        entries = self.get_entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        keep_path = self.get_path(keep) if keep is not None else None
+        num_removed = 0
+        for path, size, _ in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            os.remove(path)
+            total_bytes -= size
+            num_removed += 1
+        return num_removed
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        r"""Remove the snapshot with the given key, or every snapshot if no key is given
+
+        Parameters
+        ----------
+        key : Optional[str]
+            The cache key
+
+        Returns
+        -------
+        int
+            The number of snapshots that were removed
+        """
+        paths = [path for path, _, _ in self.get_entries()] if key is None else [self.get_path(key)]
+        num_removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                num_removed += 1
+            except FileNotFoundError:
+                pass
+        return num_removed
+
+
+def run_cached_simulation(
+    config: Config,
+    agents: Optional[list[Agent]] = None,
+    random_sim_vars: Optional[RandomSimulationVariables] = None,
+    override_dict: Optional[dict[str, Any]] = None,
+    cache: Optional[ResultCache] = None,
+) -> Simulator:
+    r"""Construct and run a simulator with sim_utils.get_simulator, or load the result of an identical earlier run
+
+    On a cache hit, the config's random number generator is advanced to the state it would have after running the
+    simulation, so that later simulations with the same config object draw the same random numbers either way.
+
+    Parameters
+    ----------
+    config : Config
+        The simulator config
+    agents : Optional[list[Agent]]
+        The agents that should be used in the simulator
+    random_sim_vars : Optional[RandomSimulationVariables]
+        Explicit random simulation variables, if any
+    override_dict : Optional[dict[str, Any]]
+        Overrides of the random simulation variables, if any
+    cache : Optional[ResultCache]
+        The cache; defaults to a ResultCache in DEFAULT_CACHE_DIRECTORY
+
+    Returns
+    -------
+    Simulator
+        The simulator, after run_simulation
+    """
+    if cache is None:
+        cache = ResultCache()
+    key = get_cache_key(config, agents, random_sim_vars, override_dict)
+    simulator = cache.load(key)
+    if simulator is not None:
+        logging.info("result_cache: loaded simulation %s from %s", key, cache.directory)
+        config.simulator.rng.bit_generator.state = simulator.config.simulator.rng.bit_generator.state
+        return simulator
+    simulator = sim_utils.get_simulator(config, agents, random_sim_vars, override_dict)
+    simulator.run_simulation()
+    cache.save(key, simulator)
+    return simulator
@@ -13,6 +13,7 @@ from elfpy.types import (
     StretchedTime,
     TokenType,
     RandomSimulationVariables,
+    ValidationLevel,
 )
 from elfpy.markets import Market
 from elfpy.pricing_models.hyperdrive import HyperdrivePricingModel
@@ -58,7 +59,12 @@ def get_simulator(
     else:
         set_random_sim_vars = random_sim_vars
     # Instantiate the market.
-    pricing_model = get_pricing_model(config.amm.pricing_model_name)
+    pricing_model = get_pricing_model(
+        config.amm.pricing_model_name,
+        config.simulator.precision,
+        config.simulator.validation_level,
+        config.simulator.validation_interval,
+    )
     market = get_market(
         pricing_model,
         set_random_sim_vars.target_pool_apr,
@@ -67,6 +73,7 @@ def get_simulator(
         config.simulator.num_position_days,
         set_random_sim_vars.vault_apr,
         set_random_sim_vars.init_share_price,
+        config.simulator.num_blocks_per_day,
     )
     # Instantiate the initial LP agent.
     init_agents = [
@@ -219,6 +226,7 @@ def get_market(
     num_position_days: int,
     vault_apr: list,
     init_share_price: float,
+    num_blocks_per_day: int = 7_200,
 ) -> Market:
     r"""Setup market
 
@@ -240,6 +248,8 @@ def get_market(
         valut apr per day for the duration of the simulation
     init_share_price : float
         the initial price of the yield bearing vault shares
+    num_blocks_per_day : int
+        number of blocks in a day, which sets the rate of the market's block clock
 
     Returns
     -------
@@ -264,17 +274,29 @@ def get_market(
             time_stretch=pricing_model.calc_time_stretch(target_pool_apr),
             normalizing_constant=num_position_days,
         ),
+        blocks_per_year=365 * num_blocks_per_day,
     )
     return market
 
 
-def get_pricing_model(model_name: str) -> PricingModel:
+def get_pricing_model(
+    model_name: str,
+    precision: int = 128,
+    validation_level: str = "full",
+    validation_interval: int = 100,
+) -> PricingModel:
     r"""Get a PricingModel object from the config passed in
 
     Parameters
     ----------
     model_name : str
         name of the desired pricing_model; can be "hyperdrive", or "yieldspace"
+    precision : int
+        bits of precision for the pricing model arithmetic; 128 uses Decimal and 64 uses native float64
+    validation_level : str
+        how often the checks of trades are run; "full", "sampled" every validation_interval trades, or "off"
+    validation_interval : int
+        number of trades per checked trade when the validation_level is "sampled"
 
     Returns
     -------
@@ -283,9 +305,9 @@ def get_pricing_model(model_name: str) -> PricingModel:
     """
     logging.info("%s %s %s", "#" * 20, model_name, "#" * 20)
     if model_name.lower() == "hyperdrive":
-        pricing_model = HyperdrivePricingModel()
+        pricing_model = HyperdrivePricingModel(precision, ValidationLevel(validation_level), validation_interval)
     elif model_name.lower() == "yieldspace":
-        pricing_model = YieldSpacePricingModel()
+        pricing_model = YieldSpacePricingModel(precision, ValidationLevel(validation_level), validation_interval)
     else:
         raise ValueError(f'pricing_model_name must be "Hyperdrive", or "YieldSpace", not {model_name}')
     return pricing_model
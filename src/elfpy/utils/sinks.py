@@ -0,0 +1,179 @@
+"""Sinks that stream recorded simulation state to disk in fixed-size chunks
+
+When a sink is assigned to Simulator.state_sink, the simulator moves every full chunk of recorded rows out of
+simulation_state and into a new file in the sink's directory, so the memory used by the recorded state stays
+bounded by the chunk size. The sink keeps the list of files it wrote, which post_processing uses to reassemble
+the full state; chunks can also be scanned one at a time with iter_chunks.
+
+Numeric columns are stored with their NumPy dtypes. Object columns (e.g. the datetime columns and
+position_duration) are stored as strings.
+
+Both sinks require pyarrow, which is listed in requirements.txt; the rest of elfpy runs without it.
+
+Example
+-------
+simulator.state_sink = ParquetSink("outputs/run_0", chunk_size=10_000)
+simulator.run_simulation()
+trades_df = post_processing.compute_derived_variables(simulator)
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, Optional
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+def import_pyarrow() -> Any:
+    r"""Returns the pyarrow module, raising a helpful error if it is not installed"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as err:
+        raise ImportError("the simulation state sinks require pyarrow; install it with `pip install pyarrow`") from err
+    return pyarrow
+
+
+def columns_to_table(columns: dict[str, np.ndarray]) -> Any:
+    r"""Converts simulation state columns into a pyarrow Table
+
+    Parameters
+    ----------
+    columns : dict[str, np.ndarray]
+        Column arrays of equal length, keyed by column name
+
+    Returns
+    -------
+    pyarrow.Table
+        The table, with object columns converted to strings
+    """
+    pyarrow = import_pyarrow()
+    arrays = {}
+    for name, values in columns.items():
+        if values.dtype == object:
+            arrays[name] = pyarrow.array([None if value is None else str(value) for value in values], pyarrow.string())
+        else:
+            arrays[name] = pyarrow.array(values)
+    return pyarrow.table(arrays)
+
+
+class StateSink(ABC):
+    r"""Destination for chunks of recorded simulation state
+
+    Parameters
+    ----------
+    directory : str
+        Directory that the chunk files are written to; it is created if it does not exist
+    chunk_size : int
+        Number of rows in each chunk file
+    """
+
+    file_extension = ""
+
+    def __init__(self, directory: str, chunk_size: int = 10_000):
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be at least 1, not {chunk_size}")
+        self.directory = directory
+        self.chunk_size = chunk_size
+        # files are listed explicitly, so that a forked simulator can share the chunks written before the fork
+        self.chunk_files: list[str] = []
+        os.makedirs(directory, exist_ok=True)
+
+    @abstractmethod
+    def write_table(self, table: Any, filename: str) -> None:
+        r"""Writes a pyarrow Table to a new file"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_table(self, filename: str, columns: Optional[list[str]] = None) -> Any:
+        r"""Reads a pyarrow Table from a file written by write_table"""
+        raise NotImplementedError
+
+    def write_chunk(self, columns: dict[str, np.ndarray]) -> None:
+        r"""Writes a chunk of rows to a new file
+
+        Parameters
+        ----------
+        columns : dict[str, np.ndarray]
+            Column arrays of equal length, keyed by column name
+        """
+        # the random suffix keeps forks of a simulation from overwriting each other's chunks
+        filename = os.path.join(
+            self.directory, f"chunk_{len(self.chunk_files):06d}_{uuid.uuid4().hex[:8]}{self.file_extension}"
+        )
+        self.write_table(columns_to_table(columns), filename)
+        self.chunk_files.append(filename)
+
+    def iter_chunks(self, columns: Optional[list[str]] = None) -> Iterator[pd.DataFrame]:
+        r"""Lazily reads the chunks in the order they were written
+
+        Parameters
+        ----------
+        columns : Optional[list[str]]
+            Columns to read; defaults to all of them
+
+        Yields
+        ------
+        pd.DataFrame
+            One dataframe per chunk
+        """
+        for filename in self.chunk_files:
+            yield self.read_table(filename, columns).to_pandas()
+
+    def read(self, columns: Optional[list[str]] = None) -> pd.DataFrame:
+        r"""Reassembles every chunk into a single dataframe
+
+        Parameters
+        ----------
+        columns : Optional[list[str]]
+            Columns to read; defaults to all of them
+
+        Returns
+        -------
+        pd.DataFrame
+            The rows of every chunk, in the order they were written
+        """
+        chunks = list(self.iter_chunks(columns))
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(chunks, ignore_index=True)
+
+
+class ParquetSink(StateSink):
+    r"""Writes each chunk of simulation state to a Parquet file"""
+
+    file_extension = ".parquet"
+
+    def write_table(self, table: Any, filename: str) -> None:
+        import_pyarrow()
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        pyarrow.parquet.write_table(table, filename)
+
+    def read_table(self, filename: str, columns: Optional[list[str]] = None) -> Any:
+        import_pyarrow()
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        return pyarrow.parquet.read_table(filename, columns=columns)
+
+
+class ArrowIpcSink(StateSink):
+    r"""Writes each chunk of simulation state to an Arrow IPC (Feather v2) file, which can be memory mapped"""
+
+    file_extension = ".arrow"
+
+    def write_table(self, table: Any, filename: str) -> None:
+        pyarrow = import_pyarrow()
+        with pyarrow.OSFile(filename, "wb") as file:
+            with pyarrow.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
+
+    def read_table(self, filename: str, columns: Optional[list[str]] = None) -> Any:
+        pyarrow = import_pyarrow()
+        # the table references the memory map, which is closed when the table is garbage collected
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(filename, "r")).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table
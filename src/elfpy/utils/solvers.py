@@ -0,0 +1,83 @@
+"""Root finding utilities for the max trade size searches"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from typing import Any, Callable, Optional
+
+# Resolution of the 25 step bisection that this solver replaces
+DEFAULT_XTOL = 2**-25
+DEFAULT_FTOL = 1e-10
+
+
+def find_max_feasible(
+    slack_fn: Callable[[float], tuple[Optional[float], Any]],
+    *,
+    upper: float = 1.0,
+    xtol: float = DEFAULT_XTOL,
+    ftol: float = DEFAULT_FTOL,
+    max_iter: int = 100,
+    default_payload: Any = None,
+) -> tuple[float, Any]:
+    r"""Finds the largest x in (0, upper] that satisfies a feasibility constraint
+
+    The constraint is described by a slack function that is non-negative where x is feasible, negative where it is
+    infeasible, and that decreases through zero at the feasibility boundary. The solver keeps a bracket
+    [feasible, infeasible] and shrinks it with Illinois (modified regula falsi) steps, which converge superlinearly for
+    smooth slack functions. It falls back to bisection wherever the slack is unknown.
+
+    The search stops when a feasible point has slack <= ftol, or when the bracket is narrower than xtol; the returned
+    point is always feasible. The defaults match the resolution of a 25 step bisection on [0, 1] while typically
+    needing fewer than 10 evaluations.
+
+    Parameters
+    ----------
+    slack_fn : Callable[[float], tuple[Optional[float], Any]]
+        Returns (slack, payload) for a candidate x. The slack should be dimensionless, e.g. normalized by the
+        reserves. A slack of None marks x as infeasible without a usable slack value (for example, the trade
+        math failed), which forces a bisection step. The payload is returned alongside the solution.
+    upper : float
+        Upper end of the search interval; if it is feasible it is returned immediately
+    xtol : float
+        Absolute tolerance on x
+    ftol : float
+        Tolerance on the slack of a feasible point
+    max_iter : int
+        Maximum number of slack evaluations after the evaluation at upper
+    default_payload : Any
+        Payload to return if no feasible point was found
+
+    Returns
+    -------
+    tuple[float, Any]
+        The largest feasible x found (0 if none was found) and its payload
+    """
+    # pylint: disable=too-many-arguments
+    slack, payload = slack_fn(upper)
+    if slack is not None and slack >= 0:
+        return upper, payload
+    lower, lower_slack, lower_payload = 0.0, None, default_payload
+    upper_slack = slack
+    last_side = 0  # +1 if the last step moved the lower (feasible) end, -1 if it moved the upper end
+    for _ in range(max_iter):
+        width = upper - lower
+        if width <= xtol:
+            break
+        if lower_slack is not None and upper_slack is not None and lower_slack != upper_slack:
+            # secant through the bracket ends, kept away from the ends so that the bracket always shrinks
+            x = upper - upper_slack * width / (upper_slack - lower_slack)
+            x = min(max(x, lower + xtol / 2), upper - xtol / 2)
+        else:
+            x = lower + width / 2
+        slack, payload = slack_fn(x)
+        if slack is not None and slack >= 0:
+            lower, lower_slack, lower_payload = x, slack, payload
+            if slack <= ftol:
+                break
+            if last_side == 1 and upper_slack is not None:
+                upper_slack /= 2  # Illinois modification: the upper end was kept twice in a row
+            last_side = 1
+        else:
+            upper, upper_slack = x, slack
+            if last_side == -1 and lower_slack is not None:
+                lower_slack /= 2  # Illinois modification: the lower end was kept twice in a row
+            last_side = -1
+    return lower, lower_payload
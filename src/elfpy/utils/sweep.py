@@ -0,0 +1,290 @@
+"""Utilities for running Monte Carlo sweeps of simulations over seeds and config overrides
+
+Each run in a sweep gets its own random number generator, spawned from a single root SeedSequence in the order that
+the runs are listed. Runs are independent of each other and of the order in which they are executed, so a sweep
+produces identical results regardless of how many worker processes are used.
+
+Example
+-------
+python -m elfpy.utils.sweep --config config/example_config.toml --num_seeds 8 --grid min_fee=0.1,0.2 --max_workers 4
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional, TYPE_CHECKING
+import argparse
+import itertools
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from elfpy.utils import outputs, sim_utils
+import elfpy.utils.parse_config as config_utils
+
+if TYPE_CHECKING:
+    from elfpy.simulators import Simulator
+    from elfpy.utils.config import Config
+
+
+@dataclass
+class SweepRun:
+    """Specification for a single run in a sweep"""
+
+    run_number: int
+    override_dict: dict[str, Any]
+    seed_sequence: np.random.SeedSequence
+
+
+@dataclass
+class SweepResult:
+    """Compact summary of a single run in a sweep
+
+    final_state holds the last row of the simulation_state numeric columns, which includes the final market state
+    and every agent's wallet state.
+    """
+
+    run_number: int
+    override_dict: dict[str, Any]
+    spawn_key: tuple[int, ...]
+    num_trades: int
+    final_state: dict[str, float] = field(default_factory=dict)
+
+
+def get_grid_overrides(grid: dict[str, list]) -> list[dict[str, Any]]:
+    r"""Expand a grid of config values into the list of every combination
+
+    Parameters
+    ----------
+    grid : dict[str, list]
+        Config variable names mapped to the list of values to sweep over
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        One override dictionary for each element of the cartesian product of the grid values
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def get_sweep_runs(
+    override_dicts: Optional[list[dict[str, Any]]] = None,
+    num_seeds: int = 1,
+    root_seed: Optional[int] = None,
+) -> list[SweepRun]:
+    r"""Construct the list of runs for a sweep, with an independent seed for each run
+
+    Parameters
+    ----------
+    override_dicts : Optional[list[dict[str, Any]]]
+        Config overrides to sweep over; defaults to a single run of the unmodified config
+    num_seeds : int
+        Number of independently seeded runs for each override dictionary
+    root_seed : Optional[int]
+        Entropy for the root SeedSequence; if None, fresh entropy is drawn from the OS
+
+    Returns
+    -------
+    list[SweepRun]
+        Runs ordered by override dictionary, then by seed
+    """
+    if override_dicts is None:
+        override_dicts = [{}]
+    run_specs = [(override_dict, seed) for override_dict in override_dicts for seed in range(num_seeds)]
+    seed_sequences = np.random.SeedSequence(root_seed).spawn(len(run_specs))
+    return [
+        SweepRun(run_number=run_number, override_dict=override_dict, seed_sequence=seed_sequence)
+        for run_number, ((override_dict, _), seed_sequence) in enumerate(zip(run_specs, seed_sequences))
+    ]
+
+
+def get_sweep_member_simulator(config: Config, run: SweepRun) -> Simulator:
+    r"""Construct the simulator of a single run in a sweep
+
+    The agents are constructed from config.simulator.agent_policies, with wallet addresses starting at 1.
+
+    Parameters
+    ----------
+    config : Config
+        Base config for the sweep
+    run : SweepRun
+        Run specification, containing the config overrides and seed for this run
+
+    Returns
+    -------
+    Simulator
+        The initialized simulator, which has not been run
+    """
+    run_config = config_utils.override_config_variables(config, run.override_dict)
+    run_config.simulator.rng = np.random.default_rng(run.seed_sequence)
+    agents = [
+        sim_utils.get_policy(policy_name)(wallet_address=wallet_address)
+        for wallet_address, policy_name in enumerate(run_config.simulator.agent_policies, start=1)
+    ]
+    simulator = sim_utils.get_simulator(run_config, agents)
+    simulator.run_number = run.run_number
+    return simulator
+
+
+def run_sweep_member(config: Config, run: SweepRun) -> SweepResult:
+    r"""Run a single simulation in a sweep
+
+    Parameters
+    ----------
+    config : Config
+        Base config for the sweep
+    run : SweepRun
+        Run specification, containing the config overrides and seed for this run
+
+    Returns
+    -------
+    SweepResult
+        Compact summary of the simulation output
+    """
+    simulator = get_sweep_member_simulator(config, run)
+    simulator.run_simulation()
+    simulation_state = simulator.simulation_state
+    final_state = {}
+    if len(simulation_state) > 0:
+        for key, value in simulation_state.as_dict().items():
+            if value.dtype != object:
+                final_state[key] = value[-1].item()
+    return SweepResult(
+        run_number=run.run_number,
+        override_dict=run.override_dict,
+        spawn_key=tuple(run.seed_sequence.spawn_key),
+        num_trades=simulator.run_trade_number,
+        final_state=final_state,
+    )
+
+
+def run_sweep(
+    config: Config,
+    override_dicts: Optional[list[dict[str, Any]]] = None,
+    num_seeds: int = 1,
+    root_seed: Optional[int] = None,
+    max_workers: Optional[int] = None,
+) -> list[SweepResult]:
+    r"""Run a sweep of simulations over config overrides and seeds, fanned out to worker processes
+
+    Parameters
+    ----------
+    config : Config
+        Base config for every run in the sweep
+    override_dicts : Optional[list[dict[str, Any]]]
+        Config overrides to sweep over; defaults to a single run of the unmodified config
+    num_seeds : int
+        Number of independently seeded runs for each override dictionary
+    root_seed : Optional[int]
+        Entropy for the root SeedSequence; defaults to config.simulator.random_seed
+    max_workers : Optional[int]
+        Number of worker processes; if 1, the runs are executed in the current process.
+        Defaults to the number of processors on the machine.
+
+    Returns
+    -------
+    list[SweepResult]
+        One result per run, ordered by run number regardless of the number of workers
+    """
+    if root_seed is None:
+        root_seed = config.simulator.random_seed
+    runs = get_sweep_runs(override_dicts, num_seeds, root_seed)
+    logging.info("running a sweep of %d simulations", len(runs))
+    if max_workers == 1:
+        return [run_sweep_member(config, run) for run in runs]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run_sweep_member, itertools.repeat(config, len(runs)), runs))
+
+
+def get_sweep_df(results: list[SweepResult]) -> pd.DataFrame:
+    r"""Converts sweep results into a dataframe with one row per run
+
+    Parameters
+    ----------
+    results : list[SweepResult]
+        Output of run_sweep
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns for the run number, seed spawn key, number of trades, overrides, and final state of each run
+    """
+    rows = []
+    for result in results:
+        row = {"run_number": result.run_number, "spawn_key": result.spawn_key, "num_trades": result.num_trades}
+        row.update({f"override_{key}": value for key, value in result.override_dict.items()})
+        row.update(result.final_state)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def parse_grid_argument(grid_argument: str) -> tuple[str, list]:
+    r"""Parse a command line grid argument of the form key=value1,value2,...
+
+    Values are decoded as JSON when possible, and otherwise kept as strings.
+
+    Parameters
+    ----------
+    grid_argument : str
+        Grid specification for a single config variable
+
+    Returns
+    -------
+    tuple[str, list]
+        The config variable name and the list of values to sweep over
+    """
+    if "=" not in grid_argument:
+        raise ValueError(f"grid argument must have the form key=value1,value2,..., not {grid_argument}")
+    key, values = grid_argument.split("=", maxsplit=1)
+    parsed_values = []
+    for value in values.split(","):
+        try:
+            parsed_values.append(json.loads(value))
+        except json.JSONDecodeError:
+            parsed_values.append(value)
+    return key, parsed_values
+
+
+def get_argparser() -> argparse.ArgumentParser:
+    """Define & parse arguments from stdin"""
+    parser = argparse.ArgumentParser(
+        prog="ElfSweep",
+        description="Run a parallel Monte Carlo sweep of Elfpy simulations over seeds and config values",
+    )
+    parser.add_argument(
+        "--config", help="Config file. Default uses the example config.", default="config/example_config.toml", type=str
+    )
+    parser.add_argument(
+        "--grid",
+        help="Config values to sweep over, as key=value1,value2. May be given more than once.",
+        default=[],
+        action="append",
+        type=str,
+    )
+    parser.add_argument("--num_seeds", help="Number of seeds for each grid point", default=1, type=int)
+    parser.add_argument("--root_seed", help="Root seed. Default uses the config random_seed.", default=None, type=int)
+    parser.add_argument("--max_workers", help="Number of worker processes", default=None, type=int)
+    parser.add_argument("--output", help="Optional output JSON filename; default prints to stdout", default=None)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run a sweep from command line arguments"""
+    args = get_argparser().parse_args(argv)
+    config = config_utils.load_and_parse_config_file(args.config)
+    grid = dict(parse_grid_argument(grid_argument) for grid_argument in args.grid)
+    results = run_sweep(
+        config,
+        override_dicts=get_grid_overrides(grid),
+        num_seeds=args.num_seeds,
+        root_seed=args.root_seed,
+        max_workers=args.max_workers,
+    )
+    outputs.write_json([result.__dict__ for result in results], args.output)
+
+
+if __name__ == "__main__":
+    main()
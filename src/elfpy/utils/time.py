@@ -1,6 +1,7 @@
 """Helper functions for converting time units"""
 
 from datetime import datetime, timedelta
+from typing import Any
 import pytz
 
 import numpy as np
@@ -87,6 +88,39 @@ def get_years_remaining(market_time: float, mint_time: float, position_duration_
     return time_remaining
 
 
+def get_years_remaining_at_block(
+    market_block: int, mint_block: Any, blocks_per_year: int, position_duration_years: float
+) -> Any:
+    r"""Get the year fraction remaining on tokens minted at the given block(s)
+
+    The elapsed time is computed from the integer number of blocks, so it is exact up to a single rounding and
+    positions minted at the same block always have the same time remaining.
+
+    Parameters
+    ----------
+    market_block : int
+        Number of blocks that have elapsed in the given market
+    mint_block : Any
+        Block at which the token in question was minted, or a NumPy array of them. Should be at most market_block.
+    blocks_per_year : int
+        Number of blocks in a year
+    position_duration_years: float
+        Total duration of the token's term, in fractions of a year
+
+    Returns
+    -------
+    Any
+        Time left until token maturity, in fractions of a year
+    """
+    if np.any(np.asarray(mint_block) > market_block):
+        raise ValueError(
+            f"elfpy.utils.time.get_years_remaining_at_block: ERROR: {mint_block=} must be at most {market_block=}."
+        )
+    years_elapsed = (market_block - mint_block) / blocks_per_year
+    # if we are closing after the position duration has completed, then just set time_remaining to zero
+    return np.maximum(position_duration_years - years_elapsed, 0)
+
+
 def norm_days(days: float, normalizing_constant: float = 365) -> float:
     r"""Returns days normalized, with a default assumption of a year-long scale
 
@@ -0,0 +1,214 @@
+"""A ring buffer of typed trade events, which replaces the per-trade debug logging on the hot path
+
+Building a debug log call evaluates its arguments even when the DEBUG level is disabled, which costs time on every
+trade. Instead, the market keeps an EventTrace. While it is disabled, recording an event is skipped after a single
+attribute check, so no event or argument is built. While it is enabled, it keeps the most recent events: the trade that
+was submitted with the reserves before it, the resulting market deltas, and the resulting wallet deltas. The buffer
+can be dumped as JSON Lines at any time, e.g. after an error, to see the trades that led up to it.
+
+Example
+-------
+simulator.market.trace.resize(10_000)  # or set trace_capacity in the simulator config
+simulator.run_simulation()
+simulator.market.trace.dump_jsonl("trace.jsonl")
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, ClassVar, Iterator, Union
+import json
+
+from elfpy.utils.outputs import CustomEncoder
+
+if TYPE_CHECKING:
+    from elfpy.types import MarketAction, MarketDeltas, MarketState
+    from elfpy.wallet import Wallet
+
+
+@dataclass
+class TradeEvent:
+    r"""A trade submitted to the market, with the market state before it was executed"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    event_type: ClassVar[str] = "trade"
+
+    block_number: int
+    wallet_address: int
+    action_type: str
+    trade_amount: float
+    mint_block: int
+    open_share_price: float
+    share_reserves: float
+    bond_reserves: float
+    base_buffer: float
+    bond_buffer: float
+    lp_reserves: float
+    share_price: float
+
+    @classmethod
+    def from_action(cls, block_number: int, action: MarketAction, market_state: MarketState) -> TradeEvent:
+        r"""Construct the event of a trade from the action and the market state before it"""
+        return cls(
+            block_number=block_number,
+            wallet_address=action.wallet_address,
+            action_type=action.action_type.value,
+            trade_amount=action.trade_amount,
+            mint_block=action.mint_block,
+            open_share_price=action.open_share_price,
+            share_reserves=market_state.share_reserves,
+            bond_reserves=market_state.bond_reserves,
+            base_buffer=market_state.base_buffer,
+            bond_buffer=market_state.bond_buffer,
+            lp_reserves=market_state.lp_reserves,
+            share_price=market_state.share_price,
+        )
+
+
+@dataclass
+class MarketDeltaEvent:
+    r"""The changes to the market reserves that resulted from a trade"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    event_type: ClassVar[str] = "market_delta"
+
+    block_number: int
+    wallet_address: int
+    action_type: str
+    d_base_asset: float
+    d_token_asset: float
+    d_base_buffer: float
+    d_bond_buffer: float
+    d_lp_reserves: float
+    d_share_price: float
+
+    @classmethod
+    def from_deltas(cls, block_number: int, action: MarketAction, market_deltas: MarketDeltas) -> MarketDeltaEvent:
+        r"""Construct the event of the market deltas of a trade"""
+        return cls(
+            block_number=block_number,
+            wallet_address=action.wallet_address,
+            action_type=action.action_type.value,
+            **market_deltas.__dict__,
+        )
+
+
+@dataclass
+class WalletDeltaEvent:
+    r"""The changes to an agent's wallet from a trade or from settlement; positions are balances keyed by mint block"""
+
+    event_type: ClassVar[str] = "wallet_delta"
+
+    block_number: int
+    wallet_address: int
+    base: float
+    lp_tokens: float
+    fees_paid: float
+    longs: dict[int, float]
+    shorts: dict[int, float]
+
+    @classmethod
+    def from_deltas(cls, block_number: int, wallet_address: int, wallet_deltas: Wallet) -> WalletDeltaEvent:
+        r"""Construct the event of the deltas that are applied to a wallet"""
+        return cls(
+            block_number=block_number,
+            wallet_address=wallet_address,
+            base=wallet_deltas.base,
+            lp_tokens=wallet_deltas.lp_tokens,
+            fees_paid=wallet_deltas.fees_paid,
+            longs={mint_block: long.balance for mint_block, long in wallet_deltas.longs.items()},
+            shorts={mint_block: short.balance for mint_block, short in wallet_deltas.shorts.items()},
+        )
+
+
+TraceEvent = Union[TradeEvent, MarketDeltaEvent, WalletDeltaEvent]
+
+
+class EventTrace:
+    r"""A ring buffer that keeps the most recent trace events
+
+    Code that records events checks `enabled` before building the event, so that a disabled trace costs a single
+    attribute check.
+
+    Parameters
+    ----------
+    capacity : int
+        The number of events that are kept; older events are dropped. A capacity of 0 disables the trace.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.events: deque[TraceEvent] = deque(maxlen=0)
+        self.capacity = 0
+        self.enabled = False
+        self.num_recorded = 0  # including the events that have been dropped
+        self.resize(capacity)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def __iter__(self) -> Iterator[TraceEvent]:
+        return iter(self.events)
+
+    def resize(self, capacity: int) -> None:
+        r"""Change the number of events that are kept, keeping the most recent events that fit
+
+        Parameters
+        ----------
+        capacity : int
+            The new capacity; 0 disables the trace
+        """
+        if capacity < 0:
+            raise ValueError(f"trace capacity must be non-negative, not {capacity}")
+        self.events = deque(self.events, maxlen=capacity)
+        self.capacity = capacity
+        self.enabled = capacity > 0
+
+    def record(self, event: TraceEvent) -> None:
+        r"""Append an event, dropping the oldest event if the trace is full"""
+        self.events.append(event)
+        self.num_recorded += 1
+
+    def clear(self) -> None:
+        r"""Remove every event, without changing the capacity"""
+        self.events.clear()
+        self.num_recorded = 0
+
+    @property
+    def num_dropped(self) -> int:
+        r"""The number of recorded events that no longer fit in the buffer"""
+        return self.num_recorded - len(self.events)
+
+    def get_records(self) -> list[dict]:
+        r"""Returns the events as dictionaries, oldest first
+
+        Returns
+        -------
+        list[dict]
+            Each record has the event's sequence number among all recorded events, its event_type, and its fields
+        """
+        first_sequence = self.num_dropped
+        return [
+            {"sequence": first_sequence + index, "event_type": event.event_type, **asdict(event)}
+            for index, event in enumerate(self.events)
+        ]
+
+    def dump_jsonl(self, filename: str) -> int:
+        r"""Write the events as JSON Lines, one event per line, oldest first
+
+        Parameters
+        ----------
+        filename : str
+            The file to write to; it is overwritten
+
+        Returns
+        -------
+        int
+            The number of events that were written
+        """
+        records = self.get_records()
+        with open(filename, mode="w", encoding="UTF-8") as file:
+            for record in records:
+                file.write(json.dumps(record, cls=CustomEncoder) + "\n")
+        return len(records)
@@ -0,0 +1,288 @@
+"""Vault APR processes, which generate the daily APR of the yield source
+
+Each process can sample the APR paths of many runs at once, as a (num_runs, num_days) array, or stream the APR of
+a single run day by day. A VaultAprStream generates the APRs in chunks as the simulation reaches them and only
+keeps the current chunk, so long or open-ended simulations do not precompute or hold the whole path.
+
+Processes with state (geometric Brownian motion, mean reversion, and regime switching) continue from the last
+sampled day when a new chunk is generated. Their time unit is a year, and each day is a step of 1/365 years.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+from numpy.random import Generator
+
+# number of days in a year, which sets the step size of the processes
+DAYS_PER_YEAR = 365
+
+
+class VaultAprProcess(ABC):
+    r"""A random process that generates the vault APR of each day"""
+
+    @abstractmethod
+    def sample(
+        self, rng: Generator, num_days: int, num_runs: int = 1, previous: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        r"""Sample the APR paths of several runs at once
+
+        Parameters
+        ----------
+        rng : Generator
+            The random number generator
+        num_days : int
+            Number of days in each path
+        num_runs : int
+            Number of independent paths
+        previous : Optional[np.ndarray]
+            The APR of each run on the day before the first sampled day, to continue paths that were sampled
+            earlier; if None, the paths start at the initial APR of the process
+
+        Returns
+        -------
+        np.ndarray
+            The APRs, with shape (num_runs, num_days)
+        """
+        raise NotImplementedError
+
+    def stream(self, rng: Generator, chunk_size: int = DAYS_PER_YEAR) -> Iterator[float]:
+        r"""Generate the APRs of a single run day by day, without an end
+
+        Parameters
+        ----------
+        rng : Generator
+            The random number generator
+        chunk_size : int
+            Number of days sampled at a time
+
+        Returns
+        -------
+        Iterator[float]
+            The APR of each day
+        """
+        previous = None
+        while True:
+            chunk = self.sample(rng, chunk_size, num_runs=1, previous=previous)
+            previous = chunk[:, -1]
+            yield from chunk[0].tolist()
+
+
+class ConstantApr(VaultAprProcess):
+    r"""The same APR on every day
+
+    Parameters
+    ----------
+    value : float
+        The APR
+    """
+
+    def __init__(self, value: float):
+        self.value = value
+
+    def sample(self, rng, num_days, num_runs=1, previous=None):
+        return np.full((num_runs, num_days), self.value, dtype=np.float64)
+
+
+class UniformApr(VaultAprProcess):
+    r"""An independent, uniformly distributed APR on each day
+
+    Parameters
+    ----------
+    low : float
+        The lowest APR
+    high : float
+        The highest APR
+    """
+
+    def __init__(self, low: float, high: float):
+        self.low = low
+        self.high = high
+
+    def sample(self, rng, num_days, num_runs=1, previous=None):
+        return rng.uniform(low=self.low, high=self.high, size=(num_runs, num_days))
+
+
+class GeometricBrownianMotionApr(VaultAprProcess):
+    r"""An APR that follows a geometric Brownian motion
+
+    Parameters
+    ----------
+    initial : float
+        The APR on the first day
+    drift : float
+        The drift of the log APR, per year
+    volatility : float
+        The volatility of the log APR, per square root of a year
+    """
+
+    def __init__(self, initial: float, drift: float = 0.0, volatility: float = 1.0):
+        self.initial = initial
+        self.drift = drift
+        self.volatility = volatility
+
+    def sample(self, rng, num_days, num_runs=1, previous=None):
+        step = 1 / DAYS_PER_YEAR
+        log_increments = (self.drift - self.volatility**2 / 2) * step + self.volatility * np.sqrt(step) * rng.normal(
+            size=(num_runs, num_days)
+        )
+        if previous is None:
+            start = np.full(num_runs, self.initial, dtype=np.float64)
+            log_increments[:, 0] = 0  # the first day is the initial APR
+        else:
+            start = np.asarray(previous, dtype=np.float64)
+        return start[:, np.newaxis] * np.exp(np.cumsum(log_increments, axis=1))
+
+
+class MeanRevertingApr(VaultAprProcess):
+    r"""An APR that reverts to a long-run mean, as an Ornstein-Uhlenbeck (Vasicek) process
+
+    The process is sampled with its exact daily transition, so the step size does not bias the path.
+
+    Parameters
+    ----------
+    initial : float
+        The APR on the first day
+    mean : float
+        The long-run mean APR
+    reversion_speed : float
+        The rate at which the APR reverts to the mean, per year
+    volatility : float
+        The volatility of the APR, per square root of a year
+    """
+
+    def __init__(self, initial: float, mean: float, reversion_speed: float, volatility: float):
+        if reversion_speed <= 0:
+            raise ValueError(f"reversion_speed must be positive, not {reversion_speed}")
+        self.initial = initial
+        self.mean = mean
+        self.reversion_speed = reversion_speed
+        self.volatility = volatility
+
+    def sample(self, rng, num_days, num_runs=1, previous=None):
+        decay = np.exp(-self.reversion_speed / DAYS_PER_YEAR)
+        noise_scale = self.volatility * np.sqrt((1 - decay**2) / (2 * self.reversion_speed))
+        noise = noise_scale * rng.normal(size=(num_runs, num_days))
+        aprs = np.empty((num_runs, num_days), dtype=np.float64)
+        if previous is None:
+            aprs[:, 0] = self.initial
+        else:
+            aprs[:, 0] = self.mean + (np.asarray(previous) - self.mean) * decay + noise[:, 0]
+        for day in range(1, num_days):
+            aprs[:, day] = self.mean + (aprs[:, day - 1] - self.mean) * decay + noise[:, day]
+        return aprs
+
+
+class RegimeSwitchingApr(VaultAprProcess):
+    r"""An APR that switches between regimes with a Markov chain, e.g. low and high yield environments
+
+    Parameters
+    ----------
+    aprs : Sequence[float]
+        The APR of each regime
+    transition_matrix : Sequence[Sequence[float]]
+        transition_matrix[i][j] is the probability of moving from regime i to regime j on each day
+    initial_regime : int
+        The regime on the first day
+    """
+
+    def __init__(self, aprs: Sequence[float], transition_matrix: Sequence[Sequence[float]], initial_regime: int = 0):
+        self.aprs = np.asarray(aprs, dtype=np.float64)
+        self.transition_matrix = np.asarray(transition_matrix, dtype=np.float64)
+        num_regimes = len(self.aprs)
+        if self.transition_matrix.shape != (num_regimes, num_regimes):
+            raise ValueError(
+                f"transition_matrix must have shape {(num_regimes, num_regimes)}, not {self.transition_matrix.shape}"
+            )
+        if np.any(self.transition_matrix < 0) or not np.allclose(self.transition_matrix.sum(axis=1), 1):
+            raise ValueError("the rows of transition_matrix must be probabilities that sum to 1")
+        if len(np.unique(self.aprs)) != num_regimes:
+            raise ValueError("the regimes must have distinct APRs, so that the regime can be recovered from the APR")
+        self.initial_regime = initial_regime
+        self.cumulative_probabilities = np.cumsum(self.transition_matrix, axis=1)
+
+    def sample(self, rng, num_days, num_runs=1, previous=None):
+        regimes = np.empty((num_runs, num_days), dtype=np.int64)
+        uniforms = rng.uniform(size=(num_runs, num_days))
+        if previous is None:
+            regime = np.full(num_runs, self.initial_regime)
+            first_day = 0
+        else:  # recover the regime from the APR of the previous day
+            sorter = np.argsort(self.aprs)
+            regime = sorter[np.searchsorted(self.aprs, previous, sorter=sorter)]
+            first_day = -1
+        for day in range(num_days):
+            if day > first_day:
+                # the first regime of a new path is the initial regime; every other day is a transition
+                regime = self._transition(regime, uniforms[:, day])
+            regimes[:, day] = regime
+        return self.aprs[regimes]
+
+    def _transition(self, regime: np.ndarray, uniforms: np.ndarray) -> np.ndarray:
+        r"""Draw the next regime of each run, given the current regimes and uniform random numbers"""
+        next_regime = (uniforms[:, np.newaxis] >= self.cumulative_probabilities[regime]).sum(axis=1)
+        return np.minimum(next_regime, len(self.aprs) - 1)
+
+
+class VaultAprStream:
+    r"""The APRs of a single run, generated chunk by chunk as the days are requested
+
+    Days must be requested in non-decreasing order (as the simulator does); only the current chunk is kept.
+
+    Parameters
+    ----------
+    process : VaultAprProcess
+        The process that generates the APRs
+    rng : Generator
+        The random number generator, which the stream owns
+    chunk_size : int
+        Number of days sampled at a time
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, process: VaultAprProcess, rng: Generator, chunk_size: int = DAYS_PER_YEAR):
+        self.process = process
+        self.rng = rng
+        self.chunk_size = chunk_size
+        self.chunk = process.sample(rng, chunk_size)[0]
+        self.chunk_start_day = 0
+
+    def __getitem__(self, day: int) -> float:
+        if day < self.chunk_start_day:
+            raise IndexError(
+                f"the vault APR of day {day} was discarded; the stream starts at day {self.chunk_start_day}"
+            )
+        while day >= self.chunk_start_day + self.chunk_size:
+            self.chunk = self.process.sample(self.rng, self.chunk_size, previous=self.chunk[-1:])[0]
+            self.chunk_start_day += self.chunk_size
+        return float(self.chunk[day - self.chunk_start_day])
+
+
+def get_vault_apr_process(vault_apr: dict) -> VaultAprProcess:
+    r"""Construct a vault APR process from its config dictionary
+
+    Parameters
+    ----------
+    vault_apr : dict
+        The "type" of the process ("constant", "uniform", "geometricbrownianmotion", "meanreverting", or
+        "regimeswitching"), and the arguments of its constructor
+
+    Returns
+    -------
+    VaultAprProcess
+        The process
+    """
+    process_types = {
+        "constant": ConstantApr,
+        "uniform": UniformApr,
+        "geometricbrownianmotion": GeometricBrownianMotionApr,
+        "meanreverting": MeanRevertingApr,
+        "regimeswitching": RegimeSwitchingApr,
+    }
+    process_type = vault_apr["type"].lower()
+    if process_type not in process_types:
+        raise ValueError(f"{vault_apr['type']=} not one of {list(process_types)}")
+    kwargs = {key: value for key, value in vault_apr.items() if key not in ["type", "stream", "chunk_size"]}
+    return process_types[process_type](**kwargs)
@@ -0,0 +1,385 @@
+"""Vectorized mark-to-market valuation of agent wallets
+
+Every open position of every wallet is valued in a single batched pricing model call, instead of simulating
+market.close_long or market.close_short once per position. The time remaining of every position is looked up by
+the number of blocks since its mint block in the market's StretchedTimeTable, which the scalar close trades share.
+
+The batch pricing functions use float64 arithmetic, so the values agree with the scalar close trades to within
+the error bound documented in elfpy.pricing_models.backends. Markets whose pricing model uses Decimal precision value
+each position with the scalar pricing functions instead, so that their values are computed with the precision that
+was configured. Positions that the reserves cannot close are valued as NaN instead of raising an error.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from typing import TYPE_CHECKING, Callable, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from elfpy.types import Quantity, StretchedTime, TokenType
+
+if TYPE_CHECKING:
+    from elfpy.markets import Market
+    from elfpy.types import TradeResult
+    from elfpy.wallet import Wallet
+    from elfpy.wallet_registry import WalletRegistry
+
+# how often the simulator marks open positions to market
+VALUATION_CADENCES = ("trade", "block", "day")
+
+
+class Positions(NamedTuple):
+    r"""The open positions of a list of wallets as flat arrays, where the owners are indices into the list"""
+
+    long_owners: np.ndarray
+    long_mint_blocks: np.ndarray
+    long_balances: np.ndarray
+    short_owners: np.ndarray
+    short_mint_blocks: np.ndarray
+    short_balances: np.ndarray
+    short_open_share_prices: np.ndarray
+
+
+def get_time_remaining(market: Market, mint_blocks: np.ndarray, market_block: Optional[int] = None) -> StretchedTime:
+    r"""Returns the time remaining for positions minted at each of the given blocks
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    mint_blocks : np.ndarray
+        The mint block of each position
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    StretchedTime
+        Time remaining, where days is an array with one entry per position
+    """
+    return market.get_time_remaining(mint_blocks, market_block)
+
+
+def is_batch_valued(market: Market) -> bool:
+    r"""Returns True if the market's positions are valued with the float64 batch pricing functions
+
+    Markets whose pricing model uses a Decimal backend are valued one position at a time with the scalar pricing
+    functions, so that the recorded values keep the configured precision.
+    """
+    return market.pricing_model.backend.precision == 64
+
+
+def calc_scalar_trade_values(
+    market: Market,
+    calc_trade: Callable[[Quantity, StretchedTime], TradeResult],
+    amounts: np.ndarray,
+    mint_blocks: np.ndarray,
+    market_block: Optional[int] = None,
+) -> np.ndarray:
+    r"""Returns the base that the user receives in each of a list of bond trades, computed one trade at a time
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    calc_trade : Callable[[Quantity, StretchedTime], TradeResult]
+        Computes the trade of a quantity of bonds with a given time remaining, e.g. with calc_out_given_in
+    amounts : np.ndarray
+        The bond amount of each trade
+    mint_blocks : np.ndarray
+        The mint block of the position that each trade closes
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    np.ndarray
+        The user's change in base of each trade, or NaN where the pricing model cannot compute it
+    """
+    values = np.full(len(amounts), np.nan)
+    for index, (amount, mint_block) in enumerate(zip(amounts.tolist(), mint_blocks.tolist())):
+        time_remaining = market.get_time_remaining(mint_block, market_block)
+        try:
+            trade_result = calc_trade(Quantity(amount=amount, unit=TokenType.PT), time_remaining)
+        except ArithmeticError:  # the reserves cannot support the trade
+            continue
+        values[index] = float(trade_result.user_result.d_base)
+    return values
+
+
+def calc_long_values(
+    market: Market, mint_blocks: np.ndarray, balances: np.ndarray, market_block: Optional[int] = None
+) -> np.ndarray:
+    r"""Returns the base received by closing each long position, as computed by market.close_long
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    mint_blocks : np.ndarray
+        The mint block of each position
+    balances : np.ndarray
+        The bond balance of each position
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    np.ndarray
+        The value of each position in base; empty positions are worth zero
+    """
+    values = np.zeros(len(balances))
+    is_open = balances > 0
+    if not np.any(is_open) or not market.market_state.share_reserves:
+        return values
+    if is_batch_valued(market):
+        trade_result = market.pricing_model.calc_out_given_in_batch(
+            in_amount=balances[is_open],
+            in_unit=TokenType.PT,
+            market_state=market.market_state,
+            time_remaining=get_time_remaining(market, mint_blocks[is_open], market_block),
+        )
+        values[is_open] = trade_result.user_result.d_base
+    else:
+        values[is_open] = calc_scalar_trade_values(
+            market,
+            lambda quantity, time_remaining: market.pricing_model.calc_out_given_in(
+                in_=quantity, market_state=market.market_state, time_remaining=time_remaining
+            ),
+            balances[is_open],
+            mint_blocks[is_open],
+            market_block,
+        )
+    return values
+
+
+def calc_short_values(
+    market: Market,
+    mint_blocks: np.ndarray,
+    balances: np.ndarray,
+    open_share_prices: np.ndarray,
+    market_block: Optional[int] = None,
+) -> np.ndarray:
+    r"""Returns the base received by closing each short position, as computed by market.close_short
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    mint_blocks : np.ndarray
+        The mint block of each position
+    balances : np.ndarray
+        The bond balance of each position
+    open_share_prices : np.ndarray
+        The share price at the time each position was opened
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    np.ndarray
+        The value of each position in base; empty positions are worth zero
+    """
+    values = np.zeros(len(balances))
+    is_open = balances > 0
+    if not np.any(is_open) or not market.market_state.share_reserves:
+        return values
+    # close_short clamps the trade amount to the bond reserves
+    trade_amounts = np.minimum(balances[is_open], market.market_state.bond_reserves)
+    if is_batch_valued(market):
+        trade_result = market.pricing_model.calc_in_given_out_batch(
+            out_amount=trade_amounts,
+            out_unit=TokenType.PT,
+            market_state=market.market_state,
+            time_remaining=get_time_remaining(market, mint_blocks[is_open], market_block),
+        )
+        d_base = trade_result.user_result.d_base
+    else:
+        d_base = calc_scalar_trade_values(
+            market,
+            lambda quantity, time_remaining: market.pricing_model.calc_in_given_out(
+                out=quantity, market_state=market.market_state, time_remaining=time_remaining
+            ),
+            trade_amounts,
+            mint_blocks[is_open],
+            market_block,
+        )
+    values[is_open] = (market.market_state.share_price / open_share_prices[is_open]) * trade_amounts + d_base
+    return values
+
+
+def get_shared_registry(wallets: list[Wallet]) -> Optional[WalletRegistry]:
+    r"""Returns the WalletRegistry that stores every one of the wallets, or None if there is no such registry"""
+    registry = getattr(wallets[0], "registry", None) if wallets else None
+    if registry is not None and all(getattr(wallet, "registry", None) is registry for wallet in wallets):
+        return registry
+    return None
+
+
+def get_balances(wallets: list[Wallet]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    r"""Returns the address, base, and lp_tokens of each wallet as arrays
+
+    Parameters
+    ----------
+    wallets : list[Wallet]
+        The wallets to read
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray, np.ndarray]
+        addresses, base, and lp_tokens, in the order of ``wallets``
+    """
+    registry = get_shared_registry(wallets)
+    if registry is not None:
+        indices = np.array([wallet.index for wallet in wallets], dtype=np.int64)
+        return registry.address[indices], registry.base[indices], registry.lp_tokens[indices]
+    return (
+        np.array([wallet.address for wallet in wallets], dtype=np.int64),
+        np.array([wallet.base for wallet in wallets], dtype=np.float64),
+        np.array([wallet.lp_tokens for wallet in wallets], dtype=np.float64),
+    )
+
+
+def get_positions(wallets: list[Wallet]) -> Positions:
+    r"""Returns the open positions of the wallets as flat arrays
+
+    If every wallet is a view into the same elfpy.wallet_registry.WalletRegistry, the positions are read from the
+    registry's position tables without visiting each wallet.
+
+    Parameters
+    ----------
+    wallets : list[Wallet]
+        The wallets that hold the positions
+
+    Returns
+    -------
+    Positions
+        The long and short positions, where the owners are positions in ``wallets``
+    """
+    registry = get_shared_registry(wallets)
+    if registry is not None:
+        return Positions(*registry.get_positions([wallet.index for wallet in wallets]))
+    long_owners, long_mint_blocks, long_balances = [], [], []
+    short_owners, short_mint_blocks, short_balances, short_open_share_prices = [], [], [], []
+    for owner, wallet in enumerate(wallets):
+        for mint_block, long in wallet.longs.items():
+            long_owners.append(owner)
+            long_mint_blocks.append(mint_block)
+            long_balances.append(long.balance)
+        for mint_block, short in wallet.shorts.items():
+            short_owners.append(owner)
+            short_mint_blocks.append(mint_block)
+            short_balances.append(short.balance)
+            short_open_share_prices.append(short.open_share_price)
+    return Positions(
+        long_owners=np.array(long_owners, dtype=np.int64),
+        long_mint_blocks=np.array(long_mint_blocks, dtype=np.int64),
+        long_balances=np.array(long_balances, dtype=np.float64),
+        short_owners=np.array(short_owners, dtype=np.int64),
+        short_mint_blocks=np.array(short_mint_blocks, dtype=np.int64),
+        short_balances=np.array(short_balances, dtype=np.float64),
+        short_open_share_prices=np.array(short_open_share_prices, dtype=np.float64),
+    )
+
+
+def get_position_totals(
+    market: Market,
+    positions: Positions,
+    num_wallets: int,
+    mark_to_market: bool = True,
+    market_block: Optional[int] = None,
+) -> dict[str, np.ndarray]:
+    r"""Returns the summed value of each wallet's longs and shorts
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    positions : Positions
+        The open positions, as returned by get_positions
+    num_wallets : int
+        The number of wallets that own the positions
+    mark_to_market : bool
+        If False, the total_longs and total_shorts values, which simulate closing every position, are NaN
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        total_longs, total_shorts, total_longs_no_mock, and total_shorts_no_mock, with one entry per wallet
+    """
+    if mark_to_market:
+        long_values = calc_long_values(market, positions.long_mint_blocks, positions.long_balances, market_block)
+        short_values = calc_short_values(
+            market,
+            positions.short_mint_blocks,
+            positions.short_balances,
+            positions.short_open_share_prices,
+            market_block,
+        )
+        totals = {
+            "total_longs": np.bincount(positions.long_owners, weights=long_values, minlength=num_wallets),
+            "total_shorts": np.bincount(positions.short_owners, weights=short_values, minlength=num_wallets),
+        }
+    else:
+        totals = {"total_longs": np.full(num_wallets, np.nan), "total_shorts": np.full(num_wallets, np.nan)}
+    # the no_mock totals value positions at the spot price instead of simulating closing trades
+    has_positions = len(positions.long_owners) + len(positions.short_owners) > 0
+    spot_price = market.spot_price if has_positions else np.nan
+    totals["total_longs_no_mock"] = np.bincount(
+        positions.long_owners, weights=positions.long_balances * spot_price, minlength=num_wallets
+    )
+    totals["total_shorts_no_mock"] = np.bincount(
+        positions.short_owners, weights=positions.short_balances * (1 - spot_price), minlength=num_wallets
+    )
+    return totals
+
+
+def calc_lp_values(market: Market, lp_tokens: np.ndarray) -> np.ndarray:
+    r"""Returns the base value of each wallet's share of the market's LP reserves"""
+    market_state = market.market_state
+    lp_values = np.zeros(len(lp_tokens))
+    has_lp = lp_tokens > 0
+    lp_values[has_lp] = (
+        market_state.share_reserves * market_state.share_price * (lp_tokens[has_lp] / market_state.lp_reserves)
+    )
+    return lp_values
+
+
+def get_wallets_state(
+    market: Market,
+    wallets: Iterable[Wallet],
+    mark_to_market: bool = True,
+    market_block: Optional[int] = None,
+) -> dict[str, float]:
+    r"""Returns the state of every wallet, with all open positions valued in one vectorized pass
+
+    Parameters
+    ----------
+    market : Market
+        The market the positions were opened on
+    wallets : Iterable[Wallet]
+        The wallets to value
+    mark_to_market : bool
+        If False, the total_longs and total_shorts values, which simulate closing every position, are NaN
+    market_block : Optional[int]
+        The market block number at which the positions are valued; defaults to market.block_number
+
+    Returns
+    -------
+    dict[str, float]
+        The values of Wallet.get_state_keys for every wallet
+    """
+    wallets = list(wallets)
+    totals = get_position_totals(market, get_positions(wallets), len(wallets), mark_to_market, market_block)
+    addresses, bases, lp_tokens = get_balances(wallets)
+    columns = {
+        "base": bases.tolist(),
+        "lp_tokens": calc_lp_values(market, lp_tokens).tolist(),
+        **{key: values.tolist() for key, values in totals.items()},
+    }
+    state = {}
+    for index, address in enumerate(addresses.tolist()):
+        for name, values in columns.items():
+            state[f"agent_{address}_{name}"] = values[index]
+    return state
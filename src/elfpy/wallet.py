@@ -4,6 +4,8 @@ from __future__ import annotations  # types will be strings by default in 3.11
 from typing import TYPE_CHECKING, Dict
 from dataclasses import dataclass, field
 
+from elfpy import valuation
+
 if TYPE_CHECKING:
     from elfpy.markets import Market
     from typing import Any
@@ -56,10 +58,10 @@ class Wallet:
         The base assets that held by the trader.
     lp_tokens : float
         The LP tokens held by the trader.
-    longs : Dict[float, Long]
-        The long positions held by the trader.
-    shorts : Dict[float, Short]
-        The short positions held by the trader.
+    longs : Dict[int, Long]
+        The long positions held by the trader, keyed by mint block.
+    shorts : Dict[int, Short]
+        The short positions held by the trader, keyed by mint block.
     fees_paid : float
         The fees paid by the wallet.
     """
@@ -74,9 +76,9 @@ class Wallet:
     base: float = 0
     lp_tokens: float = 0
 
-    # non-fungible (identified by mint_time, stored as dict)
-    longs: Dict[float, Long] = field(default_factory=dict)
-    shorts: Dict[float, Short] = field(default_factory=dict)
+    # non-fungible (identified by mint_block, stored as dict)
+    longs: Dict[int, Long] = field(default_factory=dict)
+    shorts: Dict[int, Short] = field(default_factory=dict)
 
     # TODO: This isn't used for short trades
     fees_paid: float = 0
@@ -111,48 +113,12 @@ class Wallet:
     def get_state(self, market: Market) -> dict:
         r"""The wallet's current state of public variables
 
+        Open positions are valued with elfpy.valuation.get_wallets_state; use that function directly to value
+        several wallets in one vectorized pass.
+
         .. todo:: TODO: return a dataclass instead of dict to avoid having to check keys & the get_state_keys func
         """
-        lp_token_value = (
-            market.market_state.share_reserves
-            * market.market_state.share_price
-            * (self.lp_tokens / market.market_state.lp_reserves)
-            if self.lp_tokens > 0
-            else 0.0
-        )
-        share_reserves = market.market_state.share_reserves
-        # compute long values in units of base
-        longs_value = 0
-        longs_value_no_mock = 0
-        for mint_time, long in self.longs.items():
-            base = (
-                market.close_long(self.address, long.balance, mint_time)[1].base
-                if long.balance > 0 and share_reserves
-                else 0.0
-            )
-            base_no_mock = long.balance * market.spot_price
-            longs_value += base
-            longs_value_no_mock += base_no_mock
-        # compute short values in units of base
-        shorts_value = 0
-        shorts_value_no_mock = 0
-        for mint_time, short in self.shorts.items():
-            base = (
-                market.close_short(self.address, short.open_share_price, short.balance, mint_time)[1].base
-                if short.balance > 0 and share_reserves
-                else 0.0
-            )
-            base_no_mock = short.balance * (1 - market.spot_price)
-            shorts_value += base
-            shorts_value_no_mock += base_no_mock
-        return {
-            f"agent_{self.address}_base": self.base,
-            f"agent_{self.address}_lp_tokens": lp_token_value,
-            f"agent_{self.address}_total_longs": longs_value,
-            f"agent_{self.address}_total_shorts": shorts_value,
-            f"agent_{self.address}_total_longs_no_mock": longs_value_no_mock,
-            f"agent_{self.address}_total_shorts_no_mock": shorts_value_no_mock,
-        }
+        return valuation.get_wallets_state(market, [self])
 
     def get_state_keys(self) -> list:
         """Get state keys for a wallet."""
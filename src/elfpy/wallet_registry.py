@@ -0,0 +1,402 @@
+"""Array-backed storage for the wallets of large agent populations
+
+A WalletRegistry stores the fungible balances of every registered wallet in NumPy arrays indexed by a wallet
+index, and the open longs and shorts of every wallet in two PositionTables, with one row per (wallet, mint block).
+Each agent keeps a WalletView, which exposes the registry entry through the Wallet API, so policies and reports
+read ``agent.wallet.base`` or ``agent.wallet.longs`` as usual.
+
+Applying the deltas of a trade updates the arrays in place, and elfpy.valuation reads the position tables directly
+instead of walking every wallet, so the cost of trading and valuation grows linearly with the number of positions.
+"""
+from __future__ import annotations  # types will be strings by default in 3.11
+
+from collections.abc import MutableMapping
+from typing import Iterator, Optional, Sequence, Union
+
+import numpy as np
+
+from elfpy.wallet import Long, Short, Wallet
+
+
+class PositionTable:
+    r"""Open positions of one kind (longs or shorts), stored column-wise
+
+    Rows are kept dense: removing a position moves the last row into its slot. Each wallet's rows are also indexed
+    by mint block, in the order the positions were opened.
+
+    Parameters
+    ----------
+    capacity : int
+        Number of rows to preallocate; the columns grow by doubling when they run out of room
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._capacity = max(int(capacity), 1)
+        self.num_rows = 0
+        self.owner = np.empty(self._capacity, dtype=np.int64)
+        self.mint_block = np.empty(self._capacity, dtype=np.int64)
+        self.balance = np.empty(self._capacity, dtype=np.float64)
+        self.open_share_price = np.empty(self._capacity, dtype=np.float64)
+        # rows_by_owner[wallet_index][mint_block] is the row of that position
+        self.rows_by_owner: list[dict[int, int]] = []
+
+    def add_owner(self) -> None:
+        r"""Register a new wallet, which has no positions"""
+        self.rows_by_owner.append({})
+
+    def get_row(self, owner: int, mint_block: int) -> Optional[int]:
+        r"""Returns the row of a wallet's position, or None if the wallet has no position at that mint block"""
+        return self.rows_by_owner[owner].get(mint_block)
+
+    def insert(self, owner: int, mint_block: int, balance: float, open_share_price: float = 0.0) -> int:
+        r"""Adds a position and returns its row
+
+        Parameters
+        ----------
+        owner : int
+            Registry index of the wallet that holds the position
+        mint_block : int
+            Market block number at which the position was opened
+        balance : float
+            The amount of bonds in the position
+        open_share_price : float
+            The share price when the position was opened; only used for shorts
+
+        Returns
+        -------
+        int
+            The row that the position was written to
+        """
+        if self.num_rows == self._capacity:
+            self._grow()
+        row = self.num_rows
+        self.owner[row] = owner
+        self.mint_block[row] = mint_block
+        self.balance[row] = balance
+        self.open_share_price[row] = open_share_price
+        self.rows_by_owner[owner][mint_block] = row
+        self.num_rows += 1
+        return row
+
+    def remove(self, row: int) -> None:
+        r"""Removes the position in a row, moving the last row into its place"""
+        del self.rows_by_owner[self.owner[row]][self.mint_block[row]]
+        last_row = self.num_rows - 1
+        if row != last_row:
+            for column in (self.owner, self.mint_block, self.balance, self.open_share_price):
+                column[row] = column[last_row]
+            self.rows_by_owner[self.owner[row]][self.mint_block[row]] = row
+        self.num_rows = last_row
+
+    def _grow(self) -> None:
+        r"""Double the capacity of every column"""
+        self._capacity *= 2
+        for name in ("owner", "mint_block", "balance", "open_share_price"):
+            column = getattr(self, name)
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[: self.num_rows] = column[: self.num_rows]
+            setattr(self, name, grown)
+
+
+class WalletRegistry:
+    r"""Fungible balances and open positions of many wallets, stored in NumPy arrays
+
+    Parameters
+    ----------
+    capacity : int
+        Number of wallets to preallocate; the arrays grow by doubling when they run out of room
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, capacity: int = 64):
+        self._capacity = max(int(capacity), 1)
+        self.num_wallets = 0
+        self.address = np.empty(self._capacity, dtype=np.int64)
+        self.base = np.empty(self._capacity, dtype=np.float64)
+        self.lp_tokens = np.empty(self._capacity, dtype=np.float64)
+        self.fees_paid = np.empty(self._capacity, dtype=np.float64)
+        self.index_by_address: dict[int, int] = {}
+        self.longs = PositionTable()
+        self.shorts = PositionTable()
+
+    def __len__(self) -> int:
+        return self.num_wallets
+
+    def add_wallet(self, wallet: Wallet) -> WalletView:
+        r"""Copies a wallet into the registry
+
+        Parameters
+        ----------
+        wallet : Wallet
+            The wallet to register; its address must not already be in the registry
+
+        Returns
+        -------
+        WalletView
+            A view onto the registered wallet, which should replace the original wallet
+        """
+        if wallet.address in self.index_by_address:
+            raise ValueError(f"a wallet with address {wallet.address} is already registered")
+        if self.num_wallets == self._capacity:
+            self._grow()
+        index = self.num_wallets
+        self.address[index] = wallet.address
+        self.base[index] = wallet.base
+        self.lp_tokens[index] = wallet.lp_tokens
+        self.fees_paid[index] = wallet.fees_paid
+        self.index_by_address[wallet.address] = index
+        self.longs.add_owner()
+        self.shorts.add_owner()
+        self.num_wallets += 1
+        for mint_block, long in wallet.longs.items():
+            self.longs.insert(index, mint_block, long.balance)
+        for mint_block, short in wallet.shorts.items():
+            self.shorts.insert(index, mint_block, short.balance, short.open_share_price)
+        return WalletView(self, index)
+
+    def apply_deltas(self, index: int, wallet_deltas: Wallet) -> None:
+        r"""Applies the changes from a trade to a registered wallet
+
+        This follows Agent.update_wallet: fees_paid is not accumulated, and positions whose balance reaches zero
+        are removed.
+
+        Parameters
+        ----------
+        index : int
+            Registry index of the wallet to update
+        wallet_deltas : Wallet
+            The changes to the wallet that resulted from the trade
+        """
+        if wallet_deltas.base is not None:
+            self.base[index] += wallet_deltas.base
+        if wallet_deltas.lp_tokens is not None:
+            self.lp_tokens[index] += wallet_deltas.lp_tokens
+        if wallet_deltas.longs:
+            self._apply_long_deltas(index, wallet_deltas.longs)
+        if wallet_deltas.shorts:
+            self._apply_short_deltas(index, wallet_deltas.shorts)
+
+    def get_positions(self, indices: Sequence[int]) -> tuple[np.ndarray, ...]:
+        r"""Returns the open positions of the given wallets as flat arrays
+
+        Parameters
+        ----------
+        indices : Sequence[int]
+            Registry indices of the wallets, without duplicates
+
+        Returns
+        -------
+        tuple[np.ndarray, ...]
+            long_owners, long_mint_blocks, long_balances, short_owners, short_mint_blocks, short_balances, and
+            short_open_share_prices, where the owners are positions in ``indices``
+        """
+        owner_position = np.full(self.num_wallets, -1, dtype=np.int64)
+        owner_position[np.asarray(indices, dtype=np.int64)] = np.arange(len(indices))
+        positions = []
+        for table in (self.longs, self.shorts):
+            owners = owner_position[table.owner[: table.num_rows]]
+            is_selected = owners >= 0
+            positions.append(owners[is_selected])
+            positions.append(table.mint_block[: table.num_rows][is_selected])
+            positions.append(table.balance[: table.num_rows][is_selected])
+        positions.append(self.shorts.open_share_price[: self.shorts.num_rows][is_selected])
+        return tuple(positions)
+
+    def _apply_long_deltas(self, index: int, long_deltas: dict[int, Long]) -> None:
+        r"""Adds the long balance deltas to a registered wallet, removing the positions that reach zero"""
+        longs = self.longs
+        for mint_block, long in long_deltas.items():
+            row = longs.get_row(index, mint_block)
+            if long.balance != 0:
+                if row is None:
+                    row = longs.insert(index, mint_block, long.balance)
+                else:
+                    longs.balance[row] += long.balance
+            if row is not None and longs.balance[row] == 0:
+                longs.remove(row)
+
+    def _apply_short_deltas(self, index: int, short_deltas: dict[int, Short]) -> None:
+        r"""Adds the short balance deltas to a registered wallet, removing the positions that reach zero"""
+        shorts = self.shorts
+        for mint_block, short in short_deltas.items():
+            row = shorts.get_row(index, mint_block)
+            if short.balance != 0:
+                if row is None:
+                    row = shorts.insert(index, mint_block, short.balance, short.open_share_price)
+                else:
+                    shorts.balance[row] += short.balance
+                    if short.balance > 0:
+                        # weighted mean of the open share prices, computed as in Agent._update_shorts
+                        old_balance = shorts.balance[row]
+                        shorts.open_share_price[row] = (
+                            short.open_share_price * short.balance + shorts.open_share_price[row] * old_balance
+                        ) / (short.balance + old_balance)
+            if row is not None and shorts.balance[row] == 0:
+                shorts.remove(row)
+
+    def _grow(self) -> None:
+        r"""Double the capacity of the wallet arrays"""
+        self._capacity *= 2
+        for name in ("address", "base", "lp_tokens", "fees_paid"):
+            column = getattr(self, name)
+            grown = np.empty(self._capacity, dtype=column.dtype)
+            grown[: self.num_wallets] = column[: self.num_wallets]
+            setattr(self, name, grown)
+
+
+class LongView:
+    r"""A long position stored in a PositionTable, with the attributes of Long"""
+
+    def __init__(self, table: PositionTable, owner: int, mint_block: int):
+        self._table = table
+        self._owner = owner
+        self._mint_block = mint_block
+
+    @property
+    def _row(self) -> int:
+        return self._table.rows_by_owner[self._owner][self._mint_block]
+
+    @property
+    def balance(self) -> float:
+        r"""The amount of bonds in the position"""
+        return float(self._table.balance[self._row])
+
+    @balance.setter
+    def balance(self, value: float) -> None:
+        self._table.balance[self._row] = value
+
+    def __str__(self):
+        return f"Long(balance: {self.balance})"
+
+
+class ShortView(LongView):
+    r"""A short position stored in a PositionTable, with the attributes of Short"""
+
+    @property
+    def open_share_price(self) -> float:
+        r"""The share price at the time the short was opened"""
+        return float(self._table.open_share_price[self._row])
+
+    @open_share_price.setter
+    def open_share_price(self, value: float) -> None:
+        self._table.open_share_price[self._row] = value
+
+    def __str__(self):
+        return f"Short(balance: {self.balance}, open_share_price: {self.open_share_price})"
+
+
+class PositionsView(MutableMapping):
+    r"""The positions of one wallet, keyed by mint block, with the behavior of the Wallet.longs and shorts dicts"""
+
+    def __init__(self, table: PositionTable, owner: int, is_short: bool):
+        self._table = table
+        self._owner = owner
+        self._view_type = ShortView if is_short else LongView
+
+    def __getitem__(self, mint_block: int) -> Union[LongView, ShortView]:
+        if mint_block not in self._table.rows_by_owner[self._owner]:
+            raise KeyError(mint_block)
+        return self._view_type(self._table, self._owner, mint_block)
+
+    def __setitem__(self, mint_block: int, position: Union[Long, Short]) -> None:
+        open_share_price = getattr(position, "open_share_price", 0.0)
+        row = self._table.get_row(self._owner, mint_block)
+        if row is None:
+            self._table.insert(self._owner, mint_block, position.balance, open_share_price)
+        else:
+            self._table.balance[row] = position.balance
+            self._table.open_share_price[row] = open_share_price
+
+    def __delitem__(self, mint_block: int) -> None:
+        row = self._table.get_row(self._owner, mint_block)
+        if row is None:
+            raise KeyError(mint_block)
+        self._table.remove(row)
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self._table.rows_by_owner[self._owner])
+
+    def __len__(self) -> int:
+        return len(self._table.rows_by_owner[self._owner])
+
+    def __repr__(self) -> str:
+        return repr({mint_block: str(position) for mint_block, position in self.items()})
+
+
+class WalletView:
+    r"""A wallet stored in a WalletRegistry, with the attributes and methods of Wallet
+
+    Parameters
+    ----------
+    registry : WalletRegistry
+        The registry that stores the wallet
+    index : int
+        The wallet's index in the registry
+    """
+
+    def __init__(self, registry: WalletRegistry, index: int):
+        self.registry = registry
+        self.index = index
+
+    @property
+    def address(self) -> int:
+        r"""The trader's address"""
+        return int(self.registry.address[self.index])
+
+    @property
+    def base(self) -> float:
+        r"""The base assets held by the trader"""
+        return float(self.registry.base[self.index])
+
+    @base.setter
+    def base(self, value: float) -> None:
+        self.registry.base[self.index] = value
+
+    @property
+    def lp_tokens(self) -> float:
+        r"""The LP tokens held by the trader"""
+        return float(self.registry.lp_tokens[self.index])
+
+    @lp_tokens.setter
+    def lp_tokens(self, value: float) -> None:
+        self.registry.lp_tokens[self.index] = value
+
+    @property
+    def fees_paid(self) -> float:
+        r"""The fees paid by the wallet"""
+        return float(self.registry.fees_paid[self.index])
+
+    @fees_paid.setter
+    def fees_paid(self, value: float) -> None:
+        self.registry.fees_paid[self.index] = value
+
+    @property
+    def longs(self) -> PositionsView:
+        r"""The long positions held by the trader, keyed by mint block"""
+        return PositionsView(self.registry.longs, self.index, is_short=False)
+
+    @property
+    def shorts(self) -> PositionsView:
+        r"""The short positions held by the trader, keyed by mint block"""
+        return PositionsView(self.registry.shorts, self.index, is_short=True)
+
+    def to_wallet(self) -> Wallet:
+        r"""Returns a standalone copy of the wallet"""
+        return Wallet(
+            address=self.address,
+            base=self.base,
+            lp_tokens=self.lp_tokens,
+            longs={mint_block: Long(long.balance) for mint_block, long in self.longs.items()},
+            shorts={
+                mint_block: Short(short.balance, short.open_share_price) for mint_block, short in self.shorts.items()
+            },
+            fees_paid=self.fees_paid,
+        )
+
+    # the remaining Wallet methods only use the attributes above
+    __getitem__ = Wallet.__getitem__
+    __setitem__ = Wallet.__setitem__
+    __str__ = Wallet.__str__
+    get_state = Wallet.get_state
+    get_state_keys = Wallet.get_state_keys
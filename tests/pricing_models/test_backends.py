@@ -0,0 +1,111 @@
+"""Testing for the numeric backends of the pricing models"""
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from elfpy.pricing_models.backends import DecimalBackend, Float64Backend, get_numeric_backend
+from elfpy.pricing_models.base import PricingModel
+from elfpy.pricing_models.hyperdrive import HyperdrivePricingModel
+from elfpy.pricing_models.yieldspace import YieldSpacePricingModel
+from elfpy.types import MarketState, Quantity, StretchedTime, TokenType
+
+# pylint: disable=duplicate-code
+
+
+class TestNumericBackends(unittest.TestCase):
+    """Tests comparing the float64 backend against the Decimal reference backend"""
+
+    def test_get_numeric_backend(self):
+        """The precision selects the backend, and unsupported precisions are rejected"""
+        assert isinstance(get_numeric_backend(64), Float64Backend)
+        assert isinstance(get_numeric_backend(128), DecimalBackend)
+        assert isinstance(HyperdrivePricingModel().backend, DecimalBackend)
+        assert isinstance(HyperdrivePricingModel(precision=64).backend, Float64Backend)
+        with self.assertRaises(ValueError):
+            get_numeric_backend(32)
+
+    def test_domain_errors(self):
+        """Both backends raise an ArithmeticError when a power is not a real number"""
+        for backend in [DecimalBackend(), Float64Backend()]:
+            with self.assertRaises(ArithmeticError):
+                backend.power(backend.number(-2.0), backend.number(0.5))
+
+    @staticmethod
+    def get_random_market(rng: np.random.Generator, pricing_model: PricingModel) -> tuple[MarketState, StretchedTime]:
+        """Returns a random market state, with the bond reserves for a random apr, and a random time remaining"""
+        share_reserves = 10 ** rng.uniform(3, 8)
+        target_apr = rng.uniform(0.01, 0.5)
+        share_price = rng.uniform(1, 2)
+        init_share_price = rng.uniform(1, share_price)
+        time_remaining = StretchedTime(
+            days=rng.uniform(1, 365), time_stretch=pricing_model.calc_time_stretch(target_apr)
+        )
+        market_state = MarketState(
+            share_reserves=share_reserves,
+            bond_reserves=pricing_model.calc_bond_reserves(
+                target_apr, share_reserves, time_remaining, init_share_price, share_price
+            ),
+            share_price=share_price,
+            init_share_price=init_share_price,
+            trade_fee_percent=rng.uniform(0, 0.5),
+            redemption_fee_percent=rng.uniform(0, 0.5),
+        )
+        return market_state, time_remaining
+
+    def assert_breakdowns_agree(self, decimal_result, float_result, tolerance: float, label: str):
+        """Each component of the float64 trade breakdown is a float within tolerance of the Decimal component"""
+        for component in ["without_fee_or_slippage", "without_fee", "fee", "with_fee"]:
+            decimal_value = getattr(decimal_result.breakdown, component)
+            float_value = getattr(float_result.breakdown, component)
+            self.assertIsInstance(float_value, float)
+            self.assertLessEqual(
+                abs(float_value - decimal_value), tolerance, f"{label} {component}: {float_value=} {decimal_value=}"
+            )
+
+    def test_float64_error_bound(self):
+        """The float64 trade results are within the documented error bound of the Decimal results"""
+        rng = np.random.default_rng(seed=1234)
+        model_types: list[type[PricingModel]] = [YieldSpacePricingModel, HyperdrivePricingModel]
+        for model_type in model_types:
+            decimal_model = model_type(precision=128)
+            float_model = model_type(precision=64)
+            for _ in range(200):
+                market_state, time_remaining = self.get_random_market(rng, decimal_model)
+                total_reserves = 2 * market_state.bond_reserves + market_state.share_price * market_state.share_reserves
+                quantity = Quantity(amount=10 ** rng.uniform(-6, 6), unit=[TokenType.BASE, TokenType.PT][_ % 2])
+                assert np.isclose(
+                    float_model.calc_spot_price_from_reserves(market_state, time_remaining),
+                    decimal_model.calc_spot_price_from_reserves(market_state, time_remaining),
+                    rtol=1e-12,
+                    atol=0,
+                )
+                for method in ["calc_in_given_out", "calc_out_given_in"]:
+                    try:
+                        decimal_result = getattr(decimal_model, method)(quantity, market_state, time_remaining)
+                    except (ArithmeticError, AssertionError):  # the trade is larger than the reserves can support
+                        continue
+                    float_result = getattr(float_model, method)(quantity, market_state, time_remaining)
+                    self.assert_breakdowns_agree(
+                        decimal_result, float_result, 1e-14 * total_reserves, f"{model_type.__name__}.{method}"
+                    )
+
+    def test_float64_get_max(self):
+        """The max trade searches agree between backends"""
+        for model_type in [YieldSpacePricingModel, HyperdrivePricingModel]:
+            market_state = MarketState(
+                share_reserves=1_000_000,
+                bond_reserves=1_000_000,
+                share_price=1,
+                init_share_price=1,
+                trade_fee_percent=0.1,
+                redemption_fee_percent=0.1,
+            )
+            time_remaining = StretchedTime(days=365, time_stretch=model_type().calc_time_stretch(0.05))
+            decimal_max_long = model_type(precision=128).get_max_long(market_state, time_remaining)
+            float_max_long = model_type(precision=64).get_max_long(market_state, time_remaining)
+            np.testing.assert_allclose(float_max_long, decimal_max_long, rtol=1e-6)
+            decimal_max_short = model_type(precision=128).get_max_short(market_state, time_remaining)
+            float_max_short = model_type(precision=64).get_max_short(market_state, time_remaining)
+            np.testing.assert_allclose(float_max_short, decimal_max_short, rtol=1e-6)
@@ -0,0 +1,134 @@
+"""Testing for the vectorized batch pricing functions"""
+from __future__ import annotations
+
+import unittest
+
+import numpy as np
+
+from elfpy.pricing_models.base import PricingModel
+from elfpy.pricing_models.hyperdrive import HyperdrivePricingModel
+from elfpy.pricing_models.yieldspace import YieldSpacePricingModel
+from elfpy.types import MarketState, Quantity, StretchedTime, TokenType, TradeResult
+
+# pylint: disable=duplicate-code
+
+
+def get_trade_components(trade_result: TradeResult) -> list:
+    """Flattens a trade result into a list of its components"""
+    return [
+        trade_result.user_result.d_base,
+        trade_result.user_result.d_bonds,
+        trade_result.market_result.d_base,
+        trade_result.market_result.d_bonds,
+        trade_result.breakdown.without_fee_or_slippage,
+        trade_result.breakdown.with_fee,
+        trade_result.breakdown.without_fee,
+        trade_result.breakdown.fee,
+    ]
+
+
+class TestBatchPricing(unittest.TestCase):
+    """Tests that the batch functions match the scalar functions element by element"""
+
+    market_state = MarketState(
+        share_reserves=1_000_000,
+        bond_reserves=1_500_000,
+        share_price=1.1,
+        init_share_price=1.0,
+        trade_fee_percent=0.1,
+        redemption_fee_percent=0.05,
+    )
+
+    def test_trade_amounts(self):
+        """A batch of trade amounts matches a loop over the scalar float64 functions"""
+        amounts = np.logspace(-3, 5, 25)
+        total_reserves = (
+            2 * self.market_state.bond_reserves + self.market_state.share_price * self.market_state.share_reserves
+        )
+        pricing_models: list[PricingModel] = [YieldSpacePricingModel(), HyperdrivePricingModel()]
+        for pricing_model in pricing_models:
+            scalar_model = type(pricing_model)(precision=64)
+            time_remaining = StretchedTime(days=180, time_stretch=pricing_model.calc_time_stretch(0.05))
+            for unit in [TokenType.BASE, TokenType.PT]:
+                for method in ["calc_in_given_out", "calc_out_given_in"]:
+                    batch_result = getattr(pricing_model, f"{method}_batch")(
+                        amounts, unit, self.market_state, time_remaining
+                    )
+                    batch_components = get_trade_components(batch_result)
+                    for component in batch_components:
+                        assert component.shape == amounts.shape
+                    for index, amount in enumerate(amounts):
+                        scalar_result = getattr(scalar_model, method)(
+                            Quantity(amount=amount, unit=unit), self.market_state, time_remaining
+                        )
+                        # np.power and math.pow can differ in the last ulp, which the curve math amplifies
+                        # by the size of the reserves (see elfpy.pricing_models.backends)
+                        np.testing.assert_allclose(
+                            [component[index] for component in batch_components],
+                            get_trade_components(scalar_result),
+                            rtol=1e-12,
+                            atol=1e-14 * total_reserves,
+                        )
+
+    def test_market_state_grid(self):
+        """Arrays of market state fields and times remaining broadcast against each other"""
+        pricing_model = HyperdrivePricingModel()
+        share_reserves = np.array([1e5, 1e6, 1e7])[:, np.newaxis]
+        days = np.array([30.0, 90.0, 180.0, 365.0])
+        time_remaining = StretchedTime(days=days, time_stretch=pricing_model.calc_time_stretch(0.05))
+        market_state = MarketState(
+            share_reserves=share_reserves,
+            bond_reserves=1.5 * share_reserves,
+            share_price=1.1,
+            init_share_price=1.0,
+            trade_fee_percent=0.1,
+            redemption_fee_percent=0.05,
+        )
+        spot_prices = pricing_model.calc_spot_price_from_reserves_batch(market_state, time_remaining)
+        aprs = pricing_model.calc_apr_from_reserves_batch(market_state, time_remaining)
+        with_fee = np.asarray(  # the batch results are arrays
+            pricing_model.calc_out_given_in_batch(100, TokenType.BASE, market_state, time_remaining).breakdown.with_fee
+        )
+        assert spot_prices.shape == aprs.shape == with_fee.shape == (3, 4)
+        for row, reserves in enumerate(share_reserves[:, 0]):
+            for col, num_days in enumerate(days):
+                scalar_state = MarketState(
+                    share_reserves=reserves,
+                    bond_reserves=1.5 * reserves,
+                    share_price=1.1,
+                    init_share_price=1.0,
+                    trade_fee_percent=0.1,
+                    redemption_fee_percent=0.05,
+                )
+                scalar_time = StretchedTime(days=num_days, time_stretch=pricing_model.calc_time_stretch(0.05))
+                assert np.isclose(
+                    spot_prices[row, col],
+                    pricing_model.calc_spot_price_from_reserves(scalar_state, scalar_time),
+                    rtol=1e-12,
+                )
+                assert np.isclose(
+                    aprs[row, col], pricing_model.calc_apr_from_reserves(scalar_state, scalar_time), rtol=1e-9
+                )
+                assert np.isclose(
+                    with_fee[row, col],
+                    pricing_model.calc_out_given_in(
+                        Quantity(amount=100, unit=TokenType.BASE), scalar_state, scalar_time
+                    ).breakdown.with_fee,
+                    rtol=1e-9,
+                )
+
+    def test_infeasible_trades_are_nan(self):
+        """Trades larger than the reserves evaluate to NaN instead of raising"""
+        pricing_model = YieldSpacePricingModel()
+        time_remaining = StretchedTime(days=180, time_stretch=pricing_model.calc_time_stretch(0.05))
+        trade_result = pricing_model.calc_in_given_out_batch(
+            [100, 1e9], TokenType.BASE, self.market_state, time_remaining
+        )
+        with_fee = np.asarray(trade_result.breakdown.with_fee)  # the batch results are arrays
+        assert np.isfinite(with_fee[0])
+        assert np.isnan(with_fee[1])
+        # the scalar functions are unaffected by the batch backend
+        with self.assertRaises(ArithmeticError):
+            pricing_model.calc_in_given_out(
+                Quantity(amount=1e9, unit=TokenType.BASE), self.market_state, time_remaining
+            )
@@ -0,0 +1,143 @@
+"""Testing for the lockstep ensemble simulator found in src/elfpy/ensemble.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+from elfpy.ensemble import EnsembleSimulator, get_ensemble_simulator
+from elfpy.utils import post_processing
+import elfpy.utils.parse_config as config_utils
+
+
+class EnsembleTests(unittest.TestCase):
+    """Tests for advancing many simulations together"""
+
+    @staticmethod
+    def get_ensemble(num_runs: int = 3, **overrides) -> EnsembleSimulator:
+        """Returns an ensemble of differently seeded runs of a small config"""
+        override_dict = {
+            "pricing_model_name": "Hyperdrive",
+            "num_trading_days": 10,
+            "num_blocks_per_day": 4,
+            "agent_policies": ["single_long", "single_short", "single_long"],
+            "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+            "shuffle_users": False,
+            "precision": 64,
+            **overrides,
+        }
+        config = config_utils.override_config_variables(
+            config_utils.load_and_parse_config_file("config/example_config.toml"), override_dict
+        )
+        return get_ensemble_simulator(config, num_runs=num_runs, root_seed=1234)
+
+    def assert_simulators_match(self, simulators, expected_simulators, rtol):
+        """The markets, wallets, and trade counts of each simulator agree with the expected simulators"""
+        for simulator, expected in zip(simulators, expected_simulators):
+            self.assertEqual(simulator.market.block_number, expected.market.block_number)
+            self.assertEqual(simulator.num_completed_days, expected.num_completed_days)
+            self.assertEqual(simulator.run_trade_number, expected.run_trade_number)
+            for key, value in expected.market.market_state.__dict__.items():
+                np.testing.assert_allclose(
+                    getattr(simulator.market.market_state, key), value, rtol=rtol, atol=1e-6, err_msg=key
+                )
+            for address, expected_agent in expected.agents.items():
+                wallet = simulator.agents[address].wallet
+                self.assertEqual(list(wallet.longs), list(expected_agent.wallet.longs))
+                self.assertEqual(list(wallet.shorts), list(expected_agent.wallet.shorts))
+                np.testing.assert_allclose(wallet.base, expected_agent.wallet.base, rtol=rtol)
+                np.testing.assert_allclose(wallet.lp_tokens, expected_agent.wallet.lp_tokens, rtol=rtol)
+
+    def assert_states_match(self, simulators, expected_simulators):
+        """The numeric simulation_state rows of each simulator agree with the expected simulators"""
+        for simulator, expected in zip(simulators, expected_simulators):
+            state_df = post_processing.get_simulation_state_df(simulator).select_dtypes("number")
+            expected_state_df = post_processing.get_simulation_state_df(expected).select_dtypes("number")
+            self.assertEqual(list(state_df.columns), list(expected_state_df.columns))
+            np.testing.assert_allclose(state_df.to_numpy(), expected_state_df.to_numpy(), rtol=1e-9, atol=1e-6)
+
+    def test_lockstep_matches_simulators(self):
+        """Runs advanced in lockstep agree with running each simulator, to float64 rounding error"""
+        # long enough for the single_long agents to close their longs and open new ones
+        ensemble = self.get_ensemble(num_trading_days=120, num_blocks_per_day=2, record_cadence="day")
+        expected_simulators = [simulator.fork() for simulator in ensemble.simulators]
+        self.assertTrue(ensemble.is_lockstep, msg=ensemble.fallback_reason)
+        for stop_day in [40, 119]:  # in two parts, before the final day
+            ensemble.run_simulation(stop_day=stop_day)
+            for expected in expected_simulators:
+                expected.run_simulation(stop_day=stop_day)
+            self.assert_simulators_match(ensemble.simulators, expected_simulators, rtol=1e-9)
+        # the lockstep days are recorded as the simulators record them with a daily record_cadence
+        self.assert_states_match(ensemble.simulators, expected_simulators)
+        self.assertGreater(len(set(ensemble.simulators[0].simulation_state["day"])), 2)
+        self.assertTrue(any(len(agent.wallet.longs) > 1 for agent in ensemble.simulators[0].agents.values()))
+        state = ensemble.get_state()
+        self.assertEqual(state["share_reserves"].shape, (119, 3))
+        np.testing.assert_array_equal(state["day"], np.arange(119))
+        # different seeds give different markets
+        self.assertEqual(len(np.unique(state["share_reserves"][-1])), 3)
+        state_df = ensemble.get_state_df()
+        self.assertEqual(len(state_df), 119 * 3)
+        self.assertEqual(state_df["run_number"].tolist()[:3], [0, 1, 2])
+
+    def test_final_day_runs_on_the_normal_path(self):
+        """The final day is run by each simulator, and the lockstep days are recorded as with a daily record_cadence"""
+        ensemble = self.get_ensemble(record_cadence="day")
+        expected_simulators = [simulator.fork() for simulator in ensemble.simulators]
+        ensemble.run_simulation()
+        for expected in expected_simulators:
+            expected.run_simulation()
+        self.assert_simulators_match(ensemble.simulators, expected_simulators, rtol=1e-9)
+        self.assert_states_match(ensemble.simulators, expected_simulators)
+        for simulator in ensemble.simulators:
+            for agent in simulator.agents.values():
+                self.assertTrue(all(long.balance <= 0 for long in agent.wallet.longs.values()))
+        with self.assertRaises(ValueError):
+            ensemble.run_simulation(stop_day=5)
+
+    def test_sampled_validation(self):
+        """The sampled validation_level checks the same trades of each run as the normal path"""
+        ensemble = self.get_ensemble(validation_level="sampled", validation_interval=3)
+        self.assertTrue(ensemble.is_lockstep, msg=ensemble.fallback_reason)
+        expected_simulators = [simulator.fork() for simulator in ensemble.simulators]
+        ensemble.run_simulation(stop_day=9)
+        for expected in expected_simulators:
+            expected.run_simulation(stop_day=9)
+        for simulator, expected in zip(ensemble.simulators, expected_simulators):
+            self.assertGreater(expected.market.pricing_model.num_sampled_trades, 0)
+            self.assertEqual(
+                simulator.market.pricing_model.num_sampled_trades, expected.market.pricing_model.num_sampled_trades
+            )
+
+    def test_shuffled_lockstep(self):
+        """With shuffle_users, each run acts in its own random order, which the ensemble draws reproducibly"""
+        final_reserves = []
+        for _ in range(2):
+            ensemble = self.get_ensemble(num_runs=8, shuffle_users=True)
+            self.assertTrue(ensemble.is_lockstep, msg=ensemble.fallback_reason)
+            ensemble.run_simulation(stop_day=9)
+            final_reserves.append([simulator.market.market_state.share_reserves for simulator in ensemble.simulators])
+            for simulator in ensemble.simulators:
+                self.assertEqual(simulator.run_trade_number, ensemble.simulators[0].run_trade_number)
+        np.testing.assert_array_equal(final_reserves[0], final_reserves[1])
+        self.assertTrue(np.all(np.isfinite(final_reserves[0])))
+
+    def test_fallback_to_simulators(self):
+        """Agents without a vectorized policy make the ensemble run each simulator on the normal path"""
+        ensemble = self.get_ensemble(agent_policies=["single_long", "lp_and_withdraw"])
+        self.assertFalse(ensemble.is_lockstep)
+        self.assertIn("lp_and_withdraw", ensemble.fallback_reason)
+        expected_simulators = [simulator.fork() for simulator in ensemble.simulators]
+        ensemble.run_simulation()
+        for expected in expected_simulators:
+            expected.run_simulation()
+        self.assert_simulators_match(ensemble.simulators, expected_simulators, rtol=0)
+        self.assertEqual(ensemble.get_state(), {})
+        for overrides, reason in [
+            ({"settle_matured_positions": True}, "settle_matured_positions"),
+            ({"use_wallet_registry": True}, "use_wallet_registry"),
+            ({"record_cadence": "reservoir"}, "reservoir"),
+            ({"precision": 128}, "Decimal precision"),
+            ({"vault_apr": {"type": "constant", "value": 0.05, "stream": True}}, "streamed"),
+        ]:
+            self.assertIn(reason, self.get_ensemble(num_runs=2, **overrides).fallback_reason)
@@ -6,6 +6,8 @@ import logging
 import itertools
 import os
 import sys
+import tempfile
+import threading
 from typing import Any
 
 from elfpy.utils.parse_config import load_and_parse_config_file
@@ -75,3 +77,61 @@ class TestLogging(BaseLogTest):
     def test_logging(self):
         """Tests logging"""
         self.run_logging_test(delete_logs=True)
+
+
+class TestQueuedLogging(unittest.TestCase):
+    """Tests for writing logs from a background thread"""
+
+    def test_queued_file_logging(self):
+        """Queued records are written in order by the writer thread, and close_logging writes out the queue"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_filename = os.path.join(temp_dir, "queued.log")
+            # a queue of one record makes logging wait on the writer, instead of dropping records
+            output_utils.setup_logging(
+                log_filename, log_level=logging.DEBUG, use_queue=True, queue_size=1, batch_size=7
+            )
+            handler = logging.getLogger().handlers[0]
+            self.assertIsInstance(handler, output_utils.LogQueueHandler)
+            writer_threads = set()
+            output_handler = handler.listener.handlers[0]
+            emit = output_handler.emit
+            output_handler.emit = lambda record: (writer_threads.add(threading.get_ident()), emit(record))
+            values = {"value": 0}
+            for index in range(100):
+                values["value"] = index
+                logging.debug("record %d with %s", index, values)  # values is mutated after the call
+            config = config_utils.override_config_variables(
+                load_and_parse_config_file("config/example_config.toml"),
+                {"num_trading_days": 2, "num_blocks_per_day": 3},
+            )
+            sim_utils.get_simulator(config).run_simulation()
+            output_utils.close_logging(delete_logs=False)
+            self.assertFalse(handler.listener.is_running)
+            with open(log_filename, mode="r", encoding="UTF-8") as file:
+                log_text = file.read()
+            positions = [log_text.index(f"record {index} with {{'value': {index}}}") for index in range(100)]
+            self.assertEqual(positions, sorted(positions))
+            self.assertIn("simulators.run_block", log_text)
+            self.assertEqual(len(writer_threads), 1)
+            self.assertNotIn(threading.get_ident(), writer_threads)
+
+    def test_batched_file_handler(self):
+        """The batched handler writes each full batch, and writes the rest of the records when it is flushed"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_filename = os.path.join(temp_dir, "batched.log")
+            handler = output_utils.BatchedRotatingFileHandler(log_filename, mode="w", batch_size=3)
+            logger = logging.getLogger("test_batched_file_handler")
+            logger.propagate = False
+            logger.setLevel(logging.DEBUG)  # independent of the root level left by other tests
+            logger.addHandler(handler)
+            for index in range(5):
+                logger.warning("message %d", index)
+            with open(log_filename, mode="r", encoding="UTF-8") as file:
+                self.assertEqual(file.read(), "message 0\nmessage 1\nmessage 2\n")
+            for index in range(5, 12):
+                logger.warning("message %d", index)
+            handler.flush()
+            logger.removeHandler(handler)
+            handler.close()
+            with open(log_filename, mode="r", encoding="UTF-8") as file:
+                self.assertEqual(file.read(), "".join(f"message {index}\n" for index in range(12)))
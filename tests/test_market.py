@@ -6,8 +6,10 @@ import unittest
 import logging
 from typing import Any
 
+import numpy as np
+
 import utils_for_tests as test_utils  # utilities for testing
-from elfpy.types import MarketDeltas
+from elfpy.types import MarketDeltas, StretchedTime
 from elfpy.wallet import Wallet, Long, Short
 
 import elfpy.utils.outputs as output_utils  # utilities for file outputs
@@ -99,7 +101,7 @@ class BaseMarketTest(unittest.TestCase):
         amount_of_bonds_purchased = agent_deltas.longs[0].balance
         # sell those bonds to close the long
         market_deltas, agent_deltas = simulator.market.close_long(
-            mint_time=0,
+            mint_block=0,
             wallet_address=1,
             trade_amount=amount_of_bonds_purchased,  # in bonds: that's the thing in your wallet you want to sell
         )
@@ -121,13 +123,13 @@ class BaseMarketTest(unittest.TestCase):
         amount_of_bonds_sold = agent_deltas.shorts[0].balance
         # sell those bonds to close the short (partial is the amount of the short to close, 1.0 by default)
         trade_amount = amount_of_bonds_sold * partial
-        mint_time = 0
+        mint_block = 0
         if tick_time:
-            simulator.market.tick(simulator.market_step_size())
+            simulator.market.tick()
         market_deltas, agent_deltas = simulator.market.close_short(
-            mint_time=mint_time,
+            mint_block=mint_block,
             wallet_address=1,
-            open_share_price=agent_deltas.shorts[mint_time].open_share_price,
+            open_share_price=agent_deltas.shorts[mint_block].open_share_price,
             trade_amount=trade_amount,  # in bonds: that's the thing you owe, and need to buy back
         )
         actual_deltas = Deltas(market_deltas=market_deltas, agent_deltas=agent_deltas)
@@ -366,3 +368,102 @@ class MarketTestsOneFunction(BaseMarketTest):
         self.run_market_test_close_short(
             agent_policy=agent_policy, expected_deltas=expected_deltas, partial=0.5, tick_time=True
         )
+
+
+class MarketQuoteCacheTests(BaseMarketTest):
+    """Tests for the per-state-version cache of market quotes"""
+
+    def test_quotes_cached_until_state_changes(self):
+        """Repeated quotes at the same state version are only computed once"""
+        simulator = self.set_up_test(agent_policies=["single_long"])
+        market = simulator.market
+        num_calls = {"get_max_long": 0, "_calc_spot_price": 0, "_calc_rate": 0}
+
+        def count_calls(owner, name):
+            method = getattr(owner, name)
+
+            def counted(*args, **kwargs):
+                num_calls[name] += 1
+                return method(*args, **kwargs)
+
+            setattr(owner, name, counted)
+
+        count_calls(market.pricing_model, "get_max_long")
+        count_calls(market, "_calc_spot_price")
+        count_calls(market, "_calc_rate")
+        market.invalidate_quotes()  # setting up the simulation may have cached some quotes
+        expected_quotes = (market.get_max_long(), market.spot_price, market.rate)
+        for _ in range(10):  # e.g. several agents polling the same block
+            self.assertEqual((market.get_max_long(), market.spot_price, market.rate), expected_quotes)
+        self.assertEqual(num_calls, {"get_max_long": 1, "_calc_spot_price": 1, "_calc_rate": 1})
+        # a trade changes the state, so the quotes are recomputed once
+        version = market.state_version
+        market.trade_and_update(simulator.agents[1].get_trades(market)[0])
+        self.assertGreater(market.state_version, version)
+        for _ in range(10):
+            self.assertNotEqual((market.get_max_long(), market.spot_price, market.rate), expected_quotes)
+        self.assertEqual(num_calls, {"get_max_long": 2, "_calc_spot_price": 2, "_calc_rate": 2})
+        # ticking the clock also invalidates the cache
+        version = market.state_version
+        market.tick()
+        self.assertGreater(market.state_version, version)
+        _ = market.spot_price
+        self.assertEqual(num_calls["_calc_spot_price"], 3)
+
+
+class MarketBlockClockTests(BaseMarketTest):
+    """Tests for the integer block clock"""
+
+    def test_block_clock(self):
+        """Market time is derived from the block number without accumulating rounding errors"""
+        simulator = self.set_up_test(agent_policies=["single_long"])
+        market = simulator.market
+        self.assertEqual(market.blocks_per_year, 365 * simulator.config.simulator.num_blocks_per_day)
+        num_blocks = 180 * simulator.config.simulator.num_blocks_per_day
+        market.tick(num_blocks)
+        self.assertEqual(market.time, num_blocks / market.blocks_per_year)
+        self.assertEqual(market.time, 180 / 365)
+        # positions are keyed by the integer block number at which they were minted
+        _, agent_deltas = market.open_long(wallet_address=1, trade_amount=100)
+        self.assertEqual(list(agent_deltas.longs), [num_blocks])
+        self.assertIsInstance(list(agent_deltas.longs)[0], int)
+        with self.assertRaises(ValueError):
+            market.tick(-1)
+
+
+class MarketTimeRemainingTableTests(BaseMarketTest):
+    """Tests for the precomputed table of time remaining by block offset"""
+
+    def test_table_matches_stretched_time(self):
+        """Table lookups are identical to constructing a StretchedTime from the years remaining"""
+        simulator = self.set_up_test(agent_policies=["single_long"])
+        market = simulator.market
+        market.tick(10 * simulator.config.simulator.num_blocks_per_day)
+        table = market.time_remaining_table
+        mint_blocks = np.array([0, 1, 7, market.block_number // 3, market.block_number], dtype=np.int64)
+        batch_time_remaining = market.get_time_remaining(mint_blocks)
+        for index, mint_block in enumerate(mint_blocks):
+            expected = StretchedTime(
+                days=market.get_years_remaining(int(mint_block)) * 365,
+                time_stretch=market.position_duration.time_stretch,
+                normalizing_constant=market.position_duration.normalizing_constant,
+            )
+            time_remaining = market.get_time_remaining(int(mint_block))
+            for days, normalized_time, stretched_time in [
+                (time_remaining.days, time_remaining.normalized_time, time_remaining.stretched_time),
+                (
+                    batch_time_remaining.days[index],
+                    batch_time_remaining.normalized_time[index],
+                    batch_time_remaining.stretched_time[index],
+                ),
+            ]:
+                self.assertEqual(days, expected.days)
+                self.assertEqual(normalized_time, expected.normalized_time)
+                self.assertEqual(stretched_time, expected.stretched_time)
+        # only the pages that were looked up are computed
+        rows = np.minimum(market.block_number - mint_blocks, table.num_rows - 1)
+        self.assertEqual(table.num_computed_pages, len(np.unique(rows // table.page_size)))
+        # matured positions have zero time remaining
+        self.assertEqual(table.get_time_remaining(10 * table.num_rows).days, 0)
+        with self.assertRaises(ValueError):
+            market.get_time_remaining(market.block_number + 1)
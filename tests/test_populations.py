@@ -0,0 +1,72 @@
+"""Testing for the vectorized agent populations found in src/elfpy/populations.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy.policies import single_long
+from elfpy.populations import SingleLongPopulation
+from elfpy.types import MarketActionType
+
+
+class PopulationTests(unittest.TestCase):
+    """Tests for computing the actions of many agents with the same policy at once"""
+
+    # long enough for the single_long agents to close their longs after a quarter year; the runs stop before the
+    # final liquidation, because single_long closes more bonds than it holds, which leaves the init_lp unable to
+    # withdraw its liquidity
+    override_dict = {
+        "target_liquidity": 10e6,
+        "num_trading_days": 100,
+        "num_blocks_per_day": 2,
+        "num_position_days": 365,
+        "vault_apr": {"type": "constant", "value": 0.05},
+        "shuffle_users": True,
+    }
+    wallet_addresses = range(1, 21)
+
+    def get_simulator(self, **overrides):
+        """Returns a simulator without any trading agents"""
+        return test_utils.setup_simulation_entities(
+            config_file="config/example_config.toml",
+            override_dict={**self.override_dict, **overrides},
+            agent_policies=[],
+        )
+
+    def test_population_matches_agents(self):
+        """A population records the same simulation state as the same agents added one at a time"""
+        for overrides in [{}, {"use_wallet_registry": True}, {"skip_idle_blocks": True}]:
+            reference = self.get_simulator(**overrides)
+            reference.add_agents([single_long.Policy(address, budget=1000) for address in self.wallet_addresses])
+            reference.run_simulation(stop_day=95)
+            simulator = self.get_simulator(**overrides)
+            simulator.add_population(SingleLongPopulation(self.wallet_addresses, budget=1000))
+            with mock.patch.object(single_long.Policy, "action", side_effect=AssertionError("action was called")):
+                simulator.run_simulation(stop_day=95)
+            self.assertEqual(list(simulator.agents), list(reference.agents))
+            expected_state = reference.simulation_state.as_dict()
+            for key, values in simulator.simulation_state.as_dict().items():
+                if values.dtype != object:
+                    np.testing.assert_array_equal(values, expected_state[key], err_msg=f"{overrides}: {key}")
+
+    def test_actions(self):
+        """Members open one long each, and close it once the holding period has passed"""
+        simulator = self.get_simulator()
+        population = SingleLongPopulation(self.wallet_addresses, budget=1000)
+        simulator.add_population(population)
+        trades = population.get_trades(simulator.market)
+        self.assertEqual(list(trades), list(self.wallet_addresses))
+        self.assertTrue(all(action.action_type == MarketActionType.OPEN_LONG for (action,) in trades.values()))
+        simulator.execute_trades(list(trades.items()))
+        self.assertTrue(all(actions == [] for actions in population.get_trades(simulator.market).values()))
+        mint_block = simulator.market.block_number
+        self.assertEqual(population.get_next_wakeup_time(simulator.market), simulator.market.time + 0.25)
+        simulator.market.tick(int(0.26 * simulator.market.blocks_per_year))
+        trades = population.get_trades(simulator.market)
+        for address, (action,) in trades.items():
+            self.assertEqual(action.action_type, MarketActionType.CLOSE_LONG)
+            self.assertEqual(action.mint_block, mint_block)
+            self.assertEqual(action, simulator.agents[address].get_trades(simulator.market)[0])
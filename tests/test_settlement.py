@@ -0,0 +1,103 @@
+"""Testing for the bulk settlement of matured positions found in src/elfpy/settlement.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy import settlement
+from elfpy.settlement import MaturityIndex
+
+
+class SettlementTests(unittest.TestCase):
+    """Tests for settling matured positions in one pass"""
+
+    override_dict = {
+        "pricing_model_name": "Hyperdrive",
+        "target_liquidity": 10e6,
+        "target_pool_apr": 0.05,
+        "vault_apr": {"type": "constant", "value": 0.05},
+        "num_trading_days": 12,
+        "num_position_days": 2,
+        "num_blocks_per_day": 4,
+        "precision": 64,
+    }
+    agent_policies = ["single_long", "single_short", "single_long", "single_short"]
+
+    def get_simulator(self, **overrides):
+        """Returns a simulator with agents that hold their positions past maturity"""
+        return test_utils.setup_simulation_entities(
+            config_file="config/example_config.toml",
+            override_dict={**self.override_dict, **overrides},
+            agent_policies=self.agent_policies,
+        )
+
+    def test_maturity_index(self):
+        """Positions are returned once, in order of maturity, when their maturity block is reached"""
+        index = MaturityIndex(blocks_to_maturity=10)
+        index.add(wallet_address=1, position_type="long", mint_block=5)
+        index.add(wallet_address=2, position_type="short", mint_block=3)
+        index.add(wallet_address=1, position_type="long", mint_block=5)  # same position, added again
+        index.add(wallet_address=3, position_type="long", mint_block=3)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.next_maturity_block, 13)
+        self.assertEqual(index.pop_matured(12), [])
+        self.assertEqual(index.pop_matured(15), [(2, "short", 3), (3, "long", 3), (1, "long", 5)])
+        self.assertIsNone(index.next_maturity_block)
+        with self.assertRaises(ValueError):
+            index.add(wallet_address=1, position_type="lp", mint_block=0)
+
+    def test_settlement_matches_close_trades(self):
+        """Bulk settlement gives the same wallets and reserves as closing each matured position with a trade"""
+        simulator = self.get_simulator()
+        simulator.run_simulation(stop_day=5)
+        expected = simulator.fork()
+        market = expected.market
+        for wallet_address, position_type, mint_block in market.maturity_index.pop_matured(market.block_number):
+            agent = expected.agents[wallet_address]
+            if position_type == "long" and mint_block in agent.wallet.longs:
+                market_deltas, agent_deltas = market.close_long(
+                    wallet_address, agent.wallet.longs[mint_block].balance, mint_block
+                )
+            elif position_type == "short" and mint_block in agent.wallet.shorts:
+                short = agent.wallet.shorts[mint_block]
+                market_deltas, agent_deltas = market.close_short(
+                    wallet_address, short.open_share_price, short.balance, mint_block
+                )
+            else:
+                continue
+            market.update_market(market_deltas)
+            agent.update_wallet(agent_deltas, market)
+        settled_wallets = settlement.settle_matured_positions(
+            simulator.market, {address: agent.wallet for address, agent in simulator.agents.items()}
+        )
+        self.assertGreater(len(settled_wallets), 0)
+        for address, agent_deltas in settled_wallets.items():
+            simulator.agents[address].update_wallet(agent_deltas, simulator.market)
+        for key in ["share_reserves", "bond_reserves", "base_buffer", "bond_buffer"]:
+            np.testing.assert_allclose(
+                getattr(simulator.market.market_state, key),
+                getattr(expected.market.market_state, key),
+                rtol=1e-12,
+                atol=1e-6,
+                err_msg=key,
+            )
+        for address, agent in simulator.agents.items():
+            self.assertEqual(list(agent.wallet.longs), list(expected.agents[address].wallet.longs))
+            self.assertEqual(list(agent.wallet.shorts), list(expected.agents[address].wallet.shorts))
+            self.assertAlmostEqual(agent.wallet.base, expected.agents[address].wallet.base, delta=1e-6)
+
+    def test_simulation_settles_matured_positions(self):
+        """With settle_matured_positions, no wallet holds a position past the block at which it matures"""
+        for overrides in [{}, {"skip_idle_blocks": True}, {"use_wallet_registry": True}]:
+            simulator = self.get_simulator(settle_matured_positions=True, **overrides)
+            simulator.run_simulation(stop_day=10)
+            blocks_to_maturity = simulator.market.maturity_index.blocks_to_maturity
+            # the market has ticked past the last executed block, whose matured positions were settled
+            last_block = simulator.market.block_number - 1
+            for agent in simulator.agents.values():
+                for mint_block in [*agent.wallet.longs, *agent.wallet.shorts]:
+                    self.assertGreater(mint_block + blocks_to_maturity, last_block, msg=f"{overrides}")
+            simulator.run_simulation()
+            self.assertTrue(np.isfinite(simulator.market.market_state.share_reserves))
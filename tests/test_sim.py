@@ -1,18 +1,24 @@
 """Testing for the ElfPy package modules"""
 from __future__ import annotations  # types are strings by default in 3.11
 
+import copy
 import logging
+import os
+import tempfile
 import unittest
 
 import numpy as np
 from numpy.random import RandomState
+import pandas.testing as pd_testing
 
+from elfpy.policies.no_action import NoAction
 from elfpy.simulators import Simulator
 from elfpy.utils.config import Config
 from elfpy.utils.parse_config import load_and_parse_config_file
-from elfpy.utils import sim_utils  # utilities for setting up a simulation
+from elfpy.utils import post_processing, sim_utils  # utilities for setting up a simulation
 import elfpy.utils.outputs as output_utils
 import elfpy.utils.parse_config as config_utils
+import elfpy.utils.price as price_utils
 
 
 class BaseSimTest(unittest.TestCase):
@@ -143,19 +149,223 @@ class BaseSimTest(unittest.TestCase):
         config_file = "config/example_config.toml"
         override_dict = {"num_trading_days": 3, "num_blocks_per_day": 3}
         simulator = self.setup_and_run_simulator(config_file, override_dict)
-        simulation_state_num_writes = np.array([len(value) for value in simulator.simulation_state.__dict__.values()])
+        simulation_state_num_writes = np.array([len(value) for value in simulator.simulation_state.as_dict().values()])
         goal_writes = simulation_state_num_writes[0]
         try:
             np.testing.assert_equal(simulation_state_num_writes, goal_writes)
         except Exception as exc:
             bad_keys = [
-                key
-                for key in simulator.simulation_state.__dict__
-                if len(simulator.simulation_state[key]) != goal_writes
+                key for key in simulator.simulation_state.columns if len(simulator.simulation_state[key]) != goal_writes
             ]
             raise AssertionError(f"ERROR: Analysis keys have too many entries: {bad_keys}") from exc
         output_utils.close_logging(delete_logs=delete_logs)
 
+    def run_skip_idle_blocks_test(self, delete_logs=True):
+        """Runs the same simulation with and without idle-block fast-forwarding and compares the outputs"""
+        self.setup_logging(log_level=logging.INFO)
+        config_file = "config/example_config.toml"
+        policies = ["single_long", "single_short", "single_lp", "lp_and_withdraw"]
+        simulation_dfs = []
+        for skip_idle_blocks in [False, True]:
+            override_dict = {
+                "num_trading_days": 30,
+                "num_blocks_per_day": 10,
+                "num_position_days": 20,
+                "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+                "skip_idle_blocks": skip_idle_blocks,
+            }
+            config = self.setup_config(config_file, override_dict)
+            agents = [
+                sim_utils.get_policy(policy)(wallet_address=address) for address, policy in enumerate(policies, start=1)
+            ]
+            agents.append(NoAction(wallet_address=len(policies) + 1, budget=1000))
+            simulator = sim_utils.get_simulator(config, agents)
+            simulator.run_simulation()
+            assert simulator.block_number == 30 * 10 - 1
+            simulation_dfs.append(post_processing.get_simulation_state_df(simulator))
+        # the wall clock columns depend on when each simulation was started, and StretchedTime has no __eq__
+        object_columns = ["simulation_start_time", "block_timestamp", "current_market_datetime", "position_duration"]
+        pd_testing.assert_frame_equal(
+            simulation_dfs[0].drop(columns=object_columns),
+            simulation_dfs[1].drop(columns=object_columns),
+            check_exact=True,
+        )
+        output_utils.close_logging(delete_logs=delete_logs)
+
+    def get_record_cadence_state(self, record_cadence, num_blocks_per_day):
+        """Returns the numeric simulation_state columns of a simulation with the given record_cadence"""
+        override_dict = {
+            "num_trading_days": 30,
+            "num_blocks_per_day": num_blocks_per_day,
+            "num_position_days": 5,
+            "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+            "skip_idle_blocks": True,
+            "record_cadence": record_cadence,
+            "record_interval": 3,
+            "reservoir_size": 10,
+        }
+        config = self.setup_config("config/example_config.toml", override_dict)
+        policies = ["single_long", "single_short", "single_lp", "lp_and_withdraw"]
+        agents = [
+            sim_utils.get_policy(policy)(wallet_address=address) for address, policy in enumerate(policies, start=1)
+        ]
+        simulator = sim_utils.get_simulator(config, agents)
+        simulator.run_simulation()
+        return {key: value for key, value in simulator.simulation_state.as_dict().items() if value.dtype != object}
+
+    def run_record_cadence_test(self, delete_logs=True):
+        """Compares the rows recorded with each record_cadence to the rows recorded after every trade"""
+        self.setup_logging(log_level=logging.INFO)
+        num_blocks_per_day = 10
+        states = {
+            record_cadence: self.get_record_cadence_state(record_cadence, num_blocks_per_day)
+            for record_cadence in ["trade", "interval", "block", "day", "reservoir"]
+        }
+        every_trade = states["trade"]
+        num_trades = len(every_trade["run_trade_number"])
+        assert num_trades > 10
+        np.testing.assert_array_equal(every_trade["run_trade_number"], np.arange(num_trades))
+        # rows recorded after a trade are identical to the corresponding rows recorded after every trade
+        for record_cadence in ["interval", "block", "reservoir"]:
+            state = states[record_cadence]
+            for key, values in state.items():
+                np.testing.assert_array_equal(values, every_trade[key][state["run_trade_number"]], err_msg=key)
+        # every third trade, and the final trade
+        np.testing.assert_array_equal(
+            states["interval"]["run_trade_number"], np.append(np.arange(2, num_trades - 1, 3), num_trades - 1)
+        )
+        # the last trade of each block with trades
+        block_number = every_trade["block_number"]
+        np.testing.assert_array_equal(
+            states["block"]["run_trade_number"], np.flatnonzero(np.append(block_number[:-1] != block_number[1:], True))
+        )
+        # a uniform sample of trades, in order
+        reservoir_trade_numbers = states["reservoir"]["run_trade_number"]
+        assert len(reservoir_trade_numbers) == 10
+        assert np.all(np.diff(reservoir_trade_numbers) > 0)
+        # the state at the end of each day with trades, which has the same trades as the last trade of the day
+        day = every_trade["day"]
+        last_trade_of_day = np.flatnonzero(np.append(day[:-1] != day[1:], True))
+        np.testing.assert_array_equal(states["day"]["run_trade_number"], last_trade_of_day)
+        assert np.all(states["day"]["daily_block_number"] == num_blocks_per_day - 1)
+        for key in ["day", "cumulative_volume", "cumulative_fees", "share_reserves", "bond_reserves", "share_price"]:
+            np.testing.assert_array_equal(states["day"][key], every_trade[key][last_trade_of_day], err_msg=key)
+        # the aggregates are accumulated exactly between rows
+        assert every_trade["cumulative_volume"][-1] > 0
+        assert every_trade["cumulative_fees"][-1] > 0
+        output_utils.close_logging(delete_logs=delete_logs)
+
+    def run_snapshot_test(self, delete_logs=True):
+        """Checks that pausing, forking, and restoring a simulation does not change its results"""
+        self.setup_logging(log_level=logging.INFO)
+        config_file = "config/example_config.toml"
+        policies = ["single_long", "single_short", "single_lp", "lp_and_withdraw"]
+
+        def get_simulator():
+            override_dict = {
+                "num_trading_days": 20,
+                "num_blocks_per_day": 5,
+                "num_position_days": 5,
+                "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+            }
+            config = self.setup_config(config_file, override_dict)
+            agents = [
+                sim_utils.get_policy(policy)(wallet_address=address) for address, policy in enumerate(policies, start=1)
+            ]
+            return sim_utils.get_simulator(config, agents)
+
+        def get_df(simulator):
+            # the wall clock columns depend on when each simulation was started, and StretchedTime has no __eq__
+            object_columns = [
+                "simulation_start_time",
+                "block_timestamp",
+                "current_market_datetime",
+                "position_duration",
+            ]
+            return post_processing.get_simulation_state_df(simulator).drop(columns=object_columns)
+
+        reference = get_simulator()
+        reference.run_simulation()
+        simulator = get_simulator()
+        simulator.run_simulation(stop_day=8)
+        with self.assertRaises(ValueError):
+            simulator.run_simulation(stop_day=7)
+        fork = simulator.fork()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "snapshot.pkl.gz")
+            simulator.save_snapshot(filename)
+            restored = Simulator.load_snapshot(filename)
+        # run the fork first, to check that it does not share state with the original
+        fork.run_simulation(stop_day=15)
+        fork.run_simulation()
+        simulator.run_simulation()
+        restored.run_simulation()
+        for resumed in [fork, simulator, restored]:
+            assert resumed.num_completed_days == 20
+            pd_testing.assert_frame_equal(get_df(reference), get_df(resumed), check_exact=True)
+        output_utils.close_logging(delete_logs=delete_logs)
+
+    def run_share_price_accrual_test(self, delete_logs=True):
+        """Checks that the recorded share prices follow the precomputed share price path"""
+        self.setup_logging(log_level=logging.INFO)
+        config_file = "config/example_config.toml"
+        num_blocks_per_day = 4
+        for share_price_accrual in ["day", "block"]:
+            override_dict = {
+                "num_trading_days": 10,
+                "num_blocks_per_day": num_blocks_per_day,
+                "num_position_days": 5,
+                "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+                "share_price_accrual": share_price_accrual,
+            }
+            simulator = self.setup_and_run_simulator(config_file, override_dict)
+            state = simulator.simulation_state.as_dict()
+            share_price_path = simulator.market.share_price_path
+            expected = [share_price_path.get_share_price(block_number) for block_number in state["block_number"]]
+            np.testing.assert_array_equal(state["share_price"], expected, err_msg=share_price_accrual)
+            path_df = post_processing.get_share_price_path_df(simulator)
+            num_steps = 10 if share_price_accrual == "day" else 10 * num_blocks_per_day
+            assert len(path_df) == num_steps
+            assert path_df["day"].iloc[-1] == 9
+            # the share price changes within a day only when it accrues every block
+            within_day = np.diff(path_df["share_price"])[np.diff(path_df["day"]) == 0]
+            assert np.all(within_day > 0) if share_price_accrual == "block" else len(within_day) == 0
+        output_utils.close_logging(delete_logs=delete_logs)
+
+    def run_streamed_vault_apr_test(self, delete_logs=True):
+        """Checks a simulation whose vault aprs are streamed instead of precomputed"""
+        self.setup_logging(log_level=logging.INFO)
+        config_file = "config/example_config.toml"
+        override_dict = {
+            "num_trading_days": 20,
+            "num_blocks_per_day": 4,
+            "num_position_days": 5,
+            "vault_apr": {
+                "type": "RegimeSwitching",
+                "aprs": [0.02, 0.08],
+                "transition_matrix": [[0.8, 0.2], [0.2, 0.8]],
+                "stream": True,
+                "chunk_size": 7,
+            },
+        }
+        simulator = self.setup_simulator(config_file, override_dict)
+        vault_apr = copy.deepcopy(simulator.random_variables.vault_apr)
+        expected_vault_apr = [vault_apr[day] for day in range(20)]
+        expected_share_price = price_utils.calc_daily_share_prices(
+            expected_vault_apr, simulator.market.market_state.share_price, compound_vault_apr=True
+        )
+        simulator.run_simulation(stop_day=10)
+        fork = simulator.fork()
+        simulator.run_simulation()
+        fork.run_simulation()
+        state = simulator.simulation_state.as_dict()
+        np.testing.assert_array_equal(state["share_price"], fork.simulation_state.as_dict()["share_price"])
+        np.testing.assert_array_equal(state["vault_apr"], np.array(expected_vault_apr)[state["day"]])
+        np.testing.assert_array_equal(state["share_price"], expected_share_price[state["day"]])
+        # only the last chunk of 7 days is kept
+        assert simulator.random_variables.vault_apr.chunk_start_day == 14
+        output_utils.close_logging(delete_logs=delete_logs)
+
 
 class TestSimulator(BaseSimTest):
     """Test running a simulation using each pricing model type"""
@@ -180,3 +390,23 @@ class TestSimulator(BaseSimTest):
     def test_simulation_state(self):
         """Test override & initalizaiton of random variables"""
         self.run_simulation_state_test(delete_logs=True)
+
+    def test_skip_idle_blocks(self):
+        """Test that fast-forwarding idle blocks does not change the simulation results"""
+        self.run_skip_idle_blocks_test(delete_logs=True)
+
+    def test_record_cadence(self):
+        """Tests recording the simulation state less often than every trade"""
+        self.run_record_cadence_test()
+
+    def test_snapshot(self):
+        """Tests forking, saving, and restoring a simulation part way through"""
+        self.run_snapshot_test()
+
+    def test_share_price_accrual(self):
+        """Tests looking up the share price in the precomputed path, daily or every block"""
+        self.run_share_price_accrual_test()
+
+    def test_streamed_vault_apr(self):
+        """Tests streaming the vault aprs day by day"""
+        self.run_streamed_vault_apr_test()
@@ -0,0 +1,75 @@
+"""Testing for the columnar SimulationState"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+from dataclasses import fields
+import unittest
+
+import numpy as np
+
+from elfpy.types import MarketState, SimulationState
+
+
+def get_row(**values) -> dict:
+    """Returns a row with the given values, and zeros in the integer columns, which must always be provided"""
+    integer_columns = [name for name, dtype, _ in SimulationState.simulator_columns if dtype == np.int64]
+    return {**dict.fromkeys(integer_columns, 0), **values}
+
+
+class TestSimulationState(unittest.TestCase):
+    """Unit tests for the SimulationState column store"""
+
+    def test_append_and_grow(self):
+        """Appending past the initial capacity keeps every row and dtype"""
+        state = SimulationState(capacity=2)
+        for trade_number in range(5):
+            state.append(get_row(run_trade_number=trade_number, spot_price=0.5 * trade_number, model_name="model"))
+        assert len(state) == 5
+        np.testing.assert_array_equal(state["run_trade_number"], np.arange(5))
+        np.testing.assert_array_equal(state.spot_price, 0.5 * np.arange(5))
+        assert state["run_trade_number"].dtype == np.int64
+        assert list(state["model_name"]) == ["model"] * 5
+
+    def test_schema(self):
+        """The simulator and market state columns are registered up front, agent columns are backfilled"""
+        state = SimulationState()
+        for market_field in fields(MarketState):
+            assert market_field.name in state.columns
+        state.append(get_row(spot_price=1.0))
+        state.append(get_row(spot_price=2.0))
+        state.add_columns(["agent_1_base"])
+        state.append(get_row(spot_price=3.0, agent_1_base=10.0))
+        np.testing.assert_array_equal(state["agent_1_base"], [np.nan, np.nan, 10.0])
+        with self.assertRaises(KeyError):
+            state.append(get_row(not_a_column=1.0))
+        # omitted float columns are NaN and object columns are None, but integer columns have no missing value
+        assert np.isnan(state["pool_apr"]).all()
+        assert list(state["model_name"]) == [None] * 3
+        with self.assertRaises(ValueError):
+            state.append({"spot_price": 4.0})
+        assert len(state) == 3
+        with self.assertRaises(AttributeError):
+            _ = state.not_a_column
+
+    def test_views_are_read_only(self):
+        """Column views share memory with the state and cannot be written through"""
+        state = SimulationState()
+        state.append(get_row(spot_price=1.0))
+        view = state.as_dict()["spot_price"]
+        with self.assertRaises(ValueError):
+            view[0] = 2.0
+        state["spot_price"] = [3.0]
+        assert state["spot_price"][0] == 3.0
+
+    def test_take_rows(self):
+        """Taking rows removes the oldest rows and keeps the rest in order"""
+        state = SimulationState(capacity=2)
+        for trade_number in range(5):
+            state.append(get_row(run_trade_number=trade_number, model_name=f"model_{trade_number}"))
+        taken = state.take_rows(3)
+        np.testing.assert_array_equal(taken["run_trade_number"], np.arange(3))
+        assert list(taken["model_name"]) == ["model_0", "model_1", "model_2"]
+        np.testing.assert_array_equal(state["run_trade_number"], [3, 4])
+        state.append(get_row(run_trade_number=5, model_name="model_5"))
+        np.testing.assert_array_equal(state["run_trade_number"], [3, 4, 5])
+        assert len(state.take_rows(10)["run_trade_number"]) == 3
+        assert len(state) == 0
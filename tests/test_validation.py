@@ -0,0 +1,67 @@
+"""Testing for the validation levels of the pricing models and markets"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy.pricing_models.hyperdrive import HyperdrivePricingModel
+from elfpy.types import MarketDeltas, Quantity, TokenType, ValidationLevel
+from elfpy.utils import sim_utils
+
+
+class ValidationTests(unittest.TestCase):
+    """Tests for running the checks of trades on every trade, a sample of trades, or none"""
+
+    @staticmethod
+    def get_simulator(**overrides):
+        """Returns a simulator of a short simulation, in which the agents act in a fixed order"""
+        return test_utils.get_short_simulator(num_trading_days=5, shuffle_users=False, **overrides)
+
+    def test_sample_validation(self):
+        """Full validation checks every trade, sampled validation the first of every interval, and off none"""
+        expected_decisions = {
+            ValidationLevel.FULL: [True] * 7,
+            ValidationLevel.SAMPLED: [True, False, False, True, False, False, True],
+            ValidationLevel.OFF: [False] * 7,
+        }
+        for validation_level, expected in expected_decisions.items():
+            pricing_model = HyperdrivePricingModel(validation_level=validation_level, validation_interval=3)
+            self.assertEqual([pricing_model.sample_validation() for _ in range(7)], expected)
+        self.assertTrue(HyperdrivePricingModel().is_validating)
+        pricing_model = sim_utils.get_pricing_model("yieldspace", 64, "sampled")
+        self.assertEqual(pricing_model.validation_level, ValidationLevel.SAMPLED)
+        with self.assertRaises(ValueError):
+            HyperdrivePricingModel(validation_interval=0)
+        with self.assertRaises(ValueError):
+            sim_utils.get_pricing_model("hyperdrive", validation_level="sometimes")
+
+    def test_skipped_checks(self):
+        """Checks that fail with full validation are skipped for trades that are not validated"""
+        for validation_level in ValidationLevel:
+            market = self.get_simulator(validation_level=validation_level.value).market
+            market.pricing_model.num_sampled_trades = 0  # the next trade is the first of a sampling interval
+            market.pricing_model.sample_validation()
+            quantity = Quantity(amount=0, unit=TokenType.BASE)  # below the minimum trade amount
+            bad_deltas = MarketDeltas(d_base_asset=np.inf)
+            if validation_level == ValidationLevel.OFF:
+                market.pricing_model.check_input_assertions(quantity, market.market_state, market.position_duration)
+                market.update_market(bad_deltas)
+            else:
+                with self.assertRaises(AssertionError):
+                    market.pricing_model.check_input_assertions(quantity, market.market_state, market.position_duration)
+                with self.assertRaises(AssertionError):
+                    market.update_market(bad_deltas)
+
+    def test_results_do_not_depend_on_validation(self):
+        """The checks have no side effects, so simulations give the same results at every validation level"""
+        simulation_states = []
+        for validation_level in ["full", "sampled", "off"]:
+            simulator = self.get_simulator(validation_level=validation_level, validation_interval=2)
+            simulator.run_simulation()
+            simulation_states.append(simulator.simulation_state)
+        for simulation_state in simulation_states[1:]:
+            for key, values in simulation_states[0].as_dict().items():
+                if values.dtype != object and key != "simulation_start_time":
+                    np.testing.assert_array_equal(simulation_state[key], values, err_msg=key)
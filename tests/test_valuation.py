@@ -0,0 +1,134 @@
+"""Testing for the vectorized wallet valuation found in src/elfpy/valuation.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy import valuation
+from elfpy.wallet import Long, Short, Wallet
+
+
+class ValuationTests(unittest.TestCase):
+    """Tests for valuing all agent wallets in one vectorized pass"""
+
+    override_dict = {
+        "target_liquidity": 10e6,
+        "target_pool_apr": 0.05,
+        "trade_fee_percent": 0.1,
+        "redemption_fee_percent": 0.1,
+        "num_trading_days": 4,
+        "num_position_days": 365,
+        "num_blocks_per_day": 3,
+        "shuffle_users": False,
+    }
+    agent_policies = ["single_long", "single_short", "single_long", "lp_and_withdraw"]
+
+    def get_simulator(self, **overrides):
+        """Returns a simulator with the test config and agents"""
+        return test_utils.setup_simulation_entities(
+            config_file="config/example_config.toml",
+            override_dict={**self.override_dict, **overrides},
+            agent_policies=self.agent_policies,
+        )
+
+    def test_matches_close_trades(self):
+        """Position values match the scalar close_long and close_short trades, exactly at Decimal precision"""
+        for precision, tolerance in [(64, 1e-14), (128, 0)]:
+            simulator = self.get_simulator(precision=precision)
+            simulator.collect_and_execute_trades()  # seed the pool
+            market = simulator.market
+            market.tick(30)
+            # several positions share a mint block, and there are positions from several mint blocks
+            wallets = [
+                Wallet(address=10, longs={0: Long(1_000), 10: Long(50)}, shorts={0: Short(200, 1)}),
+                Wallet(address=11, longs={10: Long(20_000)}, shorts={10: Short(5_000, 1), 20: Short(10, 1)}),
+                Wallet(address=12, longs={20: Long(0)}),
+                Wallet(address=13),
+            ]
+            wallets_state = valuation.get_wallets_state(market, wallets)
+            total_reserves = market.market_state.share_reserves * market.market_state.share_price
+            for wallet in wallets:
+                expected_longs = sum(
+                    market.close_long(wallet.address, long.balance, mint_block)[1].base
+                    for mint_block, long in wallet.longs.items()
+                    if long.balance > 0
+                )
+                expected_shorts = sum(
+                    market.close_short(wallet.address, short.open_share_price, short.balance, mint_block)[1].base
+                    for mint_block, short in wallet.shorts.items()
+                )
+                np.testing.assert_allclose(
+                    wallets_state[f"agent_{wallet.address}_total_longs"],
+                    expected_longs,
+                    rtol=tolerance,
+                    atol=tolerance * total_reserves,
+                )
+                np.testing.assert_allclose(
+                    wallets_state[f"agent_{wallet.address}_total_shorts"],
+                    expected_shorts,
+                    rtol=tolerance,
+                    atol=tolerance * total_reserves,
+                )
+                self.assertEqual(wallet.get_state(market), {key: wallets_state[key] for key in wallet.get_state_keys()})
+            self.assertEqual(wallets_state["agent_13_total_longs"], 0)
+        no_mark_state = valuation.get_wallets_state(market, wallets, mark_to_market=False)
+        self.assertTrue(np.isnan(no_mark_state["agent_10_total_longs"]))
+        self.assertEqual(no_mark_state["agent_10_total_longs_no_mock"], wallets_state["agent_10_total_longs_no_mock"])
+
+    @staticmethod
+    def get_row_groups(state, group_keys):
+        """Returns the last row of each group of rows with the same group_keys values, the other rows, and the last row
+        of the previous group of each of the other rows, or the first row if the row is in the first group"""
+        is_group_change = np.zeros(len(state["day"]) - 1, dtype=bool)
+        for key in group_keys:
+            is_group_change |= state[key][:-1] != state[key][1:]
+        last_rows_in_group = np.flatnonzero(np.append(is_group_change, True))
+        other_rows = np.setdiff1d(np.arange(len(state["day"])), last_rows_in_group)
+        previous_group = np.searchsorted(last_rows_in_group, other_rows) - 1
+        return last_rows_in_group, other_rows, np.where(previous_group >= 0, last_rows_in_group[previous_group], 0)
+
+    def test_valuation_cadence(self):
+        """Block and day cadences value the last row of each block or day, and the other rows carry the last mark"""
+        states = {}
+        for cadence in valuation.VALUATION_CADENCES:
+            simulator = self.get_simulator(valuation_cadence=cadence)
+            simulator.run_simulation()
+            states[cadence] = simulator.simulation_state.as_dict()
+        every_trade = states["trade"]
+        for cadence, group_keys in (("block", ("day", "daily_block_number")), ("day", ("day",))):
+            state = states[cadence]
+            self.assertEqual(list(state), list(every_trade))
+            last_rows_in_group, other_rows, carried_rows = self.get_row_groups(state, group_keys)
+            self.assertLess(len(last_rows_in_group), len(state["day"]))
+            # the other rows carry the values of the previous group's last row, or of the agent's first row
+            for key, values in state.items():
+                if key.endswith(("_total_longs", "_total_shorts")):
+                    first_row = np.flatnonzero(~np.isnan(every_trade[key]))[0]
+                    expected = np.where(
+                        other_rows < first_row, np.nan, every_trade[key][np.maximum(carried_rows, first_row)]
+                    )
+                    np.testing.assert_array_equal(values[last_rows_in_group], every_trade[key][last_rows_in_group])
+                    np.testing.assert_array_equal(values[other_rows], expected, err_msg=key)
+                elif values.dtype != object:
+                    np.testing.assert_array_equal(values, every_trade[key], err_msg=key)
+
+    def test_interval_records_are_valued(self):
+        """Rows recorded at an interval are valued like every other row, even if more trades follow in their block"""
+        states = {}
+        for cadence in valuation.VALUATION_CADENCES:
+            simulator = self.get_simulator(valuation_cadence=cadence, record_cadence="interval", record_interval=2)
+            simulator.run_simulation()
+            states[cadence] = simulator.simulation_state.as_dict()
+        for cadence in ["block", "day"]:
+            for key, values in states[cadence].items():
+                if key.endswith(("_total_longs", "_total_shorts")):
+                    # rows that were recorded before an agent had a wallet are the only rows without values
+                    self.assertFalse(np.all(np.isnan(values)), msg=key)
+                    np.testing.assert_array_equal(np.isnan(values), np.isnan(states["trade"][key]), err_msg=key)
+
+    def test_invalid_cadence(self):
+        """Unknown valuation cadences are rejected"""
+        with self.assertRaises(ValueError):
+            self.get_simulator(valuation_cadence="hourly")
@@ -0,0 +1,123 @@
+"""Testing for the array-backed wallet storage found in src/elfpy/wallet_registry.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy.agent import Agent
+from elfpy.utils.trace import EventTrace
+from elfpy.wallet import Long, Short, Wallet
+from elfpy.wallet_registry import WalletRegistry, WalletView
+
+
+class MockMarket:
+    """The market attributes used by Agent.update_wallet"""
+
+    # pylint: disable=too-few-public-methods
+
+    time = 0.0
+    block_number = 0
+    trace = EventTrace()
+
+
+class WalletRegistryTests(unittest.TestCase):
+    """Tests for storing agent wallets in a WalletRegistry"""
+
+    override_dict = {
+        "target_liquidity": 10e6,
+        "target_pool_apr": 0.05,
+        "num_trading_days": 6,
+        "num_position_days": 2,
+        "num_blocks_per_day": 4,
+    }
+    agent_policies = ["single_long", "single_short", "lp_and_withdraw", "single_short", "single_long"]
+
+    @staticmethod
+    def get_random_deltas(rng, wallet):
+        """Returns deltas that change the wallet's balances and one of its long or short positions"""
+        mint_block = int(rng.integers(4))
+        deltas = Wallet(address=wallet.address, base=rng.normal(), lp_tokens=rng.normal())
+        if rng.random() < 0.5:
+            # close the whole position half of the time, so positions are removed from the tables
+            existing = wallet.longs.get(mint_block)
+            balance = -existing.balance if existing is not None and rng.random() < 0.5 else rng.uniform(1, 10)
+            deltas.longs = {mint_block: Long(balance)}
+        else:
+            existing = wallet.shorts.get(mint_block)
+            balance = -existing.balance if existing is not None and rng.random() < 0.5 else rng.uniform(1, 10)
+            deltas.shorts = {mint_block: Short(balance, rng.uniform(1, 1.1))}
+        return deltas
+
+    def test_deltas_match_agent_update_wallet(self):
+        """Applying trade deltas to a registry wallet matches updating a Wallet object"""
+        rng = np.random.default_rng(seed=1234)
+        registry = WalletRegistry(capacity=1)
+        agents = [Agent(wallet_address=address, budget=1_000) for address in range(5)]
+        views = [registry.add_wallet(Wallet(address=address, base=1_000)) for address in range(5)]
+        market = MockMarket()
+        for _ in range(2_000):
+            owner = rng.integers(len(agents))
+            agent, view = agents[owner], views[owner]
+            deltas = self.get_random_deltas(rng, agent.wallet)
+            agent.update_wallet(deltas, market)
+            registry.apply_deltas(view.index, deltas)
+        for agent, view in zip(agents, views):
+            wallet = view.to_wallet()
+            self.assertEqual(wallet.base, agent.wallet.base)
+            self.assertEqual(wallet.lp_tokens, agent.wallet.lp_tokens)
+            self.assertEqual(list(wallet.longs), list(agent.wallet.longs))  # same insertion order
+            self.assertEqual(list(wallet.shorts), list(agent.wallet.shorts))
+            for mint_block, long in agent.wallet.longs.items():
+                self.assertEqual(wallet.longs[mint_block].balance, long.balance)
+            for mint_block, short in agent.wallet.shorts.items():
+                self.assertEqual(wallet.shorts[mint_block].balance, short.balance)
+                self.assertEqual(wallet.shorts[mint_block].open_share_price, short.open_share_price)
+        self.assertEqual(registry.longs.num_rows, sum(len(agent.wallet.longs) for agent in agents))
+
+    def test_view_api(self):
+        """A WalletView reads and writes the registry through the Wallet API"""
+        registry = WalletRegistry()
+        view = registry.add_wallet(Wallet(address=7, base=100, longs={50: Long(3)}, shorts={25: Short(2, 1.01)}))
+        self.assertEqual(view.address, 7)
+        self.assertEqual(view["base"], 100)
+        view["lp_tokens"] += 5
+        view.longs[50].balance += 1
+        view.shorts[75] = Short(4, 1.02)
+        del view.shorts[25]
+        self.assertEqual(registry.lp_tokens[view.index], 5)
+        self.assertEqual(view.longs[50].balance, 4)
+        self.assertEqual(list(view.shorts), [75])
+        self.assertEqual(view.shorts[75].open_share_price, 1.02)
+        self.assertEqual(view.get_state_keys(), Wallet(address=7).get_state_keys())
+        self.assertEqual(str(view), str(view.to_wallet()))
+        with self.assertRaises(KeyError):
+            _ = view.longs[25]
+        with self.assertRaises(ValueError):
+            registry.add_wallet(Wallet(address=7))
+
+    def test_simulation_matches_wallet_objects(self):
+        """A simulation with a wallet registry records the same state as one with Wallet objects"""
+        states = {}
+        simulators = {}
+        for use_wallet_registry in [False, True]:
+            simulator = test_utils.setup_simulation_entities(
+                config_file="config/example_config.toml",
+                override_dict={**self.override_dict, "use_wallet_registry": use_wallet_registry},
+                agent_policies=self.agent_policies,
+            )
+            simulator.run_simulation()
+            simulators[use_wallet_registry] = simulator
+            states[use_wallet_registry] = simulator.simulation_state.as_dict()
+        self.assertIsNone(simulators[False].wallet_registry)
+        self.assertTrue(all(isinstance(agent.wallet, WalletView) for agent in simulators[True].agents.values()))
+        for key, values in states[False].items():
+            if values.dtype != object:
+                # position values are summed in a different order, so they agree to rounding error
+                np.testing.assert_allclose(states[True][key], values, rtol=1e-12, err_msg=key)
+        for address, agent in simulators[False].agents.items():
+            wallet = simulators[True].agents[address].wallet.to_wallet()
+            self.assertEqual(wallet.base, agent.wallet.base)
+            self.assertEqual(list(wallet.longs), list(agent.wallet.longs))
+            self.assertEqual(list(wallet.shorts), list(agent.wallet.shorts))
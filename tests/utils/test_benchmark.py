@@ -0,0 +1,73 @@
+"""Testing for the benchmark suite found in src/elfpy/utils/benchmark.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from elfpy.utils import benchmark
+from elfpy.utils.benchmark import BenchmarkOptions, SimulationScale
+
+
+class BenchmarkTests(unittest.TestCase):
+    """Unit tests for running and comparing benchmarks"""
+
+    options = BenchmarkOptions(min_time=0, max_calls=2, scales=[SimulationScale(2, 2, 2)])
+
+    def test_cases(self):
+        """Every area of the suite has cases with unique names, and every case runs"""
+        names = [case.name for case in benchmark.get_benchmark_cases(self.options)]
+        self.assertEqual(len(names), len(set(names)))
+        for prefix in [
+            "pricing.YieldSpace.calc_in_given_out",
+            "pricing.Hyperdrive.calc_out_given_in",
+            "pricing.Hyperdrive.get_max_short",
+            "market.trade_and_update.close_short",
+            "market.trade_and_update.remove_liquidity",
+            "wallet.get_state",
+            "post_processing.compute_derived_variables",
+            "simulation.run_simulation.2x2x2",
+        ]:
+            self.assertTrue(any(name.startswith(prefix) for name in names), msg=prefix)
+        results = benchmark.run_benchmarks(self.options, isolate=False)
+        self.assertEqual([result.name for result in results], names)
+        for result in results:
+            self.assertEqual(result.num_calls, 1)  # a single call, since min_time is zero
+            self.assertGreater(result.ops_per_second, 0)
+            self.assertGreater(result.peak_rss_bytes, 0)
+
+    def test_report_and_comparison(self):
+        """Reports written by the command line can be compared, matching cases by name"""
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f"{name}.json") for name in ["baseline", "candidate"]]
+            argv = ["--min_time", "0", "--scales", "2x2x2", "--filter", "Hyperdrive.calc_out_given_in"]
+            benchmark.main(argv + ["--output", paths[0]])  # each case runs in its own process
+            with open(paths[0], mode="r", encoding="UTF-8") as file:
+                baseline = json.load(file)
+        self.assertEqual(
+            [result["name"] for result in baseline["results"]],
+            ["pricing.Hyperdrive.calc_out_given_in.base", "pricing.Hyperdrive.calc_out_given_in.pt"],
+        )
+        self.assertIn("code_fingerprint", baseline["metadata"])
+        scales = baseline["metadata"]["options"]["scales"]
+        self.assertEqual(scales, [{"num_agents": 2, "num_trading_days": 2, "num_blocks_per_day": 2}])
+        candidate = json.loads(json.dumps(baseline))
+        candidate["results"][0]["ops_per_second"] *= 2
+        candidate["results"][1]["name"] = "renamed"
+        comparison = benchmark.compare_reports(baseline, candidate).set_index("name")
+        self.assertAlmostEqual(comparison.loc["pricing.Hyperdrive.calc_out_given_in.base", "speedup"], 2)
+        self.assertEqual(comparison.loc["pricing.Hyperdrive.calc_out_given_in.base", "rss_ratio"], 1)
+        self.assertTrue(np.isnan(comparison.loc["renamed", "speedup"]))
+        self.assertTrue(np.isnan(comparison.loc["pricing.Hyperdrive.calc_out_given_in.pt", "speedup"]))
+
+    def test_simulation_scale(self):
+        """Scales are parsed from, and printed as, AGENTSxDAYSxBLOCKS"""
+        scale = SimulationScale.from_string("4x30x100")
+        self.assertEqual(scale, SimulationScale(num_agents=4, num_trading_days=30, num_blocks_per_day=100))
+        self.assertEqual(str(scale), "4x30x100")
+        for bad_scale in ["4x30", "4x0x100", "ax30x100"]:
+            with self.assertRaises(ValueError):
+                SimulationScale.from_string(bad_scale)
@@ -6,6 +6,7 @@ import numpy as np
 
 from elfpy.types import StretchedTime
 from elfpy.utils import price as price_utils
+from elfpy.utils import vault_apr as vault_apr_utils
 
 
 class BasePriceTest(unittest.TestCase):
@@ -258,3 +259,66 @@ class TestPriceUtils(BasePriceTest):
     def test_calc_spot_price_from_apr(self):
         """Execute the test"""
         self.run_calc_spot_price_from_apr_test()
+
+
+class SharePricePathTests(unittest.TestCase):
+    """Unit tests for the precomputed vault share price path"""
+
+    vault_apr = [0.05, 0.02, 0.1, 0.07]
+
+    def test_daily_share_prices(self):
+        """The daily path matches accruing the share price with a delta at the start of each day"""
+        for compound_vault_apr in [True, False]:
+            init_share_price = 1.2
+            share_price = init_share_price
+            expected = []
+            for day, apr in enumerate(self.vault_apr):
+                if day > 0:
+                    price_multiplier = share_price if compound_vault_apr else init_share_price
+                    share_price += apr / 365 * price_multiplier
+                expected.append(share_price)
+            share_price_path = price_utils.get_share_price_path(
+                self.vault_apr, init_share_price, compound_vault_apr, num_blocks_per_day=10
+            )
+            np.testing.assert_array_equal(share_price_path.prices, expected)
+            self.assertEqual(share_price_path.get_share_price(19), expected[1])
+            self.assertEqual(share_price_path.get_share_price(1_000), expected[-1])
+
+    def test_block_share_prices(self):
+        """The per-block path interpolates between the daily prices"""
+        num_blocks_per_day = 4
+        daily_path = price_utils.get_share_price_path(self.vault_apr, 1, True, num_blocks_per_day)
+        block_path = price_utils.get_share_price_path(self.vault_apr, 1, True, num_blocks_per_day, accrual="block")
+        self.assertEqual(len(block_path), len(self.vault_apr) * num_blocks_per_day)
+        for day, share_price in enumerate(daily_path.prices):
+            self.assertEqual(block_path.get_share_price(day * num_blocks_per_day), share_price)
+        self.assertTrue(np.all(np.diff(block_path.prices) > 0))
+        self.assertAlmostEqual(block_path.get_share_price(6), (daily_path.prices[1] + daily_path.prices[2]) / 2)
+        with self.assertRaises(ValueError):
+            price_utils.get_share_price_path(self.vault_apr, 1, True, num_blocks_per_day, accrual="hour")
+
+    def test_streaming_share_prices(self):
+        """A share price path accrued from streamed aprs matches the path precomputed from the same aprs"""
+        num_days, num_blocks_per_day = 20, 3
+        process = vault_apr_utils.MeanRevertingApr(initial=0.02, mean=0.05, reversion_speed=5, volatility=0.01)
+        vault_apr = [
+            vault_apr_utils.VaultAprStream(process, np.random.default_rng(seed=1), chunk_size=6)[day]
+            for day in range(num_days)
+        ]
+        for accrual in price_utils.SHARE_PRICE_ACCRUALS:
+            for compound_vault_apr in [True, False]:
+                stream = vault_apr_utils.VaultAprStream(process, np.random.default_rng(seed=1), chunk_size=6)
+                streaming_path = price_utils.get_share_price_path(
+                    stream, 1.1, compound_vault_apr, num_blocks_per_day, accrual
+                )
+                self.assertIsInstance(streaming_path, price_utils.StreamingSharePricePath)
+                share_price_path = price_utils.get_share_price_path(
+                    vault_apr, 1.1, compound_vault_apr, num_blocks_per_day, accrual
+                )
+                # the last day of the precomputed path accrues towards a day past the end of vault_apr
+                for block_number in range((num_days - 1) * num_blocks_per_day):
+                    self.assertEqual(
+                        streaming_path.get_share_price(block_number), share_price_path.get_share_price(block_number)
+                    )
+                with self.assertRaises(ValueError):
+                    streaming_path.get_share_price(0)
@@ -0,0 +1,107 @@
+"""Testing for the simulation phase profiler found in src/elfpy/utils/profiling.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import itertools
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy.utils.profiling import PhaseProfiler
+
+
+class CountedModel:
+    """Stand-in for a pricing model, whose calc_ methods are counted"""
+
+    def calc_value(self, value):
+        """Counted method"""
+        return 2 * value
+
+    def calc_nested_value(self, value):
+        """Counted method that calls another counted method"""
+        return self.calc_value(value) + 1
+
+    def model_name(self):
+        """Method that is not counted"""
+        return "counted"
+
+
+class ProfilingTests(unittest.TestCase):
+    """Unit tests for timing the phases of a simulation"""
+
+    @staticmethod
+    def run_simulator(**overrides):
+        """Run a short simulation with a mix of policies"""
+        simulator = test_utils.get_short_simulator(**overrides)
+        simulator.run_simulation(stop_day=2)
+        simulator.run_simulation()
+        return simulator
+
+    def test_simulation_profile(self):
+        """Profiling reports every phase and the throughput of the runs, and does not change the results"""
+        simulator = self.run_simulator(profile_phases=True)
+        expected = self.run_simulator()
+        for key, values in expected.simulation_state.as_dict().items():
+            if values.dtype != object and key != "simulation_start_time":
+                np.testing.assert_array_equal(simulator.simulation_state[key], values, err_msg=key)
+        self.assertEqual(len(expected.profiler.phase_seconds), 0)
+        profiler = simulator.profiler
+        summary = profiler.get_summary()
+        self.assertEqual(summary["num_blocks"], 4 * 3)
+        # the trades of the initial LP are executed before the first run
+        self.assertEqual(summary["num_trades"], simulator.run_trade_number - 3)
+        self.assertGreater(summary["trades_per_second"], 0)
+        self.assertGreater(summary["pricing_model_calls"]["calc_out_given_in"], 0)
+        self.assertIn("get_max_short", summary["pricing_model_calls"])
+        phase_df = profiler.get_phase_df()
+        collected_policies = set(phase_df.policy[phase_df.phase == "collect_trades"])
+        self.assertEqual(collected_policies, {"init_lp", "single_long", "single_short", "single_lp"})
+        traded_actions = set(phase_df.action_type[phase_df.phase == "trade_and_update"])
+        self.assertTrue({"open_long", "open_short", "add_liquidity"} <= traded_actions)
+        self.assertTrue({"update_wallet", "record_state", "logging", "share_price", "other"} <= set(phase_df.phase))
+        self.assertEqual(phase_df.calls[phase_df.phase == "share_price"].sum(), 4)
+        self.assertAlmostEqual(phase_df.percent_of_wall.sum(), 100)
+        self.assertIn("blocks/sec", profiler.get_report_string())
+        # the counters are removed after each run, so the simulator can be forked and snapshot
+        self.assertEqual(set(vars(simulator.market.pricing_model)) & set(summary["pricing_model_calls"]), set())
+        simulator.fork()
+
+    def test_nested_phases_and_call_counts(self):
+        """Time in an inner phase is not counted for the outer phase, and calls are only counted during a run"""
+        profiler = PhaseProfiler()
+        model = CountedModel()
+        with profiler.phase("outside"):
+            pass  # phases outside of a run are not timed
+        clock = itertools.count()
+        with mock.patch("elfpy.utils.profiling.time.perf_counter", side_effect=lambda: float(next(clock))):
+            with profiler.profile_run(model):  # starts at 0
+                with profiler.phase("outer", policy="policy"):  # 1
+                    with profiler.phase("inner", action_type="action"):  # 2
+                        self.assertEqual(model.calc_nested_value(1), 3)
+                        model.model_name()
+                    # inner exits at 3, and outer at 4
+            # the run ends at 5
+        self.assertEqual(dict(profiler.phase_seconds), {("outer", "policy", ""): 2.0, ("inner", "", "action"): 1.0})
+        self.assertEqual(profiler.wall_seconds, 5.0)
+        self.assertEqual(dict(profiler.pricing_model_calls), {"calc_nested_value": 1, "calc_value": 1})
+        self.assertEqual(vars(model), {})
+        model.calc_value(1)
+        self.assertEqual(profiler.pricing_model_calls["calc_value"], 1)
+        phase_df = profiler.get_phase_df().set_index("phase")
+        self.assertEqual(phase_df.loc["other", "total_seconds"], 2.0)
+        self.assertEqual(phase_df.loc["outer", "percent_of_wall"], 40.0)
+        profiler.reset()
+        self.assertEqual(profiler.get_summary()["wall_seconds"], 0)
+
+    def test_disabled_profiler(self):
+        """A disabled profiler does not time phases or wrap the pricing model"""
+        profiler = PhaseProfiler(enabled=False)
+        model = CountedModel()
+        with profiler.profile_run(model):
+            self.assertNotIn("calc_value", vars(model))
+            with profiler.phase("phase"):
+                model.calc_value(1)
+        self.assertEqual(len(profiler.phase_seconds), 0)
+        self.assertEqual(profiler.wall_seconds, 0)
+        self.assertEqual(len(profiler.pricing_model_calls), 0)
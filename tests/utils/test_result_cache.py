@@ -0,0 +1,116 @@
+"""Testing for the simulation result cache found in src/elfpy/utils/result_cache.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from elfpy.utils import result_cache, sim_utils
+from elfpy.utils.result_cache import ResultCache
+import elfpy.utils.parse_config as config_utils
+
+
+class ResultCacheTests(unittest.TestCase):
+    """Unit tests for caching simulation results on disk"""
+
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cache = ResultCache(self.temporary_directory.name)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    @staticmethod
+    def get_config(**overrides):
+        """Small config so that each run is fast"""
+        override_dict = {"num_trading_days": 3, "num_blocks_per_day": 3, **overrides}
+        return config_utils.override_config_variables(
+            config_utils.load_and_parse_config_file("config/example_config.toml"), override_dict
+        )
+
+    @staticmethod
+    def get_agents():
+        """Fresh agents for a simulation"""
+        return [
+            sim_utils.get_policy("single_long")(wallet_address=1),
+            sim_utils.get_policy("single_short")(wallet_address=2),
+        ]
+
+    def test_cache_key(self):
+        """Equal inputs give equal keys, and any change to the config, seed, or agents gives a new key"""
+        key = result_cache.get_cache_key(self.get_config(), self.get_agents())
+        self.assertEqual(key, result_cache.get_cache_key(self.get_config(), self.get_agents()))
+        other_keys = [
+            result_cache.get_cache_key(self.get_config(num_trading_days=4), self.get_agents()),
+            result_cache.get_cache_key(self.get_config(random_seed=2), self.get_agents()),
+            result_cache.get_cache_key(self.get_config(), self.get_agents()[:1]),
+            result_cache.get_cache_key(self.get_config(), self.get_agents(), override_dict={"target_pool_apr": 0.1}),
+        ]
+        self.assertEqual(len({key, *other_keys}), 5)
+        config = self.get_config()
+        config.simulator.rng.random()  # the state of the generator determines the random simulation variables
+        self.assertNotEqual(key, result_cache.get_cache_key(config, self.get_agents()))
+
+    def test_callable_cache_key(self):
+        """Callable vault APRs with different bodies or captured values give different keys"""
+
+        def get_vault_apr(value):
+            return lambda: [value] * 3
+
+        keys = [
+            result_cache.get_cache_key(self.get_config(vault_apr=vault_apr), self.get_agents())
+            for vault_apr in [
+                lambda: [0.01] * 3,
+                lambda: [0.50] * 3,
+                get_vault_apr(0.01),
+                get_vault_apr(0.50),
+            ]
+        ]
+        self.assertEqual(len(set(keys)), 4)
+        self.assertEqual(
+            keys[2], result_cache.get_cache_key(self.get_config(vault_apr=get_vault_apr(0.01)), self.get_agents())
+        )
+
+    def test_cached_simulation_matches_run(self):
+        """A cache hit returns the same results as running the simulation, and advances the rng the same way"""
+        config = self.get_config()
+        simulator = result_cache.run_cached_simulation(config, self.get_agents(), cache=self.cache)
+        self.assertEqual(len(self.cache), 1)
+        cached_config = self.get_config()
+        cached_simulator = result_cache.run_cached_simulation(cached_config, self.get_agents(), cache=self.cache)
+        self.assertIsNot(cached_simulator, simulator)
+        self.assertEqual(len(self.cache), 1)
+        for key, values in simulator.simulation_state.as_dict().items():
+            if values.dtype != object:
+                np.testing.assert_array_equal(cached_simulator.simulation_state[key], values, err_msg=key)
+        self.assertEqual(config.simulator.rng.random(), cached_config.simulator.rng.random())
+
+    def test_eviction_and_invalidation(self):
+        """The least recently used snapshots are evicted when the cache is full, and entries can be invalidated"""
+        simulator = sim_utils.get_simulator(self.get_config(), self.get_agents())
+        self.cache.save("first", simulator)
+        entry_bytes = self.cache.size_bytes
+        self.cache.max_bytes = 2 * entry_bytes + entry_bytes // 2  # room for two entries
+        time.sleep(0.01)
+        self.cache.save("second", simulator)
+        time.sleep(0.01)
+        self.assertIsNotNone(self.cache.load("first"))  # now the second entry is the least recently used
+        time.sleep(0.01)
+        self.cache.save("third", simulator)
+        self.assertIn("first", self.cache)
+        self.assertNotIn("second", self.cache)
+        self.assertIn("third", self.cache)
+        self.assertEqual(self.cache.invalidate("first"), 1)
+        self.assertIsNone(self.cache.load("first"))
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_unreadable_entry_is_a_miss(self):
+        """A snapshot that cannot be read is removed and treated as a miss"""
+        with open(self.cache.get_path("broken"), mode="wb") as file:
+            file.write(b"not a snapshot")
+        self.assertIsNone(self.cache.load("broken"))
+        self.assertFalse(os.path.exists(self.cache.get_path("broken")))
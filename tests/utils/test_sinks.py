@@ -0,0 +1,76 @@
+"""Testing for the simulation state sinks found in src/elfpy/utils/sinks.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import tempfile
+import unittest
+
+import numpy as np
+import pandas.testing as pd_testing
+
+from elfpy.utils import post_processing, sim_utils
+from elfpy.utils.sinks import ArrowIpcSink, ParquetSink
+import elfpy.utils.parse_config as config_utils
+
+# the wall clock columns depend on when each simulation was started, and StretchedTime has no __eq__
+OBJECT_COLUMNS = ["simulation_start_time", "block_timestamp", "current_market_datetime", "position_duration"]
+
+
+class SinkTests(unittest.TestCase):
+    """Tests for streaming the simulation state to disk during a simulation"""
+
+    @staticmethod
+    def get_simulator():
+        """Returns a small simulation with several trading agents"""
+        config = config_utils.override_config_variables(
+            config_utils.load_and_parse_config_file("config/example_config.toml"),
+            {"num_trading_days": 10, "num_blocks_per_day": 5, "num_position_days": 3},
+        )
+        agents = [
+            sim_utils.get_policy(policy)(wallet_address=address)
+            for address, policy in enumerate(["single_long", "single_short", "lp_and_withdraw"], start=1)
+        ]
+        return sim_utils.get_simulator(config, agents)
+
+    def test_sinks_match_in_memory_state(self):
+        """Streaming the state in chunks gives the same dataframe as keeping it in memory"""
+        reference = self.get_simulator()
+        reference.run_simulation()
+        reference_df = post_processing.compute_derived_variables(reference)
+        chunk_size = 4
+        for sink_type in [ParquetSink, ArrowIpcSink]:
+            with tempfile.TemporaryDirectory() as directory:
+                simulator = self.get_simulator()
+                simulator.state_sink = sink_type(directory, chunk_size=chunk_size)
+                simulator.run_simulation(stop_day=5)
+                assert len(simulator.simulation_state) < chunk_size  # memory is bounded by the chunk size
+                simulator.run_simulation()
+                assert len(simulator.simulation_state) == 0
+                chunks = list(simulator.state_sink.iter_chunks(columns=["run_trade_number"]))
+                assert len(chunks) == int(np.ceil(len(reference_df) / chunk_size))
+                assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+                trades_df = post_processing.compute_derived_variables(simulator)
+                pd_testing.assert_frame_equal(
+                    trades_df.drop(columns=OBJECT_COLUMNS),
+                    reference_df.drop(columns=OBJECT_COLUMNS),
+                    check_exact=True,
+                    check_dtype=False,
+                )
+                assert list(trades_df["model_name"]) == list(reference_df["model_name"])
+
+    def test_fork_shares_chunks(self):
+        """A forked simulator reads the chunks written before the fork and writes its own afterwards"""
+        with tempfile.TemporaryDirectory() as directory:
+            simulator = self.get_simulator()
+            simulator.state_sink = ParquetSink(directory, chunk_size=2)
+            simulator.run_simulation(stop_day=5)
+            fork = simulator.fork()
+            num_shared_chunks = len(simulator.state_sink.chunk_files)
+            fork.run_simulation()
+            simulator.run_simulation()
+            fork_chunk_files, chunk_files = fork.state_sink.chunk_files, simulator.state_sink.chunk_files
+            assert fork_chunk_files[:num_shared_chunks] == chunk_files[:num_shared_chunks]
+            assert not set(fork_chunk_files[num_shared_chunks:]) & set(chunk_files)
+            pd_testing.assert_frame_equal(
+                post_processing.get_simulation_state_df(fork).drop(columns=OBJECT_COLUMNS),
+                post_processing.get_simulation_state_df(simulator).drop(columns=OBJECT_COLUMNS),
+            )
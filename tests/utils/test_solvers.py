@@ -0,0 +1,64 @@
+"""Testing for the root finding utilities found in src/elfpy/utils/solvers.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+from elfpy.utils.solvers import DEFAULT_FTOL, DEFAULT_XTOL, find_max_feasible
+
+
+class CountingSlack:  # pylint: disable=too-few-public-methods
+    """Slack function with a known feasibility boundary that counts its evaluations"""
+
+    def __init__(self, boundary: float, power: float = 1.0, fail_above: float = 2.0):
+        self.boundary = boundary
+        self.power = power
+        self.fail_above = fail_above
+        self.num_evals = 0
+
+    def __call__(self, x: float):
+        self.num_evals += 1
+        if x > self.fail_above:
+            return None, None
+        return self.boundary**self.power - x**self.power, x
+
+
+class TestFindMaxFeasible(unittest.TestCase):
+    """Unit tests for the find_max_feasible function"""
+
+    def test_upper_feasible(self):
+        """The upper bound is returned after a single evaluation if it is feasible"""
+        slack_fn = CountingSlack(boundary=1.5)
+        x, payload = find_max_feasible(slack_fn)
+        self.assertEqual(x, 1.0)
+        self.assertEqual(payload, 1.0)
+        self.assertEqual(slack_fn.num_evals, 1)
+
+    def test_nothing_feasible(self):
+        """The default payload is returned if no feasible point is found"""
+        x, payload = find_max_feasible(lambda x: (None, x), default_payload=(0, 0))
+        self.assertEqual(x, 0)
+        self.assertEqual(payload, (0, 0))
+
+    def test_converges_near_boundary(self):
+        """The result is feasible, close to the boundary, and found in no more evaluations than bisection"""
+        for boundary in [1e-6, 0.01, 0.3, 0.5, 0.77, 0.999]:
+            for power in [1.0, 3.0, 0.2]:
+                for fail_above in [2.0, (1 + boundary) / 2]:
+                    slack_fn = CountingSlack(boundary, power, fail_above)
+                    x, payload = find_max_feasible(slack_fn)
+                    self.assertEqual(x, payload)
+                    slack = boundary**power - x**power
+                    self.assertGreaterEqual(slack, 0)
+                    self.assertTrue(
+                        boundary - x < DEFAULT_XTOL or slack <= DEFAULT_FTOL,
+                        msg=f"{boundary=}, {power=}, {fail_above=}",
+                    )
+                    self.assertLessEqual(slack_fn.num_evals, 26, msg=f"{boundary=}, {power=}, {fail_above=}")
+
+    def test_smooth_slack_is_fast(self):
+        """A smooth slack function converges in a handful of evaluations"""
+        for boundary in [0.3, 0.5, 0.77, 0.999]:
+            for power in [1.0, 2.0, 3.0]:
+                slack_fn = CountingSlack(boundary, power)
+                find_max_feasible(slack_fn)
+                self.assertLessEqual(slack_fn.num_evals, 10, msg=f"{boundary=}, {power=}")
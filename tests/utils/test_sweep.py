@@ -0,0 +1,58 @@
+"""Testing for functions in src/elfpy/utils/sweep.py"""
+
+import unittest
+
+import pandas.testing as pd_testing
+
+from elfpy.utils import sweep
+import elfpy.utils.parse_config as config_utils
+
+
+class SweepTests(unittest.TestCase):
+    """Unit tests for the parallel sweep runner"""
+
+    @staticmethod
+    def get_config():
+        """Small config so that each run is fast"""
+        override_dict = {
+            "num_trading_days": 3,
+            "num_blocks_per_day": 3,
+            "agent_policies": ["single_long", "single_short"],
+            "vault_apr": {"type": "uniform", "low": 0.01, "high": 0.1},
+        }
+        return config_utils.override_config_variables(
+            config_utils.load_and_parse_config_file("config/example_config.toml"), override_dict
+        )
+
+    def test_get_grid_overrides(self):
+        """The grid is expanded into every combination of values"""
+        overrides = sweep.get_grid_overrides({"min_fee": [0.1, 0.2], "max_fee": [0.5, 0.6, 0.7]})
+        assert len(overrides) == 6
+        assert overrides[0] == {"min_fee": 0.1, "max_fee": 0.5}
+        assert sweep.get_grid_overrides({}) == [{}]
+        assert sweep.parse_grid_argument("min_fee=0.1,0.2") == ("min_fee", [0.1, 0.2])
+        with self.assertRaises(ValueError):
+            sweep.parse_grid_argument("min_fee")
+
+    def test_seeds_are_independent(self):
+        """Every run gets a distinct seed, and the seeds only depend on the root seed and run order"""
+        runs = sweep.get_sweep_runs([{}, {"min_fee": 0.2}], num_seeds=3, root_seed=123)
+        assert [run.run_number for run in runs] == list(range(6))
+        spawn_keys = [run.seed_sequence.spawn_key for run in runs]
+        assert len(set(spawn_keys)) == 6
+        other_runs = sweep.get_sweep_runs([{}, {"min_fee": 0.2}], num_seeds=3, root_seed=123)
+        for run, other_run in zip(runs, other_runs):
+            assert run.seed_sequence.generate_state(4).tolist() == other_run.seed_sequence.generate_state(4).tolist()
+
+    def test_worker_count_does_not_change_results(self):
+        """A sweep returns identical results with one or several worker processes"""
+        config = self.get_config()
+        override_dicts = sweep.get_grid_overrides({"min_fee": [0.1, 0.2]})
+        serial_results = sweep.run_sweep(config, override_dicts, num_seeds=2, max_workers=1)
+        parallel_results = sweep.run_sweep(config, override_dicts, num_seeds=2, max_workers=2)
+        assert len(serial_results) == 4
+        assert [result.run_number for result in parallel_results] == [0, 1, 2, 3]
+        serial_df = sweep.get_sweep_df(serial_results)
+        pd_testing.assert_frame_equal(serial_df, sweep.get_sweep_df(parallel_results), check_exact=True)
+        # different seeds produce different markets
+        assert serial_df["share_reserves"].nunique() > 1
@@ -131,6 +131,29 @@ class TestTimeUtils(unittest.TestCase):
                     time_remaining, test_case["expected_result"], err_msg=f"unexpected time remaining {time_remaining}"
                 )
 
+    def test_get_years_remaining_at_block(self):
+        """Unit tests for the get_years_remaining_at_block function"""
+        blocks_per_year = 365 * 7_200
+        # 6mo duration, minted 3mo before the market block; scalars and arrays give the same result
+        market_block = blocks_per_year // 2
+        mint_blocks = np.array([0, blocks_per_year // 4, market_block])
+        time_remaining = time_utils.get_years_remaining_at_block(market_block, mint_blocks, blocks_per_year, 0.5)
+        np.testing.assert_array_equal(time_remaining, [0, 0.25, 0.5])
+        for mint_block, expected_result in zip(mint_blocks, time_remaining):
+            self.assertEqual(
+                time_utils.get_years_remaining_at_block(market_block, mint_block, blocks_per_year, 0.5),
+                expected_result,
+            )
+        # positions minted at the same block always have the same time remaining, whatever the market block
+        for market_block in range(1_000_000, 1_000_100):
+            self.assertEqual(
+                time_utils.get_years_remaining_at_block(market_block, market_block - 7_200, blocks_per_year, 1.0),
+                1 - 7_200 / blocks_per_year,
+            )
+        # ERROR CASE: minted in the future
+        with self.assertRaises(ValueError):
+            time_utils.get_years_remaining_at_block(0, np.array([0, 1]), blocks_per_year, 0.5)
+
     def test_norm_days(self):
         """Unit tests for the norm_days function"""
 
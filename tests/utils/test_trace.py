@@ -0,0 +1,99 @@
+"""Testing for the structured trade trace found in src/elfpy/utils/trace.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import json
+import os
+import pickle
+import tempfile
+import unittest
+
+import utils_for_tests as test_utils  # utilities for testing
+from elfpy.types import MarketAction, MarketActionType, MarketDeltas, MarketState
+from elfpy.utils.trace import EventTrace, MarketDeltaEvent, TradeEvent, WalletDeltaEvent
+
+
+class TraceTests(unittest.TestCase):
+    """Unit tests for recording and dumping the trade trace"""
+
+    def test_ring_buffer(self):
+        """The trace keeps the most recent events, and a trace with no capacity is disabled"""
+        action = MarketAction(action_type=MarketActionType.OPEN_LONG, trade_amount=10, wallet_address=1)
+        trace = EventTrace(capacity=3)
+        self.assertTrue(trace.enabled)
+        for block_number in range(5):
+            trace.record(MarketDeltaEvent.from_deltas(block_number, action, MarketDeltas(d_base_asset=block_number)))
+        self.assertEqual([event.block_number for event in trace], [2, 3, 4])
+        self.assertEqual((trace.num_recorded, trace.num_dropped), (5, 2))
+        self.assertEqual([record["sequence"] for record in trace.get_records()], [2, 3, 4])
+        trace.resize(2)
+        self.assertEqual([event.d_base_asset for event in trace], [3, 4])
+        trace.resize(0)
+        self.assertFalse(trace.enabled)
+        self.assertEqual(len(trace), 0)
+        trace.clear()
+        self.assertEqual(trace.num_recorded, 0)
+        with self.assertRaises(ValueError):
+            trace.resize(-1)
+        event = TradeEvent.from_action(7, action, MarketState(share_reserves=100, bond_reserves=200))
+        self.assertEqual((event.action_type, event.share_reserves, event.bond_reserves), ("open_long", 100, 200))
+
+    def test_disabled_trace(self):
+        """Simulations do not record events unless trace_capacity is set"""
+        simulator = test_utils.get_short_simulator()
+        simulator.run_simulation()
+        self.assertFalse(simulator.market.trace.enabled)
+        self.assertEqual(simulator.market.trace.num_recorded, 0)
+
+    @staticmethod
+    def run_traced_simulator():
+        """Returns a short simulation that has been run with a trace that keeps every event"""
+        simulator = test_utils.get_short_simulator(trace_capacity=100_000)
+        simulator.run_simulation()
+        return simulator
+
+    def test_simulation_trace(self):
+        """Every trade records a trade, a market delta, and a wallet delta event, in that order"""
+        simulator = self.run_traced_simulator()
+        self.assertEqual(simulator.market.trace.num_dropped, 0)
+        events = list(simulator.market.trace)
+        trade_events = [event for event in events if isinstance(event, TradeEvent)]
+        wallet_delta_events = [event for event in events if isinstance(event, WalletDeltaEvent)]
+        self.assertEqual(len(trade_events), simulator.run_trade_number)
+        self.assertEqual(
+            len([event for event in events if isinstance(event, MarketDeltaEvent)]), simulator.run_trade_number
+        )
+        self.assertGreaterEqual(len(wallet_delta_events), simulator.run_trade_number)
+        self.assertTrue({"open_long", "open_short", "add_liquidity"} <= {event.action_type for event in trade_events})
+        # each trade is followed by its market deltas and then the wallet deltas of the agent that traded
+        for index, event in enumerate(events):
+            if isinstance(event, TradeEvent):
+                market_delta_event, wallet_delta_event = events[index + 1 : index + 3]
+                self.assertIsInstance(market_delta_event, MarketDeltaEvent)
+                self.assertIsInstance(wallet_delta_event, WalletDeltaEvent)
+                self.assertEqual(market_delta_event.wallet_address, event.wallet_address)
+                self.assertEqual(wallet_delta_event.wallet_address, event.wallet_address)
+                self.assertEqual(market_delta_event.block_number, event.block_number)
+        # the wallet deltas of an agent add up to the change in its wallet
+        for address, agent in simulator.agents.items():
+            self.assertAlmostEqual(
+                sum(event.base for event in wallet_delta_events if event.wallet_address == address),
+                agent.wallet.base - agent.budget,
+            )
+
+    def test_dump_trace(self):
+        """The trace of a simulation can be dumped as JSON Lines, and is copied by forks and pickles"""
+        simulator = self.run_traced_simulator()
+        trace = simulator.market.trace
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "trace.jsonl")
+            self.assertEqual(trace.dump_jsonl(filename), len(trace))
+            with open(filename, mode="r", encoding="UTF-8") as file:
+                records = [json.loads(line) for line in file]
+        self.assertEqual([record["sequence"] for record in records], list(range(len(trace))))
+        self.assertEqual(records[0]["event_type"], "trade")
+        self.assertEqual(records[0]["action_type"], next(iter(trace)).action_type)
+        # the trace is part of the market, so it is copied by forks and pickles
+        fork = simulator.fork()
+        self.assertEqual(len(fork.market.trace), len(trace))
+        fork.market.trace.clear()
+        self.assertEqual(len(pickle.loads(pickle.dumps(simulator.market)).trace), len(trace))
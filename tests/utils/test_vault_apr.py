@@ -0,0 +1,73 @@
+"""Testing for the vault APR processes found in src/elfpy/utils/vault_apr.py"""
+from __future__ import annotations  # types are strings by default in 3.11
+
+import unittest
+
+import numpy as np
+
+import elfpy.utils.vault_apr as vault_apr_utils
+
+
+class VaultAprTests(unittest.TestCase):
+    """Unit tests for sampling and streaming vault APRs"""
+
+    processes = [
+        vault_apr_utils.ConstantApr(value=0.05),
+        vault_apr_utils.UniformApr(low=0.01, high=0.1),
+        vault_apr_utils.GeometricBrownianMotionApr(initial=0.05, drift=0.01, volatility=0.3),
+        vault_apr_utils.MeanRevertingApr(initial=0.02, mean=0.05, reversion_speed=5, volatility=0.01),
+        vault_apr_utils.RegimeSwitchingApr(aprs=[0.02, 0.08], transition_matrix=[[0.99, 0.01], [0.05, 0.95]]),
+    ]
+
+    def test_batch_sample(self):
+        """Processes sample independent paths for many runs at once"""
+        for process in self.processes:
+            aprs = process.sample(np.random.default_rng(seed=1), num_days=50, num_runs=20)
+            self.assertEqual(aprs.shape, (20, 50))
+            self.assertTrue(np.all(np.isfinite(aprs)))
+            if not isinstance(process, (vault_apr_utils.ConstantApr, vault_apr_utils.UniformApr)):
+                np.testing.assert_array_equal(aprs[:, 0], aprs[0, 0])  # every path starts at the initial value
+                self.assertGreater(len(np.unique(aprs[:, -1])), 1, msg=type(process).__name__)
+
+    def test_stream(self):
+        """A stream yields the same aprs day by day as iterating the process, keeping only the current chunk"""
+        for process in self.processes:
+            stream = vault_apr_utils.VaultAprStream(process, np.random.default_rng(seed=2), chunk_size=7)
+            expected = process.stream(np.random.default_rng(seed=2), chunk_size=7)
+            for day in range(30):
+                self.assertEqual(stream[day], next(expected))
+            self.assertEqual(stream.chunk_start_day, 28)
+            self.assertEqual(len(stream.chunk), 7)
+            with self.assertRaises(IndexError):
+                _ = stream[3]
+
+    def test_long_run_statistics(self):
+        """Mean reverting paths settle around their mean, and regimes follow the transition matrix"""
+        rng = np.random.default_rng(seed=3)
+        mean_reverting = vault_apr_utils.MeanRevertingApr(initial=0.2, mean=0.05, reversion_speed=10, volatility=0.02)
+        aprs = mean_reverting.sample(rng, num_days=365, num_runs=500)
+        self.assertAlmostEqual(np.mean(aprs[:, -1]), 0.05, delta=0.002)
+        # the stationary standard deviation is volatility / sqrt(2 * reversion_speed)
+        self.assertAlmostEqual(np.std(aprs[:, -1]), 0.02 / np.sqrt(20), delta=0.0005)
+        regime_switching = vault_apr_utils.RegimeSwitchingApr(
+            aprs=[0.03, 0.01, 0.06], transition_matrix=[[0.9, 0.1, 0], [0, 0.5, 0.5], [1, 0, 0]]
+        )
+        aprs = regime_switching.sample(rng, num_days=200, num_runs=50)
+        self.assertTrue(np.all(aprs[:, 0] == 0.03))
+        transitions = set(zip(aprs[:, :-1].ravel().tolist(), aprs[:, 1:].ravel().tolist()))
+        self.assertEqual(transitions, {(0.03, 0.03), (0.03, 0.01), (0.01, 0.01), (0.01, 0.06), (0.06, 0.03)})
+        # a continued path starts from the regime of its previous day
+        continued = regime_switching.sample(rng, num_days=1, num_runs=200, previous=np.full(200, 0.06))
+        np.testing.assert_array_equal(continued, 0.03)
+        with self.assertRaises(ValueError):
+            vault_apr_utils.RegimeSwitchingApr(aprs=[0.01, 0.02], transition_matrix=[[0.5, 0.4], [0, 1]])
+
+    def test_get_vault_apr_process(self):
+        """Processes are constructed from their config dictionary"""
+        process = vault_apr_utils.get_vault_apr_process(
+            {"type": "MeanReverting", "initial": 0.02, "mean": 0.05, "reversion_speed": 5, "volatility": 0.01}
+        )
+        self.assertIsInstance(process, vault_apr_utils.MeanRevertingApr)
+        self.assertEqual(process.mean, 0.05)
+        with self.assertRaises(ValueError):
+            vault_apr_utils.get_vault_apr_process({"type": "linear"})
@@ -43,6 +43,18 @@ def setup_simulation_entities(config_file, override_dict, agent_policies) -> Sim
     return simulator
 
 
+def get_short_simulator(**overrides) -> Simulator:
+    """Construct the simulator of a short simulation with longs, shorts, and LPs, which has not been run"""
+    override_dict = {
+        "num_trading_days": 4,
+        "num_blocks_per_day": 3,
+        "agent_policies": ["single_long", "single_short", "single_lp"],
+        "precision": 64,
+        **overrides,
+    }
+    return setup_simulation_entities("config/example_config.toml", override_dict, override_dict["agent_policies"])
+
+
 def validate_custom_parameters(policy_instruction):
     """
     separate the policy name from the policy arguments and validate the arguments